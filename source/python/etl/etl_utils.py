@@ -2,11 +2,158 @@ import copy
 import csv
 import json
 import os
+import shutil
 import nltk
+import numpy
+
+try:
+    import ujson as fast_json
+except ImportError:
+    fast_json = json
 
 __author__ = 'franpena'
 
 
+DEFAULT_JSON_BATCH_SIZE = 10000
+COLUMNAR_MANIFEST_FILE = 'columns.json'
+ARRAY_COLUMN = 'array'
+TEXT_COLUMN = 'text'
+RAGGED_COLUMN = 'ragged'
+JSON_COLUMN = 'json'
+# The types of the numbers that a numpy array stores without changing them
+NUMBER_DTYPES = {bool: numpy.bool_, int: numpy.int64, float: numpy.float64}
+CONTAINER_TYPES = {'list': list, 'tuple': tuple}
+
+
+def get_number_type(values):
+    """
+    Returns the type shared by all the values when they are numbers that a
+    numpy array stores exactly (see NUMBER_DTYPES), or None otherwise. Mixed
+    types are not accepted, since the array would convert them, for instance
+    integers mixed with floats would come back as floats
+
+    :rtype: type
+    """
+    number_types = set()
+    for value in values:
+        value_type = type(value)
+        if value_type is long and -2 ** 63 <= value < 2 ** 63:
+            value_type = int
+        if value_type not in NUMBER_DTYPES:
+            return None
+        number_types.add(value_type)
+        if len(number_types) > 1:
+            return None
+    return number_types.pop() if number_types else float
+
+
+def get_container_type(values):
+    """
+    Returns 'list' if all the values are lists, 'tuple' if all of them are
+    tuples and None otherwise
+
+    :rtype: str
+    """
+    value_types = set(type(value) for value in values)
+    if value_types <= {list}:
+        return 'list'
+    if value_types == {tuple}:
+        return 'tuple'
+    return None
+
+
+def is_json_serializable(value):
+    """
+    Indicates if the value comes back from JSON with the same content and
+    the same container types. Tuples, for instance, come back as lists, and
+    ujson only encodes 64-bit integers
+    """
+    if isinstance(value, (int, long)):
+        return -2 ** 63 <= value < 2 ** 64
+    if value is None or isinstance(value, (float, basestring)):
+        return True
+    if type(value) is list:
+        return all(is_json_serializable(element) for element in value)
+    if type(value) is dict:
+        return all(
+            isinstance(key, basestring) and is_json_serializable(element)
+            for key, element in value.iteritems())
+    return False
+
+
+class VariableLengthColumn(object):
+    """
+    A read-only column of a columnar records store in which every row can have
+    a different length (texts, bags-of-words, corpora, topic distributions).
+    The values of all the rows are kept in flat (possibly memory-mapped)
+    arrays and the boundaries of each row are given by an offsets array, so
+    that rows are only decoded when they are accessed
+    """
+
+    def __init__(self, kind, offsets, values, width=0, container='list',
+                 element_container='list'):
+        self.kind = kind
+        self.offsets = offsets
+        self.values = values
+        self.width = width
+        self.container = CONTAINER_TYPES[container]
+        self.element_container = CONTAINER_TYPES[element_container]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start = self.offsets[index]
+        end = self.offsets[index + 1]
+
+        if self.kind == RAGGED_COLUMN:
+            if self.width == 0:
+                return self.container(self.values[0][start:end].tolist())
+            return self.container(self.element_container(row) for row in zip(
+                *[values[start:end].tolist() for values in self.values]))
+
+        data = self.values[0][start:end].tobytes().decode('utf-8')
+        if self.kind == JSON_COLUMN:
+            return fast_json.loads(data)
+        return data
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def tolist(self):
+        return list(self)
+
+
+class ColumnarRecords(object):
+    """
+    A read-only sequence of records backed by the (possibly memory-mapped)
+    columns returned by ETLUtils.load_columnar_file. A record is only built
+    when it is accessed, and every access returns a new dictionary, so the
+    caller can modify it without affecting the stored records
+    """
+
+    def __init__(self, columns):
+        self.field_names = list(columns.keys())
+        self.columns = [columns[field] for field in self.field_names]
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, index):
+        values = []
+        for column in self.columns:
+            value = column[index]
+            if isinstance(value, numpy.generic):
+                value = value.item()
+            values.append(value)
+        return dict(zip(self.field_names, values))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
 class ETLUtils:
     def __init__(self):
         pass
@@ -21,16 +168,413 @@ class ETLUtils:
         data
         :return: a list of dictionaries with the data from the files
         """
-        records = [json.loads(line) for line in open(file_path)]
+        records = list(ETLUtils.iter_json_file(file_path))
 
         return records
 
     @staticmethod
     def save_json_file(file_path, records):
-        with open(file_path, 'w') as outfile:
+        ETLUtils.write_json_stream(file_path, records)
+
+    @staticmethod
+    def iter_json_file(file_path, batch_size=None):
+        """
+        Lazily reads a JSON-lines file, so that only one record (or one batch
+        of records) has to be kept in memory at any given time
+
+        :type file_path: string
+        :param file_path: the path for the file that contains one JSON record
+        per line
+        :type batch_size: int
+        :param batch_size: if None, the records are yielded one by one,
+        otherwise they are yielded in lists of at most batch_size records
+        :return: a generator over the records (or the batches of records) of
+        the file
+        """
+        with open(file_path) as read_file:
+            if batch_size is None:
+                for line in read_file:
+                    yield fast_json.loads(line)
+                return
+
+            batch = []
+            for line in read_file:
+                batch.append(fast_json.loads(line))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    @staticmethod
+    def write_json_stream(
+            file_path, records, batch_size=DEFAULT_JSON_BATCH_SIZE,
+            append=False):
+        """
+        Writes the given records into a JSON-lines file. The records can be
+        any iterable (e.g. a generator), they are serialized and written in
+        batches of batch_size records, so the whole output never has to be
+        held in memory
+
+        :type file_path: string
+        :param file_path: the path of the file in which the records are going
+        to be written
+        :param records: an iterable of dictionaries
+        :type batch_size: int
+        :param batch_size: the number of records that are serialized before
+        being flushed to the file
+        :type append: bool
+        :param append: if True the records are appended at the end of the file
+        instead of overwriting it
+        :rtype: int
+        :return: the number of records written
+        """
+        num_records = 0
+        lines = []
+
+        with open(file_path, 'a' if append else 'w') as outfile:
             for record in records:
-                json.dump(record, outfile)
-                outfile.write('\n')
+                lines.append(fast_json.dumps(record))
+                num_records += 1
+                if len(lines) == batch_size:
+                    outfile.write('\n'.join(lines) + '\n')
+                    lines = []
+            if lines:
+                outfile.write('\n'.join(lines) + '\n')
+
+        return num_records
+
+    @staticmethod
+    def get_columnar_folder(file_path):
+        """
+        Returns the folder in which the columnar version of the given
+        JSON-lines file is stored
+
+        :type file_path: string
+        :param file_path: the path of a JSON-lines records file
+        :rtype: string
+        """
+        return os.path.splitext(file_path)[0] + '_columns/'
+
+    @staticmethod
+    def save_columnar_file(folder, records, fields=None, source_file=None):
+        """
+        Stores the records in a columnar binary format. Every field is saved in
+        its own numpy .npy file(s), so the columns can later be memory-mapped
+        independently. Numeric fields are stored as plain arrays, while
+        variable-length fields (texts, bags-of-words, corpora, topic
+        distributions) are stored as a flat values array plus an offsets index.
+        The fields that can't be represented as numeric arrays are stored as
+        UTF-8 encoded JSON.
+
+        The columns are written to a temporary folder which then replaces the
+        given folder, so a crash never leaves a partially written folder
+
+        :type folder: string
+        :param folder: the folder in which the columns are going to be saved
+        :type records: list[dict]
+        :param records: a list of dictionaries, all of them containing the
+        given fields
+        :type fields: list[str]
+        :param fields: the fields to store. If None, all the fields of the
+        first record are stored
+        :type source_file: string
+        :param source_file: the JSON-lines file that contains the same records.
+        Its size and modification time are stored, so load_records_file can
+        tell if the file has changed since the columns were saved
+        :raise ValueError: if a record doesn't contain all the fields, or a
+        field contains values that wouldn't be loaded back exactly as they are
+        """
+        if fields is None:
+            fields = sorted(records[0].keys()) if records else []
+
+        folder = folder.rstrip('/')
+        temporary_folder = '%s.tmp-%d' % (folder, os.getpid())
+        if os.path.isdir(temporary_folder):
+            shutil.rmtree(temporary_folder)
+        os.makedirs(temporary_folder)
+
+        try:
+            columns = {}
+            for field in fields:
+                try:
+                    values = [record[field] for record in records]
+                except KeyError:
+                    raise ValueError(
+                        'All the records must contain the field \'%s\'' %
+                        field)
+                columns[field] = \
+                    ETLUtils._save_column(temporary_folder, field, values)
+
+            manifest = {
+                'num_records': len(records),
+                'fields': list(fields),
+                'columns': columns,
+                'source': ETLUtils._get_file_stamp(source_file)
+            }
+            with open(os.path.join(
+                    temporary_folder, COLUMNAR_MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f)
+        except:
+            shutil.rmtree(temporary_folder)
+            raise
+
+        old_folder = None
+        if os.path.exists(folder):
+            old_folder = '%s.old-%d' % (folder, os.getpid())
+            os.rename(folder, old_folder)
+        os.rename(temporary_folder, folder)
+        if old_folder is not None:
+            shutil.rmtree(old_folder)
+
+    @staticmethod
+    def _get_file_stamp(file_path):
+        if file_path is None or not os.path.exists(file_path):
+            return None
+        file_stat = os.stat(file_path)
+        return {'size': file_stat.st_size, 'mtime': file_stat.st_mtime}
+
+    @staticmethod
+    def _save_column(folder, field, values):
+
+        def column_file(suffix):
+            return os.path.join(folder, field + suffix + '.npy')
+
+        number_type = get_number_type(values)
+        if number_type is not None:
+            numpy.save(
+                column_file(''),
+                numpy.array(values, dtype=NUMBER_DTYPES[number_type]))
+            return {'kind': ARRAY_COLUMN}
+
+        lengths = None
+        kind = JSON_COLUMN
+        width = 0
+        element_types = []
+        container = get_container_type(values)
+        element_container = 'list'
+        if all(isinstance(value, basestring) for value in values):
+            kind = TEXT_COLUMN
+        elif container is not None:
+            elements = [element for value in values for element in value]
+            element_types = [get_number_type(elements)]
+            element_container = get_container_type(elements)
+            if element_types[0] is not None:
+                kind = RAGGED_COLUMN
+            elif element_container is not None and elements:
+                width = len(elements[0])
+                if width > 0 and all(
+                        len(element) == width for element in elements):
+                    element_types = [
+                        get_number_type(
+                            [element[position] for element in elements])
+                        for position in range(width)
+                    ]
+                    if all(element_types):
+                        kind = RAGGED_COLUMN
+                if kind != RAGGED_COLUMN:
+                    width = 0
+
+        if kind == JSON_COLUMN and not all(
+                is_json_serializable(value) for value in values):
+            raise ValueError(
+                'The field \'%s\' contains values that can\'t be stored in '
+                'columnar format' % field)
+
+        if kind == RAGGED_COLUMN:
+            lengths = [len(value) for value in values]
+            if width == 0:
+                numpy.save(
+                    column_file('.values'),
+                    numpy.array(
+                        elements, dtype=NUMBER_DTYPES[element_types[0]]))
+            else:
+                for position in range(width):
+                    numpy.save(
+                        column_file('.values-%d' % position),
+                        numpy.array(
+                            [element[position] for element in elements],
+                            dtype=NUMBER_DTYPES[element_types[position]]))
+        else:
+            if kind == JSON_COLUMN:
+                values = [fast_json.dumps(value) for value in values]
+            encoded_values = [
+                value if isinstance(value, bytes) else value.encode('utf-8')
+                for value in values
+            ]
+            lengths = [len(value) for value in encoded_values]
+            numpy.save(
+                column_file('.values'),
+                numpy.frombuffer(b''.join(encoded_values), dtype=numpy.uint8))
+
+        offsets = numpy.zeros(len(values) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=offsets[1:])
+        numpy.save(column_file('.offsets'), offsets)
+
+        column_info = {'kind': kind, 'width': width}
+        if kind == RAGGED_COLUMN:
+            column_info['container'] = container
+            column_info['element_container'] = element_container or 'list'
+        return column_info
+
+    @staticmethod
+    def load_columnar_file(folder, fields=None, mmap_mode='r'):
+        """
+        Loads the columns stored in the given folder by save_columnar_file.
+        Only the requested columns are read, and by default they are
+        memory-mapped instead of being read into memory
+
+        :type folder: string
+        :param folder: the folder in which the columns were saved
+        :type fields: list[str]
+        :param fields: the fields to load. If None, all the stored fields are
+        loaded
+        :param mmap_mode: the mode used to memory-map the numpy files. If None
+        the files are read into memory
+        :rtype: dict
+        :return: a dictionary with the field names as keys and the columns as
+        values. Numeric fields are returned as numpy arrays, variable-length
+        fields are returned as VariableLengthColumn objects
+        """
+        with open(os.path.join(folder, COLUMNAR_MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        if fields is None:
+            fields = manifest['fields']
+
+        def load_array(field, suffix):
+            return numpy.load(
+                os.path.join(folder, field + suffix + '.npy'),
+                mmap_mode=mmap_mode)
+
+        columns = {}
+        for field in fields:
+            if field not in manifest['columns']:
+                raise ValueError(
+                    'The field \'%s\' is not stored in %s' % (field, folder))
+            column_info = manifest['columns'][field]
+            kind = column_info['kind']
+
+            if kind == ARRAY_COLUMN:
+                columns[field] = load_array(field, '')
+                continue
+
+            width = column_info['width']
+            if kind == RAGGED_COLUMN and width > 0:
+                values = [
+                    load_array(field, '.values-%d' % position)
+                    for position in range(width)
+                ]
+            else:
+                values = [load_array(field, '.values')]
+            columns[field] = VariableLengthColumn(
+                kind, load_array(field, '.offsets'), values, width,
+                column_info.get('container', 'list'),
+                column_info.get('element_container', 'list'))
+
+        return columns
+
+    @staticmethod
+    def load_columnar_records(folder, fields=None):
+        """
+        Builds a list of dictionaries from a folder written by
+        save_columnar_file
+
+        :type folder: string
+        :param folder: the folder in which the columns were saved
+        :type fields: list[str]
+        :param fields: the fields each dictionary will have. If None, all the
+        stored fields are loaded
+        :rtype: list[dict]
+        """
+        columns = ETLUtils.load_columnar_file(folder, fields)
+        field_names = list(columns.keys())
+        field_values = [columns[field].tolist() for field in field_names]
+
+        records = [
+            dict(zip(field_names, values)) for values in zip(*field_values)]
+
+        return records
+
+    @staticmethod
+    def is_columnar_file_current(file_path):
+        """
+        Indicates if the columnar version of the given JSON-lines file exists
+        and was saved from the current content of the file, by comparing the
+        size and the modification time of the file with the ones stored by
+        save_columnar_file
+
+        :type file_path: string
+        :param file_path: the path of a JSON-lines records file
+        :rtype: bool
+        """
+        manifest_file = os.path.join(
+            ETLUtils.get_columnar_folder(file_path), COLUMNAR_MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            return False
+        if not os.path.exists(file_path):
+            return True
+
+        with open(manifest_file) as f:
+            source = json.load(f).get('source')
+        return source == ETLUtils._get_file_stamp(file_path)
+
+    @staticmethod
+    def load_records_file(file_path, fields=None):
+        """
+        Loads the records of a JSON-lines file, reading them from its columnar
+        version (see save_columnar_file) when one has been exported from the
+        current content of the file
+
+        :type file_path: string
+        :param file_path: the path of a JSON-lines records file
+        :type fields: list[str]
+        :param fields: the fields each record will have. If None, all the
+        fields are loaded
+        :rtype: list[dict]
+        """
+        if ETLUtils.is_columnar_file_current(file_path):
+            return ETLUtils.load_columnar_records(
+                ETLUtils.get_columnar_folder(file_path), fields)
+
+        records = ETLUtils.load_json_file(file_path)
+        if fields is not None:
+            records = ETLUtils.select_fields(fields, records)
+
+        return records
+
+    @staticmethod
+    def save_records_file(file_path, records):
+        """
+        Saves the records both as a JSON-lines file and in columnar format (in
+        the folder given by get_columnar_folder). Both are written to
+        temporary files which are then renamed, and the columnar version is
+        only used by load_records_file if it matches the JSON file. When the
+        records can't be stored in columnar format, only the JSON file is
+        saved
+
+        :type file_path: string
+        :param file_path: the path of the JSON-lines file
+        :type records: list[dict]
+        :param records: a list of dictionaries
+        """
+        temporary_path = '%s.tmp-%d' % (file_path, os.getpid())
+        try:
+            ETLUtils.write_json_stream(temporary_path, records)
+            os.rename(temporary_path, file_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        columnar_folder = ETLUtils.get_columnar_folder(file_path)
+        try:
+            ETLUtils.save_columnar_file(
+                columnar_folder, records, source_file=file_path)
+        except ValueError as error:
+            print('The records of %s are only saved as JSON: %s' % (
+                file_path, error))
+            if os.path.isdir(columnar_folder):
+                shutil.rmtree(columnar_folder)
 
     @staticmethod
     def drop_fields(fields, dictionary_list):
@@ -1,25 +1,188 @@
 
 import csv
+import itertools
+import struct
 
 import numpy
 from scipy import sparse
 
-from utils.constants import Constants
-
 __author__ = 'fpena'
 
 
+# The identifier that libFM writes at the beginning of its binary files
+LIBFM_BINARY_FILE_ID = 2
+LINES_CHUNK_SIZE = 100000
+
+
+class FeatureDictionary(object):
+    """
+    Assigns the indices of the variables of a libFM model. The static columns
+    take the first indices, in the order given, and every value of a one-hot
+    column gets a new index the first time it is seen.
+
+    The same dictionary has to be used for all the files that are given to the
+    same model, so a user or an item gets the same index in the training and in
+    the test files. It can be saved and loaded, so the files don't need to be
+    converted at the same time
+    """
+
+    def __init__(self, static_columns):
+        """
+        :type static_columns: list[int]
+        :param static_columns: the columns of the CSV files whose values are
+        copied as they are
+        """
+        self.static_columns = list(static_columns)
+        self.feature_ids = {}
+        self.num_features = len(self.static_columns)
+
+    def get_id(self, column, value):
+        """
+        Returns the index of the variable for the given value of a one-hot
+        column, adding it to the dictionary if it isn't there
+
+        :type column: int
+        :param value: the value of the column
+        :rtype: int
+        """
+        key = (column, str(value))
+        feature_id = self.feature_ids.get(key)
+        if feature_id is None:
+            feature_id = self.num_features
+            self.feature_ids[key] = feature_id
+            self.num_features += 1
+        return feature_id
+
+    def save(self, file_path):
+        """
+        Saves the dictionary to a CSV file, the first row contains the static
+        columns and the other ones the column, value and index of every
+        variable
+        """
+        features = sorted(self.feature_ids.items(), key=lambda item: item[1])
+        with open(file_path, 'wb') as write_file:
+            writer = csv.writer(write_file)
+            writer.writerow(self.static_columns)
+            for (column, value), feature_id in features:
+                writer.writerow([column, value, feature_id])
+
+    @staticmethod
+    def load(file_path):
+        """
+        Loads a dictionary saved with the save method
+
+        :rtype: FeatureDictionary
+        """
+        with open(file_path, 'rb') as read_file:
+            reader = csv.reader(read_file)
+            feature_dictionary = FeatureDictionary(
+                [int(column) for column in next(reader)])
+            for column, value, feature_id in reader:
+                feature_dictionary.feature_ids[(int(column), value)] = \
+                    int(feature_id)
+        feature_dictionary.num_features += len(feature_dictionary.feature_ids)
+        return feature_dictionary
+
+
+class TextRowWriter(object):
+    """
+    Writes the rows of a design matrix in the text format of libFM
+    """
+
+    def __init__(self, file_path):
+        self.write_file = open(file_path, 'w')
+        self.row_formats = {}
+
+    def write_row(self, target, feature_ids, values):
+        num_entries = len(feature_ids)
+        row_format = self.row_formats.get(num_entries)
+        if row_format is None:
+            row_format = '%s' + ' %d:%s' * num_entries + '\n'
+            self.row_formats[num_entries] = row_format
+        entries = [target] * (2 * num_entries + 1)
+        entries[1::2] = feature_ids
+        entries[2::2] = values
+        self.write_file.write(row_format % tuple(entries))
+
+    def close(self, num_features):
+        self.write_file.close()
+
+
+class BinaryRowWriter(object):
+    """
+    Writes the rows of a design matrix in the binary format of libFM, the
+    variables go to file_path + '.x' and the targets to file_path + '.y'.
+    The sizes in the headers of the files are not known until all the rows
+    have been written, so the headers are written again when the writer is
+    closed.
+
+    libFM reads the binary files when it is given file_path without the
+    extensions. The MCMC and ALS methods also need the transposed matrix in
+    file_path + '.xt', which is created with the transpose tool of libFM
+    """
+
+    def __init__(self, file_path):
+        self.x_file = open(file_path + '.x', 'wb')
+        self.y_file = open(file_path + '.y', 'wb')
+        self.num_rows = 0
+        self.num_values = 0
+        self.write_headers(0)
+
+    def write_headers(self, num_features):
+        self.x_file.seek(0)
+        self.x_file.write(struct.pack(
+            '<IIQII', LIBFM_BINARY_FILE_ID, 4, self.num_values, self.num_rows,
+            num_features))
+        self.y_file.seek(0)
+        self.y_file.write(struct.pack('<I', self.num_rows))
+
+    def write_row(self, target, feature_ids, values):
+        num_entries = len(feature_ids)
+        entries = [None] * (2 * num_entries)
+        entries[::2] = feature_ids
+        entries[1::2] = [float(value) for value in values]
+        self.x_file.write(
+            struct.pack('<I' + 'If' * num_entries, num_entries, *entries))
+        self.y_file.write(struct.pack('<f', float(target)))
+        self.num_rows += 1
+        self.num_values += num_entries
+
+    def close(self, num_features):
+        self.write_headers(num_features)
+        self.x_file.close()
+        self.y_file.close()
+
+
+def get_static_columns(
+        num_columns, target_column, one_hot_columns, delete_columns):
+    """
+    The static columns are that ones that are not going to be deleted, don't
+    belong to the one-hot columns or the target column
+
+    :rtype: list[int]
+    """
+    return sorted(set(range(num_columns)).difference(
+        [target_column], one_hot_columns, delete_columns))
+
+
 def csv_to_libfm(
         input_files, target_column, one_hot_columns,
-        delete_columns=None, delimiter=',', has_header=False, suffix='.libfm'):
+        delete_columns=None, delimiter=',', has_header=False, suffix='.libfm',
+        feature_dictionary=None, binary=False):
     """
     Converts a CSV file to the libFM format.
 
+    The files are read and written one row at a time, so the memory that is
+    used doesn't depend on the size of the files but only on the number of
+    variables in the model.
+
     :type input_files: list[str]
     :param input_files: a list with the path of the CSV files to convert
     :type target_column: int
     :param target_column: the index of the column that contains the target.
     In the case of a recommender system, the target is the rating.
+    :type one_hot_columns: list[int]
+    :param one_hot_columns: the columns that are encoded with one-hot vectors
     :type delete_columns: list[int]
     :param delete_columns: A list with the columns of the CSV file that are to
     be excluded
@@ -27,6 +190,17 @@ def csv_to_libfm(
     :param delimiter: the separator used in the CSV file
     :type has_header: bool
     :param has_header: a boolean indicating if the CSV file has a header or not
+    :type suffix: str
+    :param suffix: the suffix that is added to the path of every input file to
+    obtain the path of its output file
+    :type feature_dictionary: FeatureDictionary
+    :param feature_dictionary: the dictionary with the indices of the
+    variables. If None, a new dictionary is created. The dictionary is updated
+    with the values that weren't in it, so it can be saved and used to convert
+    more files for the same model
+    :type binary: bool
+    :param binary: if True, the files are written in the binary format of
+    libFM (see BinaryRowWriter) instead of in the text format
 
     :rtype int
     :return the number of variables in the model
@@ -35,134 +209,211 @@ def csv_to_libfm(
     if delete_columns is None:
         delete_columns = []
 
-    csv_reader_list = [
-        csv.reader(open(input_file, 'r'), delimiter=delimiter)
-        for input_file in input_files
-        ]
+    with open(input_files[0], 'r') as read_file:
+        num_columns = len(next(csv.reader(read_file, delimiter=delimiter)))
+    static_columns = get_static_columns(
+        num_columns, target_column, one_hot_columns, delete_columns)
+
+    if feature_dictionary is None:
+        feature_dictionary = FeatureDictionary(static_columns)
+    elif feature_dictionary.static_columns != static_columns:
+        raise ValueError(
+            'The static columns of the feature dictionary %s are not the '
+            'static columns of the files %s' %
+            (feature_dictionary.static_columns, static_columns))
+
+    row_writer_class = BinaryRowWriter if binary else TextRowWriter
+    static_ids = range(len(static_columns))
+    one_hot_values = ['1'] * len(one_hot_columns)
+
+    for input_file in input_files:
+        row_writer = row_writer_class(input_file + suffix)
+        try:
+            with open(input_file, 'r') as read_file:
+                csv_reader = csv.reader(read_file, delimiter=delimiter)
+                if has_header:
+                    next(csv_reader)
+
+                for row in csv_reader:
+                    feature_ids = static_ids + [
+                        feature_dictionary.get_id(column, row[column])
+                        for column in one_hot_columns]
+                    values = \
+                        [row[column] for column in static_columns] + \
+                        one_hot_values
+                    row_writer.write_row(
+                        row[target_column], feature_ids, values)
+        finally:
+            row_writer.close(feature_dictionary.num_features)
+
+    print('Number of variables in the model: %d' %
+          feature_dictionary.num_features)
+
+    return feature_dictionary.num_features
+
+
+def rows_to_matrices(
+        data_matrix_list, target_column, one_hot_columns, delete_columns=None):
+    """
+    Builds in memory the same design matrices that csv_to_libfm writes to the
+    libFM files, with the same indices for the variables, so the data can be
+    given directly to an in-process factorization machine
 
-    data_matrix_list = []
+    :type data_matrix_list: list[list[list]]
+    :param data_matrix_list: a list of data sets, each one of them is a list
+    with the rows of a CSV file without the header
+    :type target_column: int
+    :param target_column: the index of the column that contains the target
+    :type one_hot_columns: list[int]
+    :param one_hot_columns: the columns that are encoded with one-hot vectors
+    :type delete_columns: list[int]
+    :param delete_columns: the columns that are to be excluded
+    :rtype: (list[(scipy.sparse.csr_matrix, numpy.ndarray)], int)
+    :return: a tuple with the list of (design matrix, targets) pairs, one for
+    each data set, and the number of variables in the model
+    """
 
-    for csv_reader in csv_reader_list:
-        if has_header:
-            next(csv_reader)
-        data_matrix_list.append(list(csv_reader))
+    if delete_columns is None:
+        delete_columns = []
 
-    # The static columns are that ones that are not going to be deleted, don't
-    # belong to the one-hot columns or the target column
-    all_columns = range(len(data_matrix_list[0][0]))
-    static_columns = set(all_columns).difference(
-        [target_column], one_hot_columns, delete_columns)
+    static_columns = get_static_columns(
+        len(data_matrix_list[0][0]), target_column, one_hot_columns,
+        delete_columns)
 
-    id_counter = 0
-    output_row_list = []
+    feature_dictionary = FeatureDictionary(static_columns)
+    entries_list = []
 
-    # Do the target column
     for data_matrix in data_matrix_list:
-        output_rows = []
-        for row_index in range(len(data_matrix)):
-            output_rows.append(str(data_matrix[row_index][target_column]))
-        output_row_list.append(output_rows)
-
-    # Do the static columns
-    for column_index in static_columns:
-
-        for data_matrix, output_rows in zip(data_matrix_list, output_row_list):
-            column = get_column(data_matrix, column_index)
-
-            for row_index in range(len(data_matrix)):
-                output_rows[row_index] +=\
-                    " " + str(id_counter) + ":" + str(column[row_index])
-
-        id_counter += 1
-
-    vector_map = {}
+        num_rows = len(data_matrix)
+        targets = numpy.array(
+            [row[target_column] for row in data_matrix], dtype=float)
+
+        rows = [numpy.repeat(numpy.arange(num_rows), len(static_columns))]
+        columns = [numpy.tile(numpy.arange(len(static_columns)), num_rows)]
+        values = [numpy.array(
+            [[row[column] for column in static_columns]
+             for row in data_matrix], dtype=float).ravel()]
+
+        vector_ids = [
+            feature_dictionary.get_id(column_index, row[column_index])
+            for row in data_matrix for column_index in one_hot_columns]
+        rows.append(numpy.repeat(numpy.arange(num_rows), len(one_hot_columns)))
+        columns.append(numpy.array(vector_ids, dtype=int))
+        values.append(numpy.ones(len(vector_ids)))
+
+        entries_list.append((
+            numpy.concatenate(values), numpy.concatenate(rows),
+            numpy.concatenate(columns), num_rows, targets))
+
+    id_counter = feature_dictionary.num_features
+    matrices = []
+    for values, rows, columns, num_rows, targets in entries_list:
+        x_matrix = sparse.csr_matrix(
+            (values, (rows, columns)), shape=(num_rows, id_counter))
+        x_matrix.eliminate_zeros()
+        matrices.append((x_matrix, targets))
 
-    # Do the one-hot columns
-    for data_matrix, output_rows in zip(data_matrix_list, output_row_list):
-        for column_index in one_hot_columns:
-            column = get_column(data_matrix, column_index)
-
-            for row_index in range(len(data_matrix)):
-                vector_key = str(column_index) + " : " + str(column[row_index])
-
-                if vector_key not in vector_map:
-                    vector_map[vector_key] = id_counter
-                    id_counter += 1
+    print('Number of variables in the model: %d' % id_counter)
 
-                output_rows[row_index] += " " + str(vector_map[vector_key]) + ":1"
+    return matrices, id_counter
 
-    for input_file, output_rows in zip(input_files, output_row_list):
-        with open(input_file + suffix, 'w') as write_file:
-            for row in output_rows:
-                write_file.write("%s\n" % row)
 
-    print('Number of variables in the model: %d' % id_counter)
+def load_libfm_model(libfm_model_file, num_variables_in_model):
+    """
+    Loads the parameters of a model saved by libFM with the -save_model
+    option. Every section of the file is parsed with a single call to numpy
+
+    :type libfm_model_file: str
+    :type num_variables_in_model: int
+    :rtype: (float, numpy.ndarray, numpy.ndarray)
+    :return: the global bias w0, the vector w with the weights of the
+    variables and the (variables x factors) matrix V with their factors
+    """
 
-    return id_counter
+    with open(libfm_model_file, 'r') as model_file:
+        # The sections are the global bias, the unary interactions and the
+        # pairwise interactions, each one of them after a line with its title
+        sections = [
+            section.partition('\n')[2]
+            for section in model_file.read().split('#')[1:]]
 
+    w0_section, w_section, v_section = sections
+    w0 = float(w0_section)
+    w = numpy.fromstring(w_section, sep=' ')
+    V = numpy.fromstring(v_section, sep=' ')
 
-def get_column(matrix, i):
-    return [row[i] for row in matrix]
+    if len(w) != num_variables_in_model:
+        raise ValueError(
+            'The model has %d variables instead of %d' %
+            (len(w), num_variables_in_model))
 
+    return w0, w, V.reshape(num_variables_in_model, -1)
 
-def load_libfm_model(libfm_model_file, num_variables_in_model):
 
-    w = numpy.zeros(num_variables_in_model)
-    V = numpy.zeros((num_variables_in_model, Constants.FM_NUM_FACTORS))
+def load_libfm_file(file_name, num_variables_in_model):
+    """
+    Loads a file in the text format of libFM. The file is read in chunks of
+    lines and every chunk is parsed with a single call to numpy
 
-    with open(libfm_model_file, 'r') as model_file:
+    :type file_name: str
+    :type num_variables_in_model: int
+    :rtype: (scipy.sparse.csr_matrix, numpy.ndarray)
+    :return: a tuple with the design matrix and the targets
+    """
 
-        index = 0
-        lines = model_file.readlines()
-
-        # print(lines[index])
-        # if line == '#global bias W0':
-        # print('w000000')
-        index += 1
-        w0 = float(lines[index])
-        print(w0)
-        index += 1
-        index += 1
-        # if line == '#unary interactions Wj':
-        # model_file.readline()
-        for j in range(num_variables_in_model):
-            w[j] = lines[index]
-            index += 1
-        # if line == 'pairwise interactions Vj,f':
-        # model_file.readline()
-        index += 1
-        for j in range(num_variables_in_model):
-            factors = lines[index].split()
-            index += 1
-            for f in range(len(factors)):
-                V[j, f] = factors[f]
-
-    print('w0', w0)
-    print('w', w)
-    print('V', V)
-
-    return w0, w, V
+    targets_list = [numpy.zeros(0)]
+    ids_list = [numpy.zeros(0, dtype=int)]
+    values_list = [numpy.zeros(0)]
+    row_lengths_list = [numpy.zeros(0, dtype=int)]
+
+    with open(file_name, 'r') as read_file:
+        while True:
+            lines = list(itertools.islice(read_file, LINES_CHUNK_SIZE))
+            if not lines:
+                break
+            lines = [line for line in lines if line.strip()]
+
+            # Every row is the target followed by (id, value) pairs
+            row_lengths = numpy.array(
+                [line.count(':') for line in lines], dtype=int)
+            numbers = numpy.fromstring(
+                ' '.join(lines).replace(':', ' '), sep=' ')
+            target_positions = numpy.cumsum(2 * row_lengths + 1) - \
+                (2 * row_lengths + 1)
+            is_entry = numpy.ones(len(numbers), dtype=bool)
+            is_entry[target_positions] = False
+            entries = numbers[is_entry]
+
+            targets_list.append(numbers[target_positions])
+            ids_list.append(entries[::2].astype(int))
+            values_list.append(entries[1::2])
+            row_lengths_list.append(row_lengths)
+
+    row_lengths = numpy.concatenate(row_lengths_list)
+    indptr = numpy.concatenate(([0], numpy.cumsum(row_lengths)))
+    x_matrix = sparse.csr_matrix(
+        (numpy.concatenate(values_list), numpy.concatenate(ids_list), indptr),
+        shape=(len(row_lengths), num_variables_in_model))
+
+    return x_matrix, numpy.concatenate(targets_list)
 
 
 def load_test_file(file_name, num_variables_in_model):
+    """
+    Loads the design matrix of a file in the text format of libFM
 
-    with open(file_name, 'r') as model_file:
-        row_index = 0
-        lines = model_file.readlines()
-        # x_list = numpy.zeros((len(lines), num_variables_in_model))
-        x_list = sparse.lil_matrix((len(lines), num_variables_in_model))
-
-        for line in lines:
-            entries = line.split(' ')[1:]
-
-            for entry in entries:
-                print('entry: %s' % entry)
-                column_index = entry.split(':')[0]
-                cell_value = entry.split(':')[1]
-                x_list[row_index, column_index] = cell_value
+    :rtype: scipy.sparse.csr_matrix
+    """
+    return load_libfm_file(file_name, num_variables_in_model)[0]
 
-            row_index += 1
 
-    print(x_list)
+def load_predictions(predictions_file):
+    """
+    Loads the predictions written by libFM with the -out option, one for each
+    line
 
-    return x_list
+    :type predictions_file: str
+    :rtype: numpy.ndarray
+    """
+    with open(predictions_file, 'r') as read_file:
+        return numpy.fromstring(read_file.read(), sep=' ')
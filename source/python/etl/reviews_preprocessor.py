@@ -8,7 +8,6 @@ from langdetect import DetectorFactory
 from langdetect.lang_detect_exception import LangDetectException
 import numpy
 from gensim import corpora
-from nltk import PerceptronTagger
 from nltk.corpus import stopwords
 
 from etl import ETLUtils
@@ -22,11 +21,93 @@ from topicmodeling.context.context_transformer import ContextTransformer
 from topicmodeling.context.reviews_classifier import ReviewsClassifier
 from topicmodeling.nmf_topic_extractor import NmfTopicExtractor
 from tripadvisor.fourcity import extractor
+from utils import artifact_cache
 from utils import utilities
 from utils.constants import Constants
 from utils.utilities import all_context_words
 
 
+# The properties read to train the topic model on the first half of the
+# records and to find the topic distributions of the second half
+RECSYS_TOPICS_PROPERTIES = [
+    Constants.TOPIC_MODEL_TYPE_FIELD,
+    Constants.TOPIC_MODEL_NUM_TOPICS_FIELD,
+    Constants.TOPIC_MODEL_PASSES_FIELD,
+    Constants.TOPIC_MODEL_ITERATIONS_FIELD,
+    Constants.TOPIC_MODEL_FOLDS_FIELD,
+    Constants.TOPIC_MODEL_TARGET_REVIEWS_FIELD,
+    Constants.TOPIC_MODEL_NORMALIZE_FIELD,
+    Constants.MIN_DICTIONARY_WORD_COUNT_FIELD,
+    Constants.MAX_DICTIONARY_WORD_COUNT_FIELD,
+]
+# The properties read to find the contextual topics of the records
+RECSYS_CONTEXT_PROPERTIES = [
+    Constants.TOPIC_MODEL_TARGET_REVIEWS_FIELD,
+    Constants.TOPIC_WEIGHTING_METHOD_FIELD,
+    Constants.CONTEXT_EXTRACTOR_ALPHA_FIELD,
+    Constants.CONTEXT_EXTRACTOR_BETA_FIELD,
+    Constants.CONTEXT_EXTRACTOR_EPSILON_FIELD,
+    Constants.LDA_BETA_COMPARISON_OPERATOR_FIELD,
+]
+
+
+def plant_langdetect_seed():
+    DetectorFactory.seed = Constants.LANGDETECT_SEED
+
+
+def detect_languages(texts):
+    """
+    Detects the language of each one of the given texts. This function is
+    used as the unit of work when the reviews are tagged in parallel
+
+    :type texts: list[str]
+    :param texts: the texts of the reviews
+    :rtype: list[str]
+    :return: the language of each text, or 'unknown' if it couldn't be
+    detected
+    """
+    languages = []
+    for text in texts:
+        try:
+            language = langdetect.detect(text)
+        except LangDetectException:
+            language = 'unknown'
+        languages.append(language)
+
+    return languages
+
+
+def lemmatize_texts(texts):
+    return nlp_utils.get_default_pipeline().lemmatize_many(texts)
+
+
+def lemmatize_texts_sentences(texts):
+    """
+    Splits each one of the given texts into sentences (up to the number of
+    sentences given by Constants.DOCUMENT_LEVEL) and lemmatizes them
+
+    :type texts: list[str]
+    :param texts: the texts of the reviews
+    :rtype: list[list[(str, list)]]
+    :return: for every text, a list of pairs with the sentence and its
+    lemmatized words
+    """
+    document_level = Constants.DOCUMENT_LEVEL
+    texts_sentences = []
+
+    for text in texts:
+        lemmatized_sentences = []
+        for sentence in nlp_utils.get_sentences(text):
+            if isinstance(document_level, (int, float)) and\
+                    len(lemmatized_sentences) >= document_level:
+                break
+            lemmatized_sentences.append(
+                (sentence, nlp_utils.lemmatize_sentence(sentence)))
+        texts_sentences.append(lemmatized_sentences)
+
+    return texts_sentences
+
+
 class ReviewsPreprocessor:
 
     def __init__(self, use_cache=False):
@@ -35,56 +116,68 @@ class ReviewsPreprocessor:
         self.dictionary = None
 
     def load_records(self):
+        """
+        Streams the raw records file and transforms every record as soon as it
+        is read, so the raw records (which contain many fields that are not
+        used) are never held in memory all at once
+        """
         print('%s: load records' % time.strftime("%Y/%m/%d-%H:%M:%S"))
-        self.records = ETLUtils.load_json_file(Constants.RECORDS_FILE)
+        self.records = [
+            self.transform_record(record) for record in
+            ETLUtils.iter_json_file(Constants.RECORDS_FILE)
+        ]
 
     def shuffle_records(self):
         print('%s: shuffle records' % time.strftime("%Y/%m/%d-%H:%M:%S"))
         random.shuffle(self.records)
         self.records = self.records
 
-    def transform_yelp_records(self):
-        new_records = []
-
-        for record in self.records:
+    @staticmethod
+    def transform_yelp_record(record):
 
-            user_id = record['user_id']
-            item_id = record['business_id']
+        user_id = record['user_id']
+        item_id = record['business_id']
 
-            new_records.append(
-                {
-                    Constants.REVIEW_ID_FIELD: record['review_id'],
-                    Constants.USER_ID_FIELD: user_id,
-                    Constants.ITEM_ID_FIELD: item_id,
-                    Constants.RATING_FIELD: record['stars'],
-                    Constants.TEXT_FIELD: record['text'],
-                    Constants.USER_ITEM_KEY_FIELD: '%s|%s' %
-                                                   (str(user_id), str(item_id)),
-                }
-            )
+        return {
+            Constants.REVIEW_ID_FIELD: record['review_id'],
+            Constants.USER_ID_FIELD: user_id,
+            Constants.ITEM_ID_FIELD: item_id,
+            Constants.RATING_FIELD: record['stars'],
+            Constants.TEXT_FIELD: record['text'],
+            Constants.USER_ITEM_KEY_FIELD: '%s|%s' %
+                                           (str(user_id), str(item_id)),
+        }
 
-        self.records = new_records
+    @staticmethod
+    def transform_fourcity_record(record):
 
-    def transform_fourcity_records(self):
-        new_records = []
+        user_id = record['author']['id']
+        item_id = record['offering_id']
 
-        for record in self.records:
+        return {
+            Constants.REVIEW_ID_FIELD: record['id'],
+            Constants.USER_ID_FIELD: user_id,
+            Constants.ITEM_ID_FIELD: item_id,
+            Constants.RATING_FIELD: record['ratings']['overall'],
+            Constants.TEXT_FIELD: record['text'],
+            Constants.USER_ITEM_KEY_FIELD: '%s|%s' % (user_id, item_id),
+        }
 
-            user_id = record['author']['id']
-            item_id = record['offering_id']
+    @staticmethod
+    def transform_record(record):
+        if 'yelp' in Constants.ITEM_TYPE:
+            return ReviewsPreprocessor.transform_yelp_record(record)
+        elif 'fourcity' in Constants.ITEM_TYPE:
+            return ReviewsPreprocessor.transform_fourcity_record(record)
+        return record
 
-            new_records.append(
-                {
-                    Constants.REVIEW_ID_FIELD: record['id'],
-                    Constants.USER_ID_FIELD: user_id,
-                    Constants.ITEM_ID_FIELD: item_id,
-                    Constants.RATING_FIELD: record['ratings']['overall'],
-                    Constants.TEXT_FIELD: record['text'],
-                    Constants.USER_ITEM_KEY_FIELD: '%s|%s' % (user_id, item_id),
-                }
-            )
+    def transform_yelp_records(self):
+        self.records = [
+            self.transform_yelp_record(record) for record in self.records]
 
-        self.records = new_records
+    def transform_fourcity_records(self):
+        self.records = [
+            self.transform_fourcity_record(record) for record in self.records]
 
     def transform_records(self):
         if 'yelp' in Constants.ITEM_TYPE:
@@ -137,13 +230,12 @@ class ReviewsPreprocessor:
                 ETLUtils.load_json_file(Constants.LANGUAGE_RECORDS_FILE)
             return
 
-        DetectorFactory.seed = 0
+        texts = [record[Constants.TEXT_FIELD] for record in self.records]
+        languages = utilities.map_shards(
+            detect_languages, texts, Constants.PREPROCESSING_NUM_WORKERS,
+            plant_langdetect_seed)
 
-        for record in self.records:
-            try:
-                language = langdetect.detect(record[Constants.TEXT_FIELD])
-            except LangDetectException:
-                language = 'unknown'
+        for record, language in zip(self.records, languages):
             record[Constants.LANGUAGE_FIELD] = language
 
         ETLUtils.save_json_file(Constants.LANGUAGE_RECORDS_FILE, self.records)
@@ -276,11 +368,11 @@ class ReviewsPreprocessor:
     @staticmethod
     def pos_tag_reviews(records):
         print('%s: tag reviews' % time.strftime("%Y/%m/%d-%H:%M:%S"))
-        tagger = PerceptronTagger()
 
-        for record in records:
-            tagged_words =\
-                nlp_utils.tag_words(record[Constants.TEXT_FIELD], tagger)
+        texts = [record[Constants.TEXT_FIELD] for record in records]
+        all_tagged_words = nlp_utils.get_default_pipeline().tag_many(texts)
+
+        for record, tagged_words in zip(records, all_tagged_words):
             record[Constants.POS_TAGS_FIELD] = tagged_words
 
     @staticmethod
@@ -294,35 +386,29 @@ class ReviewsPreprocessor:
         """
         print('%s: lemmatize reviews' % time.strftime("%Y/%m/%d-%H:%M:%S"))
 
-        record_index = 0
-        for record in records:
-            #
-
-            tagged_words =\
-                nlp_utils.lemmatize_text(record[Constants.TEXT_FIELD])
+        texts = [record[Constants.TEXT_FIELD] for record in records]
+        all_tagged_words = utilities.map_shards(
+            lemmatize_texts, texts, Constants.PREPROCESSING_NUM_WORKERS)
 
+        for record, tagged_words in zip(records, all_tagged_words):
             record[Constants.POS_TAGS_FIELD] = tagged_words
-            record_index += 1
 
         return records
-        # print('')
 
     @staticmethod
     def lemmatize_sentences(records):
         print('%s: lemmatize sentences' % time.strftime("%Y/%m/%d-%H:%M:%S"))
 
+        texts = [record[Constants.TEXT_FIELD] for record in records]
+        all_lemmatized_sentences = utilities.map_shards(
+            lemmatize_texts_sentences, texts,
+            Constants.PREPROCESSING_NUM_WORKERS)
+
         sentence_records = []
-        record_index = 0
-        document_level = Constants.DOCUMENT_LEVEL
-        for record in records:
-            sentences = \
-                nlp_utils.get_sentences(record[Constants.TEXT_FIELD])
+        for record, lemmatized_sentences in zip(
+                records, all_lemmatized_sentences):
             sentence_index = 0
-            for sentence in sentences:
-                if isinstance(document_level, (int, float)) and\
-                        sentence_index >= document_level:
-                    break
-                tagged_words = nlp_utils.lemmatize_sentence(sentence)
+            for sentence, tagged_words in lemmatized_sentences:
                 sentence_record = {}
                 sentence_record.update(record)
                 sentence_record[Constants.TEXT_FIELD] = sentence
@@ -330,9 +416,6 @@ class ReviewsPreprocessor:
                 sentence_record[Constants.POS_TAGS_FIELD] = tagged_words
                 sentence_records.append(sentence_record)
                 sentence_index += 1
-                # print(sentence_record)
-            record_index += 1
-            # print('\rrecord index: %d/%d' % (record_index, len(records))),
         return sentence_records
 
     def lemmatize_records(self):
@@ -464,10 +547,11 @@ class ReviewsPreprocessor:
 
     def export_records(self):
         print('%s: export records' % time.strftime("%Y/%m/%d-%H:%M:%S"))
-        ETLUtils.save_json_file(
+        ETLUtils.write_json_stream(
             Constants.FULL_PROCESSED_RECORDS_FILE, self.records)
         self.drop_unnecessary_fields()
-        ETLUtils.save_json_file(Constants.PROCESSED_RECORDS_FILE, self.records)
+        ETLUtils.save_records_file(
+            Constants.PROCESSED_RECORDS_FILE, self.records)
 
     def label_review_targets(self):
 
@@ -488,7 +572,7 @@ class ReviewsPreprocessor:
               % time.strftime("%Y/%m/%d-%H:%M:%S"))
 
         if Constants.TOPIC_MODEL_TYPE == 'lda':
-            topic_model = topic_model_creator.load_topic_model(None, None)
+            topic_model = topic_model_creator.load_lda_topic_model()
             corpus = [record[Constants.CORPUS_FIELD] for record in records]
             lda_context_utils.update_reviews_with_topics(
                 topic_model, corpus, records)
@@ -565,27 +649,37 @@ class ReviewsPreprocessor:
 
         topic_model_creator.train_topic_model(topic_model_records)
 
-        if os.path.exists(Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE):
-            print('Recsys topic records have already been generated')
-            recsys_records = ETLUtils.load_json_file(
-                Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE)
-        else:
-            recsys_records = self.records[num_records / 2:]
-            self.find_topic_distribution(recsys_records)
-            ETLUtils.save_json_file(
-                Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE, recsys_records)
-
-        if os.path.exists(Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE):
-            print('Recsys contextual records have already been generated')
-            print(Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE)
-            recsys_records = ETLUtils.load_json_file(
-                Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE)
-        else:
+        # The topic distributions and the contextual topics are reused when
+        # they were computed from the same records with the same properties,
+        # and they are always exported to the files the next stages read
+        cache = artifact_cache.get_artifact_cache()
+        records_hash = artifact_cache.hash_records(self.records)
+        topics_key = artifact_cache.generate_key(
+            'recsys_topic_records', [records_hash],
+            artifact_cache.get_properties(RECSYS_TOPICS_PROPERTIES))
+
+        def find_recsys_topics():
+            records = self.records[num_records / 2:]
+            self.find_topic_distribution(records)
+            return records
+
+        recsys_records = cache.get_or_create(
+            'recsys_topic_records', [records_hash], RECSYS_TOPICS_PROPERTIES,
+            find_recsys_topics, ETLUtils.write_json_stream,
+            ETLUtils.load_json_file, 'json')
+        ETLUtils.save_records_file(
+            Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE, recsys_records)
+
+        def update_recsys_context_topics():
             self.update_context_topics(recsys_records)
-            ETLUtils.save_json_file(
-                Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE,
-                recsys_records
-            )
+            return recsys_records
+
+        recsys_records = cache.get_or_create(
+            'recsys_contextual_records', [topics_key],
+            RECSYS_CONTEXT_PROPERTIES, update_recsys_context_topics,
+            ETLUtils.write_json_stream, ETLUtils.load_json_file, 'json')
+        ETLUtils.save_records_file(
+            Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE, recsys_records)
 
         context_transformer = ContextTransformer(recsys_records)
         context_transformer.load_data()
@@ -665,7 +759,6 @@ class ReviewsPreprocessor:
     def preprocess(self):
 
         self.load_records()
-        self.transform_records()
         self.summarize_dataset()
         self.add_integer_ids()
         self.clean_reviews()
@@ -702,7 +795,7 @@ class ReviewsPreprocessor:
                 os.path.exists(Constants.PROCESSED_RECORDS_FILE):
             print('Records have already been processed')
             self.records = \
-                ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
+                ETLUtils.load_records_file(Constants.PROCESSED_RECORDS_FILE)
         else:
             self.preprocess()
 
@@ -1,4 +1,9 @@
+import os
+import shutil
+import tempfile
+
 from etl import ETLUtils
+from etl.etl_utils import ColumnarRecords
 
 __author__ = 'fpena'
 
@@ -108,4 +113,181 @@ class TestETLUtils(TestCase):
 
         self.assertEqual(expected_result, actual_result)
 
+    def test_write_json_stream(self):
+
+        folder = tempfile.mkdtemp()
+        file_path = os.path.join(folder, 'records.json')
+
+        try:
+            num_records = ETLUtils.write_json_stream(
+                file_path, iter(reviews_matrix_5_short), batch_size=2)
+            self.assertEqual(len(reviews_matrix_5_short), num_records)
+            self.assertEqual(
+                reviews_matrix_5_short, ETLUtils.load_json_file(file_path))
+
+            ETLUtils.write_json_stream(
+                file_path, reviews_matrix_5_users, append=True)
+            self.assertEqual(
+                reviews_matrix_5_short + reviews_matrix_5_users,
+                ETLUtils.load_json_file(file_path))
+        finally:
+            shutil.rmtree(folder)
+
+    def test_iter_json_file(self):
+
+        folder = tempfile.mkdtemp()
+        file_path = os.path.join(folder, 'records.json')
+
+        try:
+            ETLUtils.save_json_file(file_path, reviews_matrix_5_short)
+
+            self.assertEqual(
+                reviews_matrix_5_short,
+                list(ETLUtils.iter_json_file(file_path)))
+
+            batches = list(ETLUtils.iter_json_file(file_path, batch_size=4))
+            self.assertEqual([4, 4, 1], [len(batch) for batch in batches])
+            self.assertEqual(
+                reviews_matrix_5_short,
+                [record for batch in batches for record in batch])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_save_columnar_file(self):
+
+        records = [
+            {
+                'review_id': u'R1', 'user_integer_id': 0, 'stars': 4.0,
+                'has_context': True, 'bow': [u'room', u'pool'],
+                'corpus': [[0, 1], [3, 2]], 'topics': [[0, 0.25], [1, 0.75]],
+                'context_topics': {u'topic_01': 0.75, u'nocontexttopics': 0.25}
+            },
+            {
+                'review_id': u'R2 \u00e9', 'user_integer_id': 1, 'stars': 2.0,
+                'has_context': False, 'bow': [],
+                'corpus': [], 'topics': [[0, 0.5], [1, 0.5]],
+                'context_topics': {u'topic_01': 0.5, u'nocontexttopics': 0.5}
+            }
+        ]
+
+        folder = tempfile.mkdtemp()
+
+        try:
+            ETLUtils.save_columnar_file(folder, records)
+            self.assertEqual(
+                records, ETLUtils.load_columnar_records(folder))
+
+            columns = ETLUtils.load_columnar_file(
+                folder, ['user_integer_id', 'topics'])
+            self.assertEqual(['topics', 'user_integer_id'], sorted(columns))
+            self.assertEqual([0, 1], columns['user_integer_id'].tolist())
+            self.assertEqual([[0, 0.5], [1, 0.5]], columns['topics'][1])
+            self.assertRaises(
+                ValueError, ETLUtils.load_columnar_file, folder, ['text'])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_columnar_file_types(self):
+
+        records = [
+            {
+                'user_id': u'U1', 'count': 1, 'optional_count': 3,
+                'mixed': 1, 'flag': True, 'big': 2 ** 63,
+                'pair': (1, 2), 'pairs': ((0, 0.5),),
+                'pair_list': [(0, 0.5)], 'tags': [u'a'], 'extra': None
+            },
+            {
+                'user_id': u'U2', 'count': 2, 'optional_count': None,
+                'mixed': 2.5, 'flag': False, 'big': 1,
+                'pair': (2, 3), 'pairs': ((1, 0.25), (2, 0.75)),
+                'pair_list': [], 'tags': [u'b', 3], 'extra': {u'k': [1]}
+            }
+        ]
+
+        folder = tempfile.mkdtemp()
+
+        try:
+            ETLUtils.save_columnar_file(folder, records)
+            loaded_records = ETLUtils.load_columnar_records(folder)
+            self.assertEqual(records, loaded_records)
+            # repr tells apart 1 from 1.0 and True, and tuples from lists
+            for record, loaded_record in zip(records, loaded_records):
+                for field, value in record.items():
+                    self.assertEqual(repr(value), repr(loaded_record[field]))
+
+            self.assertRaises(
+                ValueError, ETLUtils.save_columnar_file, folder,
+                [{'user_id': u'U1'}, {'offering_id': 1}])
+            self.assertRaises(
+                ValueError, ETLUtils.save_columnar_file, folder,
+                [{'tags': [u'a', (1, 2)]}])
+            self.assertRaises(
+                ValueError, ETLUtils.save_columnar_file, folder,
+                [{'big': 2 ** 70}])
+            # A failed save leaves the previous columns untouched
+            self.assertEqual(
+                loaded_records, ETLUtils.load_columnar_records(folder))
+            self.assertEqual([], [
+                name for name in os.listdir(os.path.dirname(folder))
+                if name.startswith(os.path.basename(folder) + '.')])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_columnar_records(self):
+
+        folder = tempfile.mkdtemp()
+
+        try:
+            ETLUtils.save_columnar_file(folder, reviews_matrix_5_short)
+            records = ColumnarRecords(ETLUtils.load_columnar_file(folder))
+            self.assertEqual(len(reviews_matrix_5_short), len(records))
+            self.assertEqual(reviews_matrix_5_short, list(records))
+            self.assertEqual(
+                repr(reviews_matrix_5_short[3]['overall_rating']),
+                repr(records[3]['overall_rating']))
+
+            # Every access builds a new record
+            records[0]['overall_rating'] = 1.0
+            self.assertEqual(5.0, records[0]['overall_rating'])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_load_records_file(self):
+
+        folder = tempfile.mkdtemp()
+        file_path = os.path.join(folder, 'records.json')
+
+        try:
+            ETLUtils.save_json_file(file_path, reviews_matrix_5_short)
+            self.assertEqual(
+                reviews_matrix_5_users,
+                ETLUtils.load_records_file(file_path, ['user_id']))
+
+            ETLUtils.save_records_file(file_path, reviews_matrix_5_short)
+            self.assertTrue(
+                os.path.isdir(ETLUtils.get_columnar_folder(file_path)))
+            self.assertEqual(
+                reviews_matrix_5_short, ETLUtils.load_records_file(file_path))
+            self.assertEqual(
+                reviews_matrix_5_users,
+                ETLUtils.load_records_file(file_path, ['user_id']))
+            self.assertEqual(['records.json', 'records_columns'],
+                             sorted(os.listdir(folder)))
+
+            # The columns are ignored once the JSON file changes
+            ETLUtils.save_json_file(file_path, reviews_matrix_5_short[:2])
+            self.assertFalse(ETLUtils.is_columnar_file_current(file_path))
+            self.assertEqual(
+                reviews_matrix_5_short[:2],
+                ETLUtils.load_records_file(file_path))
+
+            # Records with different keys are only saved as JSON
+            records = [{'user_id': u'U1'}, {'offering_id': 1}]
+            ETLUtils.save_records_file(file_path, records)
+            self.assertFalse(
+                os.path.exists(ETLUtils.get_columnar_folder(file_path)))
+            self.assertEqual(records, ETLUtils.load_records_file(file_path))
+        finally:
+            shutil.rmtree(folder)
+
     # def
@@ -1,31 +1,155 @@
 import filecmp
 import os
+import shutil
+import struct
+import tempfile
+
+import numpy
+from etl import libfm_converter
 from etl.libfm_converter import csv_to_libfm
+from etl.libfm_converter import FeatureDictionary
 from unittest import TestCase
 
 __author__ = 'fpena'
 
 
-folder = '/Users/fpena/UCC/Thesis/projects/yelp/source/python/etl/tests/'
+folder = os.path.dirname(os.path.abspath(__file__)) + '/'
+
+
+def write_lines(file_path, lines):
+    with open(file_path, 'w') as write_file:
+        for line in lines:
+            write_file.write(line + '\n')
+
+
+def read_binary_file(file_path):
+    """
+    Reads the rows of a file written in the binary format of libFM
+    """
+    with open(file_path + '.x', 'rb') as read_file:
+        content = read_file.read()
+    file_id, float_size, num_values, num_rows, num_columns = \
+        struct.unpack_from('<IIQII', content)
+    offset = struct.calcsize('<IIQII')
+    rows = []
+    for row in range(num_rows):
+        num_entries = struct.unpack_from('<I', content, offset)[0]
+        offset += 4
+        entries = struct.unpack_from('<' + 'If' * num_entries, content, offset)
+        offset += 8 * num_entries
+        rows.append(zip(entries[::2], entries[1::2]))
+
+    with open(file_path + '.y', 'rb') as read_file:
+        content = read_file.read()
+    num_targets = struct.unpack_from('<I', content)[0]
+    targets = struct.unpack_from('<' + 'f' * num_targets, content, 4)
+
+    return file_id, num_values, num_columns, rows, list(targets)
 
 
 class TestLibfmConverter(TestCase):
 
-    def test_csv_to_libfm(self):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + '/'
+        self.train_file = self.folder + 'train.csv'
+        self.test_file = self.folder + 'test.csv'
+        write_lines(self.train_file, [
+            'rating,user,item,weight', '5,U1,I1,0.5', '3,U2,I1,0'])
+        write_lines(self.test_file, ['rating,user,item,weight', '4,U1,I2,1'])
 
-        input_file = folder + 'yelp.csv_train_0'
-        expected_file = input_file + ".libfm"
-        output_file = expected_file + "_test"
+    def tearDown(self):
+        shutil.rmtree(self.folder)
 
-        if os.path.isfile(output_file):
-            os.remove(output_file)
+    def test_csv_to_libfm(self):
+
+        input_file = self.folder + 'yelp.csv_train_0'
+        shutil.copy(folder + 'yelp.csv_train_0', input_file)
+        expected_file = folder + 'yelp.csv_train_0.libfm'
+        output_file = input_file + '.libfm'
 
-        delete_columns = []
         csv_to_libfm(
-            input_file, output_file, 2, delete_columns=delete_columns,
-            delimiter=',', has_header=True)
+            [input_file], 2, [0, 1], delimiter=',', has_header=True)
 
         self.assertTrue(filecmp.cmp(output_file, expected_file))
 
-        if os.path.isfile(output_file):
-            os.remove(output_file)
+    def test_feature_dictionary(self):
+        num_variables = csv_to_libfm(
+            [self.train_file, self.test_file], 0, [1, 2], has_header=True)
+        self.assertEqual(5, num_variables)
+        with open(self.train_file + '.libfm') as read_file:
+            self.assertEqual(
+                ['5 0:0.5 1:1 2:1', '3 0:0 3:1 2:1'],
+                read_file.read().splitlines())
+        with open(self.test_file + '.libfm') as read_file:
+            self.assertEqual(['4 0:1 1:1 4:1'], read_file.read().splitlines())
+
+        # Converting the files one at a time with a saved dictionary gives
+        # the same indices
+        dictionary_file = self.folder + 'dictionary.csv'
+        feature_dictionary = FeatureDictionary([3])
+        csv_to_libfm(
+            [self.train_file], 0, [1, 2], has_header=True, suffix='.train',
+            feature_dictionary=feature_dictionary)
+        feature_dictionary.save(dictionary_file)
+        self.assertEqual(
+            num_variables,
+            csv_to_libfm(
+                [self.test_file], 0, [1, 2], has_header=True, suffix='.test',
+                feature_dictionary=FeatureDictionary.load(dictionary_file)))
+        self.assertTrue(filecmp.cmp(
+            self.train_file + '.libfm', self.train_file + '.train'))
+        self.assertTrue(filecmp.cmp(
+            self.test_file + '.libfm', self.test_file + '.test'))
+
+        self.assertRaises(
+            ValueError, csv_to_libfm, [self.test_file], 0, [1],
+            has_header=True, feature_dictionary=feature_dictionary)
+
+    def test_binary(self):
+        csv_to_libfm(
+            [self.train_file, self.test_file], 0, [1, 2], has_header=True,
+            binary=True)
+
+        file_id, num_values, num_columns, rows, targets = \
+            read_binary_file(self.train_file + '.libfm')
+        self.assertEqual(libfm_converter.LIBFM_BINARY_FILE_ID, file_id)
+        self.assertEqual(6, num_values)
+        self.assertEqual(4, num_columns)
+        self.assertEqual(
+            [[(0, 0.5), (1, 1), (2, 1)], [(0, 0), (3, 1), (2, 1)]], rows)
+        self.assertEqual([5, 3], targets)
+
+        file_id, num_values, num_columns, rows, targets = \
+            read_binary_file(self.test_file + '.libfm')
+        self.assertEqual(5, num_columns)
+        self.assertEqual([[(0, 1), (1, 1), (4, 1)]], rows)
+        self.assertEqual([4], targets)
+
+    def test_load_libfm_file(self):
+        num_variables = csv_to_libfm(
+            [self.train_file], 0, [1, 2], has_header=True)
+
+        x_matrix, targets = libfm_converter.load_libfm_file(
+            self.train_file + '.libfm', num_variables)
+        numpy.testing.assert_array_equal(
+            [[0.5, 1, 1, 0], [0, 0, 1, 1]], x_matrix.toarray())
+        numpy.testing.assert_array_equal([5, 3], targets)
+
+    def test_load_libfm_model(self):
+        model_file = self.folder + 'model.libfm'
+        write_lines(model_file, [
+            '#global bias W0', '0.25', '#unary interactions Wj', '1', '-2',
+            '0.5', '#pairwise interactions Vj,f', '1 2', '3 4', '5 6'])
+
+        w0, w, V = libfm_converter.load_libfm_model(model_file, 3)
+        self.assertEqual(0.25, w0)
+        numpy.testing.assert_array_equal([1, -2, 0.5], w)
+        numpy.testing.assert_array_equal([[1, 2], [3, 4], [5, 6]], V)
+        self.assertRaises(
+            ValueError, libfm_converter.load_libfm_model, model_file, 4)
+
+        predictions_file = self.folder + 'predictions.txt'
+        write_lines(predictions_file, ['4.5', '3.25', '1'])
+        numpy.testing.assert_array_equal(
+            [4.5, 3.25, 1],
+            libfm_converter.load_predictions(predictions_file))
@@ -16,10 +16,13 @@ from gensim import corpora
 
 from etl import ETLUtils
 from etl import libfm_converter
+from evaluation import cross_validation_scheduler
+from evaluation.cross_validation_scheduler import CrossValidationScheduler
 from evaluation import rmse_calculator
 from evaluation.top_n_evaluator import TopNEvaluator
 from evaluation import parameter_combinator
 # from recommenders import fastfm_recommender
+from recommenders.factorization_machine import FactorizationMachine
 from topicmodeling.context import topic_model_creator
 from tripadvisor.fourcity import extractor
 from utils import utilities
@@ -199,11 +202,11 @@ class ContextTopNRunner(object):
 
         if Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
             self.original_records =\
-                ETLUtils.load_json_file(
+                ETLUtils.load_records_file(
                     Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE)
         else:
             self.original_records =\
-                ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
+                ETLUtils.load_records_file(Constants.PROCESSED_RECORDS_FILE)
 
         print('num_records: %d' % len(self.original_records))
         user_ids = extractor.get_groupby_list(
@@ -395,18 +398,49 @@ class ContextTopNRunner(object):
         # print('all used context words count: %d' % len(all_context_words))
         print('all used context topics: %d' % len(all_context_topics))
 
-    def prepare_records_for_libfm(self):
-        print('prepare_records_for_libfm: %s' %
-              time.strftime("%Y/%m/%d-%H:%M:%S"))
-
-        self.headers = build_headers(self.context_rich_topics)
-
+    def filter_train_records(self):
         if Constants.FM_REVIEW_TYPE == Constants.SPECIFIC or \
                 Constants.FM_REVIEW_TYPE == Constants.GENERIC:
             self.train_records = ETLUtils.filter_records(
                 self.train_records, Constants.PREDICTED_CLASS_FIELD,
                 [Constants.FM_REVIEW_TYPE])
 
+    def build_libfm_row(self, record, is_train):
+        """
+        Builds the row that represents the given record in the libFM data,
+        with the same columns as self.headers
+
+        :param record: the record
+        :param is_train: indicates if the record belongs to the training set.
+        The context topics of the records to predict are taken from
+        self.context_topics_map
+        :return: a list with the values of the row
+        """
+        row = []
+        for header in basic_headers:
+            row.append(record[header])
+
+        if Constants.USE_CONTEXT is True:
+            if is_train:
+                context_topics = record[Constants.CONTEXT_TOPICS_FIELD]
+            else:
+                important_record = record[Constants.REVIEW_ID_FIELD]
+                context_topics = self.context_topics_map[important_record]
+            for topic in self.context_rich_topics:
+                row.append(context_topics['topic' + str(topic[0])])
+
+            if Constants.USE_NO_CONTEXT_TOPICS_SUM:
+                row.append(context_topics['nocontexttopics'])
+
+        return row
+
+    def prepare_records_for_libfm(self):
+        print('prepare_records_for_libfm: %s' %
+              time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+        self.headers = build_headers(self.context_rich_topics)
+        self.filter_train_records()
+
         with open(self.csv_train_file, 'w') as out_file:
             writer = csv.writer(out_file)
 
@@ -414,20 +448,7 @@ class ContextTopNRunner(object):
             writer.writerow(self.headers)
 
             for record in self.train_records:
-                row = []
-                for header in basic_headers:
-                    row.append(record[header])
-
-                if Constants.USE_CONTEXT is True:
-                    context_topics = record[Constants.CONTEXT_TOPICS_FIELD]
-                    for topic in self.context_rich_topics:
-                        # print('context_topics', context_topics)
-                        row.append(context_topics['topic' + str(topic[0])])
-
-                    if Constants.USE_NO_CONTEXT_TOPICS_SUM:
-                        row.append(context_topics['nocontexttopics'])
-
-                writer.writerow(row)
+                writer.writerow(self.build_libfm_row(record, True))
 
         self.train_records = None
         gc.collect()
@@ -439,21 +460,7 @@ class ContextTopNRunner(object):
             writer.writerow(self.headers)
 
             for record in self.records_to_predict:
-                row = []
-                for header in basic_headers:
-                    row.append(record[header])
-
-                if Constants.USE_CONTEXT is True:
-                    important_record = record[Constants.REVIEW_ID_FIELD]
-                    context_topics = \
-                        self.context_topics_map[important_record]
-                    for topic in self.context_rich_topics:
-                        row.append(context_topics['topic' + str(topic[0])])
-
-                    if Constants.USE_NO_CONTEXT_TOPICS_SUM:
-                        row.append(context_topics['nocontexttopics'])
-
-                writer.writerow(row)
+                writer.writerow(self.build_libfm_row(record, False))
 
         # self.records_to_predict = None
         self.context_topics_map = None
@@ -519,10 +526,54 @@ class ContextTopNRunner(object):
         self.predictions = rmse_calculator.read_targets_from_txt(
             self.context_predictions_file)
 
+    def predict_factorization_machine(self):
+        """
+        Trains a factorization machine in-process with the same data and
+        hyperparameters that would be given to libFM, without writing any
+        file or running any external command
+        """
+        print('predict_factorization_machine: %s' %
+              time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+        self.headers = build_headers(self.context_rich_topics)
+        self.filter_train_records()
+
+        train_rows = [
+            self.build_libfm_row(record, True) for record in self.train_records]
+        test_rows = [
+            self.build_libfm_row(record, False)
+            for record in self.records_to_predict]
+        self.train_records = None
+        self.context_topics_map = None
+        self.context_rich_topics = None
+        gc.collect()
+
+        matrices, self.num_variables_in_model = \
+            libfm_converter.rows_to_matrices([train_rows, test_rows], 0, [1, 2])
+        (x_train, y_train), (x_test, _) = matrices
+
+        factorization_machine = FactorizationMachine(
+            method=Constants.FM_METHOD,
+            num_factors=Constants.FM_NUM_FACTORS,
+            use_bias=Constants.FM_USE_BIAS,
+            use_1way_interactions=Constants.FM_USE_1WAY_INTERACTIONS,
+            num_iterations=Constants.FM_ITERATIONS,
+            init_stdev=Constants.FM_INIT_STDEV,
+            learn_rate=Constants.FM_SDG_LEARN_RATE,
+            regularization=(
+                Constants.FM_REGULARIZATION0, Constants.FM_REGULARIZATION1,
+                Constants.FM_REGULARIZATION2),
+            seed=Constants.LIBFM_SEED
+        )
+        self.predictions = factorization_machine.fit_predict(
+            x_train, y_train, x_test).tolist()
+
     def predict(self):
         if Constants.SOLVER == Constants.LIBFM:
             self.prepare_records_for_libfm()
             self.predict_libfm()
+        elif Constants.SOLVER == Constants.FACTORIZATION_MACHINE:
+            self.predict_factorization_machine()
         # elif Constants.SOLVER == Constants.FASTFM:
         #     self.predict_fastfm()
 
@@ -639,6 +690,45 @@ class ContextTopNRunner(object):
         else:
             raise ValueError('Unrecognized evaluation metric')
 
+    def run_fold(self, records, cycle_index, fold_index):
+        """
+        Trains and evaluates the recommender on a single fold of the given
+        records
+
+        :param records: the records of the cycle, already shuffled
+        :param cycle_index: the index of the cycle
+        :param fold_index: the index of the fold
+        :return: a dictionary with the evaluation metrics
+        """
+        num_folds = Constants.CROSS_VALIDATION_NUM_FOLDS
+        split = 1 - (1/float(num_folds))
+        cv_start = float(fold_index) / num_folds
+        print('\nFold: %d/%d' % ((fold_index+1), num_folds))
+
+        self.records = records
+        self.create_tmp_file_names(cycle_index, fold_index)
+        self.train_records, self.test_records = \
+            ETLUtils.split_train_test_copy(
+                self.records, split=split, start=cv_start)
+        # subsample_size = int(len(self.train_records)*0.5)
+        # self.train_records = self.train_records[:subsample_size]
+        self.get_records_to_predict(True)
+        if Constants.USE_CONTEXT:
+            if Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
+                self.load_cache_context_topics(None, None)
+            else:
+                context_extractor = \
+                    self.train_topic_model(cycle_index, fold_index)
+                self.find_reviews_topics(
+                    context_extractor, cycle_index, fold_index)
+        else:
+            self.context_rich_topics = []
+        self.predict()
+        metrics = self.evaluate()
+        self.clear()
+
+        return metrics
+
     def perform_cross_validation(self, records):
 
         Constants.print_properties()
@@ -650,52 +740,29 @@ class ContextTopNRunner(object):
         num_cycles = Constants.NUM_CYCLES
         num_folds = Constants.CROSS_VALIDATION_NUM_FOLDS
         total_iterations = num_cycles * num_folds
-        split = 1 - (1/float(num_folds))
         metric_name = Constants.EVALUATION_METRIC
 
         # self.load()
 
+        # The records of every cycle are shuffled before running any fold, so
+        # the folds are independent tasks that can run in any order
+        cycle_orders = []
         for i in range(num_cycles):
+            order = range(len(records))
+            if Constants.SHUFFLE_DATA:
+                self.shuffle(order)
+            cycle_orders.append(order)
 
-            print('\n\nCycle: %d/%d' % ((i+1), num_cycles))
+        scheduler = CrossValidationScheduler(
+            type(self), Constants.CROSS_VALIDATION_NUM_WORKERS,
+            cross_validation_scheduler.get_progress_file_path())
+        task_results = scheduler.run(records, cycle_orders, num_folds)
 
-            self.records = copy.deepcopy(records)
-            if Constants.SHUFFLE_DATA:
-                self.shuffle(self.records)
-
-            for j in range(num_folds):
-
-                fold_start = time.time()
-                cv_start = float(j) / num_folds
-                print('\nFold: %d/%d' % ((j+1), num_folds))
-
-                self.create_tmp_file_names(i, j)
-                self.train_records, self.test_records = \
-                    ETLUtils.split_train_test_copy(
-                        self.records, split=split, start=cv_start)
-                # subsample_size = int(len(self.train_records)*0.5)
-                # self.train_records = self.train_records[:subsample_size]
-                self.get_records_to_predict(True)
-                if Constants.USE_CONTEXT:
-                    if Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
-                        self.load_cache_context_topics(None, None)
-                    else:
-                        context_extractor = self.train_topic_model(i, j)
-                        self.find_reviews_topics(context_extractor, i, j)
-                else:
-                    self.context_rich_topics = []
-                self.predict()
-                metrics = self.evaluate()
-
-                metrics_list.append(metrics)
-                print('Accumulated %s: %f' % (metric_name,
-                    numpy.mean([k[metric_name] for k in metrics_list])))
-
-                fold_end = time.time()
-                fold_time = fold_end - fold_start
-                total_cycle_time += fold_time
-                self.clear()
-                print("Total fold %d time = %f seconds" % ((j+1), fold_time))
+        for task_result in task_results:
+            metrics_list.append(task_result['metrics'])
+            print('Accumulated %s: %f' % (metric_name,
+                numpy.mean([k[metric_name] for k in metrics_list])))
+            total_cycle_time += task_result['fold_time']
 
         results = self.summarize_results(metrics_list)
 
@@ -770,39 +837,15 @@ class ContextTopNRunner(object):
         records = self.original_records
 
         # self.plant_seeds()
-        total_cycle_time = 0.0
-        num_folds = Constants.CROSS_VALIDATION_NUM_FOLDS
-        split = 1 - (1 / float(num_folds))
         self.records = copy.deepcopy(records)
         if Constants.SHUFFLE_DATA:
             self.shuffle(self.records)
 
         fold_start = time.time()
-        cv_start = float(fold) / num_folds
-        print('\nFold: %d/%d' % ((fold + 1), num_folds))
-
-        self.create_tmp_file_names(0, fold)
-        self.train_records, self.test_records = \
-            ETLUtils.split_train_test_copy(
-                self.records, split=split, start=cv_start)
-        # subsample_size = int(len(self.train_records)*0.5)
-        # self.train_records = self.train_records[:subsample_size]
-        self.get_records_to_predict(True)
-        if Constants.USE_CONTEXT:
-            if Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
-                self.load_cache_context_topics(None, None)
-            else:
-                context_extractor = self.train_topic_model(0, fold)
-                self.find_reviews_topics(context_extractor, 0, fold)
-        else:
-            self.context_rich_topics = []
-        self.predict()
-        metrics = self.evaluate()
+        metrics = self.run_fold(self.records, 0, fold)
 
         fold_end = time.time()
         fold_time = fold_end - fold_start
-        total_cycle_time += fold_time
-        self.clear()
         print("Total fold %d time = %f seconds" % ((fold + 1), fold_time))
 
         return metrics
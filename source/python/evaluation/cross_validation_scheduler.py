@@ -0,0 +1,184 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy
+
+from etl import ETLUtils
+from etl.etl_utils import ColumnarRecords
+from utils import utilities
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+RECORDS_FOLDER = 'records/'
+CYCLE_ORDERS_FILE = 'cycle_orders.npy'
+
+# The data every worker process maps once from the shared folder, so that the
+# records are not pickled and sent with every task. The workers only keep the
+# memory-mapped columns, and the records of a task are built from them when
+# the task runs
+_worker_data = {}
+
+
+def get_progress_file_path():
+    """
+    Returns the path of the file in which the results of the finished
+    cross-validation tasks are recorded. The name depends on all the
+    properties, so a run can only be resumed with the same configuration
+
+    :rtype: str
+    """
+    properties_hash = hashlib.md5(json.dumps(
+        Constants.get_properties_copy(), sort_keys=True)).hexdigest()
+    return Constants.CACHE_FOLDER + Constants.ITEM_TYPE + \
+        '_cross_validation_progress_' + properties_hash + '.json'
+
+
+def initialize_worker(runner_class, shared_folder):
+    _worker_data['runner_class'] = runner_class
+    # Every access builds a new dictionary, so the records don't need a copy
+    _worker_data['get_record'] = ColumnarRecords(
+        ETLUtils.load_columnar_file(shared_folder + RECORDS_FOLDER)
+    ).__getitem__
+    _worker_data['cycle_orders'] = numpy.load(
+        shared_folder + CYCLE_ORDERS_FILE, mmap_mode='r')
+
+
+def run_task(task):
+    """
+    Evaluates a single (cycle, fold) pair with a new runner. The random seeds
+    are planted at the beginning of the task, so the result doesn't depend on
+    the process that runs it or on the tasks that ran before
+
+    :param task: a tuple with the cycle and the fold indices
+    :return: a dictionary with the indices, the metrics and the time taken
+    """
+    cycle_index, fold_index = task
+    get_record = _worker_data['get_record']
+    order = _worker_data['cycle_orders'][cycle_index]
+
+    utilities.plant_seeds()
+    fold_start = time.time()
+    runner = _worker_data['runner_class']()
+    metrics = runner.run_fold(
+        [get_record(index) for index in order], cycle_index, fold_index)
+    fold_time = time.time() - fold_start
+    print("Total fold %d time = %f seconds" % ((fold_index + 1), fold_time))
+
+    return {
+        'cycle': cycle_index,
+        'fold': fold_index,
+        'metrics': metrics,
+        'fold_time': fold_time
+    }
+
+
+class CrossValidationScheduler:
+    """
+    Runs the (cycle, fold) tasks of a cross-validation, either serially in the
+    current process or in parallel in a pool of worker processes. The records
+    and the order in which they are shuffled on every cycle are written once
+    to memory-mapped files that all the workers map, and every worker builds
+    the records of a task from the columns only when it runs the task. Every
+    finished task is recorded in a progress file, so an interrupted run can be
+    resumed without repeating the finished tasks
+    """
+
+    def __init__(self, runner_class, num_workers=None, progress_file=None):
+        """
+        :param runner_class: the class of the runner that evaluates a fold, it
+        must have a run_fold(records, cycle_index, fold_index) method
+        :param num_workers: the number of worker processes. If it is None or
+        less than 2 the tasks are run serially in the current process
+        :param progress_file: the JSON file in which the finished tasks are
+        recorded. If None the progress is not recorded
+        """
+        self.runner_class = runner_class
+        self.num_workers = num_workers
+        self.progress_file = progress_file
+
+    def load_progress(self):
+        """
+        :return: a dictionary with the results of the finished tasks, the
+        keys are (cycle, fold) tuples
+        """
+        if self.progress_file is None or \
+                not os.path.exists(self.progress_file):
+            return {}
+        return {
+            (result['cycle'], result['fold']): result
+            for result in ETLUtils.load_json_file(self.progress_file)
+        }
+
+    def run(self, records, cycle_orders, num_folds):
+        """
+        Runs all the cross-validation tasks that haven't been finished yet
+
+        :type records: list[dict]
+        :param records: the records used in the cross-validation
+        :param cycle_orders: a list with the order of the records in every
+        cycle
+        :param num_folds: the number of folds of every cycle
+        :rtype: list[dict]
+        :return: the results of the tasks, sorted by cycle and fold as in a
+        serial run
+        """
+        tasks = [
+            (cycle_index, fold_index)
+            for cycle_index in range(len(cycle_orders))
+            for fold_index in range(num_folds)
+        ]
+        task_results = self.load_progress()
+        pending_tasks = [task for task in tasks if task not in task_results]
+        print('Cross-validation tasks pending: %d/%d' %
+              (len(pending_tasks), len(tasks)))
+
+        if self.num_workers is None or self.num_workers < 2 or \
+                len(pending_tasks) < 2:
+            _worker_data['runner_class'] = self.runner_class
+            _worker_data['get_record'] = \
+                lambda index: copy.deepcopy(records[index])
+            _worker_data['cycle_orders'] = cycle_orders
+            try:
+                for task in pending_tasks:
+                    self.record_result(task_results, run_task(task))
+            finally:
+                _worker_data.clear()
+        else:
+            shared_folder = tempfile.mkdtemp() + '/'
+            try:
+                ETLUtils.save_columnar_file(
+                    shared_folder + RECORDS_FOLDER, records)
+                numpy.save(
+                    shared_folder + CYCLE_ORDERS_FILE,
+                    numpy.array(cycle_orders, dtype=numpy.int64))
+
+                pool = Pool(
+                    self.num_workers, initialize_worker,
+                    (self.runner_class, shared_folder))
+                try:
+                    for result in pool.imap_unordered(run_task, pending_tasks):
+                        self.record_result(task_results, result)
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                shutil.rmtree(shared_folder)
+
+        if self.progress_file is not None and \
+                os.path.exists(self.progress_file):
+            os.remove(self.progress_file)
+
+        return [task_results[task] for task in tasks]
+
+    def record_result(self, task_results, result):
+        task_results[(result['cycle'], result['fold'])] = result
+        if self.progress_file is not None:
+            ETLUtils.write_row_to_json(self.progress_file, result)
@@ -51,10 +51,8 @@ def calculate_recommender_precision(
     known_ratings = extractor.get_user_item_ratings(test_data, user_id, True)
     items = known_ratings.keys()
 
-    predicted_ratings = {}
-
-    for item in items:
-        predicted_ratings[item] = recommender.predict_rating(user_id, item)
+    predicted_ratings = dict(zip(items, predict_ratings(
+        recommender, [user_id] * len(items), items)))
 
     return calculate_precision(known_ratings, predicted_ratings, n, min_score)
 
@@ -174,28 +172,55 @@ def calculate_is_a_hit(reviews, recommender, user_id, liked_item, n, text_review
     # unknown_items.append(liked_item)
     # all_items = unknown_items[:]
 
-    if not recommender.has_context:
-        desired_prediction =\
-            recommender.predict_rating(user_id, liked_item)
-    else:
-        desired_prediction =\
-            recommender.predict_rating(user_id, liked_item, text_review)
+    # The liked item is predicted first, because if it can't be predicted
+    # there is no need to predict the rest of the items
+    contexts = None
+    if recommender.has_context:
+        contexts = [text_review]
+    desired_prediction = predict_ratings(
+        recommender, [user_id], [liked_item], contexts)[0]
 
     if desired_prediction is None:
         return None
 
-    predicted_ratings = {liked_item: desired_prediction}
-
-    for item in unknown_items:
-        if not recommender.has_context:
-            predicted_ratings[item] = recommender.predict_rating(user_id, item)
-        else:
-            predicted_ratings[item] =\
-                recommender.predict_rating(user_id, item, text_review)
+    if recommender.has_context:
+        contexts = [text_review] * len(unknown_items)
+    predicted_ratings = dict(zip(unknown_items, predict_ratings(
+        recommender, [user_id] * len(unknown_items), unknown_items, contexts)))
+    predicted_ratings[liked_item] = desired_prediction
 
     return is_a_hit(liked_item, predicted_ratings, n)
 
 
+def predict_ratings(recommender, user_ids, item_ids, contexts=None):
+    """
+    Predicts the ratings for the given user-item pairs. If the recommender
+    implements predict_many all the ratings are predicted in a single call,
+    otherwise predict_rating is called for every pair
+
+    :param recommender: the recommender used to make the predictions
+    :param user_ids: a list with the IDs of the users
+    :param item_ids: a list with the IDs of the items, of the same length as
+    user_ids
+    :param contexts: a list with the text reviews used as context of each
+    prediction, or None if the predictions don't have context
+    :return: a list with the predicted ratings
+    """
+    if hasattr(recommender, 'predict_many'):
+        return recommender.predict_many(user_ids, item_ids, contexts)
+
+    if contexts is None:
+        return [
+            recommender.predict_rating(user_id, item_id)
+            for user_id, item_id in zip(user_ids, item_ids)
+        ]
+
+    return [
+        recommender.predict_rating(user_id, item_id, context)
+        for user_id, item_id, context in zip(user_ids, item_ids, contexts)
+    ]
+
+
 def get_unknown_items(reviews, user_id, num_unknown=1000):
     item_ids = extractor.get_groupby_list(reviews, 'offering_id')
     user_reviews = ETLUtils.filter_records(reviews, 'user_id', [user_id])
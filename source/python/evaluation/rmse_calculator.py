@@ -1,6 +1,7 @@
 import csv
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 from evaluation.root_mean_square_error import RootMeanSquareError
+from etl import libfm_converter
 
 __author__ = 'fpena'
 
@@ -14,12 +15,7 @@ def calculate_rmse_from_csv(
 
 def read_targets_from_txt(text_file):
 
-    target_list = []
-    with open(text_file) as f:
-        for line in f:
-            target_list.append(float(line))
-
-    return target_list
+    return libfm_converter.load_predictions(text_file).tolist()
 
 
 def read_targets_from_csv(
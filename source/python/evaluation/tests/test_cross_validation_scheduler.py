@@ -0,0 +1,81 @@
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+from etl import ETLUtils
+from evaluation.cross_validation_scheduler import CrossValidationScheduler
+
+__author__ = 'fpena'
+
+
+class SumRunner:
+    """
+    A runner that returns the sum of the ratings of the records of the fold
+    plus a random number, so the results depend on the order of the records
+    and on the random seeds
+    """
+
+    def run_fold(self, records, cycle_index, fold_index):
+        fold_records = records[fold_index::2]
+        return {
+            'sum': sum(record['stars'] for record in fold_records),
+            'random': random.random(),
+            'first_review': fold_records[0]['review_id']
+        }
+
+
+class TestCrossValidationScheduler(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + '/'
+        self.records = [
+            {'review_id': 'R%d' % index, 'stars': float(index % 5 + 1)}
+            for index in range(20)
+        ]
+        random_generator = random.Random(0)
+        self.cycle_orders = []
+        for _ in range(3):
+            order = range(len(self.records))
+            random_generator.shuffle(order)
+            self.cycle_orders.append(order)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_run(self):
+        serial_results = CrossValidationScheduler(SumRunner).run(
+            self.records, self.cycle_orders, 2)
+        parallel_results = CrossValidationScheduler(SumRunner, 3).run(
+            self.records, self.cycle_orders, 2)
+
+        self.assertEqual(
+            [(cycle, fold) for cycle in range(3) for fold in range(2)],
+            [(result['cycle'], result['fold']) for result in serial_results])
+        self.assertEqual(
+            [result['metrics'] for result in serial_results],
+            [result['metrics'] for result in parallel_results])
+
+        for result in serial_results:
+            order = self.cycle_orders[result['cycle']]
+            self.assertEqual(
+                'R%d' % order[result['fold']],
+                result['metrics']['first_review'])
+
+    def test_resume(self):
+        progress_file = self.folder + 'progress.json'
+        finished_result = {
+            'cycle': 1, 'fold': 0, 'metrics': {'sum': -1}, 'fold_time': 0.0}
+        ETLUtils.write_row_to_json(progress_file, finished_result)
+
+        scheduler = CrossValidationScheduler(SumRunner, 2, progress_file)
+        self.assertEqual({(1, 0): finished_result}, scheduler.load_progress())
+
+        results = scheduler.run(self.records, self.cycle_orders, 2)
+
+        # The finished task is not run again and the progress file is removed
+        # once all the tasks have finished
+        self.assertEqual(6, len(results))
+        self.assertEqual(finished_result, results[2])
+        self.assertFalse(os.path.exists(progress_file))
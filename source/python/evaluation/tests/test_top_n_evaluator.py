@@ -1,4 +1,7 @@
 from unittest import TestCase
+
+import numpy
+
 from evaluation.top_n_evaluator import TopNEvaluator
 
 __author__ = 'fpena'
@@ -181,4 +184,85 @@ class TestTopNEvaluator(TestCase):
         item = 'I4'
         top_n_evaluator.update_num_hits(top_n_list, item)
 
-        self.assertEqual(2.0 / 3, top_n_evaluator.calculate_recall())
\ No newline at end of file
+        self.assertEqual(2.0 / 3, top_n_evaluator.calculate_recall())
+
+    def test_get_irrelevant_items_seed(self):
+        records = [
+            {'user_id': 'U%d' % (i % 7), 'business_id': 'I%d' % i, 'stars': 5.0}
+            for i in range(200)
+        ]
+        top_n_evaluator = TopNEvaluator(records, records, None)
+        top_n_evaluator.initialize()
+
+        # The items must be the same ones a shuffle of the whole list returns
+        for user_id in ['U0', 'U3']:
+            numpy.random.seed(0)
+            diff_items = list(set(top_n_evaluator.item_ids).difference(
+                top_n_evaluator.user_item_map[user_id]))
+            numpy.random.shuffle(diff_items)
+            expected_state = numpy.random.rand()
+
+            numpy.random.seed(0)
+            actual_items = top_n_evaluator.get_irrelevant_items(user_id, 20)
+            self.assertEqual(diff_items[:20], actual_items)
+            self.assertEqual(expected_state, numpy.random.rand())
+
+    def test_find_hits(self):
+        random_generator = numpy.random.RandomState(0)
+        num_items = 50
+        records = [
+            {
+                'user_id': 'U%d' % i, 'business_id': 'I%d' % i, 'stars': 5.0,
+                'review_id': 'R%d' % i
+            }
+            for i in range(num_items)
+        ]
+        top_n_evaluator = TopNEvaluator(records, records, None, 5, 20)
+        top_n_evaluator.initialize()
+        top_n_evaluator.get_records_to_predict()
+
+        # Predictions with plenty of ties
+        predictions = list(random_generator.randint(
+            1, 6, num_items * 21).astype(float))
+        actual_hits = top_n_evaluator.find_hits(predictions)
+
+        index = 0
+        for record, actual_hit in zip(records, actual_hits):
+            user_item_key = record['user_id'] + '|' + record['business_id']
+            item_rating_map = {}
+            for item in top_n_evaluator.items_to_predict[user_item_key]:
+                item_rating_map[item] = predictions[index]
+                index += 1
+            top_n_list = TopNEvaluator.create_top_n_list(item_rating_map, 5)
+            self.assertEqual(record['business_id'] in top_n_list, actual_hit)
+
+    def test_find_hits_none_predictions(self):
+        records = [
+            {
+                'user_id': 'U%d' % i, 'business_id': 'I%d' % i, 'stars': 5.0,
+                'review_id': 'R%d' % i
+            }
+            for i in range(10)
+        ]
+        top_n_evaluator = TopNEvaluator(records, records, None, 2, 4)
+        top_n_evaluator.initialize()
+        top_n_evaluator.get_records_to_predict()
+
+        # A relevant item without a prediction is ranked below the rest
+        predictions = [1.0, 2.0, 3.0, 4.0, None] * len(records)
+        self.assertEqual(
+            [False] * len(records),
+            top_n_evaluator.find_hits(predictions).tolist())
+
+        # It is still a hit when fewer than N items have a prediction, as
+        # when the predictions are sorted
+        predictions = [None, None, None, 4.0, None] * len(records)
+        actual_hits = top_n_evaluator.find_hits(predictions)
+        for row, record in enumerate(records):
+            user_item_key = record['user_id'] + '|' + record['business_id']
+            item_rating_map = dict(zip(
+                top_n_evaluator.items_to_predict[user_item_key],
+                predictions[row * 5:(row + 1) * 5]))
+            top_n_list = TopNEvaluator.create_top_n_list(item_rating_map, 2)
+            self.assertEqual(
+                record['business_id'] in top_n_list, actual_hits[row])
@@ -58,6 +58,7 @@ class TopNEvaluator:
         self.items_to_predict = None
         self.records_to_predict = None
         self.user_item_map = None
+        self._item_set = None
 
     def initialize(self):
         self.user_ids =\
@@ -66,6 +67,7 @@ class TopNEvaluator:
             extractor.get_groupby_list(self.records, Constants.ITEM_ID_FIELD)
         print('total users', len(self.user_ids))
         print('total items', len(self.item_ids))
+        self._item_set = set(self.item_ids)
         self.user_item_map = self.create_user_item_map()
 
         self.find_important_records()
@@ -86,11 +88,23 @@ class TopNEvaluator:
 
         return user_item_map
 
-    def get_irrelevant_items(self, user_id):
+    def get_irrelevant_items(self, user_id, num_items=None):
+        """
+        Returns the items the given user has not rated in random order
+
+        :param user_id: the ID of the user
+        :param num_items: the number of items to return. If None all the items
+        the user has not rated are returned
+        :return: a list with the IDs of the items
+        """
         user_items = self.user_item_map[user_id]
-        diff_items = list(set(self.item_ids).difference(user_items))
-        numpy.random.shuffle(diff_items)
-        return diff_items
+        diff_items = list(self._item_set.difference(user_items))
+        # Shuffling the positions instead of the items draws exactly the same
+        # random numbers, so the sample is the same for a given seed, but it
+        # runs on an integer array and only num_items items are looked up
+        positions = numpy.arange(len(diff_items))
+        numpy.random.shuffle(positions)
+        return [diff_items[position] for position in positions[:num_items]]
 
     def find_important_records(self):
         self.important_records = [
@@ -129,12 +143,15 @@ class TopNEvaluator:
         return self.precision, self.recall
 
     def update_num_hits(self, top_n_list, record):
+        is_hit = record[Constants.ITEM_ID_FIELD] in top_n_list
+        self.update_num_hits_from_result(is_hit, record)
+
+    def update_num_hits_from_result(self, is_hit, record):
 
-        item = record[Constants.ITEM_ID_FIELD]
         review_type = record[Constants.PREDICTED_CLASS_FIELD]
         has_context = record[Constants.HAS_CONTEXT_FIELD]
 
-        if item in top_n_list:
+        if is_hit:
             self.num_hits += 1
             if review_type == Constants.SPECIFIC:
                 self.num_specific_hits += 1
@@ -170,26 +187,28 @@ class TopNEvaluator:
             review_id = record[Constants.REVIEW_ID_FIELD]
             rating = record[Constants.RATING_FIELD]
             # return I many of items
-            irrelevant_items = self.get_irrelevant_items(user_id)[:self.I]
+            irrelevant_items = self.get_irrelevant_items(user_id, self.I)
 
             if len(irrelevant_items) != self.I:
                 print('Irrelevant items size is',
                       len(irrelevant_items), user_id, item_id)
 
-            if irrelevant_items is not None:
-                # add our relevant item for prediction
-                irrelevant_items.append(item_id)
-                user_item_key = str(user_id) + '|' + str(item_id)
-                all_items_to_predict[user_item_key] = irrelevant_items
-
-                for irrelevant_item in irrelevant_items:
-                    generated_record = {
-                        Constants.REVIEW_ID_FIELD: review_id,
-                        Constants.USER_ID_FIELD: user_id,
-                        Constants.ITEM_ID_FIELD: irrelevant_item,
-                        Constants.RATING_FIELD: rating
-                    }
-                    all_records_to_predict.append(generated_record)
+            # add our relevant item for prediction
+            irrelevant_items.append(item_id)
+            user_item_key = str(user_id) + '|' + str(item_id)
+            all_items_to_predict[user_item_key] = irrelevant_items
+
+            # The runners add the context of the review to every record and
+            # export them to the libFM and CSV files, so they need one
+            # dictionary per candidate item
+            all_records_to_predict.extend([
+                {
+                    Constants.REVIEW_ID_FIELD: review_id,
+                    Constants.USER_ID_FIELD: user_id,
+                    Constants.ITEM_ID_FIELD: irrelevant_item,
+                    Constants.RATING_FIELD: rating
+                } for irrelevant_item in irrelevant_items
+            ])
 
         self.items_to_predict = all_items_to_predict
         self.records_to_predict = all_records_to_predict
@@ -220,7 +239,6 @@ class TopNEvaluator:
         print('I', self.I)
         assert len(predictions) == len(self.important_records) * (self.I + 1)
 
-        index = 0
         self.num_hits = 0
         self.num_misses = 0
         self.num_specific_hits = 0
@@ -232,24 +250,11 @@ class TopNEvaluator:
         self.num_has_no_context_hits = 0
         self.num_has_no_context_misses = 0
 
-        for record in self.important_records:
-            user_id = record[Constants.USER_ID_FIELD]
-            item_id = record[Constants.ITEM_ID_FIELD]
-            user_item_key = str(user_id) + '|' + str(item_id)
-
-            item_rating_map = {}
-            irrelevant_items = self.items_to_predict[user_item_key]
-
-            assert len(irrelevant_items) == self.I + 1
-            for irrelevant_item in irrelevant_items:
-                rating = predictions[index]
-                item_rating_map[irrelevant_item] = rating
+        is_hit = self.find_hits(predictions)
 
-                index += 1
-
-            top_n_list = self.create_top_n_list(item_rating_map, self.N)
+        for record, record_is_hit in zip(self.important_records, is_hit):
             # use this inf. for calculating PR
-            self.update_num_hits(top_n_list, record)
+            self.update_num_hits_from_result(record_is_hit, record)
 
         self.calculate_precision()
         self.calculate_recall()
@@ -257,6 +262,54 @@ class TopNEvaluator:
         # print('precision', self.precision)
         # print('recall', self.recall)
 
+    def find_hits(self, predictions):
+        """
+        Determines for each important record whether its item is in the top-N
+        list built from the predictions. The predictions of each record are
+        arranged as a row of a matrix, in which the relevant item is the last
+        column. The item is a hit if fewer than N items are ranked above it,
+        which only requires counting the items with a higher prediction instead
+        of sorting the whole row. When there are ties around the N-th position
+        the record is evaluated with create_top_n_list, so the result is
+        exactly the same as sorting the predictions
+
+        :param predictions: a list with the predicted ratings, with I + 1
+        predictions per important record
+        :rtype: numpy.ndarray
+        :return: a boolean array with one value per important record
+        """
+        num_records = len(self.important_records)
+        # A recommender returns None when it can't predict a rating. None is
+        # sorted before any number, so it becomes -inf instead of NaN, which
+        # would compare as neither higher nor equal and would count as a hit
+        prediction_matrix = numpy.array([
+            -numpy.inf if prediction is None else prediction
+            for prediction in predictions
+        ], dtype=float).reshape(num_records, self.I + 1)
+        relevant_predictions = prediction_matrix[:, -1:]
+        irrelevant_predictions = prediction_matrix[:, :-1]
+
+        num_greater = (irrelevant_predictions > relevant_predictions).sum(axis=1)
+        num_ties = (irrelevant_predictions == relevant_predictions).sum(axis=1)
+
+        is_hit = num_greater + num_ties < self.N
+        is_tied = (num_greater < self.N) & ~is_hit
+
+        for row in numpy.flatnonzero(is_tied):
+            record = self.important_records[row]
+            item_id = record[Constants.ITEM_ID_FIELD]
+            user_item_key =\
+                str(record[Constants.USER_ID_FIELD]) + '|' + str(item_id)
+            irrelevant_items = self.items_to_predict[user_item_key]
+
+            assert len(irrelevant_items) == self.I + 1
+            item_rating_map = dict(zip(irrelevant_items, predictions[
+                row * (self.I + 1):(row + 1) * (self.I + 1)]))
+            top_n_list = self.create_top_n_list(item_rating_map, self.N)
+            is_hit[row] = item_id in top_n_list
+
+        return is_hit
+
 
 # start = time.time()
 # # main()
@@ -48,14 +48,20 @@ def run_recommender(args):
         args[Constants.TOPIC_MODEL_NUM_TOPICS_FIELD] = \
             int(args[Constants.TOPIC_MODEL_NUM_TOPICS_FIELD])
 
-    Constants.update_properties(args)
+    # Every trial runs with its own configuration, the global one is restored
+    # afterwards so the properties of a trial don't leak into the next one
+    base_configuration = Constants.get_configuration()
+    Constants.set_configuration(base_configuration.with_overrides(args))
 
     # Finish updating parameters
 
-    my_context_top_n_runner = ContextTopNRunner()
-    results = my_context_top_n_runner.run()
-    results['loss'] = -results[Constants.EVALUATION_METRIC]
-    results['status'] = 'ok'
+    try:
+        my_context_top_n_runner = ContextTopNRunner()
+        results = my_context_top_n_runner.run()
+        results['loss'] = -results[Constants.EVALUATION_METRIC]
+        results['status'] = 'ok'
+    finally:
+        Constants.set_configuration(base_configuration)
 
     print('loss', results['loss'])
 
@@ -32,12 +32,18 @@ def run_recommender(args):
         Constants.USE_CONTEXT_FIELD: args[Constants.USE_CONTEXT_FIELD]
     }
 
-    Constants.update_properties(parameters)
+    # Every trial runs with its own configuration, the global one is restored
+    # afterwards so the properties of a trial don't leak into the next one
+    base_configuration = Constants.get_configuration()
+    Constants.set_configuration(base_configuration.with_overrides(parameters))
     # Finish updating parameters
 
-    results = topic_model_analyzer.export_topics()
-    results['loss'] = -results['combined_score']
-    results['status'] = 'ok'
+    try:
+        results = topic_model_analyzer.export_topics()
+        results['loss'] = -results['combined_score']
+        results['status'] = 'ok'
+    finally:
+        Constants.set_configuration(base_configuration)
 
     print('loss', results['loss'])
 
@@ -1,28 +1,152 @@
+import copy
+from collections import OrderedDict
+
 import gensim
 import nltk
 from gensim.utils import lemmatize
 from pattern.text.en import parse
 
 
-def get_sentences(text):
+NEWLINE_RE = nltk.re.compile('\n')
+DEFAULT_CACHE_SIZE = 10000
+
+
+class NlpPipeline(object):
+    """
+    Keeps the NLP models (the punkt sentence tokenizer, the perceptron
+    part-of-speech tagger and the pattern lemmatizer) loaded, so that they are
+    deserialized only once per process instead of once per call. The results
+    for every text are memoized in a bounded cache, which means that texts
+    that are processed more than once (e.g. when extracting the metrics of
+    reviews that have already been lemmatized) are only processed once. The
+    least recently used texts are evicted first, and every call returns a
+    copy of the cached result, so the caller can modify it.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._sentence_tokenizer = None
+        self._tagger = None
+        self._sentences_cache = OrderedDict()
+        self._tags_cache = OrderedDict()
+        self._lemmas_cache = OrderedDict()
+
+    @property
+    def sentence_tokenizer(self):
+        if self._sentence_tokenizer is None:
+            self._sentence_tokenizer =\
+                nltk.data.load('tokenizers/punkt/english.pickle')
+        return self._sentence_tokenizer
+
+    @property
+    def tagger(self):
+        if self._tagger is None:
+            self._tagger = nltk.PerceptronTagger()
+        return self._tagger
+
+    def _memoize(self, cache, text, function):
+        if text in cache:
+            # Re-inserting the text marks it as the most recently used
+            result = cache.pop(text)
+            cache[text] = result
+            return copy.deepcopy(result)
+
+        result = function(text)
+        if self.cache_size > 0:
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+            cache[text] = result
+            return copy.deepcopy(result)
+        return result
+
+    def split_sentences(self, text):
+        paragraphs = NEWLINE_RE.split(text)
+        sentences = []
+        for paragraph in paragraphs:
+            sentences.extend(self.sentence_tokenizer.tokenize(paragraph))
+
+        return sentences
+
+    def get_sentences(self, text):
+        """
+        Memoized version of split_sentences
+
+        :type text: str
+        :param text: just a text
+        :rtype: list[str]
+        :return: a list with the sentences there are in the given text
+        """
+        return self._memoize(
+            self._sentences_cache, text, self.split_sentences)
+
+    def tag(self, text):
+        """
+        Memoized version of tag_words that uses the pipeline's models
+
+        :param text: the text to tag
+        :return: a list of pairs, in the form of (word, tag)
+        """
+        return self._memoize(
+            self._tags_cache, text,
+            lambda value: tag_words(value, self.tagger, self))
+
+    def lemmatize(self, text):
+        """
+        Memoized version of lemmatize_text that uses the pipeline's models
+
+        :param text: the text to lemmatize
+        :return: a list of triples, in the form of (word, tag, lemma)
+        """
+        return self._memoize(
+            self._lemmas_cache, text,
+            lambda value: lemmatize_text(value, self))
+
+    def tokenize_many(self, texts):
+        return [self.get_sentences(text) for text in texts]
+
+    def tag_many(self, texts):
+        return [self.tag(text) for text in texts]
+
+    def lemmatize_many(self, texts):
+        return [self.lemmatize(text) for text in texts]
+
+    def clear_cache(self):
+        self._sentences_cache.clear()
+        self._tags_cache.clear()
+        self._lemmas_cache.clear()
+
+
+_default_pipeline = None
+
+
+def get_default_pipeline():
+    """
+    Returns the NlpPipeline shared by all the functions of this module in the
+    current process
+
+    :rtype: NlpPipeline
+    """
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = NlpPipeline()
+    return _default_pipeline
+
+
+def get_sentences(text, nlp_pipeline=None):
     """
     Returns a list with the sentences there are in the given text
 
     :type text: str
     :param text: just a text
+    :type nlp_pipeline: NlpPipeline
+    :param nlp_pipeline: the pipeline that holds the sentence tokenizer. If
+    None, the default pipeline of this process is used
     :rtype: list[str]
     :return: a list with the sentences there are in the given text
     """
-    sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
-    newline_re = nltk.re.compile('\n')
-    paragraphs = newline_re.split(text)
-    sentences = []
-    for paragraph in paragraphs:
-        # sentences.append(paragraph)
-        sentences.extend(sentence_tokenizer.tokenize(paragraph))
-
-    return sentences
-    # return sentence_tokenizer.tokenize(text)
+    if nlp_pipeline is None:
+        nlp_pipeline = get_default_pipeline()
+    return nlp_pipeline.split_sentences(text)
 
 
 
@@ -35,7 +159,7 @@ def get_words(text):
     :rtype: list[str]
     :return: a list with the words there are in the given text
     """
-    sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
+    sentence_tokenizer = get_default_pipeline().sentence_tokenizer
     sentences = sentence_tokenizer.tokenize(text)
 
     words = []
@@ -59,23 +183,27 @@ def get_words_from_sentence(sentence):
     return nltk.tokenize.word_tokenize(sentence)
 
 
-def tag_words(text, tagger=None):
+def tag_words(text, tagger=None, nlp_pipeline=None):
     """
     Tags the words contained in the given text using part-of-speech tags. The
     text is split into sentences and it returns a list of lists with the tagged
     words. One list for every sentence.
 
-    :param tagger: a part-of-speech tagger. This parameter is useful in order to
-    avoid the initialization of the tagger every time this method is called,
-    since the initialization can take a long time.
+    :param tagger: a part-of-speech tagger. If None, the tagger of the
+    pipeline is used, which is only initialized once.
     :param text: the text to tag
+    :type nlp_pipeline: NlpPipeline
+    :param nlp_pipeline: the pipeline that holds the NLP models. If None, the
+    default pipeline of this process is used
     :return: a list of lists with pairs, in the form of (word, tag)
     """
-    sentences = get_sentences(text)
+    if nlp_pipeline is None:
+        nlp_pipeline = get_default_pipeline()
+    sentences = nlp_pipeline.split_sentences(text)
     tokenized_sentences = [
         get_words_from_sentence(sent.lower()) for sent in sentences]
     if tagger is None:
-        tagger = nltk.PerceptronTagger()
+        tagger = nlp_pipeline.tagger
 
     tagged_words = []
     for sent in tokenized_sentences:
@@ -83,19 +211,19 @@ def tag_words(text, tagger=None):
     return tagged_words
 
 
-def lemmatize_text(text):
+def lemmatize_text(text, nlp_pipeline=None):
     """
     Tags the words contained in the given text using part-of-speech tags. The
     text is split into sentences and it returns a list of lists with the tagged
     words. One list for every sentence.
 
-    :param tagger: a part-of-speech tagger. This parameter is useful in order to
-    avoid the initialization of the tagger every time this method is called,
-    since the initialization can take a long time.
     :param text: the text to tag
+    :type nlp_pipeline: NlpPipeline
+    :param nlp_pipeline: the pipeline that holds the sentence tokenizer. If
+    None, the default pipeline of this process is used
     :return: a list of lists with pairs, in the form of (word, tag)
     """
-    sentences = get_sentences(text)
+    sentences = get_sentences(text, nlp_pipeline)
     # tokenized_sentences = [
     #     get_words_from_sentence(sent.lower()) for sent in sentences]
 
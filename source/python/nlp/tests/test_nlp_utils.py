@@ -101,3 +101,48 @@ class TestNlpUtils(TestCase):
         actual_value = nlp_utils.count_verbs(counts)
         expected_value = 4
         self.assertEqual(actual_value, expected_value)
+
+    def test_nlp_pipeline(self):
+        nlp_pipeline = nlp_utils.NlpPipeline(cache_size=2)
+        texts = [empty_paragraph, paragraph1, paragraph2]
+
+        actual_value = nlp_pipeline.tokenize_many(texts)
+        expected_value = [nlp_utils.get_sentences(text) for text in texts]
+        self.assertEqual(actual_value, expected_value)
+
+        actual_value = nlp_pipeline.tag_many(texts)
+        expected_value = [nlp_utils.tag_words(text) for text in texts]
+        self.assertEqual(actual_value, expected_value)
+
+        # Modifying a result must not modify the cached value
+        nlp_pipeline.get_sentences(paragraph1).append('extra sentence')
+        self.assertEqual(
+            nlp_pipeline.get_sentences(paragraph1),
+            nlp_utils.get_sentences(paragraph1))
+        nlp_pipeline.tag(paragraph1)[0].append(('extra', 'NN'))
+        self.assertEqual(
+            nlp_pipeline.tag(paragraph1), nlp_utils.tag_words(paragraph1))
+
+    def test_nlp_pipeline_cache(self):
+        nlp_pipeline = nlp_utils.NlpPipeline(cache_size=2)
+        split_texts = []
+        split_sentences = nlp_pipeline.split_sentences
+
+        def count_split_sentences(text):
+            split_texts.append(text)
+            return split_sentences(text)
+
+        nlp_pipeline.split_sentences = count_split_sentences
+
+        for text in [paragraph1, paragraph2, paragraph1, review_text1]:
+            nlp_pipeline.get_sentences(text)
+        # paragraph1 was used after paragraph2, so paragraph2 is evicted
+        self.assertEqual([paragraph1, paragraph2, review_text1], split_texts)
+
+        self.assertEqual(
+            nlp_utils.get_sentences(paragraph1),
+            nlp_pipeline.get_sentences(paragraph1))
+        self.assertEqual([paragraph1, paragraph2, review_text1], split_texts)
+        nlp_pipeline.get_sentences(paragraph2)
+        self.assertEqual(
+            [paragraph1, paragraph2, review_text1, paragraph2], split_texts)
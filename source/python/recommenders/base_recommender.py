@@ -1,6 +1,6 @@
 from abc import ABCMeta, abstractmethod
+from recommenders.neighbour_index import NeighbourIndex
 from tripadvisor.fourcity import extractor
-from utils import dictionary_utils
 
 
 __author__ = 'fpena'
@@ -18,6 +18,7 @@ class BaseRecommender(object):
         self.user_ids = None
         self.user_dictionary = None
         self.user_similarity_matrix = None
+        self.neighbour_index = None
 
     def load(self, reviews):
         self.reviews = reviews
@@ -30,39 +31,89 @@ class BaseRecommender(object):
             self.user_similarity_matrix =\
                 self._similarity_matrix_builder.build_similarity_matrix(
                     self.user_dictionary, self.user_ids)
+            self.update_neighbour_index()
 
     def clear(self):
         self.reviews = None
         self.user_ids = None
         self.user_dictionary = None
         self.user_similarity_matrix = None
+        self.neighbour_index = None
 
-    def get_neighbourhood(self, user_id, item_id):
-
-        # if self._num_neighbors is None:
-        #     neighbourhood = list(self.user_ids)
-        #     neighbourhood.remove(user_id)
-        #     return neighbourhood
-
-        similarity_matrix = self.user_similarity_matrix[user_id].copy()
-        similarity_matrix.pop(user_id, None)
-
-        # We remove the users who have not rated the given item
-        similarity_matrix = {
-            k: v for k, v in similarity_matrix.items()
-            if item_id in self.user_dictionary[k].item_ratings}
-
-        # Sort the users by similarity
-        neighbourhood = dictionary_utils.sort_dictionary_keys(
-            similarity_matrix)  # [:self._num_neighbors]
-
-        return neighbourhood
+    def update_neighbour_index(self):
+        """
+        Rebuilds the index with the nearest neighbours of every user. It has to
+        be called every time the similarity matrix changes
+        """
+        self.neighbour_index = NeighbourIndex(self._num_neighbors)
+        self.neighbour_index.build(
+            self.user_similarity_matrix, self.user_dictionary, self.user_ids)
 
+    def get_neighbourhood(self, user_id, item_id):
+        """
+        Returns the users who have rated the given item sorted by their
+        similarity with the given user in descending order. When the
+        recommender has a number of neighbours, at most that number of users
+        is returned
+
+        :param user_id: the ID of the user
+        :param item_id: the ID of the item
+        :return: a list with the IDs of the neighbours
+        """
+        return self.get_neighbour_index().get_neighbourhood(user_id, item_id)
+
+    def get_neighbour_index(self):
+        """
+        Returns the index with the nearest neighbours of every user. The index
+        is rebuilt if the similarities or the number of neighbours have been
+        replaced since it was built
+
+        :rtype: NeighbourIndex
+        """
+        if self.neighbour_index is None or\
+                self.neighbour_index.user_similarity_matrix is not\
+                self.user_similarity_matrix or\
+                self.neighbour_index.num_neighbours != self._num_neighbors:
+            self.update_neighbour_index()
+
+        return self.neighbour_index
 
     @abstractmethod
     def predict_rating(self, user, item):
         pass
 
+    def predict_many(self, user_ids, item_ids, contexts=None):
+        """
+        Predicts the ratings for several user-item pairs at once. Subclasses
+        that can share work between the predictions override this method, by
+        default predict_rating is called for every pair
+
+        :param user_ids: a list with the IDs of the users
+        :param item_ids: a list with the IDs of the items, of the same length
+        as user_ids
+        :param contexts: ignored, this recommender doesn't use context
+        :return: a list with the predicted ratings, which contains None for
+        the ratings that couldn't be predicted
+        """
+        return [
+            self.predict_rating(user_id, item_id)
+            for user_id, item_id in zip(user_ids, item_ids)
+        ]
+
+    @staticmethod
+    def group_by_user(user_ids):
+        """
+        Groups the positions of the given list by user
+
+        :param user_ids: a list with the IDs of the users
+        :return: a dictionary where the keys are the users' ID and the values
+        are the lists of positions in which each user appears
+        """
+        user_positions = {}
+        for position, user_id in enumerate(user_ids):
+            user_positions.setdefault(user_id, []).append(position)
+        return user_positions
+
     @property
     def name(self):
         return self._name
@@ -75,13 +75,67 @@ class ContextualKNN:
         if user not in self.user_ids:
             return None
 
-        ratings_sum = 0
-        similarities_sum = 0
-        num_neighbours = 0
         user_context = None
         if self.has_context:
             user_context =\
                 lda_context_utils.get_topic_distribution(review, self.lda_model)
+
+        return self.predict_rating_on_context(user, item, user_context, {})
+
+    def predict_many(self, user_ids, item_ids, contexts=None):
+        """
+        Predicts the ratings for several user-item pairs at once. The topic
+        distribution of each review and the baseline of each user are
+        calculated once for all the items that are predicted with them,
+        instead of once per item
+
+        :param user_ids: a list with the IDs of the users
+        :param item_ids: a list with the IDs of the items
+        :param contexts: a list with the text reviews that are used as the
+        context of each prediction, or None if the recommender has no context
+        :return: a list with the predicted ratings
+        """
+        if contexts is None:
+            contexts = [None] * len(user_ids)
+
+        known_users = set(self.user_ids)
+        predicted_ratings = [None] * len(user_ids)
+        groups = {}
+        for position, (user, review) in enumerate(zip(user_ids, contexts)):
+            groups.setdefault((user, review), []).append(position)
+
+        for (user, review), positions in groups.iteritems():
+            if user not in known_users:
+                continue
+
+            user_context = None
+            if self.has_context:
+                user_context = lda_context_utils.get_topic_distribution(
+                    review, self.lda_model)
+            user_baselines = {}
+
+            for position in positions:
+                predicted_ratings[position] = self.predict_rating_on_context(
+                    user, item_ids[position], user_context, user_baselines)
+
+        return predicted_ratings
+
+    def predict_rating_on_context(
+            self, user, item, user_context, user_baselines):
+        """
+        Predicts the rating the user will give to the item in the given
+        context
+
+        :param user: the ID of the user
+        :param item: the ID of the item
+        :param user_context: the topic distribution of the user's review
+        :param user_baselines: a dictionary used to store the baseline of the
+        user in this context, so it can be shared between predictions
+        :return: the predicted rating, or None if it couldn't be predicted
+        """
+        ratings_sum = 0
+        similarities_sum = 0
+        num_neighbours = 0
         neighbourhood = self.neighbourhood_calculator.get_neighbourhood(
             user, item, user_context, self.threshold1)
 
@@ -122,8 +176,11 @@ class ContextualKNN:
             return None
 
         k = 1 / similarities_sum
-        user_average = self.user_baseline_calculator.calculate_user_baseline(
-            user, user_context, self.threshold3)
+        if user not in user_baselines:
+            user_baselines[user] =\
+                self.user_baseline_calculator.calculate_user_baseline(
+                    user, user_context, self.threshold3)
+        user_average = user_baselines[user]
 
         if user_average is None:
             return None
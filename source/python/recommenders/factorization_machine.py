@@ -0,0 +1,397 @@
+import numpy
+from scipy import sparse
+
+__author__ = 'fpena'
+
+
+FM_METHODS = ['als', 'mcmc', 'sgd']
+
+# Hyperpriors used by the MCMC method, they have the same values as in libFM
+ALPHA_0 = 1.
+GAMMA_0 = 1.
+BETA_0 = 1.
+MU_0 = 0.
+ALPHA_LAMBDA = 1.
+BETA_LAMBDA = 1.
+
+
+class FactorizationMachine:
+    """
+    A second order factorization machine for regression that is trained
+    in-process with the same learning methods as libFM (SGD, ALS and MCMC) and
+    that takes the same hyperparameters as the libFM command line. The model
+    works directly on scipy sparse design matrices, in which every row is a
+    sample and every column is a variable
+    """
+
+    def __init__(
+            self, method='mcmc', num_factors=8, use_bias=True,
+            use_1way_interactions=True, num_iterations=100, init_stdev=0.1,
+            learn_rate=0.01, regularization=(0., 0., 0.), seed=None):
+        """
+        :param method: the learning method, it can be 'sgd', 'als' or 'mcmc'
+        :param num_factors: the number of factors of the pairwise interactions
+        :param use_bias: indicates if the global bias is used
+        :param use_1way_interactions: indicates if the one-way interactions
+        are used
+        :param num_iterations: the number of iterations over the training data
+        :param init_stdev: the standard deviation used to initialize the
+        factors
+        :param learn_rate: the learning rate of the SGD method
+        :param regularization: a tuple with the regularization of the global
+        bias, the one-way interactions and the factors. In MCMC they are only
+        used as initial values of the precisions, as in libFM
+        :param seed: the seed of the random number generator
+        """
+        if method not in FM_METHODS:
+            raise ValueError('Unrecognized learning method \'' + method + '\'')
+
+        self.method = method
+        self.num_factors = num_factors
+        self.use_bias = use_bias
+        self.use_1way_interactions = use_1way_interactions
+        self.num_iterations = num_iterations
+        self.init_stdev = init_stdev
+        self.learn_rate = learn_rate
+        self.regularization0, self.regularization1, self.regularization2 =\
+            [float(value) for value in regularization]
+        self.seed = seed
+        self.w0 = 0.
+        self.w = None
+        self.v = None
+        self.min_target = None
+        self.max_target = None
+        self._random_state = None
+
+    def _initialize(self, num_variables, y_train):
+        self._random_state = numpy.random.RandomState(self.seed)
+        self.w0 = 0.
+        self.w = numpy.zeros(num_variables)
+        self.v = self._random_state.normal(
+            0., self.init_stdev, (num_variables, self.num_factors))
+        self.min_target = y_train.min()
+        self.max_target = y_train.max()
+
+    def fit(self, x_train, y_train):
+        """
+        Trains the model. Note that in MCMC the predictions are the average of
+        the predictions of every sample, so fit_predict should be used instead
+
+        :type x_train: scipy.sparse.csr_matrix
+        :param x_train: the design matrix of the training data
+        :param y_train: the targets of the training data
+        """
+        self.fit_predict(x_train, y_train, None)
+
+    def fit_predict(self, x_train, y_train, x_test):
+        """
+        Trains the model and predicts the targets of the test data. This is
+        the equivalent of a libFM run with a train and a test file
+
+        :type x_train: scipy.sparse.csr_matrix
+        :param x_train: the design matrix of the training data
+        :param y_train: the targets of the training data
+        :type x_test: scipy.sparse.csr_matrix
+        :param x_test: the design matrix of the test data, it must have the
+        same number of columns as x_train. It can be None
+        :rtype: numpy.ndarray
+        :return: the predictions for the test data, or None if x_test is None
+        """
+        x_train = sparse.csr_matrix(x_train, dtype=float)
+        x_train.sum_duplicates()
+        y_train = numpy.asarray(y_train, dtype=float)
+        if x_test is not None:
+            x_test = sparse.csr_matrix(x_test, dtype=float)
+            if x_test.shape[1] != x_train.shape[1]:
+                raise ValueError(
+                    'The train and test matrices must have the same number '
+                    'of columns')
+
+        self._initialize(x_train.shape[1], y_train)
+
+        if self.method == 'sgd':
+            self._fit_sgd(x_train, y_train)
+        else:
+            predictions = self._fit_coordinate_descent(
+                x_train, y_train, x_test)
+            if predictions is not None:
+                return numpy.clip(
+                    predictions, self.min_target, self.max_target)
+
+        if x_test is None:
+            return None
+        return self.predict(x_test)
+
+    def predict(self, x_matrix):
+        """
+        Predicts the targets of the given samples with the current parameters
+        of the model. The predictions are clipped to the range of the targets
+        seen during training, as libFM does
+
+        :type x_matrix: scipy.sparse.csr_matrix
+        :param x_matrix: the design matrix of the samples
+        :rtype: numpy.ndarray
+        """
+        x_matrix = sparse.csr_matrix(x_matrix, dtype=float)
+        return numpy.clip(
+            self._predict_raw(x_matrix), self.min_target, self.max_target)
+
+    def _predict_raw(self, x_matrix, factor_sums=None):
+        if factor_sums is None:
+            factor_sums = x_matrix * self.v
+        squares = x_matrix.multiply(x_matrix).tocsr() * (self.v ** 2)
+        predictions = 0.5 * (factor_sums ** 2 - squares).sum(axis=1)
+        if self.use_bias:
+            predictions += self.w0
+        if self.use_1way_interactions:
+            predictions += x_matrix * self.w
+        return predictions
+
+    def _fit_sgd(self, x_train, y_train):
+        """
+        Stochastic gradient descent, the parameters are updated after every
+        sample and the samples are visited in order, as in libFM. Only the
+        variables present in each sample are touched
+        """
+        indptr = x_train.indptr
+        indices = x_train.indices
+        data = x_train.data
+
+        for iteration in xrange(self.num_iterations):
+            for row in xrange(x_train.shape[0]):
+                columns = indices[indptr[row]:indptr[row + 1]]
+                values = data[indptr[row]:indptr[row + 1]]
+                factors = self.v[columns]
+                sums = values.dot(factors)
+
+                prediction = 0.5 * (
+                    sums.dot(sums) -
+                    (values ** 2).dot((factors ** 2).sum(axis=1)))
+                if self.use_bias:
+                    prediction += self.w0
+                if self.use_1way_interactions:
+                    prediction += values.dot(self.w[columns])
+                prediction = min(
+                    max(prediction, self.min_target), self.max_target)
+                gradient = prediction - y_train[row]
+
+                if self.use_bias:
+                    self.w0 -= self.learn_rate * (
+                        gradient + self.regularization0 * self.w0)
+                if self.use_1way_interactions:
+                    self.w[columns] -= self.learn_rate * (
+                        gradient * values +
+                        self.regularization1 * self.w[columns])
+                self.v[columns] -= self.learn_rate * (
+                    gradient * (
+                        numpy.outer(values, sums) -
+                        factors * (values ** 2)[:, numpy.newaxis]) +
+                    self.regularization2 * factors)
+
+    def _fit_coordinate_descent(self, x_train, y_train, x_test):
+        """
+        Alternating least squares and Markov chain Monte Carlo. Both methods
+        update one parameter at a time given the rest, ALS by solving the
+        least squares problem of the parameter and MCMC by drawing it from its
+        posterior distribution. The variables are split in groups of variables
+        that never appear in the same sample, the parameters of a group don't
+        depend on each other, so a whole group is updated at once and the
+        result is the same as updating its parameters one by one
+
+        :return: the average of the predictions for x_test over all the
+        iterations in MCMC, or None in ALS or if x_test is None
+        """
+        is_mcmc = self.method == 'mcmc'
+        num_rows = x_train.shape[0]
+        x_columns = x_train.tocsc()
+        x_columns.eliminate_zeros()
+        groups = [
+            _get_group_entries(x_columns, group)
+            for group in find_independent_groups(x_columns)]
+
+        alpha = 1.
+        w_mu = 0.
+        w_lambda = self.regularization1
+        v_mu = numpy.zeros(self.num_factors)
+        v_lambda = numpy.full(self.num_factors, self.regularization2)
+        predictions_sum = None
+
+        for iteration in xrange(self.num_iterations):
+            # The cached sums and errors are recalculated on every iteration
+            # to avoid the accumulation of rounding errors
+            factor_sums = x_train * self.v
+            errors = y_train - self._predict_raw(x_train, factor_sums)
+
+            if is_mcmc:
+                alpha = self._random_state.gamma(
+                    (ALPHA_0 + num_rows) / 2.,
+                    2. / (GAMMA_0 + errors.dot(errors)))
+
+            if self.use_bias:
+                mean, variance = _get_posterior(
+                    alpha, errors.sum() + self.w0 * num_rows, num_rows,
+                    0., self.regularization0)
+                new_w0 = self._draw(mean, variance, is_mcmc)
+                errors -= new_w0 - self.w0
+                self.w0 = new_w0
+
+            if self.use_1way_interactions:
+                if is_mcmc:
+                    w_mu, w_lambda = self._draw_hyperparameters(self.w, w_mu)
+                for columns, rows, values, positions in groups:
+                    self._update_parameters(
+                        self.w, None, columns, rows, values, positions,
+                        values, errors, alpha, w_mu, w_lambda, is_mcmc)
+
+            for factor in xrange(self.num_factors):
+                if is_mcmc:
+                    v_mu[factor], v_lambda[factor] =\
+                        self._draw_hyperparameters(
+                            self.v[:, factor], v_mu[factor])
+                sums = factor_sums[:, factor]
+                for columns, rows, values, positions in groups:
+                    gradients = values * (
+                        sums[rows] - self.v[columns[positions], factor] * values)
+                    changes = self._update_parameters(
+                        self.v, factor, columns, rows, values, positions,
+                        gradients, errors, alpha, v_mu[factor],
+                        v_lambda[factor], is_mcmc)
+                    sums[rows] += changes[positions] * values
+
+            if is_mcmc and x_test is not None:
+                predictions = self._predict_raw(x_test)
+                if predictions_sum is None:
+                    predictions_sum = predictions
+                else:
+                    predictions_sum += predictions
+
+        if predictions_sum is None:
+            return None
+        return predictions_sum / self.num_iterations
+
+    def _update_parameters(
+            self, parameters, factor, columns, rows, values, positions,
+            gradients, errors, alpha, mu, regularization, is_mcmc):
+        """
+        Updates the parameters of a group of variables and the errors of the
+        samples in which they appear
+
+        :param parameters: the vector or matrix with the parameters
+        :param factor: the column of parameters that is updated, or None if
+        parameters is a vector
+        :param columns: the variables of the group
+        :param rows: the sample of every non-zero entry of the group
+        :param values: the value of every non-zero entry of the group
+        :param positions: the position in columns of the variable of every
+        non-zero entry of the group
+        :param gradients: the derivative of the prediction with respect to
+        the parameter of every non-zero entry of the group
+        :return: the change in the value of the parameters of the group
+        """
+        if factor is None:
+            current = parameters[columns]
+        else:
+            current = parameters[columns, factor]
+
+        squares_sum = numpy.bincount(
+            positions, gradients ** 2, minlength=len(columns))
+        errors_sum = numpy.bincount(
+            positions, gradients * errors[rows], minlength=len(columns))
+        mean, variance = _get_posterior(
+            alpha, errors_sum + current * squares_sum, squares_sum, mu,
+            regularization)
+        new_values = self._draw(mean, variance, is_mcmc)
+
+        # Variables that don't appear in the training data and have no prior
+        # keep their value
+        new_values = numpy.where(numpy.isfinite(new_values), new_values, current)
+        changes = new_values - current
+
+        if factor is None:
+            parameters[columns] = new_values
+        else:
+            parameters[columns, factor] = new_values
+        errors[rows] -= changes[positions] * gradients
+
+        return changes
+
+    def _draw(self, mean, variance, is_mcmc):
+        if not is_mcmc:
+            return mean
+        return mean + numpy.sqrt(variance) *\
+            self._random_state.standard_normal(numpy.shape(mean))
+
+    def _draw_hyperparameters(self, parameters, mu):
+        """
+        Draws the precision and then the mean of the normal prior of the
+        given parameters from their posterior distribution
+
+        :param parameters: the parameters that share the prior
+        :param mu: the current mean of the prior
+        :return: a tuple with the new mean and precision
+        """
+        num_parameters = len(parameters)
+
+        regularization = self._random_state.gamma(
+            (ALPHA_LAMBDA + num_parameters + 1) / 2.,
+            2. / (BETA_LAMBDA + ((parameters - mu) ** 2).sum() +
+                  BETA_0 * (mu - MU_0) ** 2))
+        mu = self._random_state.normal(
+            (parameters.sum() + BETA_0 * MU_0) / (num_parameters + BETA_0),
+            numpy.sqrt(1. / ((num_parameters + BETA_0) * regularization)))
+
+        return mu, regularization
+
+
+def _get_posterior(alpha, weighted_sum, squares_sum, mu, regularization):
+    """
+    Returns the mean and the variance of the conditional posterior of a
+    parameter, given the sums over the samples of its gradient multiplied by
+    the target it has to explain and of its squared gradient. In ALS the mean
+    is the regularized least squares solution
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        variance = 1. / (alpha * squares_sum + regularization)
+        mean = variance * (alpha * weighted_sum + mu * regularization)
+    return mean, variance
+
+
+def _get_group_entries(x_columns, group):
+    group_matrix = x_columns[:, group]
+    positions = numpy.repeat(
+        numpy.arange(len(group)), numpy.diff(group_matrix.indptr))
+    return group, group_matrix.indices, group_matrix.data, positions
+
+
+def find_independent_groups(x_matrix):
+    """
+    Splits the variables of the design matrix in groups of variables that
+    never appear together in the same sample. A greedy colouring of the graph
+    of co-occurring variables is used, so the one-hot encoded fields of a
+    design matrix (for instance the users or the items) end up in a single
+    group each
+
+    :type x_matrix: scipy.sparse.spmatrix
+    :param x_matrix: the design matrix
+    :rtype: list[numpy.ndarray]
+    :return: a list with the arrays of the variables of every group
+    """
+    structure = sparse.csc_matrix(x_matrix, dtype=float, copy=True)
+    structure.eliminate_zeros()
+    structure.data[:] = 1
+    co_occurrences = (structure.T * structure).tocsr()
+
+    num_variables = x_matrix.shape[1]
+    colours = numpy.full(num_variables, -1)
+    for variable in xrange(num_variables):
+        neighbours = co_occurrences.indices[
+            co_occurrences.indptr[variable]:co_occurrences.indptr[variable + 1]]
+        used_colours = set(colours[neighbours])
+        colour = 0
+        while colour in used_colours:
+            colour += 1
+        colours[variable] = colour
+
+    return [
+        numpy.flatnonzero(colours == colour)
+        for colour in xrange(colours.max() + 1)]
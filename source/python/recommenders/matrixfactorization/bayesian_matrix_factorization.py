@@ -2,6 +2,7 @@
 # from numpy.linalg import inv, cholesky
 from numpy.linalg import inv, cholesky
 import time
+from scipy import sparse
 from tripadvisor.fourcity import movielens_extractor
 from utils.normal_random import NormalRandom
 
@@ -12,9 +13,27 @@ import numpy as np
 
 class BayesianMatrixFactorization:
 
-    def __init__(self):
-
-        self.num_features = 10
+    def __init__(
+            self, num_features=10, burn_in=0, thinning=1, progress_hook=None):
+        """
+        :param num_features: the number of latent features
+        :param burn_in: the number of iterations whose samples are discarded
+        before averaging the predictions
+        :param thinning: only one of every 'thinning' samples after the
+        burn-in is averaged in the predictions
+        :param progress_hook: a function that is called at the end of every
+        iteration with the model, the iteration number, the train RMSE and
+        the RMSE of the posterior mean predictions on the validation set. If
+        None the errors are printed
+        """
+
+        self.num_features = num_features
+        self.burn_in = burn_in
+        self.thinning = thinning
+        self.progress_hook = progress_hook
+        # The function that generates a (rows x columns) matrix of standard
+        # normal numbers, by default the same generator as the Matlab code
+        self.normal_generator = NormalRandom.generate_matrix
 
         self.num_users = None
         self.num_items = None
@@ -52,58 +71,57 @@ class BayesianMatrixFactorization:
         self.df_post_item = None
         self.df_post_user = None
 
-        self.matrix = None
+        # The centered training ratings as sparse (users x items) and
+        # (items x users) matrices, so that the ratings of every user and
+        # every item are contiguous
+        self.user_ratings = None
+        self.item_ratings = None
         self.train_errors = []
         self.validation_errors = []
 
         self.mu_item = None
         self.mu_user = None
-        self.counter_prob = None
-        self.probe_rat_all = None
+        # The average of the predictions on the validation set over the
+        # samples taken after the burn-in
+        self.posterior_mean_predictions = None
+        self.num_samples = 0
         self.ratings_test = None
-        self.results_file = open('/Users/fpena/tmp/bpmf/python-results.txt', 'w')
 
-    def load(self, ratings, train, validation):
+    def load(self, ratings, train, validation, iterations=50):
 
         self.train = train
         self.validation = validation
         self.num_users = movielens_extractor.get_num_users(ratings)
         self.num_items = movielens_extractor.get_num_items(ratings)
-        self.train = train
-        self.validation = validation
 
         self.mean_rating = np.mean(self.train[:, 2])
         self.ratings_test = np.float64(validation[:, 2])
-        self.item_features = 0.1 * NormalRandom.generate_matrix(self.num_items, self.num_features)
-        self.user_features = 0.1 * NormalRandom.generate_matrix(self.num_users, self.num_features)
+        self.item_features = 0.1 * self.normal_generator(self.num_items, self.num_features)
+        self.user_features = 0.1 * self.normal_generator(self.num_users, self.num_features)
 
         self.df_post_item = self.df_item + self.num_items
         self.df_post_user = self.df_user + self.num_users
 
-        # num_user, num_item, ratings = build_ml_1m()
-        self.matrix = build_rating_matrix(self.num_users, self.num_items, train)
-        self.matrix = self.matrix.T
-        self.counter_prob = 1
-        self.probe_rat_all = self.pred(self.item_features, self.user_features, self.validation, self.mean_rating)
+        self.user_ratings = build_rating_matrix(
+            self.num_users, self.num_items, train, self.mean_rating)
+        self.item_ratings = self.user_ratings.T.tocsr()
+        self.posterior_mean_predictions = np.zeros(len(self.validation))
+        self.num_samples = 0
 
-        self.estimate()
+        self.estimate(iterations)
 
     def estimate(self, iterations=50, tolerance=1e-5):
-        last_rmse = None
 
         # the algorithm will converge, but really slow
         # use MF's initialize latent parameter will be better
         for iteration in range(iterations):
 
-            self.results_file.write('Epoch %d\n' % (iteration+1))
-
             # update item & user parameter
             self.update_item_params()
             self.update_user_params()
 
             # update item & user_features
             for gibbs_cycle in range(2):
-                self.results_file.write('Gibbs cycle %d\n' % (gibbs_cycle+1))
                 self.udpate_item_features()
                 self.update_user_features()
 
@@ -112,12 +130,6 @@ class BayesianMatrixFactorization:
             train_preds = self.predict(self.train)
             train_rmse = RMSE(train_preds, np.float64(self.train[:, 2]))
 
-            probe_rat = self.pred(self.item_features, self.user_features, self.validation, self.mean_rating)
-            self.probe_rat_all = (self.counter_prob*self.probe_rat_all + probe_rat)/(self.counter_prob+1)
-            self.counter_prob = self.counter_prob + 1
-            temp = np.power((self.ratings_test - self.probe_rat_all), 2)
-            average_err = np.sqrt(np.sum(temp)/len(self.validation))
-
             # validation errors
             validation_preds = self.predict(self.validation)
             validation_rmse = RMSE(
@@ -125,122 +137,78 @@ class BayesianMatrixFactorization:
             self.train_errors.append(train_rmse)
             self.validation_errors.append(validation_rmse)
 
-            val = np.sqrt(((validation_preds - self.validation[:, 2]) ** 2).mean())
-
-            # my_rmse = np.sqrt(np.mean(temp))
-            # print('Average Test RMSE %3d %.6f \t Other RMSE %.6f ' % (iteration + 1, average_err, my_rmse))
-
-            print ("Epoch: %3d, Average Test RMSE: %.6f , " \
-                  "RMSE: %.6f " % (iteration + 1, average_err, val))
-
-            # print "iterations: %3d, train RMSE: %.6f, validation RMSE: %.6f , " \
-            #       "Average Test RMSE: %.6f " % (iteration + 1, train_rmse, validation_rmse, average_err)
-
-            # stop if converge
-            # if last_rmse:
-            #     if abs(train_rmse - last_rmse) < tolerance:
-            #         break
-
-            last_rmse = train_rmse
+            if iteration >= self.burn_in and \
+                    (iteration - self.burn_in) % self.thinning == 0:
+                self.posterior_mean_predictions += \
+                    (validation_preds - self.posterior_mean_predictions) / \
+                    (self.num_samples + 1)
+                self.num_samples += 1
+
+            average_err = None
+            if self.num_samples > 0:
+                average_err = np.sqrt(np.mean(
+                    (self.ratings_test - self.posterior_mean_predictions) ** 2))
+
+            if self.progress_hook is not None:
+                self.progress_hook(self, iteration, train_rmse, average_err)
+            else:
+                print("Epoch: %3d, Train RMSE: %.6f, Validation RMSE: %.6f, "
+                      "Average Test RMSE: %s" %
+                      (iteration + 1, train_rmse, validation_rmse,
+                       'burn-in' if average_err is None else
+                       '%.6f' % average_err))
 
     def update_item_params(self):
-        x_bar = np.mean(self.item_features, 0).T
-        x_bar = np.reshape(x_bar, (self.num_features, 1))
-        S_bar = np.cov(self.item_features.T)
-        norm_X_bar = self.mu0_item - x_bar
-
-        WI_post = inv(inv(self.WI_item) + self.num_items * S_bar + \
-            np.dot(norm_X_bar, norm_X_bar.T) * \
-            (self.num_items * self.beta_item) / (self.beta_item + self.num_items))
-
-        # Not sure why we need this...
-        WI_post = (WI_post + WI_post.T) / 2.0
-
-        # update alpha_item
-        self.alpha_item = sample_wishart(WI_post, self.df_post_item)
-
-        # update mu_item
-        mu_temp = (self.beta_item * self.mu0_item + self.num_items * x_bar) / \
-            (self.beta_item + self.num_items)
-        lam = cholesky(inv((self.beta_item + self.num_items) * self.alpha_item))
-        # lam = lam.T
-        self.mu_item = mu_temp + np.dot(lam, NormalRandom.generate_matrix(self.num_features, 1))
-
-        # raise ValueError('AAA')
+        self.alpha_item, self.mu_item = self.sample_hyperparameters(
+            self.item_features, self.WI_item, self.beta_item, self.mu0_item,
+            self.df_post_item)
 
     def update_user_params(self):
-        x_bar = np.mean(self.user_features, 0).T
+        self.alpha_user, self.mu_user = self.sample_hyperparameters(
+            self.user_features, self.WI_user, self.beta_user, self.mu0_user,
+            self.df_post_user)
+
+    def sample_hyperparameters(self, features, WI, beta0, mu0, df_post):
+        """
+        Samples the precision matrix and the mean of the features from their
+        Gaussian-Wishart posterior
+
+        :return: a tuple with the precision matrix and the mean
+        """
+        num_rows = features.shape[0]
+        x_bar = np.mean(features, 0).T
         x_bar = np.reshape(x_bar, (self.num_features, 1))
-        S_bar = np.cov(self.user_features.T)
-        norm_X_bar = self.mu0_user - x_bar
+        S_bar = np.cov(features.T)
+        norm_X_bar = mu0 - x_bar
 
-        WI_post = inv(inv(self.WI_user) + self.num_users * S_bar + \
+        WI_post = inv(inv(WI) + num_rows * S_bar + \
             np.dot(norm_X_bar, norm_X_bar.T) * \
-            (self.num_users * self.beta_user) / (self.beta_user + self.num_users))
+            (num_rows * beta0) / (beta0 + num_rows))
 
         # Not sure why we need this...
         WI_post = (WI_post + WI_post.T) / 2.0
 
-        # update alpha_user
-        self.alpha_user = sample_wishart(WI_post, self.df_post_user)
+        alpha = sample_wishart(WI_post, df_post, self.normal_generator)
 
-        # update mu_item
-        mu_temp = (self.beta_user * self.mu0_user + self.num_users * x_bar) / \
-            (self.beta_user + self.num_users)
-        lam = cholesky(inv((self.beta_user + self.num_users) * self.alpha_user))
-        self.mu_user = mu_temp + np.dot(lam, NormalRandom.generate_matrix(self.num_features, 1))
+        mu_temp = (beta0 * mu0 + num_rows * x_bar) / (beta0 + num_rows)
+        lam = cholesky(inv((beta0 + num_rows) * alpha))
+        mu = mu_temp + np.dot(lam, self.normal_generator(self.num_features, 1))
+
+        return alpha, mu
 
     def udpate_item_features(self):
-        self.matrix = self.matrix.T
         # Gibbs sampling for item features
-        for item_id in range(self.num_items):
-            self.results_file.write('Item %d\n' % (item_id+1))
-            users = self.matrix[:, item_id] > 0.0
-            features = self.user_features[users, :]
-            ratings = self.matrix[users, item_id] - self.mean_rating
-            rating_len = len(ratings)
-            ratings = np.reshape(ratings, (rating_len, 1))
-
-            covar = inv(
-                self.alpha_item + self.beta * np.dot(features.T, features))
-            lam = cholesky(covar)
-            temp = self.beta * \
-                np.dot(features.T, ratings) + np.dot(
-                    self.alpha_item, self.mu_item)
-            mean = np.dot(covar, temp)
-            temp_feature = mean + np.dot(lam, NormalRandom.generate_matrix(self.num_features, 1))
-            temp_feature = np.reshape(temp_feature, (self.num_features,))
-            self.item_features[item_id, :] = temp_feature
-
+        self.item_features = sample_features(
+            self.item_ratings, self.user_features, self.alpha_item,
+            self.mu_item, self.beta,
+            self.normal_generator(self.num_items, self.num_features))
 
     def update_user_features(self):
-        self.matrix = self.matrix.T
-        # print('matrix', self.matrix.shape, self.matrix[0:10, 0:5])
-
         # Gibbs sampling for user features
-        for user_id in range(self.num_users):
-            self.results_file.write('User %d\n' % (user_id+1))
-            items = self.matrix[:, user_id] > 0.0
-            features = self.item_features[items, :]
-            ratings = self.matrix[items, user_id] - self.mean_rating
-            rating_len = len(ratings)
-            ratings = np.reshape(ratings, (rating_len, 1))
-
-            covar = inv(
-                self.alpha_user + self.beta * np.dot(features.T, features))
-
-            temp = self.beta * \
-                np.dot(features.T, ratings) + np.dot(
-                    self.alpha_user, self.mu_user)
-            mean = np.dot(covar, temp)
-            lam = cholesky(covar)
-            temp_feature = mean + np.dot(lam, NormalRandom.generate_matrix(self.num_features, 1))
-            temp_feature = np.reshape(temp_feature, (self.num_features,))
-            self.user_features[user_id, :] = temp_feature
-
-        self.results_file.write('user_features \t (%d,%d) \t %16.16f\n' % (self.user_features.shape[0], self.user_features.shape[1], self.user_features[0,0]))
-        # transpose back
-        # self.matrix = self.matrix.T
+        self.user_features = sample_features(
+            self.user_ratings, self.item_features, self.alpha_user,
+            self.mu_user, self.beta,
+            self.normal_generator(self.num_users, self.num_features))
 
     def predict(self, data):
         u_features = self.user_features[data[:, 0], :]
@@ -255,42 +223,59 @@ class BayesianMatrixFactorization:
 
         return preds
 
-    def pred(self, w1_M1_sample,w1_P1_sample,probe_vec,mean_rating):
-        users = probe_vec[:, 0]
-        items = probe_vec[:, 1]
-
-        pred_out = np.sum(np.multiply(w1_M1_sample[items,:], w1_P1_sample[users,:]),1) + mean_rating
 
-        # print('pred_out', pred_out.shape)
-        ff = pred_out > 5
-        pred_out[ff] = 5
-        ff = pred_out < 1
-        pred_out[ff] = 1
+def sample_features(ratings, other_features, alpha, mu, beta, noise):
+    """
+    Samples the features of every row (user or item) from its conditional
+    posterior given the features of the other side. For every row i the
+    precision matrix is alpha + beta * sum_j v_j v_j^T, over the features v_j
+    of the ratings of the row. The outer products v_j v_j^T are computed once
+    for every column and summed with a sparse product, and the precision
+    matrices of all the rows are inverted and factorized on stacked arrays
+
+    :type ratings: scipy.sparse.csr_matrix
+    :param ratings: the (rows x others) matrix with the centered ratings
+    :param other_features: the (others x features) matrix
+    :param alpha: the precision matrix of the prior of the features
+    :param mu: the mean of the prior of the features, a (features x 1) matrix
+    :param beta: the precision of the ratings
+    :param noise: a (rows x features) matrix with standard normal numbers
+    :return: the sampled (rows x features) matrix
+    """
+    num_rows = ratings.shape[0]
+    num_features = other_features.shape[1]
 
-        return pred_out
+    # The ratings equal to the mean rating are stored as explicit zeros, so
+    # the structure of the matrix tells which ratings each row has
+    rated = sparse.csr_matrix(
+        (np.ones(ratings.nnz), ratings.indices, ratings.indptr),
+        shape=ratings.shape)
+    outer_products = np.einsum(
+        'ij,ik->ijk', other_features, other_features).reshape(
+        len(other_features), num_features * num_features)
 
+    precision = alpha + beta * rated.dot(outer_products).reshape(
+        num_rows, num_features, num_features)
+    covariance = inv(precision)
+    lam = cholesky(covariance)
+    temp = beta * ratings.dot(other_features) + np.dot(alpha, mu).ravel()
+    mean = np.einsum('ijk,ik->ij', covariance, temp)
 
-def build_rating_matrix(num_user, num_item, ratings):
-    """
-    build dense ratings matrix from original ml_1m rating file.
-    need to download and put ml_1m data in /data folder first.
-    Source: http://www.grouplens.org/
-    """
+    return mean + np.einsum('ijk,ik->ij', lam, noise)
 
-    print('\nbuild matrix')
-    # sparse matrix
-    #matrix = sparse.lil_matrix((num_user, num_item))
-    # dense matrix
-    matrix = np.zeros((num_user, num_item))
-    for item_id in range(num_item):
-        data = ratings[ratings[:, 1] == item_id]
-        if data.shape[0] > 0:
-            matrix[data[:, 0], item_id] = data[:, 2]
 
-        if item_id % 1000 == 0:
-            print(item_id)
+def build_rating_matrix(num_user, num_item, ratings, mean_rating=0):
+    """
+    Builds a sparse (users x items) matrix with the ratings minus the mean
+    rating
 
-    return matrix
+    :param ratings: a matrix with the user, the item and the rating of every
+    rating in its rows
+    """
+    return sparse.csr_matrix(
+        (np.float64(ratings[:, 2]) - mean_rating,
+         (ratings[:, 0], ratings[:, 1])),
+        shape=(num_user, num_item))
 
 
 def RMSE(estimation, truth):
@@ -303,7 +288,7 @@ def RMSE(estimation, truth):
     return np.sqrt(np.divide(sse, num_sample - 1.0))
 
 
-def sample_wishart(sigma, dof):
+def sample_wishart(sigma, dof, normal_generator=NormalRandom.generate_matrix):
     '''
     Returns a sample from the Wishart distn, conjugate prior for precision matrices.
     '''
@@ -312,7 +297,7 @@ def sample_wishart(sigma, dof):
 
     chol = np.linalg.cholesky(sigma).T
 
-    rnd_matrix = NormalRandom.generate_matrix(dof, n)
+    rnd_matrix = normal_generator(dof, n)
     X = np.dot(rnd_matrix, chol)
     W = np.dot(X.T, X)
 
@@ -349,4 +334,6 @@ def example():
 
     return bmf_model
 
-example()
+
+if __name__ == '__main__':
+    example()
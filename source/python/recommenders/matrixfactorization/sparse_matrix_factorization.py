@@ -0,0 +1,397 @@
+import time
+
+import numpy as np
+from scipy import sparse
+
+from recommenders.base_recommender import BaseRecommender
+
+__author__ = 'fpena'
+
+
+def accumulate(indices, values):
+    """
+    Sums the rows of values that have the same index
+
+    :param indices: an array with the index of every row
+    :param values: a (rows x features) matrix
+    :return: a tuple with the distinct indices and the matrix with the sum of
+    the rows of every index
+    """
+    unique_indices, inverse = np.unique(indices, return_inverse=True)
+    sums = np.column_stack([
+        np.bincount(inverse, weights=values[:, feature],
+                    minlength=len(unique_indices))
+        for feature in range(values.shape[1])
+    ])
+    return unique_indices, sums
+
+
+def build_rating_matrix(indices, num_rows):
+    """
+    Builds a sparse (rows x ratings) indicator matrix, so that the values of
+    the ratings can be summed by row with a matrix product
+    """
+    num_ratings = len(indices)
+    return sparse.csr_matrix(
+        (np.ones(num_ratings), (indices, np.arange(num_ratings))),
+        shape=(num_rows, num_ratings))
+
+
+class SparseMatrixFactorization(BaseRecommender):
+    """
+    Matrix factorization recommender trained on the ratings stored as COO
+    arrays (user index, item index, rating). The prediction for user u and
+    item i is
+
+        mu + b_u + b_i + p_u . q_i
+
+    where the global mean and the biases are only used when use_biases is
+    True. The model can be trained with vectorized mini-batch stochastic
+    gradient descent ('sgd') or with alternating least squares ('als') in
+    which every least squares problem is solved approximately with a few
+    steps of conjugate gradient, starting from the current factors, for all
+    the users (or items) at once. Both methods minimize the sum of the squared
+    errors plus regularization times the squared norm of the parameters.
+
+    A fraction of the ratings is held out to stop the training when the error
+    on them hasn't improved for a number of epochs, and the parameters of the
+    best epoch are kept
+    """
+
+    METHODS = ['sgd', 'als']
+
+    def __init__(
+            self, num_features=10, method='sgd', use_biases=True,
+            learning_rate=0.02, regularization=0.02, num_epochs=50,
+            batch_size=1000, cg_steps=3, validation_ratio=0.1, patience=3,
+            seed=None, verbose=False, name='SparseMatrixFactorization'):
+        """
+        :param num_features: the number of latent features
+        :param method: 'sgd' or 'als'
+        :param use_biases: if True the global mean, the user biases and the
+        item biases are added to the predictions
+        :param learning_rate: the learning rate of the stochastic gradient
+        descent
+        :param regularization: the weight of the squared norm of the
+        parameters in the objective function
+        :param num_epochs: the maximum number of passes over the ratings
+        :param batch_size: the number of ratings of every mini-batch of the
+        stochastic gradient descent
+        :param cg_steps: the number of conjugate gradient steps used to solve
+        the least squares problems of every epoch of the ALS
+        :param validation_ratio: the fraction of the ratings held out for the
+        early stopping. If 0 all the ratings are used to train and the model
+        is trained for num_epochs
+        :param patience: the number of epochs without improving the validation
+        error after which the training stops
+        :param seed: the seed of the random number generator
+        :param verbose: if True the errors of every epoch are printed
+        """
+        if method not in self.METHODS:
+            raise ValueError('Unknown matrix factorization method: ' + method)
+        super(SparseMatrixFactorization, self).__init__(name, None)
+        self.num_features = num_features
+        self.method = method
+        self.use_biases = use_biases
+        self.learning_rate = learning_rate
+        self.regularization = regularization
+        self.num_epochs = num_epochs
+        self.batch_size = batch_size
+        self.cg_steps = cg_steps
+        self.validation_ratio = validation_ratio
+        self.patience = patience
+        self.random_state = np.random.RandomState(seed)
+        self.verbose = verbose
+
+        self.user_index_map = None
+        self.item_index_map = None
+        self.global_mean = 0.0
+        self.user_biases = None
+        self.item_biases = None
+        self.user_factors = None
+        self.item_factors = None
+        self.train_errors = []
+        self.validation_errors = []
+        # The (users, items, ratings) arrays held out for the early stopping
+        self.validation_set = None
+
+    def load(self, reviews):
+        self.reviews = reviews
+        self.user_index_map = {}
+        self.item_index_map = {}
+        users = np.fromiter(
+            (self.user_index_map.setdefault(
+                review['user_id'], len(self.user_index_map))
+             for review in reviews), np.int64, len(reviews))
+        items = np.fromiter(
+            (self.item_index_map.setdefault(
+                review['offering_id'], len(self.item_index_map))
+             for review in reviews), np.int64, len(reviews))
+        ratings = np.fromiter(
+            (review['overall_rating'] for review in reviews), float,
+            len(reviews))
+        self.user_ids = list(self.user_index_map)
+
+        self.fit(users, items, ratings)
+
+    def clear(self):
+        super(SparseMatrixFactorization, self).clear()
+        self.user_index_map = None
+        self.item_index_map = None
+        self.user_biases = None
+        self.item_biases = None
+        self.user_factors = None
+        self.item_factors = None
+
+    def fit(self, users, items, ratings, num_users=None, num_items=None):
+        """
+        Trains the model
+
+        :type users: numpy.ndarray
+        :param users: the index of the user of every rating
+        :type items: numpy.ndarray
+        :param items: the index of the item of every rating
+        :type ratings: numpy.ndarray
+        :param ratings: the value of every rating
+        :param num_users: the number of users, by default the highest user
+        index plus one
+        :param num_items: the number of items, by default the highest item
+        index plus one
+        """
+        users = np.asarray(users, dtype=np.int64)
+        items = np.asarray(items, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=float)
+        num_users = users.max() + 1 if num_users is None else num_users
+        num_items = items.max() + 1 if num_items is None else num_items
+
+        order = self.random_state.permutation(len(ratings))
+        num_validation = int(len(ratings) * self.validation_ratio)
+        validation = order[:num_validation]
+        train = order[num_validation:]
+        self.validation_set = \
+            users[validation], items[validation], ratings[validation]
+
+        self.global_mean = ratings[train].mean() if self.use_biases else 0.0
+        self.user_biases = np.zeros(num_users)
+        self.item_biases = np.zeros(num_items)
+        self.user_factors = self.random_state.normal(
+            0, 0.1, (num_users, self.num_features))
+        self.item_factors = self.random_state.normal(
+            0, 0.1, (num_items, self.num_features))
+        self.train_errors = []
+        self.validation_errors = []
+
+        train_users, train_items, train_ratings = \
+            users[train], items[train], ratings[train]
+        if self.method == 'als':
+            user_matrix = build_rating_matrix(train_users, num_users)
+            item_matrix = build_rating_matrix(train_items, num_items)
+
+        best_error = float('inf')
+        best_parameters = None
+        epochs_without_improvement = 0
+
+        for epoch in range(self.num_epochs):
+            epoch_start = time.time()
+            if self.method == 'sgd':
+                self.sgd_epoch(train_users, train_items, train_ratings)
+            else:
+                self.als_epoch(
+                    train_users, train_items, train_ratings, user_matrix,
+                    item_matrix)
+
+            self.train_errors.append(self.calculate_rmse(
+                train_users, train_items, train_ratings))
+            if num_validation == 0:
+                continue
+
+            validation_error = self.calculate_rmse(*self.validation_set)
+            self.validation_errors.append(validation_error)
+            if self.verbose:
+                print('Epoch %d: train RMSE = %f, validation RMSE = %f, '
+                      'time = %f seconds' %
+                      (epoch + 1, self.train_errors[-1], validation_error,
+                       time.time() - epoch_start))
+
+            if validation_error < best_error:
+                best_error = validation_error
+                best_parameters = self.get_parameters()
+                epochs_without_improvement = 0
+            else:
+                epochs_without_improvement += 1
+                if epochs_without_improvement >= self.patience:
+                    break
+
+        if best_parameters is not None:
+            self.user_biases, self.item_biases, self.user_factors, \
+                self.item_factors = best_parameters
+
+    def get_parameters(self):
+        return (
+            self.user_biases.copy(), self.item_biases.copy(),
+            self.user_factors.copy(), self.item_factors.copy())
+
+    def sgd_epoch(self, users, items, ratings):
+        """
+        Runs an epoch of mini-batch stochastic gradient descent. The gradient
+        of every rating in a batch is computed with the same parameters, and
+        the gradients of the ratings of the same user (or item) are summed
+        """
+        learning_rate = self.learning_rate
+        regularization = self.regularization
+        order = self.random_state.permutation(len(ratings))
+
+        for start in range(0, len(ratings), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            batch_users = users[batch]
+            batch_items = items[batch]
+            user_factors = self.user_factors[batch_users]
+            item_factors = self.item_factors[batch_items]
+            errors = ratings[batch] - self.predict_indices(
+                batch_users, batch_items)
+
+            if self.use_biases:
+                self.user_biases += learning_rate * (np.bincount(
+                    batch_users, weights=errors,
+                    minlength=len(self.user_biases)) - regularization *
+                    np.bincount(batch_users, minlength=len(self.user_biases)) *
+                    self.user_biases)
+                self.item_biases += learning_rate * (np.bincount(
+                    batch_items, weights=errors,
+                    minlength=len(self.item_biases)) - regularization *
+                    np.bincount(batch_items, minlength=len(self.item_biases)) *
+                    self.item_biases)
+
+            unique_users, user_gradients = accumulate(
+                batch_users, errors[:, None] * item_factors -
+                regularization * user_factors)
+            unique_items, item_gradients = accumulate(
+                batch_items, errors[:, None] * user_factors -
+                regularization * item_factors)
+            self.user_factors[unique_users] += learning_rate * user_gradients
+            self.item_factors[unique_items] += learning_rate * item_gradients
+
+    def als_epoch(self, users, items, ratings, user_matrix, item_matrix):
+        """
+        Runs an epoch of alternating least squares, updating first the users'
+        parameters with the items' parameters fixed and then the other way
+        around
+        """
+        self.user_factors, self.user_biases = self.solve_least_squares(
+            self.user_factors, self.user_biases, self.item_factors,
+            self.item_biases, users, items, ratings, user_matrix)
+        self.item_factors, self.item_biases = self.solve_least_squares(
+            self.item_factors, self.item_biases, self.user_factors,
+            self.user_biases, items, users, ratings, item_matrix)
+
+    def solve_least_squares(
+            self, factors, biases, fixed_factors, fixed_biases, rows, columns,
+            ratings, rating_matrix):
+        """
+        Updates the factors of every row (user or item) by minimizing
+
+            sum_j (r_ij - mu - b_i - b_j - x_i . y_j) ^ 2 + reg * |x_i| ^ 2
+
+        with a few steps of conjugate gradient for all the rows at once, and
+        then updates the biases of every row in closed form
+
+        :param factors: the (rows x features) matrix that is updated
+        :param biases: the biases of the rows
+        :param fixed_factors: the factors of the other side, which are fixed
+        :param fixed_biases: the biases of the other side
+        :param rows: the row index of every rating
+        :param columns: the index of the other side of every rating
+        :param ratings: the value of every rating
+        :param rating_matrix: the sparse (rows x ratings) indicator matrix
+        :return: a tuple with the new factors and biases
+        """
+        regularization = self.regularization
+        rating_factors = fixed_factors[columns]
+        targets = ratings - self.global_mean - fixed_biases[columns] - \
+            biases[rows]
+
+        def multiply(vectors):
+            projections = np.einsum('ij,ij->i', rating_factors, vectors[rows])
+            return rating_matrix.dot(projections[:, None] * rating_factors) + \
+                regularization * vectors
+
+        factors = factors.copy()
+        residuals = rating_matrix.dot(targets[:, None] * rating_factors) - \
+            multiply(factors)
+        directions = residuals.copy()
+        residual_norms = (residuals ** 2).sum(axis=1)
+
+        for _ in range(self.cg_steps):
+            products = multiply(directions)
+            curvatures = (directions * products).sum(axis=1)
+            step_sizes = np.divide(
+                residual_norms, curvatures, out=np.zeros_like(residual_norms),
+                where=curvatures > 0)
+            factors += step_sizes[:, None] * directions
+            residuals -= step_sizes[:, None] * products
+            new_residual_norms = (residuals ** 2).sum(axis=1)
+            corrections = np.divide(
+                new_residual_norms, residual_norms,
+                out=np.zeros_like(residual_norms), where=residual_norms > 0)
+            directions = residuals + corrections[:, None] * directions
+            residual_norms = new_residual_norms
+
+        if self.use_biases:
+            errors = targets + biases[rows] - np.einsum(
+                'ij,ij->i', rating_factors, factors[rows])
+            biases = rating_matrix.dot(errors) / (
+                rating_matrix.dot(np.ones(len(rows))) + regularization)
+
+        return factors, biases
+
+    def predict_indices(self, users, items):
+        """
+        Predicts the ratings of the given user and item indices
+
+        :rtype: numpy.ndarray
+        """
+        predictions = np.einsum(
+            'ij,ij->i', self.user_factors[users], self.item_factors[items])
+        if self.use_biases:
+            predictions += self.global_mean + self.user_biases[users] + \
+                self.item_biases[items]
+        return predictions
+
+    def calculate_rmse(self, users, items, ratings):
+        return np.sqrt(np.mean(
+            (self.predict_indices(users, items) - ratings) ** 2))
+
+    def predict_rating(self, user_id, item_id):
+        """
+        Predicts the rating that the given user would give to the given item
+
+        :return: the predicted rating, or None if the user or the item don't
+        appear in the ratings the model was trained with
+        """
+        if user_id not in self.user_index_map or\
+                item_id not in self.item_index_map:
+            return None
+
+        return self.predict_indices(
+            np.array([self.user_index_map[user_id]]),
+            np.array([self.item_index_map[item_id]]))[0]
+
+    def predict_many(self, user_ids, item_ids, contexts=None):
+        predictions = [None] * len(user_ids)
+        positions = [
+            position for position, (user_id, item_id)
+            in enumerate(zip(user_ids, item_ids))
+            if user_id in self.user_index_map and
+            item_id in self.item_index_map
+        ]
+        if not positions:
+            return predictions
+
+        users = np.array(
+            [self.user_index_map[user_ids[position]] for position in positions])
+        items = np.array(
+            [self.item_index_map[item_ids[position]] for position in positions])
+        for position, prediction in zip(
+                positions, self.predict_indices(users, items)):
+            predictions[position] = prediction
+        return predictions
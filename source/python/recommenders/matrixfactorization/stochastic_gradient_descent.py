@@ -2,62 +2,33 @@ import numpy as np
 from scipy import sparse
 from scipy.sparse import csr_matrix
 import time
-from recommenders.base_recommender import BaseRecommender
+from recommenders.matrixfactorization.sparse_matrix_factorization import \
+    SparseMatrixFactorization
 from tripadvisor.fourcity import extractor
 from tripadvisor.fourcity import movielens_extractor
 
 __author__ = 'fpena'
 
 
-class StochasticGradientDescent(BaseRecommender):
+class StochasticGradientDescent(SparseMatrixFactorization):
+    """
+    Matrix factorization without biases trained with stochastic gradient
+    descent. The training runs on the sparse ratings, the dense
+    matrix_factorization function below is kept as a reference
+    """
+
     def __init__(self, num_features):
         super(StochasticGradientDescent, self).__init__(
-            'StochasticGradientDescentRecommender', None, None)
-        self.num_features = num_features
-        self.reviews = None
-        self.user_ids = None
-        self.item_ids = None
-        self.p = None
-        self.q = None
-        self.data_matrix = None
-        self.num_users = None
-        self.num_items = None
-        self.learning_rate = 0.001
-        self.regularization = 0.02
-        self.n_p = None
-        self.n_q = None
-        self.user_index_map = None
-        self.item_index_map = None
-
-    def load(self, reviews):
-        self.reviews = reviews
-        self.user_ids = extractor.get_groupby_list(self.reviews, 'user_id')
-        self.item_ids = extractor.get_groupby_list(self.reviews, 'offering_id')
-        self.num_users = len(self.user_ids)
-        self.num_items = len(self.item_ids)
-        self.data_matrix = create_matrix(self.reviews)
-        self.user_index_map = build_user_index_map(reviews)
-        self.item_index_map = build_item_index_map(reviews)
-
-        R = create_matrix(self.reviews).todense()
-
-        R = np.array(R)
-
-        N = len(R)
-        M = len(R[0])
-        K = 2
-
-        P = np.random.rand(N, K)
-        Q = np.random.rand(M, K)
-        # P.fill(0.1)
-        # Q.fill(0.1)
-
-        self.n_p, self.n_q = matrix_factorization(R, P, Q, K)
-
-    def predict_rating(self, user_id, item_id):
-        # return np.dot(self.p[user_id - 1, :], self.q[:, item_id - 1])
-        return np.dot(self.n_p[self.user_index_map[user_id]],
-                      self.n_q[self.item_index_map[item_id]])
+            num_features, 'sgd', use_biases=False,
+            name='StochasticGradientDescentRecommender')
+
+    @property
+    def n_p(self):
+        return self.user_factors
+
+    @property
+    def n_q(self):
+        return self.item_factors
 
 
 test_reviews = [
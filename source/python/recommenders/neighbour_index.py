@@ -0,0 +1,214 @@
+import numpy
+from scipy import sparse
+
+__author__ = 'fpena'
+
+
+class NeighbourIndex:
+    """
+    Keeps, for every user, the arrays with the IDs of his/her most similar
+    users and their similarities, sorted in descending order. The index is
+    built once from the similarity matrix, so recommenders don't have to sort
+    a whole row of the similarity matrix every time they make a prediction
+    """
+
+    def __init__(self, num_neighbours=None):
+        self.num_neighbours = num_neighbours
+        self.user_similarity_matrix = None
+        self.user_ids = None
+        self.neighbour_positions = None
+        self.neighbour_similarities = None
+        self._user_positions = None
+        self._similarities = None
+        self._item_positions = None
+        self._ratings_matrix = None
+
+    def build(self, user_similarity_matrix, user_dictionary, user_ids):
+        """
+        Builds the index from the given similarity matrix
+
+        :param user_similarity_matrix: a dictionary of dictionaries where
+        user_similarity_matrix[user1][user2] contains the similarity between
+        user1 and user2
+        :param user_dictionary: a dictionary with the users, the keys of the
+        dictionary are the users' ID
+        :param user_ids: the IDs of the users
+        """
+        self.user_similarity_matrix = user_similarity_matrix
+        self.user_ids = list(user_ids)
+        self._user_positions = {
+            user_id: position for position, user_id in enumerate(self.user_ids)
+        }
+
+        num_users = len(self.user_ids)
+        similarities = numpy.full((num_users, num_users), numpy.nan)
+        for user1, row in user_similarity_matrix.iteritems():
+            position1 = self._user_positions.get(user1)
+            if position1 is None:
+                continue
+            for user2, similarity in row.iteritems():
+                position2 = self._user_positions.get(user2)
+                if position2 is not None and similarity is not None:
+                    similarities[position1, position2] = similarity
+        # A user is never part of his/her own neighbourhood
+        numpy.fill_diagonal(similarities, numpy.nan)
+        self._similarities = similarities
+
+        # A users x items matrix in compressed columns, so the users who have
+        # rated an item can be obtained by slicing its column
+        self._item_positions = {}
+        rows = []
+        columns = []
+        ratings = []
+        for position, user_id in enumerate(self.user_ids):
+            for item_id, rating in\
+                    user_dictionary[user_id].item_ratings.iteritems():
+                rows.append(position)
+                columns.append(self._item_positions.setdefault(
+                    item_id, len(self._item_positions)))
+                ratings.append(rating)
+        self._ratings_matrix = sparse.csc_matrix(
+            (ratings, (rows, columns)),
+            shape=(num_users, len(self._item_positions)))
+        self._ratings_matrix.sort_indices()
+
+        self._build_top_neighbours()
+
+    def _build_top_neighbours(self):
+        """
+        Selects the top num_neighbours users of every row with argpartition
+        and sorts only those. If num_neighbours is None the whole rows are
+        sorted
+        """
+        num_users = len(self.user_ids)
+        # Missing similarities get an infinite score so they are sorted last
+        scores = numpy.where(
+            numpy.isnan(self._similarities), numpy.inf, -self._similarities)
+
+        if self.num_neighbours is None or self.num_neighbours >= num_users:
+            order = numpy.argsort(scores, axis=1, kind='mergesort')
+        else:
+            top_positions = numpy.sort(numpy.argpartition(
+                scores, self.num_neighbours - 1,
+                axis=1)[:, :self.num_neighbours], axis=1)
+            top_scores = numpy.take_along_axis(scores, top_positions, axis=1)
+            order = numpy.take_along_axis(
+                top_positions,
+                numpy.argsort(top_scores, axis=1, kind='mergesort'), axis=1)
+
+            # argpartition breaks the ties in the last place arbitrarily, in
+            # the rows where that happens the users with the lowest positions
+            # are kept, as in a full stable sort
+            kth_scores = top_scores.max(axis=1)
+            tied_rows = numpy.flatnonzero(
+                numpy.isfinite(kth_scores) &
+                ((scores <= kth_scores[:, numpy.newaxis]).sum(axis=1) >
+                 self.num_neighbours))
+            for row in tied_rows:
+                order[row] = numpy.argsort(
+                    scores[row], kind='mergesort')[:self.num_neighbours]
+
+        ordered_scores = numpy.take_along_axis(scores, order, axis=1)
+        num_valid = numpy.isfinite(ordered_scores).sum(axis=1)
+
+        self.neighbour_positions = [
+            order[row, :count] for row, count in enumerate(num_valid)]
+        self.neighbour_similarities = [
+            -ordered_scores[row, :count] for row, count in enumerate(num_valid)]
+
+    def get_neighbourhood(self, user_id, item_id=None):
+        """
+        Returns the IDs of the users most similar to the given user, sorted by
+        similarity in descending order. If an item is given, only the users
+        who have rated that item are considered
+
+        :param user_id: the ID of the user
+        :param item_id: the ID of the item the neighbours must have rated
+        :return: a list with at most num_neighbours user IDs, or all the
+        similar users if num_neighbours is None
+        """
+        position = self._user_positions[user_id]
+        top_positions = self.neighbour_positions[position]
+
+        if item_id is None:
+            return [self.user_ids[neighbour] for neighbour in top_positions]
+
+        raters = self._get_item_raters(item_id)
+        if raters is None:
+            return []
+
+        # If enough of the top neighbours have rated the item, or the top
+        # neighbours already are all the similar users, they are the answer
+        if self.num_neighbours is not None:
+            rated_positions = top_positions[
+                numpy.in1d(top_positions, raters, assume_unique=True)]
+            if len(rated_positions) == self.num_neighbours or\
+                    len(top_positions) < self.num_neighbours:
+                return [self.user_ids[neighbour] for neighbour in rated_positions]
+
+        # Otherwise the users who have rated the item are ranked directly
+        similarities = self._similarities[position, raters]
+        is_valid = ~numpy.isnan(similarities)
+        candidates = raters[is_valid]
+        similarities = similarities[is_valid]
+
+        order = numpy.argsort(
+            -similarities, kind='mergesort')[:self.num_neighbours]
+        return [self.user_ids[neighbour] for neighbour in candidates[order]]
+
+    def get_neighbourhood_ratings(self, user_id, item_ids):
+        """
+        Returns the neighbourhoods of the given user for several items at once.
+        The result is a tuple (neighbours, similarities, ratings), where
+        neighbours is an array with the positions of all the users that have a
+        similarity with the given user, and similarities and ratings are
+        neighbours x items matrices. For every item, the similarities matrix
+        only contains the similarities of the users that get_neighbourhood
+        returns for that item, the rest of the entries are zero. The
+        similarity of each neighbour is its similarity to the user, in
+        user_similarity_matrix[neighbour][user_id]
+
+        :param user_id: the ID of the user
+        :param item_ids: the list of IDs of the items
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        position = self._user_positions[user_id]
+        user_similarities = self._similarities[position]
+        neighbours = numpy.flatnonzero(~numpy.isnan(user_similarities))
+        neighbours = neighbours[numpy.argsort(
+            -user_similarities[neighbours], kind='mergesort')]
+
+        known_items = [
+            index for index, item_id in enumerate(item_ids)
+            if item_id in self._item_positions]
+        columns = [self._item_positions[item_ids[index]] for index in known_items]
+
+        ratings = numpy.zeros((len(neighbours), len(item_ids)))
+        is_rated = numpy.zeros((len(neighbours), len(item_ids)), dtype=bool)
+        if columns:
+            item_ratings = self._ratings_matrix[:, columns][neighbours]
+            ratings[:, known_items] = item_ratings.toarray()
+            item_ratings.data[:] = 1
+            is_rated[:, known_items] = item_ratings.toarray() > 0
+
+        # Only the first num_neighbours users who have rated each item
+        if self.num_neighbours is not None:
+            is_rated &= numpy.cumsum(is_rated, axis=0) <= self.num_neighbours
+
+        # The neighbours are chosen by the similarity of the user to them, but
+        # their ratings are weighted by their similarity to the user, as
+        # predict_rating does. Missing similarities don't contribute
+        neighbour_similarities = numpy.nan_to_num(
+            self._similarities[neighbours, position])
+        similarities = numpy.where(
+            is_rated, neighbour_similarities[:, numpy.newaxis], 0.)
+
+        return neighbours, similarities, ratings
+
+    def _get_item_raters(self, item_id):
+        column = self._item_positions.get(item_id)
+        if column is None:
+            return None
+        start = self._ratings_matrix.indptr[column]
+        end = self._ratings_matrix.indptr[column + 1]
+        return self._ratings_matrix.indices[start:end]
@@ -1,4 +1,5 @@
 from etl import similarity_calculator
+from recommenders.similarity import similarity_engine
 from recommenders.similarity.base_similarity_matrix_builder import \
     BaseSimilarityMatrixBuilder
 from tripadvisor.fourcity import extractor
@@ -12,6 +13,26 @@ class AverageSimilarityMatrixBuilder(BaseSimilarityMatrixBuilder):
         super(AverageSimilarityMatrixBuilder, self).__init__(
             'MultiAverageSimilarity', similarity_metric, True)
 
+    def calculate_similarity_matrix(self, user_dictionary, user_ids):
+        ratings_matrix = similarity_engine.build_ratings_matrix(
+            user_dictionary, user_ids)
+        rated_matrix = similarity_engine.get_rated_matrix(ratings_matrix)
+        total_similarity = similarity_engine.calculate_similarity_matrix(
+            ratings_matrix, self._similarity_metric, self._min_common_items)
+
+        num_criteria =\
+            similarity_engine.get_num_criteria(user_dictionary, user_ids)
+
+        for i in xrange(0, num_criteria):
+            criterion_ratings_matrix = similarity_engine.build_ratings_matrix(
+                user_dictionary, user_ids, i)
+            # Pairs without a similarity in any of the criteria become NaN
+            total_similarity += similarity_engine.calculate_similarity_matrix(
+                criterion_ratings_matrix, self._similarity_metric,
+                self._min_common_items, rated_matrix)
+
+        return total_similarity / (num_criteria + 1)
+
     def calculate_users_similarity(self, user_dictionary, user1, user2):
 
         common_items = extractor.get_common_items(user_dictionary, user1, user2)
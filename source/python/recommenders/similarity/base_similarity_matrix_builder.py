@@ -1,4 +1,5 @@
 from abc import abstractmethod, ABCMeta
+from recommenders.similarity import similarity_engine
 
 __author__ = 'fpena'
 
@@ -20,6 +21,12 @@ class BaseSimilarityMatrixBuilder:
         to prevent repeating the same calculations in each cycle
 
         """
+        similarity_matrix =\
+            self.calculate_similarity_matrix(user_dictionary, user_ids)
+        if similarity_matrix is not None:
+            return similarity_engine.to_similarity_dictionary(
+                similarity_matrix, user_ids)
+
         user_similarity_matrix = {}
 
         for user1 in user_ids:
@@ -32,6 +39,23 @@ class BaseSimilarityMatrixBuilder:
 
         return user_similarity_matrix
 
+    def calculate_similarity_matrix(self, user_dictionary, user_ids):
+        """
+        Calculates the similarity between every pair of users at once using the
+        similarity engine. Builders that can express their similarity in terms
+        of users x items matrices override this method, the rest return None
+        and fall back to comparing the users one pair at a time
+
+        :param user_dictionary: a dictionary with the users, the keys of the
+        dictionary are the users' ID
+        :param user_ids: the IDs of the users
+        :rtype: numpy.ndarray
+        :return: a dense users x users matrix with the similarities, with NaN
+        in the pairs that have no similarity, or None if this builder doesn't
+        support the vectorized calculation
+        """
+        return None
+
     @abstractmethod
     def calculate_users_similarity(self, user_dictionary, user_id1, user_id2):
         pass
@@ -1,4 +1,8 @@
+import numpy
+from scipy.spatial import distance
+
 from etl import similarity_calculator
+from recommenders.similarity import similarity_engine
 from recommenders.similarity.base_similarity_matrix_builder import \
     BaseSimilarityMatrixBuilder
 from tripadvisor.fourcity import extractor
@@ -6,12 +10,69 @@ from tripadvisor.fourcity import extractor
 __author__ = 'fpena'
 
 
+DISTANCE_METRICS = {
+    'chebyshev': 'chebyshev',
+    'euclidean': 'euclidean',
+    'manhattan': 'cityblock'
+}
+
+
 class MultiSimilarityMatrixBuilder(BaseSimilarityMatrixBuilder):
 
     def __init__(self, similarity_metric):
         super(MultiSimilarityMatrixBuilder, self).__init__(
             'MultiStandardSimilarity', similarity_metric, True)
 
+    def calculate_similarity_matrix(self, user_dictionary, user_ids):
+        """
+        Calculates the per-item similarities of all the users that have rated
+        each item at once and then averages them over the common items.
+
+        calculate_users_similarity takes the overall rating of both users from
+        user1, so the overall rating never contributes to a distance. This is
+        why only the distance based metrics are supported here, by comparing
+        the multi-criteria ratings alone. For the other metrics None is
+        returned and the similarities are calculated pair by pair
+        """
+        if self._similarity_metric not in DISTANCE_METRICS:
+            return None
+
+        ratings_matrix = similarity_engine.build_ratings_matrix(
+            user_dictionary, user_ids)
+        rated_matrix = similarity_engine.get_rated_matrix(ratings_matrix)
+        common_items = (rated_matrix * rated_matrix.T).toarray()
+
+        num_criteria =\
+            similarity_engine.get_num_criteria(user_dictionary, user_ids)
+        criteria_columns = [
+            similarity_engine.build_ratings_matrix(
+                user_dictionary, user_ids, i).tocsc()
+            for i in xrange(num_criteria)
+        ]
+
+        num_users = len(user_ids)
+        similarity_sum = numpy.zeros((num_users, num_users))
+        item_columns = rated_matrix.tocsc()
+
+        for item in xrange(item_columns.shape[1]):
+            start = item_columns.indptr[item]
+            end = item_columns.indptr[item + 1]
+            rows = item_columns.indices[start:end]
+            item_ratings = numpy.column_stack(
+                [columns.data[start:end] for columns in criteria_columns])
+            distances = distance.cdist(
+                item_ratings, item_ratings,
+                DISTANCE_METRICS[self._similarity_metric])
+            similarity_sum[numpy.ix_(rows, rows)] += 1. / (1 + distances)
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            similarity_matrix = similarity_sum / common_items
+        similarity_matrix[common_items == 0] = numpy.nan
+        if self._min_common_items is not None:
+            similarity_matrix[common_items < self._min_common_items] = numpy.nan
+
+        return similarity_matrix
+
     def calculate_users_similarity(self, user_dictionary, user1, user2):
 
         common_items = extractor.get_common_items(user_dictionary, user1, user2)
@@ -0,0 +1,268 @@
+import numpy
+from scipy import sparse
+
+__author__ = 'fpena'
+
+
+DEFAULT_BLOCK_SIZE = 1000
+SIMILARITY_METRICS = [
+    'chebyshev',
+    'cosine',
+    'euclidean',
+    'manhattan',
+    'pearson'
+]
+# Variances below this fraction of the sum of squares are considered to be
+# rounding noise, which happens when all the co-rated values are the same
+VARIANCE_TOLERANCE = 1e-10
+
+
+def build_ratings_matrix(user_dictionary, user_ids, criterion=None):
+    """
+    Builds a sparse users x items matrix with the ratings that each user has
+    given to the items. The rows follow the order of user_ids. Every rated item
+    is stored explicitly, even if its rating is zero, so the sparsity structure
+    of the matrix tells which items each user has rated
+
+    :param user_dictionary: a dictionary with the users, the keys of the
+    dictionary are the users' ID
+    :param user_ids: the list of IDs of the users that are going to be
+    included in the matrix
+    :param criterion: the index of the rating criterion that is going to be
+    used. If None the overall ratings are used
+    :rtype: scipy.sparse.csr_matrix
+    :return: the ratings matrix
+    """
+    item_index = {}
+    indptr = [0]
+    indices = []
+    data = []
+
+    for user_id in user_ids:
+        user = user_dictionary[user_id]
+        for item_id, rating in user.item_ratings.iteritems():
+            if criterion is not None:
+                rating = user.item_multi_ratings[item_id][criterion]
+            indices.append(item_index.setdefault(item_id, len(item_index)))
+            data.append(rating)
+        indptr.append(len(indices))
+
+    ratings_matrix = sparse.csr_matrix(
+        (numpy.array(data, dtype=float), numpy.array(indices, dtype=numpy.int32),
+         numpy.array(indptr, dtype=numpy.int32)),
+        shape=(len(user_ids), len(item_index)))
+    ratings_matrix.sort_indices()
+
+    return ratings_matrix
+
+
+def build_dense_ratings_matrix(vectors):
+    """
+    Builds a sparse matrix in which every user has rated every column, using
+    the given list of vectors as rows. This is useful to compare users through
+    vectors that have no missing values, such as the criteria weights
+
+    :param vectors: a list with a vector of the same length for each user
+    :rtype: scipy.sparse.csr_matrix
+    :return: the ratings matrix
+    """
+    dense_matrix = numpy.array(vectors, dtype=float)
+    num_rows, num_columns = dense_matrix.shape
+    indices = numpy.tile(numpy.arange(num_columns, dtype=numpy.int32), num_rows)
+    indptr = numpy.arange(
+        0, num_rows * num_columns + 1, num_columns, dtype=numpy.int32)
+
+    return sparse.csr_matrix(
+        (dense_matrix.ravel(), indices, indptr), shape=dense_matrix.shape)
+
+
+def get_num_criteria(user_dictionary, user_ids):
+    """
+    Returns the number of criteria in the multi-criteria ratings of the users
+
+    :param user_dictionary: a dictionary with the users, the keys of the
+    dictionary are the users' ID
+    :param user_ids: the IDs of the users
+    :return: the length of the multi-criteria ratings, or 0 if none of the
+    users has rated an item
+    """
+    for user_id in user_ids:
+        for multi_ratings in \
+                user_dictionary[user_id].item_multi_ratings.itervalues():
+            return len(multi_ratings)
+    return 0
+
+
+def get_rated_matrix(ratings_matrix):
+    """
+    Returns a binary matrix with the same sparsity structure as the given
+    ratings matrix, in which every rated item has a value of 1
+
+    :type ratings_matrix: scipy.sparse.csr_matrix
+    :param ratings_matrix: the ratings matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+    rated_matrix = ratings_matrix.copy()
+    rated_matrix.data = numpy.ones(len(rated_matrix.data))
+    return rated_matrix
+
+
+def calculate_similarity_matrix(
+        ratings_matrix, similarity_metric, min_common_items=None,
+        rated_matrix=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Calculates the similarity between every pair of rows of the given ratings
+    matrix. As in similarity_calculator.calculate_similarity, only the items
+    that both users have rated are taken into account. The matrix is processed
+    in blocks of rows, so that all the pairs are computed with sparse matrix
+    products instead of comparing the users one pair at a time
+
+    :type ratings_matrix: scipy.sparse.csr_matrix
+    :param ratings_matrix: a users x items matrix with the ratings
+    :param similarity_metric: the name of the similarity metric, it can be
+    'chebyshev', 'cosine', 'euclidean', 'manhattan' or 'pearson'
+    :param min_common_items: the minimum number of items two users must have
+    rated in common in order to calculate their similarity
+    :type rated_matrix: scipy.sparse.csr_matrix
+    :param rated_matrix: a binary matrix that indicates which items each user
+    has rated. If None it is obtained from the structure of ratings_matrix
+    :param block_size: the number of rows that are processed at once
+    :rtype: numpy.ndarray
+    :return: a dense users x users matrix with the similarities. The pairs of
+    users for which the similarity is not defined contain NaN
+    """
+    if similarity_metric not in SIMILARITY_METRICS:
+        msg = 'Unrecognized similarity metric \'' + similarity_metric + '\''
+        raise ValueError(msg)
+
+    ratings_matrix = sparse.csr_matrix(ratings_matrix, dtype=float)
+    if rated_matrix is None:
+        rated_matrix = get_rated_matrix(ratings_matrix)
+    rated_matrix = sparse.csr_matrix(rated_matrix, dtype=float)
+    squares_matrix = ratings_matrix.multiply(ratings_matrix).tocsr()
+
+    num_users = ratings_matrix.shape[0]
+    similarity_matrix = numpy.empty((num_users, num_users))
+
+    ratings_transpose = ratings_matrix.T.tocsc()
+    rated_transpose = rated_matrix.T.tocsc()
+    squares_transpose = squares_matrix.T.tocsc()
+    ratings_columns = ratings_matrix.tocsc()
+    rated_columns = rated_matrix.tocsc()
+
+    for start in xrange(0, num_users, block_size):
+        end = min(start + block_size, num_users)
+        ratings_block = ratings_matrix[start:end]
+        rated_block = rated_matrix[start:end]
+
+        common_items = (rated_block * rated_transpose).toarray()
+
+        if similarity_metric in ['chebyshev', 'manhattan']:
+            distances = _calculate_absolute_distances(
+                ratings_matrix, ratings_columns, rated_columns, start, end,
+                similarity_metric)
+            block_similarity = 1. / (1 + distances)
+        else:
+            products = (ratings_block * ratings_transpose).toarray()
+            squares1 = (squares_matrix[start:end] * rated_transpose).toarray()
+            squares2 = (rated_block * squares_transpose).toarray()
+
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                if similarity_metric == 'cosine':
+                    block_similarity = \
+                        products / numpy.sqrt(squares1 * squares2)
+                elif similarity_metric == 'euclidean':
+                    squared_distances = numpy.maximum(
+                        squares1 + squares2 - 2 * products, 0)
+                    block_similarity = \
+                        1. / (1 + numpy.sqrt(squared_distances))
+                else:
+                    sums1 = (ratings_block * rated_transpose).toarray()
+                    sums2 = (rated_block * ratings_transpose).toarray()
+                    block_similarity = _calculate_pearson(
+                        common_items, products, sums1, sums2, squares1,
+                        squares2)
+
+        block_similarity[common_items == 0] = numpy.nan
+        if min_common_items is not None:
+            block_similarity[common_items < min_common_items] = numpy.nan
+
+        similarity_matrix[start:end] = block_similarity
+
+    return similarity_matrix
+
+
+def _calculate_pearson(
+        common_items, products, sums1, sums2, squares1, squares2):
+    """
+    Calculates the Pearson correlation coefficient from the sums of the
+    co-rated values. Following similarity_calculator.calculate_similarity,
+    non-positive and undefined correlations are returned as NaN
+    """
+    covariance = products - sums1 * sums2 / common_items
+    variance1 = squares1 - sums1 ** 2 / common_items
+    variance2 = squares2 - sums2 ** 2 / common_items
+    variance1[variance1 <= VARIANCE_TOLERANCE * squares1] = numpy.nan
+    variance2[variance2 <= VARIANCE_TOLERANCE * squares2] = numpy.nan
+
+    correlation = numpy.clip(
+        covariance / numpy.sqrt(variance1 * variance2), -1., 1.)
+    correlation[~(correlation > 0)] = numpy.nan
+
+    return correlation
+
+
+def _calculate_absolute_distances(
+        ratings_matrix, ratings_columns, rated_columns, start, end,
+        similarity_metric):
+    """
+    Calculates the manhattan or chebyshev distance between the users in the
+    rows [start, end) and all the users, restricted to the co-rated items.
+    Each user is compared against everyone else at once by slicing the columns
+    of the items that user has rated
+    """
+    num_users = ratings_matrix.shape[0]
+    distances = numpy.zeros((end - start, num_users))
+
+    for row in xrange(start, end):
+        row_start = ratings_matrix.indptr[row]
+        row_end = ratings_matrix.indptr[row + 1]
+        items = ratings_matrix.indices[row_start:row_end]
+        if len(items) == 0:
+            continue
+        ratings = ratings_matrix.data[row_start:row_end]
+
+        differences = abs(
+            ratings_columns[:, items] -
+            rated_columns[:, items].multiply(ratings)).tocsr()
+
+        if similarity_metric == 'manhattan':
+            row_distances = differences.sum(axis=1)
+        else:
+            row_distances = differences.max(axis=1).toarray()
+        distances[row - start] = numpy.asarray(row_distances).ravel()
+
+    return distances
+
+
+def to_similarity_dictionary(similarity_matrix, user_ids):
+    """
+    Converts a dense similarity matrix into the dictionary of dictionaries
+    format used by the recommenders, in which
+    similarity_dictionary[user1][user2] contains the similarity between user1
+    and user2. The pairs with an undefined similarity are omitted
+
+    :type similarity_matrix: numpy.ndarray
+    :param similarity_matrix: a users x users matrix with the similarities
+    :param user_ids: the IDs of the users, in the same order as the rows of
+    the matrix
+    :return: a dictionary of dictionaries with the similarities
+    """
+    similarity_dictionary = {}
+
+    for user1, row in zip(user_ids, similarity_matrix):
+        columns = numpy.flatnonzero(~numpy.isnan(row))
+        similarity_dictionary[user1] = {
+            user_ids[column]: float(row[column]) for column in columns}
+
+    return similarity_dictionary
@@ -1,4 +1,5 @@
 from etl import similarity_calculator
+from recommenders.similarity import similarity_engine
 from recommenders.similarity.base_similarity_matrix_builder import \
     BaseSimilarityMatrixBuilder
 from tripadvisor.fourcity import extractor
@@ -11,6 +12,13 @@ class SingleSimilarityMatrixBuilder(BaseSimilarityMatrixBuilder):
         super(SingleSimilarityMatrixBuilder, self).__init__(
             'SingleSimilarity', similarity_metric, False)
 
+    def calculate_similarity_matrix(self, user_dictionary, user_ids):
+        ratings_matrix = similarity_engine.build_ratings_matrix(
+            user_dictionary, user_ids)
+
+        return similarity_engine.calculate_similarity_matrix(
+            ratings_matrix, self._similarity_metric, self._min_common_items)
+
     def calculate_users_similarity(self, user_dictionary, user1, user2):
         common_items = extractor.get_common_items(user_dictionary, user1, user2)
 
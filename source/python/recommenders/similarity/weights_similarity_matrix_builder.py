@@ -1,4 +1,5 @@
 from etl import similarity_calculator
+from recommenders.similarity import similarity_engine
 from recommenders.similarity.base_similarity_matrix_builder import \
     BaseSimilarityMatrixBuilder
 
@@ -11,6 +12,13 @@ class WeightsSimilarityMatrixBuilder(BaseSimilarityMatrixBuilder):
         super(WeightsSimilarityMatrixBuilder, self).__init__(
             'MultiWeightsSimilarity', similarity_metric, True)
 
+    def calculate_similarity_matrix(self, user_dictionary, user_ids):
+        weights_matrix = similarity_engine.build_dense_ratings_matrix(
+            [user_dictionary[user_id].criteria_weights for user_id in user_ids])
+
+        return similarity_engine.calculate_similarity_matrix(
+            weights_matrix, self._similarity_metric)
+
     def calculate_users_similarity(self, user_dictionary, user_id1, user_id2):
         """
         Calculates the similarity between two users based on how similar are
@@ -0,0 +1,63 @@
+import random
+
+import numpy
+
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+def generate_reviews(num_users, num_items, num_criteria, seed=0):
+    """
+    Generates random reviews with an overall rating and num_criteria
+    multi-criteria ratings. The users are named U0, U1, ... and the items I0,
+    I1, ...
+
+    :param num_users: the number of users
+    :param num_items: the number of items
+    :param num_criteria: the number of criteria of the multi-criteria ratings
+    :param seed: the seed of the random number generator
+    :rtype: list[dict]
+    """
+    random_generator = random.Random(seed)
+    reviews = []
+    for user in xrange(num_users):
+        num_user_items = random_generator.randint(1, num_items)
+        items = sorted(random_generator.sample(xrange(num_items), num_user_items))
+        for item in items:
+            reviews.append({
+                Constants.USER_ID_FIELD: 'U%d' % user,
+                Constants.ITEM_ID_FIELD: 'I%d' % item,
+                'overall_rating': float(random_generator.randint(1, 5)),
+                'multi_ratings': [
+                    float(random_generator.randint(1, 5))
+                    for _ in xrange(num_criteria)]
+            })
+    return reviews
+
+
+def generate_ratings(num_users, num_items, num_ratings, seed=0):
+    """
+    Generates ratings that follow a biased matrix factorization model with a
+    planted set of two factors plus some noise. Every (user, item) pair is
+    rated at most once
+
+    :param num_users: the number of users
+    :param num_items: the number of items
+    :param num_ratings: the number of ratings, at most num_users * num_items
+    :param seed: the seed of the random number generator
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    :return: the users, the items and the ratings
+    """
+    random_state = numpy.random.RandomState(seed)
+    user_factors = random_state.normal(0, 0.7, (num_users, 2))
+    item_factors = random_state.normal(0, 0.7, (num_items, 2))
+    user_biases = random_state.normal(0, 0.5, num_users)
+    item_biases = random_state.normal(0, 0.5, num_items)
+    pairs = random_state.permutation(num_users * num_items)[:num_ratings]
+    users = pairs // num_items
+    items = pairs % num_items
+    ratings = 3 + user_biases[users] + item_biases[items] + \
+        (user_factors[users] * item_factors[items]).sum(axis=1) + \
+        random_state.normal(0, 0.1, num_ratings)
+    return users, items, ratings
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+import numpy
+from numpy.linalg import inv, cholesky
+
+from recommenders.matrixfactorization import bayesian_matrix_factorization
+from recommenders.matrixfactorization.bayesian_matrix_factorization import \
+    BayesianMatrixFactorization
+from recommenders.tests.data_generator import generate_ratings
+
+__author__ = 'fpena'
+
+
+def generate_rating_array(num_users, num_items, num_ratings):
+    """
+    Returns the ratings of generate_ratings rounded to the 1-5 scale, as the
+    integer (user, item, rating) rows that BayesianMatrixFactorization loads
+    """
+    users, items, ratings = \
+        generate_ratings(num_users, num_items, num_ratings)
+    ratings = numpy.clip(numpy.round(ratings), 1, 5)
+    return numpy.column_stack((users, items, ratings)).astype(int)
+
+
+class TestBayesianMatrixFactorization(TestCase):
+
+    def test_sample_features(self):
+        ratings = generate_rating_array(30, 20, 200)
+        rating_matrix = bayesian_matrix_factorization.build_rating_matrix(
+            30, 20, ratings, 2.9)
+        random_state = numpy.random.RandomState(1)
+        item_features = random_state.normal(0, 1, (20, 3))
+        alpha = numpy.eye(3) * 2 + 0.5
+        mu = random_state.normal(0, 1, (3, 1))
+        noise = random_state.normal(0, 1, (30, 3))
+
+        user_features = bayesian_matrix_factorization.sample_features(
+            rating_matrix, item_features, alpha, mu, 2.0, noise)
+
+        # The same sample computed one user at a time
+        dense_ratings = rating_matrix.toarray()
+        for user in range(30):
+            items = numpy.nonzero(dense_ratings[user])[0]
+            features = item_features[items]
+            covariance = inv(alpha + 2.0 * features.T.dot(features))
+            mean = covariance.dot(
+                2.0 * features.T.dot(dense_ratings[user, items]) +
+                alpha.dot(mu).ravel())
+            numpy.testing.assert_allclose(
+                mean + cholesky(covariance).dot(noise[user]),
+                user_features[user])
+
+    def test_estimate(self):
+        ratings = generate_rating_array(50, 40, 1200)
+        train = ratings[:1000]
+        validation = ratings[1000:]
+        progress = []
+
+        def progress_hook(model, iteration, train_rmse, average_rmse):
+            progress.append((iteration, model.num_samples, average_rmse))
+
+        numpy.random.seed(0)
+        model = BayesianMatrixFactorization(
+            num_features=4, burn_in=4, thinning=3,
+            progress_hook=progress_hook)
+        model.load(ratings, train, validation, 20)
+
+        self.assertEqual(range(20), [entry[0] for entry in progress])
+        self.assertEqual(
+            [0] * 4 + [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 6],
+            [entry[1] for entry in progress])
+        self.assertIsNone(progress[3][2])
+
+        baseline_rmse = numpy.std(validation[:, 2])
+        self.assertLess(progress[-1][2], 0.7 * baseline_rmse)
@@ -0,0 +1,119 @@
+from unittest import TestCase
+
+import numpy
+from scipy import sparse
+
+from etl import libfm_converter
+from recommenders.factorization_machine import FactorizationMachine
+from recommenders.factorization_machine import find_independent_groups
+
+__author__ = 'fpena'
+
+
+def generate_data(num_users, num_items, num_samples, seed=0):
+    """
+    Generates the rows of a rating data set with a user, an item and a context
+    column, in which the ratings follow a factorization machine with a
+    planted set of parameters
+    """
+    random_state = numpy.random.RandomState(seed)
+    user_biases = random_state.normal(0, 0.5, num_users)
+    item_biases = random_state.normal(0, 0.5, num_items)
+    user_factors = random_state.normal(0, 0.7, (num_users, 2))
+    item_factors = random_state.normal(0, 0.7, (num_items, 2))
+
+    rows = []
+    for _ in xrange(num_samples):
+        user = random_state.randint(num_users)
+        item = random_state.randint(num_items)
+        context = round(random_state.rand(), 2)
+        rating = 3 + user_biases[user] + item_biases[item] + context +\
+            user_factors[user].dot(item_factors[item])
+        rows.append([rating, 'U%d' % user, 'I%d' % item, context])
+    return rows
+
+
+def calculate_naive_predictions(factorization_machine, x_matrix):
+    x_dense = x_matrix.toarray()
+    predictions = []
+    for x in x_dense:
+        prediction = factorization_machine.w0 + x.dot(factorization_machine.w)
+        for i in xrange(len(x)):
+            for j in xrange(i + 1, len(x)):
+                prediction += x[i] * x[j] * factorization_machine.v[i].dot(
+                    factorization_machine.v[j])
+        predictions.append(prediction)
+    return numpy.clip(
+        predictions, factorization_machine.min_target,
+        factorization_machine.max_target)
+
+
+class TestFactorizationMachine(TestCase):
+
+    def setUp(self):
+        rows = generate_data(30, 20, 1500)
+        matrices, self.num_variables = libfm_converter.rows_to_matrices(
+            [rows[:1200], rows[1200:]], 0, [1, 2])
+        (self.x_train, self.y_train), (self.x_test, self.y_test) = matrices
+
+    def calculate_rmse(self, predictions):
+        return numpy.sqrt(numpy.mean((predictions - self.y_test) ** 2))
+
+    def test_rows_to_matrices(self):
+        rows = [[5.0, 'U1', 'I1', 0.5], [3.0, 'U2', 'I1', 0.0]]
+        test_rows = [[4.0, 'U1', 'I2', 0.25]]
+        matrices, num_variables = libfm_converter.rows_to_matrices(
+            [rows, test_rows], 0, [1, 2])
+
+        # The same indices that csv_to_libfm assigns: the static columns
+        # first and then the one-hot values in the order they are seen
+        self.assertEqual(5, num_variables)
+        numpy.testing.assert_array_equal(
+            [[0.5, 1, 1, 0, 0], [0, 0, 1, 1, 0]], matrices[0][0].toarray())
+        numpy.testing.assert_array_equal([5.0, 3.0], matrices[0][1])
+        numpy.testing.assert_array_equal(
+            [[0.25, 1, 0, 0, 1]], matrices[1][0].toarray())
+
+    def test_find_independent_groups(self):
+        groups = find_independent_groups(self.x_train)
+        self.assertEqual(
+            range(self.num_variables),
+            sorted(numpy.concatenate(groups).tolist()))
+
+        structure = sparse.csc_matrix(self.x_train)
+        structure.data[:] = 1
+        for group in groups:
+            self.assertTrue((structure[:, group].sum(axis=1) <= 1).all())
+
+    def test_predict(self):
+        factorization_machine = FactorizationMachine(
+            'als', num_factors=3, num_iterations=2, regularization=(1, 1, 1),
+            seed=0)
+        factorization_machine.fit(self.x_train, self.y_train)
+        numpy.testing.assert_allclose(
+            calculate_naive_predictions(factorization_machine, self.x_test),
+            factorization_machine.predict(self.x_test))
+
+    def test_fit_predict(self):
+        baseline_rmse = self.calculate_rmse(self.y_train.mean())
+
+        for method, learn_rate in [('sgd', 0.01), ('als', 0), ('mcmc', 0)]:
+            factorization_machine = FactorizationMachine(
+                method, num_factors=2, num_iterations=50,
+                learn_rate=learn_rate, regularization=(0, 0.1, 0.1), seed=0)
+            predictions = factorization_machine.fit_predict(
+                self.x_train, self.y_train, self.x_test)
+            self.assertEqual(len(self.y_test), len(predictions))
+            self.assertLess(
+                self.calculate_rmse(predictions), 0.5 * baseline_rmse, method)
+
+        # The same seed must give the same predictions
+        predictions1 = FactorizationMachine(
+            'mcmc', num_factors=2, num_iterations=5, seed=1).fit_predict(
+            self.x_train, self.y_train, self.x_test)
+        predictions2 = FactorizationMachine(
+            'mcmc', num_factors=2, num_iterations=5, seed=1).fit_predict(
+            self.x_train, self.y_train, self.x_test)
+        numpy.testing.assert_array_equal(predictions1, predictions2)
+
+        self.assertRaises(ValueError, FactorizationMachine, 'sgda')
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+import numpy
+
+from recommenders.neighbour_index import NeighbourIndex
+from tripadvisor.fourcity.user import User
+
+__author__ = 'fpena'
+
+
+def build_users(num_users, num_items, seed=0):
+    random_generator = numpy.random.RandomState(seed)
+    user_ids = ['U%d' % user for user in xrange(num_users)]
+    user_dictionary = {}
+    for user_id in user_ids:
+        user = User(user_id)
+        items = random_generator.choice(
+            num_items, random_generator.randint(1, num_items), replace=False)
+        user.item_ratings = {'I%d' % item: 1. for item in items}
+        user_dictionary[user_id] = user
+
+    similarity_matrix = {}
+    for user1 in user_ids:
+        similarity_matrix[user1] = {}
+        for user2 in user_ids:
+            # Leave some pairs without similarity
+            if random_generator.rand() < 0.8:
+                similarity_matrix[user1][user2] = random_generator.rand()
+
+    return user_ids, user_dictionary, similarity_matrix
+
+
+def get_expected_neighbourhood(
+        similarity_matrix, user_dictionary, user_id, item_id, num_neighbours):
+    similarities = {
+        neighbour: similarity
+        for neighbour, similarity in similarity_matrix[user_id].items()
+        if neighbour != user_id and
+        (item_id is None or item_id in user_dictionary[neighbour].item_ratings)
+    }
+    neighbourhood = sorted(similarities, key=similarities.get, reverse=True)
+    return neighbourhood[:num_neighbours]
+
+
+class TestNeighbourIndex(TestCase):
+
+    def test_get_neighbourhood(self):
+        user_ids, user_dictionary, similarity_matrix = build_users(30, 10)
+        item_ids = ['I%d' % item for item in xrange(10)] + [None, 'I100']
+
+        for num_neighbours in [None, 1, 3, 10, 50]:
+            neighbour_index = NeighbourIndex(num_neighbours)
+            neighbour_index.build(similarity_matrix, user_dictionary, user_ids)
+
+            for user_id in user_ids:
+                for item_id in item_ids:
+                    expected = get_expected_neighbourhood(
+                        similarity_matrix, user_dictionary, user_id, item_id,
+                        num_neighbours)
+                    actual = neighbour_index.get_neighbourhood(user_id, item_id)
+                    self.assertEqual(expected, actual)
+
+    def test_neighbour_similarities(self):
+        user_ids, user_dictionary, similarity_matrix = build_users(10, 5)
+        neighbour_index = NeighbourIndex(4)
+        neighbour_index.build(similarity_matrix, user_dictionary, user_ids)
+
+        for position, user_id in enumerate(user_ids):
+            neighbours = neighbour_index.neighbour_positions[position]
+            similarities = neighbour_index.neighbour_similarities[position]
+            self.assertLessEqual(len(neighbours), 4)
+            for neighbour, similarity in zip(neighbours, similarities):
+                self.assertEqual(
+                    similarity_matrix[user_id][user_ids[neighbour]], similarity)
+            self.assertTrue(numpy.all(numpy.diff(similarities) <= 0))
@@ -0,0 +1,96 @@
+from unittest import TestCase
+
+import numpy
+
+from recommenders.similarity import similarity_engine
+from recommenders.similarity.average_similarity_matrix_builder import \
+    AverageSimilarityMatrixBuilder
+from recommenders.similarity.multi_similarity_matrix_builder import \
+    MultiSimilarityMatrixBuilder
+from recommenders.similarity.single_similarity_matrix_builder import \
+    SingleSimilarityMatrixBuilder
+from recommenders.similarity.weights_similarity_matrix_builder import \
+    WeightsSimilarityMatrixBuilder
+from recommenders.tests.data_generator import generate_reviews
+from tripadvisor.fourcity import extractor
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+def build_pairwise_similarity_matrix(builder, user_dictionary, user_ids):
+    similarity_matrix = {}
+    for user1 in user_ids:
+        similarity_matrix[user1] = {}
+        for user2 in user_ids:
+            similarity = builder.calculate_users_similarity(
+                user_dictionary, user1, user2)
+            if similarity is not None:
+                similarity_matrix[user1][user2] = similarity
+    return similarity_matrix
+
+
+class TestSimilarityEngine(TestCase):
+
+    def setUp(self):
+        self.reviews = generate_reviews(25, 8, 3)
+        self.user_dictionary = extractor.initialize_users(self.reviews, True)
+        self.user_ids = extractor.get_groupby_list(
+            self.reviews, Constants.USER_ID_FIELD)
+
+    def assert_similarity_matrices_equal(self, expected, actual):
+        self.assertEqual(sorted(expected.keys()), sorted(actual.keys()))
+        for user1 in expected:
+            self.assertEqual(
+                sorted(expected[user1].keys()), sorted(actual[user1].keys()))
+            for user2 in expected[user1]:
+                self.assertAlmostEqual(
+                    expected[user1][user2], actual[user1][user2])
+
+    def verify_builder(self, builder):
+        expected = build_pairwise_similarity_matrix(
+            builder, self.user_dictionary, self.user_ids)
+        actual = builder.build_similarity_matrix(
+            self.user_dictionary, self.user_ids)
+        self.assert_similarity_matrices_equal(expected, actual)
+
+    def test_single_similarity_matrix(self):
+        for metric in similarity_engine.SIMILARITY_METRICS:
+            self.verify_builder(SingleSimilarityMatrixBuilder(metric))
+
+        builder = SingleSimilarityMatrixBuilder('euclidean')
+        builder._min_common_items = 3
+        self.verify_builder(builder)
+
+    def test_average_similarity_matrix(self):
+        for metric in ['chebyshev', 'cosine', 'euclidean', 'manhattan']:
+            self.verify_builder(AverageSimilarityMatrixBuilder(metric))
+
+    def test_multi_similarity_matrix(self):
+        for metric in ['chebyshev', 'euclidean', 'manhattan']:
+            self.verify_builder(MultiSimilarityMatrixBuilder(metric))
+
+    def test_weights_similarity_matrix(self):
+        random_generator = numpy.random.RandomState(0)
+        for user_id in self.user_ids:
+            self.user_dictionary[user_id].criteria_weights =\
+                random_generator.rand(4)
+
+        for metric in similarity_engine.SIMILARITY_METRICS:
+            self.verify_builder(WeightsSimilarityMatrixBuilder(metric))
+
+    def test_calculate_similarity_matrix(self):
+        ratings_matrix = similarity_engine.build_ratings_matrix(
+            self.user_dictionary, self.user_ids)
+
+        self.assertRaises(
+            ValueError, similarity_engine.calculate_similarity_matrix,
+            ratings_matrix, 'hamming')
+
+        # The result must not depend on the size of the blocks
+        for metric in similarity_engine.SIMILARITY_METRICS:
+            expected = similarity_engine.calculate_similarity_matrix(
+                ratings_matrix, metric)
+            actual = similarity_engine.calculate_similarity_matrix(
+                ratings_matrix, metric, block_size=7)
+            numpy.testing.assert_allclose(expected, actual)
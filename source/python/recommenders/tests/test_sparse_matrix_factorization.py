@@ -0,0 +1,109 @@
+from unittest import TestCase
+
+import numpy
+
+from recommenders.matrixfactorization import sparse_matrix_factorization
+from recommenders.tests.data_generator import generate_ratings
+from recommenders.matrixfactorization.sparse_matrix_factorization import \
+    SparseMatrixFactorization
+
+__author__ = 'fpena'
+
+
+class TestSparseMatrixFactorization(TestCase):
+
+    def setUp(self):
+        self.users, self.items, self.ratings = generate_ratings(60, 40, 2000)
+
+    def calculate_rmse(self, matrix_factorization):
+        predictions = matrix_factorization.predict_indices(
+            self.users[:500], self.items[:500])
+        return numpy.sqrt(numpy.mean((predictions - self.ratings[:500]) ** 2))
+
+    def test_accumulate(self):
+        indices, sums = sparse_matrix_factorization.accumulate(
+            numpy.array([3, 1, 3]), numpy.array([[1., 2.], [3., 4.], [5., 6.]]))
+        numpy.testing.assert_array_equal([1, 3], indices)
+        numpy.testing.assert_array_equal([[3, 4], [6, 8]], sums)
+
+    def test_solve_least_squares(self):
+        # With as many conjugate gradient steps as features the solution of
+        # every least squares problem is exact
+        matrix_factorization = SparseMatrixFactorization(
+            3, 'als', use_biases=False, regularization=0.5, cg_steps=3,
+            seed=0)
+        matrix_factorization.fit(
+            self.users, self.items, self.ratings, 60, 40)
+        item_factors = matrix_factorization.item_factors
+        rating_matrix = sparse_matrix_factorization.build_rating_matrix(
+            self.users, 60)
+        user_factors, _ = matrix_factorization.solve_least_squares(
+            matrix_factorization.user_factors, numpy.zeros(60), item_factors,
+            numpy.zeros(40), self.users, self.items, self.ratings,
+            rating_matrix)
+
+        for user in [0, 7]:
+            user_items = self.items[self.users == user]
+            user_ratings = self.ratings[self.users == user]
+            factors = item_factors[user_items]
+            expected = numpy.linalg.solve(
+                factors.T.dot(factors) + 0.5 * numpy.eye(3),
+                factors.T.dot(user_ratings))
+            numpy.testing.assert_allclose(expected, user_factors[user])
+
+    def test_fit(self):
+        baseline_rmse = numpy.std(self.ratings)
+
+        for method, learning_rate in [('sgd', 0.05), ('als', 0)]:
+            matrix_factorization = SparseMatrixFactorization(
+                2, method, learning_rate=learning_rate, batch_size=100,
+                num_epochs=100, seed=0)
+            matrix_factorization.fit(self.users, self.items, self.ratings)
+            self.assertLess(
+                self.calculate_rmse(matrix_factorization),
+                0.3 * baseline_rmse, method)
+
+            # The parameters of the epoch with the lowest validation error
+            # are kept
+            validation_errors = matrix_factorization.validation_errors
+            self.assertLess(len(validation_errors), 100)
+            self.assertEqual(
+                len(validation_errors) - 1 - matrix_factorization.patience,
+                numpy.argmin(validation_errors))
+            self.assertAlmostEqual(
+                min(validation_errors),
+                matrix_factorization.calculate_rmse(
+                    *matrix_factorization.validation_set))
+
+        self.assertRaises(ValueError, SparseMatrixFactorization, 2, 'svd')
+
+    def test_predict_rating(self):
+        reviews = [
+            {'user_id': 'U%d' % user, 'offering_id': 'I%d' % item,
+             'overall_rating': rating}
+            for user, item, rating in zip(self.users, self.items, self.ratings)
+        ]
+        matrix_factorization = SparseMatrixFactorization(
+            2, 'als', num_epochs=5, seed=0)
+        matrix_factorization.load(reviews)
+
+        user_ids = ['U1', 'U2', 'U1000', 'U3']
+        item_ids = ['I1', 'I5', 'I1', 'I1000']
+        predictions = matrix_factorization.predict_many(user_ids, item_ids)
+        self.assertEqual(
+            [matrix_factorization.predict_rating(user_id, item_id)
+             for user_id, item_id in zip(user_ids, item_ids)],
+            predictions)
+        self.assertIsNone(predictions[2])
+        self.assertIsNone(predictions[3])
+        self.assertAlmostEqual(
+            matrix_factorization.global_mean +
+            matrix_factorization.user_biases[
+                matrix_factorization.user_index_map['U1']] +
+            matrix_factorization.item_biases[
+                matrix_factorization.item_index_map['I1']] +
+            matrix_factorization.user_factors[
+                matrix_factorization.user_index_map['U1']].dot(
+                matrix_factorization.item_factors[
+                    matrix_factorization.item_index_map['I1']]),
+            predictions[0])
@@ -1,7 +1,10 @@
 from unittest import TestCase
 
+from recommenders.similarity.multi_similarity_matrix_builder import \
+    MultiSimilarityMatrixBuilder
 from recommenders.similarity.single_similarity_matrix_builder import \
     SingleSimilarityMatrixBuilder
+from recommenders.tests.data_generator import generate_reviews
 from recommenders.weighted_sum_recommender import WeightedSumRecommender
 
 
@@ -83,3 +86,37 @@ class TestWeightedSumRecommender(TestCase):
         self.assertEqual(actual_rating_1, recommender.predict_rating('A1', 1))
         actual_rating_2 = 2.0
         self.assertEqual(actual_rating_2, recommender.predict_rating('A1', 3))
+
+    def test_predict_many(self):
+
+        my_reviews = generate_reviews(20, 10, 3)
+        user_ids = ['U%d' % user for user in xrange(21)]
+        item_ids = ['I%d' % item for item in xrange(11)]
+        pairs = [(user, item) for user in user_ids for item in item_ids]
+
+        # The multi-criteria cosine similarity matrix is not symmetric
+        for builder in [SingleSimilarityMatrixBuilder('euclidean'),
+                        MultiSimilarityMatrixBuilder('cosine')]:
+            for num_neighbours in [None, 3]:
+                recommender = WeightedSumRecommender(builder, num_neighbours)
+                recommender.load(my_reviews)
+                predicted_ratings = recommender.predict_many(
+                    [user for user, _ in pairs], [item for _, item in pairs])
+
+                for (user, item), predicted_rating in zip(
+                        pairs, predicted_ratings):
+                    expected_rating = recommender.predict_rating(user, item)
+                    if expected_rating is None:
+                        self.assertIsNone(predicted_rating)
+                    else:
+                        self.assertAlmostEqual(
+                            expected_rating, predicted_rating)
+
+    def test_asymmetric_similarity_matrix(self):
+        recommender = WeightedSumRecommender(MultiSimilarityMatrixBuilder('cosine'))
+        recommender.load(generate_reviews(20, 10, 3))
+        similarity_matrix = recommender.user_similarity_matrix
+        self.assertTrue(any(
+            similarity_matrix[user1].get(user2) !=
+            similarity_matrix[user2].get(user1)
+            for user1 in similarity_matrix for user2 in similarity_matrix))
@@ -1,3 +1,5 @@
+import numpy
+
 from recommenders.base_recommender import BaseRecommender
 from tripadvisor.fourcity import extractor
 
@@ -41,3 +43,34 @@ class WeightedSumRecommender(BaseRecommender):
         predicted_rating = weighted_sum / z_denominator
 
         return predicted_rating
+
+    def predict_many(self, user_ids, item_ids, contexts=None):
+        """
+        Predicts the ratings for several user-item pairs at once. For each
+        user, the weighted sums of all the requested items are computed
+        together from the neighbourhood matrices of the neighbour index
+
+        :param user_ids: a list with the IDs of the users
+        :param item_ids: a list with the IDs of the items
+        :param contexts: ignored, this recommender doesn't use context
+        :return: a list with the predicted ratings
+        """
+        predicted_ratings = [None] * len(user_ids)
+        neighbour_index = self.get_neighbour_index()
+
+        for user_id, positions in self.group_by_user(user_ids).iteritems():
+            if user_id not in self.user_dictionary:
+                continue
+
+            user_item_ids = [item_ids[position] for position in positions]
+            _, similarities, ratings =\
+                neighbour_index.get_neighbourhood_ratings(user_id, user_item_ids)
+            weighted_sums = (similarities * ratings).sum(axis=0)
+            z_denominators = numpy.abs(similarities).sum(axis=0)
+
+            for position, weighted_sum, z_denominator in zip(
+                    positions, weighted_sums, z_denominators):
+                if z_denominator != 0:
+                    predicted_ratings[position] = weighted_sum / z_denominator
+
+        return predicted_ratings
@@ -1,14 +1,92 @@
 import copy
+import itertools
 import time
 
 import operator
 
 import math
 
+import numpy
+
 from etl import ETLUtils
 from utils.constants import Constants
 
 
+def build_topic_matrix(reviews, num_topics):
+    """
+    Builds a dense reviews x topics matrix with the weight that each review
+    gives to each topic according to Constants.TOPIC_WEIGHTING_METHOD. With
+    the 'binary' method the weight is the number of times the topic appears in
+    the topic list of the review, with the 'probability' method it is the sum
+    of the probabilities of the topic
+
+    :type reviews: list[dict]
+    :param reviews: the reviews, each one of them must contain the
+    Constants.TOPICS_FIELD with a list of (topic, probability) pairs
+    :type num_topics: int
+    :param num_topics: the number of topics of the topic model
+    :rtype: numpy.ndarray
+    """
+    if Constants.TOPIC_WEIGHTING_METHOD not in ['binary', 'probability']:
+        raise ValueError('Topic weighting method not recognized')
+
+    # The (topic, weight) pairs of all the reviews are read into a single
+    # array without building intermediate Python lists
+    lengths = [len(review[Constants.TOPICS_FIELD]) for review in reviews]
+    pairs = numpy.fromiter(
+        itertools.chain.from_iterable(itertools.chain.from_iterable(
+            review[Constants.TOPICS_FIELD] for review in reviews)),
+        dtype=float, count=2 * sum(lengths)).reshape(-1, 2)
+
+    rows = numpy.repeat(numpy.arange(len(reviews)), lengths)
+    topics = pairs[:, 0].astype(int)
+    if Constants.TOPIC_WEIGHTING_METHOD == 'binary':
+        weights = numpy.ones(len(rows))
+    else:
+        weights = pairs[:, 1]
+
+    # Topics outside of the model are ignored, as they were never counted
+    is_valid = (topics >= 0) & (topics < num_topics)
+    topic_matrix = numpy.bincount(
+        rows[is_valid] * num_topics + topics[is_valid], weights[is_valid],
+        minlength=len(reviews) * num_topics)
+
+    return topic_matrix.reshape(len(reviews), num_topics)
+
+
+def calculate_topic_weighted_frequencies(topic_matrix, mask=None):
+    """
+    Calculates the weighted frequency of every topic, which is the average
+    weight that the reviews give to the topic (see
+    ContextExtractor.calculate_topic_weighted_frequency)
+
+    :type topic_matrix: numpy.ndarray
+    :param topic_matrix: a reviews x topics matrix built by build_topic_matrix
+    :type mask: numpy.ndarray
+    :param mask: a boolean array that selects the reviews that are taken into
+    account. If None all the reviews are used
+    :rtype: numpy.ndarray
+    :return: an array with the weighted frequency of every topic
+    """
+    if mask is not None:
+        topic_matrix = topic_matrix[mask]
+    return topic_matrix.sum(axis=0) / float(topic_matrix.shape[0])
+
+
+def get_target_mask(records):
+    """
+    Returns a boolean array that indicates which of the records belong to the
+    Constants.TOPIC_MODEL_TARGET_REVIEWS (the specific reviews)
+
+    :type records: list[dict]
+    :rtype: numpy.ndarray
+    """
+    return numpy.array([
+        record[Constants.TOPIC_MODEL_TARGET_FIELD] ==
+        Constants.TOPIC_MODEL_TARGET_REVIEWS for record in records
+    ], dtype=bool)
+
+
 class ContextExtractor:
 
     def __init__(self, records):
@@ -21,6 +99,8 @@ class ContextExtractor:
         self.topic_ratio_map = None
         self.target_bows = None
         self.non_target_bows = None
+        self.review_topic_matrix = None
+        self.target_mask = None
         self.lda_beta_comparison_operator = None
         if Constants.LDA_BETA_COMPARISON_OPERATOR == 'gt':
             self.lda_beta_comparison_operator = operator.gt
@@ -88,6 +168,18 @@ class ContextExtractor:
             print('context topics: %d' % len(self.context_rich_topics))
             return sorted_topics
 
+        # All the frequencies are obtained at once from the reviews x topics
+        # matrix, instead of going through the reviews once per topic
+        self.review_topic_matrix = \
+            build_topic_matrix(self.records, self.num_topics)
+        self.target_mask = get_target_mask(self.records)
+        weighted_frequencies = \
+            calculate_topic_weighted_frequencies(self.review_topic_matrix)
+        target_weighted_frequencies = calculate_topic_weighted_frequencies(
+            self.review_topic_matrix, self.target_mask)
+        non_target_weighted_frequencies = calculate_topic_weighted_frequencies(
+            self.review_topic_matrix, ~self.target_mask)
+
         topic_ratio_map = {}
         self.topic_weighted_frequency_map = {}
         lower_than_alpha_count = 0.0
@@ -95,14 +187,10 @@ class ContextExtractor:
         non_contextual_topics = set()
         for topic in range(self.num_topics):
             # print('topic: %d' % topic)
-            weighted_frq = self.calculate_topic_weighted_frequency(
-                topic, self.records)
-            target_weighted_frq = \
-                self.calculate_topic_weighted_frequency(
-                    topic, self.target_reviews)
+            weighted_frq = float(weighted_frequencies[topic])
+            target_weighted_frq = float(target_weighted_frequencies[topic])
             non_target_weighted_frq = \
-                self.calculate_topic_weighted_frequency(
-                    topic, self.non_target_reviews)
+                float(non_target_weighted_frequencies[topic])
 
             if weighted_frq < Constants.CONTEXT_EXTRACTOR_ALPHA:
                 non_contextual_topics.add(topic)
@@ -205,7 +293,9 @@ class ContextExtractor:
 def main():
 
     # records = ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
-    records = ETLUtils.load_json_file(Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE)
+    records = ETLUtils.load_records_file(
+        Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE,
+        [Constants.TOPICS_FIELD, Constants.TOPIC_MODEL_TARGET_FIELD])
 
     print('num_reviews', len(records))
     # lda_context_utils.discover_topics(my_reviews, 150)
@@ -0,0 +1,97 @@
+import time
+
+import numpy
+
+from topicmodeling.context import context_extractor
+from topicmodeling.context.context_extractor import ContextExtractor
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+def generate_records(num_records, num_topics, seed=0):
+    """
+    Generates records with a topic distribution in the same format the topic
+    models produce, a list of (topic, probability) pairs with all the topics
+
+    :param num_records: the number of records
+    :param num_topics: the number of topics
+    :param seed: the seed of the random number generator
+    :rtype: list[dict]
+    """
+    random_state = numpy.random.RandomState(seed)
+    distributions = random_state.dirichlet(numpy.ones(num_topics), num_records)
+    is_target = random_state.rand(num_records) < 0.5
+
+    records = []
+    for distribution, target in zip(distributions, is_target):
+        records.append({
+            Constants.TOPICS_FIELD: list(enumerate(distribution.tolist())),
+            Constants.TOPIC_MODEL_TARGET_FIELD:
+                'specific' if target else 'generic'
+        })
+    return records
+
+
+def benchmark(num_records=100000, num_topics=150, num_sampled_topics=3):
+    """
+    Compares the time it takes to calculate the weighted frequencies of all
+    the topics on the three review subsets (all, specific and generic), one
+    topic at a time with ContextExtractor.calculate_topic_weighted_frequency
+    and all at once with the reviews x topics matrix. The topic by topic
+    version is only timed on a few topics and extrapolated, since its cost
+    grows linearly with the number of topics
+
+    :param num_records: the number of records
+    :param num_topics: the number of topics
+    :param num_sampled_topics: the number of topics that are timed with the
+    topic by topic version
+    :return: a dictionary with the times in seconds and the speedup
+    """
+    Constants.TOPIC_WEIGHTING_METHOD = 'probability'
+    Constants.TOPIC_MODEL_TARGET_REVIEWS = 'specific'
+    records = generate_records(num_records, num_topics)
+    target_records = [
+        record for record in records
+        if record[Constants.TOPIC_MODEL_TARGET_FIELD] == 'specific']
+    non_target_records = [
+        record for record in records
+        if record[Constants.TOPIC_MODEL_TARGET_FIELD] != 'specific']
+
+    start = time.time()
+    for topic in range(num_sampled_topics):
+        for reviews in [records, target_records, non_target_records]:
+            ContextExtractor.calculate_topic_weighted_frequency(topic, reviews)
+    loop_time = (time.time() - start) * num_topics / num_sampled_topics
+
+    start = time.time()
+    topic_matrix = context_extractor.build_topic_matrix(records, num_topics)
+    mask = context_extractor.get_target_mask(records)
+    context_extractor.calculate_topic_weighted_frequencies(topic_matrix)
+    context_extractor.calculate_topic_weighted_frequencies(topic_matrix, mask)
+    context_extractor.calculate_topic_weighted_frequencies(
+        topic_matrix, ~mask)
+    matrix_time = time.time() - start
+
+    results = {
+        'num_records': num_records,
+        'num_topics': num_topics,
+        'loop_time': loop_time,
+        'matrix_time': matrix_time,
+        'speedup': loop_time / matrix_time
+    }
+    print('topic by topic (extrapolated): %f seconds' % loop_time)
+    print('reviews x topics matrix: %f seconds' % matrix_time)
+    print('speedup: %.1fx' % results['speedup'])
+
+    return results
+
+
+def main():
+    print('%s: start' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+    benchmark()
+    print('%s: end' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,8 @@ from collections import Counter
 import cPickle as pickle
 import json
 import math
-import random
+from multiprocessing import Pool
+import os
 import itertools
 
 import h5py
@@ -16,6 +17,7 @@ from nltk.corpus.reader import Synset
 import numpy as np
 import time
 import scipy.misc
+import scipy.sparse
 from sklearn.cluster import AffinityPropagation, DBSCAN
 
 from datamining import cluster_evaluation
@@ -23,6 +25,7 @@ from datamining.cluster_evaluation import DunnCalculator
 from topicmodeling.context.sense_clusterer import BaumanSensesGrouper
 from topicmodeling.context.senses_group import SenseGroup
 from topicmodeling.context.review import Review
+from utils import utilities
 from utils.constants import Constants
 
 __author__ = 'fpena'
@@ -30,6 +33,14 @@ __author__ = 'fpena'
 from nltk import tokenize
 
 
+# The size of the square tiles in which the sense similarity matrix is
+# computed and stored
+SIMILARITY_BLOCK_SIZE = 512
+
+# The minimum Wu-Palmer similarity for two senses to be grouped together
+SENSE_SIMILARITY_THRESHOLD = 0.7
+
+
 def load_reviews(reviews_file):
 
     records = [json.loads(line) for line in open(reviews_file)]
@@ -96,6 +107,67 @@ def calculate_word_weighted_frequency(word, reviews):
     return num_reviews / len(reviews)
 
 
+def build_noun_matrix(reviews, nouns):
+    """
+    Builds a sparse reviews x nouns matrix in which an entry is 1 when the
+    noun appears in the review and 0 otherwise. The nouns of the reviews that
+    are not in the given list are ignored
+
+    :type reviews: list[Review]
+    :param reviews: the reviews
+    :type nouns: list[str]
+    :param nouns: the nouns that correspond to the columns of the matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+    noun_indices = {noun: index for index, noun in enumerate(nouns)}
+    indices = []
+    indptr = [0]
+    for review in reviews:
+        indices.extend({
+            noun_indices[noun] for noun in review.nouns
+            if noun in noun_indices
+        })
+        indptr.append(len(indices))
+
+    return scipy.sparse.csr_matrix(
+        (np.ones(len(indices)), indices, indptr),
+        shape=(len(reviews), len(nouns)))
+
+
+def get_review_mask(reviews, subset):
+    """
+    Returns a boolean array that indicates which of the reviews are in the
+    subset. The reviews are compared by identity, since the subsets are
+    obtained by splitting the list of reviews
+
+    :type reviews: list[Review]
+    :type subset: list[Review]
+    :rtype: numpy.ndarray
+    """
+    subset_ids = set(id(review) for review in subset)
+    return np.array(
+        [id(review) in subset_ids for review in reviews], dtype=bool)
+
+
+def calculate_word_weighted_frequencies(noun_matrix, mask=None):
+    """
+    Calculates the weighted frequency of every noun, which is the fraction of
+    the reviews that contain the noun (see calculate_word_weighted_frequency)
+
+    :type noun_matrix: scipy.sparse.csr_matrix
+    :param noun_matrix: a reviews x nouns matrix built by build_noun_matrix
+    :type mask: numpy.ndarray
+    :param mask: a boolean array that selects the reviews that are taken into
+    account. If None all the reviews are used
+    :rtype: numpy.ndarray
+    :return: an array with the weighted frequency of every noun
+    """
+    if mask is not None:
+        noun_matrix = noun_matrix[mask]
+    return np.asarray(noun_matrix.sum(axis=0)).ravel() / \
+        float(noun_matrix.shape[0])
+
+
 def build_groups(nouns):
 
     print('building groups', time.strftime("%H:%M:%S"))
@@ -116,9 +188,14 @@ def build_groups(nouns):
     print('number of senses:', len(all_senses))
     senses_similarity_matrix = build_sense_similarity_matrix(all_senses)
 
-    groups = []
-    bronk2_synset([], all_senses_names, [], groups, senses_similarity_matrix)
-    # bronk2_synset([], all_senses[:], [], groups, all_senses[:])
+    similarity_graph = build_similarity_graph(np.array([
+        [senses_similarity_matrix[row][column] for column in all_senses_names]
+        for row in all_senses_names
+    ]))
+    groups = [
+        [all_senses_names[vertex] for vertex in clique]
+        for clique in find_cliques(similarity_graph)
+    ]
 
     sense_groups = []
     for group in groups:
@@ -134,50 +211,200 @@ def build_groups(nouns):
     return sense_groups
 
 
-def build_sense_similarity_matrix(senses):
+class SynsetPathCache(object):
     """
+    Calculates the Wu-Palmer similarity between synsets, with the same result
+    as Synset.wup_similarity, keeping the distances from every synset to its
+    hypernyms. Synset.wup_similarity traverses the hypernym graph of both
+    synsets every time it is called, which dominates the time it takes to
+    compare every pair of a large set of synsets
+    """
+
+    def __init__(self):
+        self.hypernym_paths = {}
+
+    def get_hypernym_paths(self, synset):
+        """
+        :type synset: Synset
+        :rtype: dict[Synset, int]
+        :return: the length of the shortest path from the synset to each one
+        of its hypernyms, including itself
+        """
+        paths = self.hypernym_paths.get(synset)
+        if paths is None:
+            paths = synset._shortest_hypernym_paths(False)
+            self.hypernym_paths[synset] = paths
+        return paths
+
+    def shortest_path_distance(self, synset, hypernym):
+        if synset == hypernym:
+            return 0
+        hypernym_paths = self.get_hypernym_paths(hypernym)
+        return min(
+            distance + hypernym_paths[other]
+            for other, distance in self.get_hypernym_paths(synset).iteritems()
+            if other in hypernym_paths
+        )
+
+    def wup_similarity(self, synset1, synset2):
+        """
+        :type synset1: Synset
+        :type synset2: Synset
+        :rtype: float
+        :return: the Wu-Palmer similarity, or None if the synsets don't have a
+        common hypernym
+        """
+        if synset1._needs_root():
+            # The taxonomies of the verbs don't have a common root, which
+            # Synset.wup_similarity simulates
+            return synset1.wup_similarity(synset2)
+
+        hypernym_paths2 = self.get_hypernym_paths(synset2)
+        common_hypernyms = [
+            hypernym for hypernym in self.get_hypernym_paths(synset1)
+            if hypernym in hypernym_paths2
+        ]
+        if not common_hypernyms:
+            return None
+
+        max_depth = max(hypernym.min_depth() for hypernym in common_hypernyms)
+        subsumers = sorted(
+            hypernym for hypernym in common_hypernyms
+            if hypernym.min_depth() == max_depth)
+        subsumer = synset1 if synset1 in subsumers else subsumers[0]
+
+        depth = subsumer.max_depth() + 1
+        length1 = self.shortest_path_distance(synset1, subsumer) + depth
+        length2 = self.shortest_path_distance(synset2, subsumer) + depth
+        return (2.0 * depth) / (length1 + length2)
+
+
+def compute_similarity_block(
+        senses, row_start, row_end, column_start, column_end, path_cache):
+    """
+    Calculates the Wu-Palmer similarity between the senses in the rows and
+    the senses in the columns of a block of the sense similarity matrix. When
+    the block is on the diagonal of the matrix only its upper triangle is
+    calculated, and the block is filled as a symmetric matrix with ones in the
+    diagonal. A pair of senses without a common hypernym gets a similarity of
+    zero
 
     :type senses: list[Synset]
-    :param senses:
+    :type path_cache: SynsetPathCache
+    :rtype: numpy.ndarray
     """
-    print('building senses similarity matrix', time.strftime("%H:%M:%S"))
-    similarity_matrix = {}
+    is_diagonal = row_start == column_start
+    block = np.zeros((row_end - row_start, column_end - column_start), 'f')
 
-    for sense in senses:
-        similarity_matrix[sense.name()] = {}
+    for row in range(row_start, row_end):
+        first_column = row + 1 if is_diagonal else column_start
+        for column in range(first_column, column_end):
+            similarity = path_cache.wup_similarity(senses[row], senses[column])
+            if similarity is not None:
+                block[row - row_start, column - column_start] = similarity
 
-    index = 1
-    num_senses = len(senses)
-    for sense1 in senses:
-        similarity_matrix[sense1.name()][sense1.name()] = 1.0
-        for sense2 in senses[index:]:
-            similarity = sense1.wup_similarity(sense2)
-            similarity_matrix[sense1.name()][sense2.name()] = similarity
-            similarity_matrix[sense2.name()][sense1.name()] = similarity
-
-        if not index % 100:
-            print('%s: completed %d/%d senses' %
-                  (time.strftime("%Y/%d/%m-%H:%M:%S"), index, num_senses))
-        index += 1
+    if is_diagonal:
+        block += block.T
+        np.fill_diagonal(block, 1.0)
 
-    print('finished senses similarity matrix', time.strftime("%H:%M:%S"))
+    return block
 
-    return similarity_matrix
 
+def get_upper_triangle_tiles(num_senses, block_size):
+    """
+    :rtype: list[(int, int, int, int)]
+    :return: the (row start, row end, column start, column end) limits of the
+    tiles of the upper triangle of a (num_senses x num_senses) matrix
+    """
+    starts = range(0, num_senses, block_size)
+    return [
+        (row_start, min(row_start + block_size, num_senses),
+         column_start, min(column_start + block_size, num_senses))
+        for row_start in starts for column_start in starts
+        if column_start >= row_start
+    ]
 
-def get_synset_neighbours(synset, similarity_matrix):
-    neighbours = []
 
-    for element in similarity_matrix.keys():
-        if synset == element:
-            continue
+def compute_similarity_tile(tile):
+    """
+    Calculates a tile of the sense similarity matrix with the senses shared
+    by compute_similarity_tiles
 
-        if similarity_matrix[synset][element] >= 0.7:
-            neighbours.append(element)
-        # if synset.wup_similarity(element) >= 0.9:
-        #     neighbours.append(element)
+    :type tile: (int, int, int, int)
+    :rtype: ((int, int, int, int), numpy.ndarray)
+    :return: the tile and its similarities
+    """
+    shared_data = utilities.get_shared_data()
+    block = compute_similarity_block(
+        shared_data['senses'], tile[0], tile[1], tile[2], tile[3],
+        shared_data['path_cache'])
+    return tile, block
 
-    return neighbours
+
+def compute_similarity_tiles(senses, tiles, num_workers=None):
+    """
+    Calculates the given tiles of the sense similarity matrix, spreading them
+    over a pool of num_workers processes when it is greater than 1. The tiles
+    are yielded as soon as they are finished, not necessarily in order
+
+    :type senses: list[Synset]
+    :type tiles: list[(int, int, int, int)]
+    :type num_workers: int
+    :rtype: iterator[((int, int, int, int), numpy.ndarray)]
+    """
+    shared_data = {'senses': senses, 'path_cache': SynsetPathCache()}
+    if num_workers is None or num_workers < 2 or len(tiles) < 2:
+        with utilities.share_data(shared_data):
+            for tile in tiles:
+                yield compute_similarity_tile(tile)
+    else:
+        # The hypernyms of the senses are loaded before the workers are
+        # created, so that they get them instead of loading them again
+        for sense in senses:
+            shared_data['path_cache'].get_hypernym_paths(sense)
+
+        pool = Pool(
+            num_workers, utilities.initialize_shared_data, (shared_data,))
+        try:
+            for result in pool.imap_unordered(compute_similarity_tile, tiles):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+
+def build_sense_similarity_matrix(senses, num_workers=None):
+    """
+    Calculates the Wu-Palmer similarity between every pair of senses
+
+    :type senses: list[Synset]
+    :param senses: the senses
+    :type num_workers: int
+    :param num_workers: the number of worker processes used to calculate the
+    similarities. If None, they are calculated serially
+    :rtype: dict[str, dict[str, float]]
+    :return: a dictionary that contains the similarity between every pair of
+    senses, indexed by the names of the senses
+    """
+    print('building senses similarity matrix', time.strftime("%H:%M:%S"))
+    sense_names = [sense.name() for sense in senses]
+    similarity_matrix = {name: {} for name in sense_names}
+
+    tiles = get_upper_triangle_tiles(len(senses), SIMILARITY_BLOCK_SIZE)
+    for (row_start, row_end, column_start, column_end), block in \
+            compute_similarity_tiles(senses, tiles, num_workers):
+        for row in range(row_start, row_end):
+            row_similarities = similarity_matrix[sense_names[row]]
+            for column in range(column_start, column_end):
+                similarity = \
+                    float(block[row - row_start, column - column_start])
+                row_similarities[sense_names[column]] = similarity
+                similarity_matrix[sense_names[column]][sense_names[row]] = \
+                    similarity
+
+    print('finished senses similarity matrix', time.strftime("%H:%M:%S"))
+
+    return similarity_matrix
 
 
 def is_similar(number1, number2):
@@ -255,34 +482,174 @@ def get_context_similarity(context1, context2, topic_indices):
     return 1 / (1 + np.linalg.norm(filtered_context1-filtered_context2))
 
 
-def choose_pivot(list1, list2):
+def build_similarity_graph(
+        similarity_matrix, threshold=SENSE_SIMILARITY_THRESHOLD,
+        block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Builds the graph in which two senses are neighbours when their similarity
+    is greater or equal than the threshold. The rows of the matrix are read
+    in blocks, so it can also be an HDF5 dataset that doesn't fit in memory
+
+    :type similarity_matrix: numpy.ndarray | h5py.Dataset
+    :param similarity_matrix: a square matrix with the similarity between
+    every pair of senses
+    :type threshold: float
+    :param threshold: the minimum similarity for two senses to be neighbours
+    :type block_size: int
+    :param block_size: the number of rows that are read at a time
+    :rtype: scipy.sparse.csr_matrix
+    :return: the symmetric boolean adjacency matrix of the graph, without
+    self-loops. Two senses are neighbours if any of their two similarities
+    passes the threshold
+    """
+    num_senses = similarity_matrix.shape[0]
+    all_rows = []
+    all_columns = []
 
-    index = random.randint(0, len(list1) + len(list2) - 1)
-    if index < len(list1):
-        return list1[index]
-    else:
-        return list2[index-len(list1)]
-
-
-def list_difference(list1, list2):
-    return [item for item in list1 if item not in list2]
-
-
-def bronk2_synset(clique, candidates, excluded, clique_list, similarity_matrix):
-    if len(candidates) == 0 and len(excluded) == 0:
-        # print clique
-        clique_list.append(clique)
-        return
-    pivot = choose_pivot(candidates, excluded)
-    neighbours = get_synset_neighbours(pivot, similarity_matrix)
-    p_minus_neighbours = list_difference(candidates, neighbours)[:]
-    for vertex in p_minus_neighbours:
-        vertex_neighbours = get_synset_neighbours(vertex, similarity_matrix)
-        new_candidates = [val for val in candidates if val in vertex_neighbours]  # p intersects N(vertex)
-        new_excluded = [val for val in excluded if val in vertex_neighbours]  # x intersects N(vertex)
-        bronk2_synset(clique + [vertex], new_candidates, new_excluded, clique_list, similarity_matrix)
+    for row_start in range(0, num_senses, block_size):
+        block = np.asarray(similarity_matrix[row_start:row_start + block_size])
+        rows, columns = np.nonzero(block >= threshold)
+        rows += row_start
+        not_diagonal = rows != columns
+        all_rows.append(rows[not_diagonal])
+        all_columns.append(columns[not_diagonal])
+
+    rows = np.concatenate(all_rows) if all_rows else np.zeros(0, int)
+    columns = np.concatenate(all_columns) if all_columns else np.zeros(0, int)
+    graph = scipy.sparse.csr_matrix(
+        (np.ones(len(rows), bool), (rows, columns)),
+        shape=(num_senses, num_senses))
+
+    return (graph + graph.T).tocsr()
+
+
+def get_degeneracy_ordering(graph):
+    """
+    Orders the vertices of the graph by repeatedly removing the vertex with
+    the smallest degree among the remaining ones. Every vertex has at most
+    d neighbours later in the ordering, where d is the degeneracy of the
+    graph, which bounds the size of the candidate sets of the clique search
+
+    :type graph: scipy.sparse.csr_matrix
+    :param graph: the symmetric adjacency matrix of the graph
+    :rtype: list[int]
+    :return: the vertices in degeneracy order
+    """
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    num_vertices = graph.shape[0]
+    degrees = np.diff(graph.indptr).tolist()
+    if num_vertices == 0:
+        return []
+
+    buckets = [set() for _ in range(max(degrees) + 1)]
+    for vertex, degree in enumerate(degrees):
+        buckets[degree].add(vertex)
+
+    removed = [False] * num_vertices
+    ordering = []
+    degree = 0
+    for _ in range(num_vertices):
+        # Removing a vertex lowers the degree of its neighbours by one, so
+        # the smallest degree can't be lower than the previous one minus one
+        degree = max(degree - 1, 0)
+        while not buckets[degree]:
+            degree += 1
+        vertex = buckets[degree].pop()
+        removed[vertex] = True
+        ordering.append(vertex)
+
+        for neighbour in indices[indptr[vertex]:indptr[vertex + 1]]:
+            if not removed[neighbour]:
+                neighbour_degree = degrees[neighbour]
+                buckets[neighbour_degree].remove(neighbour)
+                buckets[neighbour_degree - 1].add(neighbour)
+                degrees[neighbour] = neighbour_degree - 1
+
+    return ordering
+
+
+def choose_pivot(candidates, excluded, neighbours):
+    """
+    Chooses the vertex of candidates | excluded with the most neighbours in
+    candidates, which minimizes the number of branches of the search
+    """
+    pivot = None
+    max_neighbours = -1
+    for vertex in itertools.chain(candidates, excluded):
+        num_neighbours = len(candidates & neighbours[vertex])
+        if num_neighbours > max_neighbours:
+            pivot = vertex
+            max_neighbours = num_neighbours
+            if max_neighbours == len(candidates):
+                break
+    return pivot
+
+
+def find_cliques(graph, max_cliques=None, max_clique_size=None):
+    """
+    Finds the maximal cliques of the graph with the Bron-Kerbosch algorithm,
+    using the vertex with the most neighbours among the candidates as pivot
+    and processing the top level vertices in degeneracy order. The search is
+    iterative, so its depth is not limited by the recursion limit
+
+    :type graph: scipy.sparse.csr_matrix
+    :param graph: the symmetric adjacency matrix of the graph, as returned by
+    build_similarity_graph
+    :type max_cliques: int
+    :param max_cliques: the maximum number of cliques that are returned. If
+    None, all the maximal cliques are returned
+    :type max_clique_size: int
+    :param max_clique_size: the maximum size of the cliques. A clique that
+    reaches this size is returned without extending it, even if it is not
+    maximal. If None, the size of the cliques is not limited
+    :rtype: list[list[int]]
+    :return: the cliques, as lists of vertices
+    """
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    neighbours = [
+        set(indices[indptr[vertex]:indptr[vertex + 1]])
+        for vertex in range(graph.shape[0])
+    ]
+    ordering = get_degeneracy_ordering(graph)
+    cliques = []
+
+    # At the top level the vertices are visited in degeneracy order, so the
+    # candidates of every vertex are its neighbours later in the ordering
+    # and the excluded vertices are its neighbours earlier in the ordering
+    stack = [([], set(ordering), set(), iter(ordering))]
+    while stack:
+        clique, candidates, excluded, branches = stack[-1]
+        vertex = next(branches, None)
+        if vertex is None:
+            stack.pop()
+            continue
+
+        vertex_neighbours = neighbours[vertex]
+        new_clique = clique + [vertex]
+        new_candidates = candidates & vertex_neighbours
+        new_excluded = excluded & vertex_neighbours
         candidates.remove(vertex)
-        excluded.append(vertex)
+        excluded.add(vertex)
+
+        if not new_candidates or (
+                max_clique_size is not None and
+                len(new_clique) >= max_clique_size):
+            if not new_candidates and new_excluded:
+                # The clique is contained in a clique that was already found
+                continue
+            cliques.append(new_clique)
+            if max_cliques is not None and len(cliques) >= max_cliques:
+                break
+            continue
+
+        pivot = choose_pivot(new_candidates, new_excluded, neighbours)
+        stack.append((
+            new_clique, new_candidates, new_excluded,
+            iter(list(new_candidates - neighbours[pivot]))))
+
+    return cliques
 
 
 def generate_stats(specific_reviews, generic_reviews):
@@ -390,64 +757,113 @@ def create_graph(reviews_file, graph_file):
     print('vertex cover length: %d' % len(my_vertex_cover))
 
 
-def build_hdf5_sense_similarity_matrix(senses):
+def build_hdf5_sense_similarity_matrix(
+        senses, num_workers=None, block_size=SIMILARITY_BLOCK_SIZE,
+        folder=None):
     """
+    Calculates the Wu-Palmer similarity between every pair of senses and
+    stores it in a HDF5 file, along with a file that maps the name of every
+    sense to its index in the matrix.
+
+    Only the tiles of the upper triangle of the matrix are calculated, and
+    each one of them is written to its place and to its transposed place in a
+    dataset that is chunked in tiles of the same size and compressed. A second
+    dataset records which tiles have been completed, so if the process is
+    interrupted, calling this function again with the same senses and the
+    same block size only calculates the tiles that are missing
 
     :type senses: list[Synset]
-    :param senses:
+    :param senses: the senses
+    :type num_workers: int
+    :param num_workers: the number of worker processes used to calculate the
+    tiles. If None, they are calculated serially
+    :type block_size: int
+    :param block_size: the number of rows and columns of the tiles
+    :type folder: str
+    :param folder: the folder where the files are written. If None, the
+    dataset folder is used
     """
+    if folder is None:
+        folder = Constants.DATASET_FOLDER
 
     num_senses = len(senses)
-
-    hdf5_file = Constants.DATASET_FOLDER + Constants.ITEM_TYPE +\
-                '_sense_similarity_matrix.hdf5'
-    f = h5py.File(hdf5_file, 'w')
-    similarity_matrix = f.create_dataset(
-        Constants.ITEM_TYPE + "_sense_similarity_matrix",
-        (num_senses, num_senses)
-    )
+    sense_names = [sense.name() for sense in senses]
 
     sense_index_map = {}
-
-    sense_index = 0
-    for sense in senses:
-
-        if sense in sense_index_map:
+    for sense_index, sense_name in enumerate(sense_names):
+        if sense_name in sense_index_map:
             raise ValueError('There are repeated items in the senses iterable')
+        sense_index_map[sense_name] = sense_index
 
-        sense_index_map[sense.name()] = sense_index
-        sense_index += 1
-
-    sense_index_map_file = Constants.DATASET_FOLDER + Constants.ITEM_TYPE +\
+    sense_index_map_file = folder + Constants.ITEM_TYPE +\
         '_sense_index_map.pkl'
     with open(sense_index_map_file, 'wb') as write_file:
         pickle.dump(sense_index_map, write_file, pickle.HIGHEST_PROTOCOL)
 
-    print('building senses similarity matrix', time.strftime("%H:%M:%S"))
-
-    index = 1
-    for sense1 in senses:
-        sense1_index = sense_index_map[sense1.name()]
-        similarity_matrix[sense1_index, sense1_index] = 1.0
-        for sense2 in senses[index:]:
-            similarity = sense1.wup_similarity(sense2)
-            sense2_index = sense_index_map[sense2.name()]
-            similarity_matrix[sense1_index, sense2_index] = similarity
-            similarity_matrix[sense2_index, sense1_index] = similarity
-
-        if not index % 100:
-            print('%s: completed %d/%d senses' %
-                  (time.strftime("%Y/%d/%m-%H:%M:%S"), index, num_senses))
-        index += 1
+    hdf5_file = folder + Constants.ITEM_TYPE + '_sense_similarity_matrix.hdf5'
+    dataset_name = Constants.ITEM_TYPE + '_sense_similarity_matrix'
+    tiles_dataset_name = dataset_name + '_completed_tiles'
+    senses_dataset_name = dataset_name + '_senses'
+    num_blocks = int(math.ceil(num_senses / float(block_size)))
+
+    f = None
+    if os.path.exists(hdf5_file):
+        f = h5py.File(hdf5_file, 'a')
+        is_same_matrix = \
+            dataset_name in f and tiles_dataset_name in f and \
+            senses_dataset_name in f and \
+            f[tiles_dataset_name].shape == (num_blocks, num_blocks) and \
+            f[tiles_dataset_name].attrs.get('block_size') == block_size and \
+            list(f[senses_dataset_name][:]) == sense_names
+        if not is_same_matrix:
+            f.close()
+            f = None
+
+    if f is None:
+        f = h5py.File(hdf5_file, 'w')
+        chunk_size = max(1, min(block_size, num_senses))
+        f.create_dataset(
+            dataset_name, (num_senses, num_senses), 'f',
+            chunks=(chunk_size, chunk_size), compression='gzip')
+        f.create_dataset(tiles_dataset_name, (num_blocks, num_blocks), 'i1')
+        f[tiles_dataset_name].attrs['block_size'] = block_size
+        f.create_dataset(
+            senses_dataset_name, data=np.array(sense_names, dtype='S'))
+
+    try:
+        similarity_matrix = f[dataset_name]
+        completed_tiles = f[tiles_dataset_name]
+        completed = completed_tiles[:]
+        tiles = [
+            tile for tile in get_upper_triangle_tiles(num_senses, block_size)
+            if not completed[tile[0] // block_size, tile[2] // block_size]
+        ]
+
+        print('%s: building senses similarity matrix, %d tiles left' %
+              (time.strftime("%Y/%d/%m-%H:%M:%S"), len(tiles)))
+
+        num_completed = 0
+        for (row_start, row_end, column_start, column_end), block in \
+                compute_similarity_tiles(senses, tiles, num_workers):
+            similarity_matrix[row_start:row_end, column_start:column_end] = \
+                block
+            if row_start != column_start:
+                similarity_matrix[
+                    column_start:column_end, row_start:row_end] = block.T
+            completed_tiles[
+                row_start // block_size, column_start // block_size] = 1
+            f.flush()
+
+            num_completed += 1
+            if not num_completed % 100:
+                print('%s: completed %d/%d tiles' % (
+                    time.strftime("%Y/%d/%m-%H:%M:%S"), num_completed,
+                    len(tiles)))
+    finally:
+        f.close()
 
     print('finished senses similarity matrix', time.strftime("%H:%M:%S"))
 
-    print(similarity_matrix[1, 1])
-    print(f[Constants.ITEM_TYPE + "_sense_similarity_matrix"][0][0])
-    # print(similarity_matrix)
-
-    f.close()
-
 
 def main():
 
@@ -463,7 +879,8 @@ def main():
 
     all_senses = list(generate_all_senses(reviews))
     print('num senses: %d' % len(all_senses))
-    build_hdf5_sense_similarity_matrix(all_senses)
+    build_hdf5_sense_similarity_matrix(
+        all_senses, Constants.PREPROCESSING_NUM_WORKERS)
 
 
 def build_groups2(nouns):
@@ -492,7 +909,8 @@ def build_groups2(nouns):
     # labels1 = affinity_propagation.fit_predict(sense_similarity_matrix)
     # print('affinity propagation ready', time.strftime("%H:%M:%S"))
 
-    grouper = BaumanSensesGrouper(sense_similarity_matrix, 0.7)
+    grouper = BaumanSensesGrouper(
+        sense_similarity_matrix, SENSE_SIMILARITY_THRESHOLD)
     groups = grouper.group_senses()
     print('groups')
     # print(groups)
@@ -0,0 +1,160 @@
+import random
+import time
+
+import networkx
+import numpy
+
+from topicmodeling.context import context_utils
+
+__author__ = 'fpena'
+
+
+def generate_similarity_matrix(num_senses, density, num_groups=0, seed=0):
+    """
+    Generates a symmetric similarity matrix in which every pair of senses
+    passes the similarity threshold with probability density. When
+    num_groups is greater than 0, the senses of every group are also similar
+    between them, which plants cliques like the ones of the WordNet senses
+    of related nouns
+
+    :param num_senses: the number of senses
+    :param density: the probability that two senses are neighbours
+    :param num_groups: the number of planted groups
+    :param seed: the seed of the random number generator
+    :rtype: numpy.ndarray
+    """
+    random_state = numpy.random.RandomState(seed)
+    threshold = context_utils.SENSE_SIMILARITY_THRESHOLD
+    is_neighbour = random_state.rand(num_senses, num_senses) < density
+    if num_groups:
+        groups = random_state.randint(num_groups, size=num_senses)
+        is_neighbour |= groups[:, numpy.newaxis] == groups
+    matrix = numpy.where(is_neighbour, threshold + 0.1, threshold - 0.1)
+    matrix = numpy.triu(matrix, 1)
+    matrix += matrix.T
+    numpy.fill_diagonal(matrix, 1.0)
+    return matrix
+
+
+def random_pivot_bron_kerbosch(clique, candidates, excluded, clique_list,
+                               similarity_matrix):
+    """
+    The search that build_groups used before find_cliques: a recursive
+    Bron-Kerbosch with a random pivot, that scans the similarities of every
+    sense to find its neighbours
+    """
+    def get_neighbours(synset):
+        return [
+            element for element in similarity_matrix.keys()
+            if element != synset and similarity_matrix[synset][element] >=
+            context_utils.SENSE_SIMILARITY_THRESHOLD
+        ]
+
+    if len(candidates) == 0 and len(excluded) == 0:
+        clique_list.append(clique)
+        return
+    pivot = random.choice(candidates + excluded)
+    neighbours = get_neighbours(pivot)
+    for vertex in [item for item in candidates if item not in neighbours]:
+        vertex_neighbours = get_neighbours(vertex)
+        random_pivot_bron_kerbosch(
+            clique + [vertex],
+            [val for val in candidates if val in vertex_neighbours],
+            [val for val in excluded if val in vertex_neighbours],
+            clique_list, similarity_matrix)
+        candidates.remove(vertex)
+        excluded.append(vertex)
+
+
+def time_function(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - start
+
+
+def benchmark(
+        graphs=((60, 0.5, 0), (100, 0.5, 0), (150, 0.5, 0),
+                (2000, 0.01, 100), (5000, 0.005, 200)),
+        max_legacy_senses=100, max_cliques=10000, max_clique_size=5):
+    """
+    Times the search of the maximal cliques on synthetic dense graphs with
+    find_cliques, networkx.find_cliques and the previous recursive search,
+    which is only run on the smallest graphs. find_cliques is also timed
+    with a limit on the number of cliques and on their size
+
+    :param graphs: a list of (num_senses, density, num_groups) tuples, with
+    the parameters of generate_similarity_matrix
+    :param max_legacy_senses: the largest graph the previous search is run on
+    :param max_cliques: the limit on the number of cliques
+    :param max_clique_size: the limit on the size of the cliques
+    :return: a list with a dictionary of results for every graph
+    """
+    random.seed(0)
+    all_results = []
+
+    for num_senses, density, num_groups in graphs:
+        similarity_matrix = generate_similarity_matrix(
+            num_senses, density, num_groups)
+        graph, graph_time = time_function(
+            context_utils.build_similarity_graph, similarity_matrix)
+        cliques, cliques_time = time_function(
+            context_utils.find_cliques, graph)
+        networkx_graph = networkx.from_scipy_sparse_matrix(graph)
+        networkx_cliques, networkx_time = time_function(
+            lambda: list(networkx.find_cliques(networkx_graph)))
+        assert len(cliques) == len(networkx_cliques)
+        _, max_cliques_time = time_function(
+            context_utils.find_cliques, graph, max_cliques=max_cliques)
+        _, max_size_time = time_function(
+            context_utils.find_cliques, graph,
+            max_clique_size=max_clique_size)
+
+        results = {
+            'num_senses': num_senses,
+            'density': density,
+            'num_edges': graph.nnz // 2,
+            'num_cliques': len(cliques),
+            'graph_time': graph_time,
+            'cliques_time': cliques_time,
+            'networkx_time': networkx_time,
+            'max_cliques_time': max_cliques_time,
+            'max_size_time': max_size_time,
+        }
+        print('%d senses, density %.3f, %d edges, %d maximal cliques' % (
+            num_senses, density, results['num_edges'], len(cliques)))
+        print('  build graph: %f seconds' % graph_time)
+        print('  find_cliques: %f seconds' % cliques_time)
+        print('  networkx.find_cliques: %f seconds' % networkx_time)
+        print('  find_cliques, max_cliques=%d: %f seconds' % (
+            max_cliques, max_cliques_time))
+        print('  find_cliques, max_clique_size=%d: %f seconds' % (
+            max_clique_size, max_size_time))
+
+        if num_senses <= max_legacy_senses:
+            names = ['sense%d' % sense for sense in range(num_senses)]
+            dict_matrix = {
+                name1: dict(zip(names, row))
+                for name1, row in zip(names, similarity_matrix.tolist())}
+            legacy_cliques = []
+            _, legacy_time = time_function(
+                random_pivot_bron_kerbosch, [], names[:], [],
+                legacy_cliques, dict_matrix)
+            assert len(legacy_cliques) == len(cliques)
+            results['legacy_time'] = legacy_time
+            results['speedup'] = legacy_time / (graph_time + cliques_time)
+            print('  previous recursive search: %f seconds' % legacy_time)
+            print('  speedup: %.1fx' % results['speedup'])
+
+        all_results.append(results)
+
+    return all_results
+
+
+def main():
+    print('%s: start' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+    benchmark()
+    print('%s: end' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,7 @@
 import copy
+import functools
+import shutil
+import tempfile
 import time
 
 import operator
@@ -11,9 +14,59 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import normalize
 
 from etl import ETLUtils
+from topicmodeling.context import context_extractor
+from utils import utilities
 from utils.constants import Constants
 
 
+def get_pass_seed(pass_index):
+    """
+    Returns the seed of the random number generator of one of the passes of
+    the ensemble. It only depends on the numpy seed and on the pass, so a pass
+    always gets the same seed no matter which process runs it
+
+    :param pass_index: the index of the pass
+    :rtype: int
+    """
+    seed = Constants.NUMPY_RANDOM_SEED
+    return (0 if seed is None else seed) + pass_index
+
+
+def fit_topic_term_matrix(document_term_matrix, num_topics, seed):
+    topic_model = decomposition.NMF(
+        init="nndsvd", n_components=num_topics,
+        max_iter=Constants.TOPIC_MODEL_ITERATIONS,
+        alpha=Constants.NMF_REGULARIZATION,
+        l1_ratio=Constants.NMF_REGULARIZATION_RATIO,
+        random_state=seed
+    )
+    topic_model.fit_transform(document_term_matrix)
+    return topic_model.components_
+
+
+def load_shared_document_term_matrix(folder):
+    utilities.get_shared_data()['document_term_matrix'] = \
+        utilities.load_sparse_matrix(folder)
+
+
+def fit_topic_term_matrices(pass_parameters, document_term_matrix=None):
+    """
+    Fits one NMF model for each of the given passes
+
+    :param pass_parameters: a list of (num_topics, seed) tuples
+    :param document_term_matrix: the document-term matrix. If None, the
+    matrix loaded by load_shared_document_term_matrix is used
+    :return: a list with the topic-term matrix of every pass
+    """
+    if document_term_matrix is None:
+        document_term_matrix = \
+            utilities.get_shared_data()['document_term_matrix']
+    return [
+        fit_topic_term_matrix(document_term_matrix, num_topics, seed)
+        for num_topics, seed in pass_parameters
+    ]
+
+
 class NmfContextExtractor:
 
     def __init__(self, records):
@@ -33,6 +86,8 @@ class NmfContextExtractor:
         self.document_topic_matrix = None
         self.topic_term_matrix = None
         self.terms = None
+        self.review_topic_matrix = None
+        self.target_mask = None
         self.lda_beta_comparison_operator = None
         if Constants.LDA_BETA_COMPARISON_OPERATOR == 'gt':
             self.lda_beta_comparison_operator = operator.gt
@@ -108,27 +163,43 @@ class NmfContextExtractor:
         print('%s: topic model built' %
               time.strftime("%Y/%m/%d-%H:%M:%S"))
 
-    def build_single_topic_model(self):
+    def build_single_topic_model(self, seed=None):
         # print('%s: building NMF topic model' %
         #       time.strftime("%Y/%m/%d-%H:%M:%S"))
 
-        topic_model = decomposition.NMF(
-            init="nndsvd", n_components=self.num_topics,
-            max_iter=Constants.TOPIC_MODEL_ITERATIONS,
-            alpha=Constants.NMF_REGULARIZATION,
-            l1_ratio=Constants.NMF_REGULARIZATION_RATIO
-        )
-        topic_model.fit_transform(self.document_term_matrix)
-        topic_term_matrix = topic_model.components_
-
-        return topic_term_matrix
+        return fit_topic_term_matrix(
+            self.document_term_matrix, self.num_topics, seed)
 
     def build_stable_topic_model(self):
 
-        matrices = []
-        for i in range(Constants.TOPIC_MODEL_PASSES):
-            topic_term_matrix = self.build_single_topic_model().transpose()
-            matrices.append(topic_term_matrix)
+        # The passes are independent, when Constants.NUM_CORES is set they are
+        # fitted by a pool of processes that memory-map the document-term
+        # matrix from a temporary folder
+        pass_parameters = [
+            (self.num_topics, get_pass_seed(pass_index))
+            for pass_index in range(Constants.TOPIC_MODEL_PASSES)
+        ]
+        num_workers = Constants.NUM_CORES
+
+        if num_workers is None or num_workers < 2:
+            topic_term_matrices = fit_topic_term_matrices(
+                pass_parameters, self.document_term_matrix)
+        else:
+            shared_folder = tempfile.mkdtemp()
+            try:
+                utilities.save_sparse_matrix(
+                    shared_folder, self.document_term_matrix)
+                topic_term_matrices = utilities.map_shards(
+                    fit_topic_term_matrices, pass_parameters, num_workers,
+                    functools.partial(
+                        load_shared_document_term_matrix, shared_folder))
+            finally:
+                shutil.rmtree(shared_folder)
+
+        matrices = [
+            topic_term_matrix.transpose()
+            for topic_term_matrix in topic_term_matrices
+        ]
 
         stack_matrix = numpy.hstack(matrices)
         stack_matrix = normalize(stack_matrix, axis=0)
@@ -136,11 +207,13 @@ class NmfContextExtractor:
 
         print "Stack matrix M of size %s" % str(stack_matrix.shape)
 
+        # The model of the stacked factors is seeded as one more pass
         self.topic_model = decomposition.NMF(
             init="nndsvd", n_components=self.num_topics,
             max_iter=Constants.TOPIC_MODEL_ITERATIONS,
             alpha=Constants.NMF_REGULARIZATION,
-            l1_ratio=Constants.NMF_REGULARIZATION_RATIO
+            l1_ratio=Constants.NMF_REGULARIZATION_RATIO,
+            random_state=get_pass_seed(Constants.TOPIC_MODEL_PASSES)
         )
 
         self.document_topic_matrix = \
@@ -208,6 +281,19 @@ class NmfContextExtractor:
             return sorted_topics
 
         # numpy.random.seed(0)
+        self.review_topic_matrix = context_extractor.build_topic_matrix(
+            self.records, self.num_topics)
+        self.target_mask = context_extractor.get_target_mask(self.records)
+        weighted_frequencies = \
+            context_extractor.calculate_topic_weighted_frequencies(
+                self.review_topic_matrix)
+        target_weighted_frequencies = \
+            context_extractor.calculate_topic_weighted_frequencies(
+                self.review_topic_matrix, self.target_mask)
+        non_target_weighted_frequencies = \
+            context_extractor.calculate_topic_weighted_frequencies(
+                self.review_topic_matrix, ~self.target_mask)
+
         topic_ratio_map = {}
         self.topic_weighted_frequency_map = {}
         lower_than_alpha_count = 0.0
@@ -215,14 +301,10 @@ class NmfContextExtractor:
         non_contextual_topics = set()
         for topic in range(self.num_topics):
             # print('topic: %d' % topic)
-            weighted_frq = self.calculate_topic_weighted_frequency(
-                topic, self.records)
-            target_weighted_frq = \
-                self.calculate_topic_weighted_frequency(
-                    topic, self.target_reviews)
+            weighted_frq = float(weighted_frequencies[topic])
+            target_weighted_frq = float(target_weighted_frequencies[topic])
             non_target_weighted_frq = \
-                self.calculate_topic_weighted_frequency(
-                    topic, self.non_target_reviews)
+                float(non_target_weighted_frequencies[topic])
 
             if weighted_frq < Constants.CONTEXT_EXTRACTOR_ALPHA:
                 non_contextual_topics.add(topic)
@@ -379,7 +461,7 @@ class NmfContextExtractor:
 
 def main():
 
-    records = ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
+    records = ETLUtils.load_records_file(Constants.PROCESSED_RECORDS_FILE)
 
     print('num_reviews', len(records))
     # lda_context_utils.discover_topics(my_reviews, 150)
@@ -22,7 +22,8 @@ def get_review_metrics(record):
     :return: a list with numeric metrics
     """
     review_text = record[Constants.TEXT_FIELD]
-    log_sentences = math.log(len(nlp_utils.get_sentences(review_text)) + 1)
+    sentences = nlp_utils.get_default_pipeline().get_sentences(review_text)
+    log_sentences = math.log(len(sentences) + 1)
     # log_time_words = math.log(len(self.get_time_words(review.text)) + 1)
     tagged_words = record[Constants.POS_TAGS_FIELD]
     log_words = math.log(len(tagged_words) + 1)
@@ -0,0 +1,107 @@
+import random
+from unittest import TestCase
+
+import numpy
+
+from topicmodeling.context import context_extractor
+from topicmodeling.context.context_extractor import ContextExtractor
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+def generate_records(num_records, num_topics, seed=0):
+    random_generator = random.Random(seed)
+    records = []
+    for _ in range(num_records):
+        weights = [random_generator.random() for _ in range(num_topics)]
+        total = sum(weights)
+        # As in LDA, some of the topics are not present in the review
+        topics = [
+            (topic, weight / total) for topic, weight in enumerate(weights)
+            if random_generator.random() < 0.7]
+        records.append({
+            Constants.TOPICS_FIELD: topics,
+            Constants.TOPIC_MODEL_TARGET_FIELD:
+                random_generator.choice(['specific', 'generic'])
+        })
+    return records
+
+
+class TestContextExtractor(TestCase):
+
+    def setUp(self):
+        self.num_topics = 12
+        self.records = generate_records(200, self.num_topics)
+        self.properties = {
+            'topic_weighting_method': Constants.TOPIC_WEIGHTING_METHOD,
+            'topic_model_target_reviews': Constants.TOPIC_MODEL_TARGET_REVIEWS,
+            'topic_model_num_topics': Constants.TOPIC_MODEL_NUM_TOPICS,
+        }
+        Constants.TOPIC_MODEL_TARGET_REVIEWS = 'specific'
+        Constants.TOPIC_MODEL_NUM_TOPICS = self.num_topics
+
+    def tearDown(self):
+        Constants.TOPIC_WEIGHTING_METHOD = \
+            self.properties['topic_weighting_method']
+        Constants.TOPIC_MODEL_TARGET_REVIEWS = \
+            self.properties['topic_model_target_reviews']
+        Constants.TOPIC_MODEL_NUM_TOPICS = \
+            self.properties['topic_model_num_topics']
+
+    def test_calculate_topic_weighted_frequencies(self):
+        target_records = [
+            record for record in self.records
+            if record[Constants.TOPIC_MODEL_TARGET_FIELD] == 'specific']
+        mask = context_extractor.get_target_mask(self.records)
+        self.assertEqual(len(target_records), mask.sum())
+
+        for method in ['binary', 'probability']:
+            Constants.TOPIC_WEIGHTING_METHOD = method
+            topic_matrix = context_extractor.build_topic_matrix(
+                self.records, self.num_topics)
+            frequencies = \
+                context_extractor.calculate_topic_weighted_frequencies(
+                    topic_matrix)
+            target_frequencies = \
+                context_extractor.calculate_topic_weighted_frequencies(
+                    topic_matrix, mask)
+
+            for topic in range(self.num_topics):
+                self.assertAlmostEqual(
+                    ContextExtractor.calculate_topic_weighted_frequency(
+                        topic, self.records), frequencies[topic])
+                self.assertAlmostEqual(
+                    ContextExtractor.calculate_topic_weighted_frequency(
+                        topic, target_records), target_frequencies[topic])
+
+        Constants.TOPIC_WEIGHTING_METHOD = 'all'
+        self.assertRaises(
+            ValueError, context_extractor.build_topic_matrix, self.records,
+            self.num_topics)
+
+    def test_get_context_rich_topics(self):
+        Constants.TOPIC_WEIGHTING_METHOD = 'probability'
+        extractor = ContextExtractor(self.records)
+        extractor.separate_reviews()
+        context_rich_topics = extractor.get_context_rich_topics()
+
+        # The ratios are the same as the ones obtained topic by topic
+        for topic in range(self.num_topics):
+            expected_ratio = \
+                ContextExtractor.calculate_topic_weighted_frequency(
+                    topic, extractor.target_reviews) / \
+                ContextExtractor.calculate_topic_weighted_frequency(
+                    topic, extractor.non_target_reviews)
+            self.assertAlmostEqual(
+                expected_ratio, extractor.topic_ratio_map[topic])
+
+        ratios = [ratio for topic, ratio in context_rich_topics]
+        self.assertEqual(sorted(ratios, reverse=True), ratios)
+        self.assertTrue(all(
+            not extractor.lda_beta_comparison_operator(
+                ratio, Constants.CONTEXT_EXTRACTOR_BETA)
+            for ratio in ratios))
+        numpy.testing.assert_array_equal(
+            context_extractor.get_target_mask(self.records),
+            extractor.target_mask)
@@ -1,6 +1,16 @@
+import random
+import shutil
+import tempfile
+
+import h5py
+import networkx
+import numpy
+from nltk.corpus.reader import Synset
+
 from topicmodeling.context import review_utils
 from topicmodeling.context import context_utils
 from topicmodeling.context.review import Review
+from utils.constants import Constants
 
 __author__ = 'fpena'
 
@@ -153,3 +163,226 @@ class TestContextUtils(TestCase):
         context_utils.remove_nouns_from_reviews(actual_reviews, nouns)
         self.assertItemsEqual(actual_review1.nouns, expected_review1.nouns)
         self.assertItemsEqual(actual_review2.nouns, expected_review2.nouns)
+
+    def test_calculate_word_weighted_frequencies(self):
+        reviews = [Review() for _ in range(4)]
+        for review, nouns in zip(reviews, [
+                ['bar', 'food', 'bar'], [], ['food', 'wine'], ['night']]):
+            review.nouns = nouns
+        nouns = ['food', 'bar', 'wine', 'beer']
+
+        noun_matrix = context_utils.build_noun_matrix(reviews, nouns)
+        numpy.testing.assert_array_equal(
+            [[1, 1, 0, 0], [0, 0, 0, 0], [1, 0, 1, 0], [0, 0, 0, 0]],
+            noun_matrix.toarray())
+        numpy.testing.assert_array_equal(
+            [context_utils.calculate_word_weighted_frequency(noun, reviews)
+             for noun in nouns],
+            context_utils.calculate_word_weighted_frequencies(noun_matrix))
+
+        subset = [reviews[0], reviews[1]]
+        mask = context_utils.get_review_mask(reviews, subset)
+        numpy.testing.assert_array_equal([True, True, False, False], mask)
+        numpy.testing.assert_array_equal(
+            [context_utils.calculate_word_weighted_frequency(noun, subset)
+             for noun in nouns],
+            context_utils.calculate_word_weighted_frequencies(
+                noun_matrix, mask))
+
+
+class FakeSynset(Synset):
+    """
+    A noun synset of a made up taxonomy, which has the similarity methods of
+    the WordNet synsets without the WordNet corpus
+    """
+
+    def __init__(self, name, hypernyms):
+        Synset.__init__(self, None)
+        self._name = name
+        self._pos = 'n'
+        self._hypernym_list = hypernyms
+
+    def _needs_root(self):
+        return False
+
+    def hypernyms(self):
+        return list(self._hypernym_list)
+
+    def _hypernyms(self):
+        return self.hypernyms()
+
+    def instance_hypernyms(self):
+        return []
+
+    def _instance_hypernyms(self):
+        return []
+
+
+def generate_taxonomy(num_synsets, seed):
+    """
+    Generates a taxonomy with a single root in which a synset can have several
+    hypernyms
+    """
+    random_generator = random.Random(seed)
+    synsets = [FakeSynset('synset.n.00', [])]
+    for index in range(1, num_synsets):
+        hypernyms = random_generator.sample(
+            synsets, min(len(synsets), random_generator.choice([1, 1, 2, 3])))
+        synsets.append(FakeSynset('synset.n.%02d' % index, hypernyms))
+    return synsets
+
+
+class TestSenseSimilarityMatrix(TestCase):
+
+    def setUp(self):
+        self.senses = generate_taxonomy(60, 0)
+        # The Wu-Palmer similarity is not always symmetric, the similarity of
+        # senses[i] to senses[j] with i < j is used for both pairs
+        self.expected_matrix = numpy.triu(numpy.array(
+            [[sense1.wup_similarity(sense2) for sense2 in self.senses]
+             for sense1 in self.senses], dtype='f'), 1)
+        self.expected_matrix += self.expected_matrix.T
+        numpy.fill_diagonal(self.expected_matrix, 1.0)
+        self.folder = tempfile.mkdtemp() + '/'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_wup_similarity(self):
+        path_cache = context_utils.SynsetPathCache()
+        for sense1 in self.senses:
+            for sense2 in self.senses:
+                self.assertEqual(
+                    sense1.wup_similarity(sense2),
+                    path_cache.wup_similarity(sense1, sense2))
+
+    def test_build_sense_similarity_matrix(self):
+        similarity_matrix = \
+            context_utils.build_sense_similarity_matrix(self.senses)
+        actual_matrix = numpy.array(
+            [[similarity_matrix[sense1.name()][sense2.name()]
+              for sense2 in self.senses] for sense1 in self.senses], dtype='f')
+        numpy.testing.assert_array_equal(self.expected_matrix, actual_matrix)
+
+    def load_hdf5_matrix(self):
+        hdf5_file = self.folder + Constants.ITEM_TYPE + \
+            '_sense_similarity_matrix.hdf5'
+        with h5py.File(hdf5_file, 'r') as f:
+            return f[Constants.ITEM_TYPE + '_sense_similarity_matrix'][:]
+
+    def test_build_hdf5_sense_similarity_matrix(self):
+        context_utils.build_hdf5_sense_similarity_matrix(
+            self.senses, 2, 16, self.folder)
+        numpy.testing.assert_array_equal(
+            self.expected_matrix, self.load_hdf5_matrix())
+
+        # Simulate an interruption that left two tiles without calculating
+        hdf5_file = self.folder + Constants.ITEM_TYPE + \
+            '_sense_similarity_matrix.hdf5'
+        dataset_name = Constants.ITEM_TYPE + '_sense_similarity_matrix'
+        with h5py.File(hdf5_file, 'a') as f:
+            f[dataset_name][0:16, 16:32] = 0
+            f[dataset_name][16:32, 0:16] = 0
+            f[dataset_name][48:60, 48:60] = 0
+            f[dataset_name + '_completed_tiles'][0, 1] = 0
+            f[dataset_name + '_completed_tiles'][3, 3] = 0
+            # A completed tile is not calculated again
+            f[dataset_name][0:16, 32:48] = -1
+
+        context_utils.build_hdf5_sense_similarity_matrix(
+            self.senses, None, 16, self.folder)
+        actual_matrix = self.load_hdf5_matrix()
+        numpy.testing.assert_array_equal(-1, actual_matrix[0:16, 32:48])
+        actual_matrix[0:16, 32:48] = self.expected_matrix[0:16, 32:48]
+        numpy.testing.assert_array_equal(self.expected_matrix, actual_matrix)
+        with h5py.File(hdf5_file, 'r') as f:
+            completed_tiles = f[dataset_name + '_completed_tiles'][:]
+            self.assertTrue(completed_tiles[numpy.triu_indices(4)].all())
+
+        # With another block size the matrix is built again, even if it has
+        # the same number of tiles
+        context_utils.build_hdf5_sense_similarity_matrix(
+            self.senses, None, 15, self.folder)
+        numpy.testing.assert_array_equal(
+            self.expected_matrix, self.load_hdf5_matrix())
+
+        # With other senses the matrix is built again
+        context_utils.build_hdf5_sense_similarity_matrix(
+            self.senses[:30], None, 16, self.folder)
+        numpy.testing.assert_array_equal(
+            self.expected_matrix[:30, :30], self.load_hdf5_matrix())
+
+
+def generate_similarity_matrix(num_senses, density, seed):
+    random_state = numpy.random.RandomState(seed)
+    matrix = numpy.triu(random_state.rand(num_senses, num_senses), 1)
+    matrix += matrix.T
+    numpy.fill_diagonal(matrix, 1.0)
+    # Values are in [0, 1), so pairs are neighbours with probability density
+    return matrix + context_utils.SENSE_SIMILARITY_THRESHOLD - (1 - density)
+
+
+class TestFindCliques(TestCase):
+
+    def test_build_similarity_graph(self):
+        similarity_matrix = numpy.array([
+            [1.0, 0.7, 0.2, 0.0],
+            [0.7, 1.0, 0.69, 0.9],
+            [0.8, 0.69, 1.0, 0.0],
+            [0.0, 0.9, 0.0, 1.0]])
+        expected_graph = [
+            [0, 1, 1, 0],
+            [1, 0, 0, 1],
+            [1, 0, 0, 0],
+            [0, 1, 0, 0]]
+        for block_size in [1, 3, 4]:
+            graph = context_utils.build_similarity_graph(
+                similarity_matrix, block_size=block_size)
+            numpy.testing.assert_array_equal(expected_graph, graph.toarray())
+
+    def test_get_degeneracy_ordering(self):
+        # Star with a triangle attached to one of its leaves
+        graph = networkx.Graph(
+            [(0, 1), (0, 2), (0, 3), (3, 4), (3, 5), (4, 5)])
+        ordering = context_utils.get_degeneracy_ordering(
+            networkx.to_scipy_sparse_matrix(graph, range(6), format='csr'))
+        self.assertEqual(range(6), sorted(ordering))
+        for index, vertex in enumerate(ordering):
+            later_neighbours = set(graph[vertex]) & set(ordering[index:])
+            self.assertLessEqual(len(later_neighbours), 2)
+
+    def test_find_cliques(self):
+        for num_senses, density, seed in \
+                [(0, 0.5, 0), (1, 0.5, 0), (30, 0.1, 1), (30, 0.5, 2),
+                 (30, 0.9, 3), (60, 0.7, 4)]:
+            graph = context_utils.build_similarity_graph(
+                generate_similarity_matrix(num_senses, density, seed))
+            expected_cliques = sorted(
+                sorted(clique) for clique in networkx.find_cliques(
+                    networkx.from_scipy_sparse_matrix(graph)))
+            actual_cliques = context_utils.find_cliques(graph)
+            self.assertEqual(
+                expected_cliques,
+                sorted(sorted(clique) for clique in actual_cliques))
+
+    def test_find_cliques_limits(self):
+        graph = context_utils.build_similarity_graph(
+            generate_similarity_matrix(40, 0.8, 0))
+        adjacency = graph.toarray()
+        all_cliques = context_utils.find_cliques(graph)
+        self.assertEqual(
+            all_cliques[:10], context_utils.find_cliques(graph, max_cliques=10))
+
+        max_clique_size = 4
+        cliques = context_utils.find_cliques(
+            graph, max_clique_size=max_clique_size)
+        self.assertEqual(len(cliques), len(set(map(frozenset, cliques))))
+        for clique in cliques:
+            self.assertLessEqual(len(clique), max_clique_size)
+            sub_graph = adjacency[numpy.ix_(clique, clique)]
+            self.assertEqual(len(clique) * (len(clique) - 1), sub_graph.sum())
+        # Every maximal clique contains one of the limited cliques
+        for clique in all_cliques:
+            self.assertTrue(any(
+                set(limited_clique) <= set(clique)
+                for limited_clique in cliques))
@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+import numpy
+from scipy import sparse
+
+from topicmodeling.context.nmf_context_extractor import NmfContextExtractor
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+class TestNmfContextExtractor(TestCase):
+
+    def setUp(self):
+        self.properties = {
+            'num_cores': Constants.NUM_CORES,
+            'topic_model_passes': Constants.TOPIC_MODEL_PASSES,
+            'topic_model_iterations': Constants.TOPIC_MODEL_ITERATIONS,
+        }
+        Constants.TOPIC_MODEL_PASSES = 4
+        Constants.TOPIC_MODEL_ITERATIONS = 50
+
+    def tearDown(self):
+        Constants.NUM_CORES = self.properties['num_cores']
+        Constants.TOPIC_MODEL_PASSES = self.properties['topic_model_passes']
+        Constants.TOPIC_MODEL_ITERATIONS = \
+            self.properties['topic_model_iterations']
+
+    def build_stable_topic_model(self, num_cores):
+        Constants.NUM_CORES = num_cores
+        context_extractor = NmfContextExtractor([])
+        context_extractor.num_topics = 5
+        context_extractor.document_term_matrix = sparse.random(
+            60, 40, density=0.2, format='csr', random_state=0)
+        context_extractor.build_stable_topic_model()
+        return context_extractor
+
+    def test_build_stable_topic_model(self):
+        serial_extractor = self.build_stable_topic_model(None)
+        parallel_extractor = self.build_stable_topic_model(3)
+
+        self.assertEqual((5, 40), serial_extractor.topic_term_matrix.shape)
+        self.assertTrue(numpy.array_equal(
+            serial_extractor.document_topic_matrix,
+            parallel_extractor.document_topic_matrix))
+        self.assertTrue(numpy.array_equal(
+            serial_extractor.topic_term_matrix,
+            parallel_extractor.topic_term_matrix))
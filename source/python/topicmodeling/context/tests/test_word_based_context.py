@@ -0,0 +1,75 @@
+import random
+from unittest import TestCase
+
+from topicmodeling.context import context_utils
+from topicmodeling.context.review import Review
+from topicmodeling.context.word_based_context import WordBasedContext
+
+__author__ = 'fpena'
+
+
+def generate_reviews(num_reviews, vocabulary_size, seed):
+    random_generator = random.Random(seed)
+    vocabulary = ['noun%d' % index for index in range(vocabulary_size)]
+    reviews = []
+    for _ in range(num_reviews):
+        review = Review()
+        # Reviews can contain the same noun more than once
+        review.nouns = [
+            random_generator.choice(vocabulary[:random_generator.randint(
+                1, vocabulary_size)])
+            for _ in range(random_generator.randint(0, 10))]
+        reviews.append(review)
+    return reviews
+
+
+def classify_nouns(word_context):
+    """
+    Classifies the nouns one at a time, using
+    context_utils.calculate_word_weighted_frequency
+    """
+    context_nouns = []
+    unwanted_nouns = set()
+    for noun in word_context.candidate_nouns:
+        weighted_frq = context_utils.calculate_word_weighted_frequency(
+            noun, word_context.reviews)
+        specific_weighted_frq = \
+            context_utils.calculate_word_weighted_frequency(
+                noun, word_context.specific_reviews)
+        generic_weighted_frq = \
+            context_utils.calculate_word_weighted_frequency(
+                noun, word_context.generic_reviews)
+
+        if weighted_frq < word_context.alpha or specific_weighted_frq == 0:
+            unwanted_nouns.add(noun)
+        elif generic_weighted_frq == 0:
+            context_nouns.append(noun)
+        elif specific_weighted_frq / generic_weighted_frq < word_context.beta:
+            unwanted_nouns.add(noun)
+        else:
+            context_nouns.append(noun)
+
+    return context_nouns, unwanted_nouns
+
+
+class TestWordBasedContext(TestCase):
+
+    def setUp(self):
+        reviews = generate_reviews(200, 30, 0)
+        self.word_context = WordBasedContext(reviews)
+        self.word_context.specific_reviews = reviews[::3]
+        self.word_context.generic_reviews = [
+            review for index, review in enumerate(reviews) if index % 3]
+        self.word_context.all_nouns = context_utils.get_all_nouns(reviews)
+
+    def test_classify_nouns(self):
+        self.word_context.build_noun_matrix()
+        for alpha, beta in [(0.005, 1.0), (0.05, 0.5), (0.1, 2.0)]:
+            self.word_context.alpha = alpha
+            self.word_context.beta = beta
+            context_nouns, unwanted_nouns = self.word_context.classify_nouns()
+            self.assertEqual(classify_nouns(self.word_context),
+                             (context_nouns, unwanted_nouns))
+            self.assertEqual(
+                set(self.word_context.candidate_nouns),
+                set(context_nouns) | unwanted_nouns)
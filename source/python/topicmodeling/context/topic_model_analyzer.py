@@ -78,7 +78,8 @@ def analyze_topics(include_stability=True):
 
     utilities.plant_seeds()
     records = \
-        ETLUtils.load_json_file(Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE)
+        ETLUtils.load_records_file(
+            Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE)
     print('num_reviews', len(records))
     num_topics = Constants.TOPIC_MODEL_NUM_TOPICS
     num_terms = Constants.TOPIC_MODEL_STABILITY_NUM_TERMS
@@ -88,7 +89,7 @@ def analyze_topics(include_stability=True):
         topic_model.load_trained_data()
         topic_model_string = topic_model.print_topic_model(num_terms)
     elif Constants.TOPIC_MODEL_TYPE == 'lda':
-        topic_model = topic_model_creator.load_topic_model(None, None)
+        topic_model = topic_model_creator.load_lda_topic_model()
         topic_model_string = [
             topic_model.print_topic(topic_id, num_terms)
             for topic_id in range(num_topics)
@@ -15,30 +15,107 @@ from etl import ETLUtils
 from topicmodeling import topic_ensemble_caller
 from topicmodeling.context.lda_based_context import LdaBasedContext
 from topicmodeling.context.nmf_context_extractor import NmfContextExtractor
+from utils import artifact_cache
 from utils import constants
 from utils import utilities
 from utils.constants import Constants
 
 
-def create_topic_model(records, cycle_index, fold_index, check_exists=True):
+# The properties read while training a context extractor, the topic model is
+# only reused from the artifact cache when all of them have the same value
+CONTEXT_EXTRACTOR_PROPERTIES = [
+    Constants.TOPIC_MODEL_TYPE_FIELD,
+    Constants.TOPIC_MODEL_NUM_TOPICS_FIELD,
+    Constants.TOPIC_MODEL_PASSES_FIELD,
+    Constants.TOPIC_MODEL_ITERATIONS_FIELD,
+    Constants.TOPIC_MODEL_TARGET_REVIEWS_FIELD,
+    Constants.TOPIC_WEIGHTING_METHOD_FIELD,
+    Constants.CONTEXT_EXTRACTOR_ALPHA_FIELD,
+    Constants.CONTEXT_EXTRACTOR_BETA_FIELD,
+    Constants.CONTEXT_EXTRACTOR_EPSILON_FIELD,
+    Constants.LDA_BETA_COMPARISON_OPERATOR_FIELD,
+    Constants.MIN_DICTIONARY_WORD_COUNT_FIELD,
+    Constants.MAX_DICTIONARY_WORD_COUNT_FIELD,
+    Constants.NMF_REGULARIZATION_FIELD,
+    Constants.NMF_REGULARIZATION_RATIO_FIELD,
+    Constants.NUMPY_RANDOM_SEED_FIELD,
+]
+CONTEXT_EXTRACTOR_STAGE = 'context_extractor'
+
+
+def save_pickle(file_path, value):
+    with open(file_path, 'wb') as write_file:
+        pickle.dump(value, write_file, pickle.HIGHEST_PROTOCOL)
+
+
+def load_pickle(file_path):
+    with open(file_path, 'rb') as read_file:
+        return pickle.load(read_file)
+
+
+def get_topic_model_file_path(cycle_index, fold_index):
+    return Constants.generate_file_name(
+        'topic_model', 'pkl', Constants.CACHE_FOLDER,
+        cycle_index, fold_index, True)
 
-    print('%s: Create topic model' % time.strftime("%Y/%m/%d-%H:%M:%S"))
 
-    topic_model_file_path = \
-        Constants.generate_file_name(
-            'topic_model', 'pkl', Constants.CACHE_FOLDER,
-            cycle_index, fold_index, True)
+def get_topic_model_name(cycle_index, fold_index):
+    return os.path.basename(
+        get_topic_model_file_path(cycle_index, fold_index))
 
-    print(topic_model_file_path)
 
-    if check_exists and os.path.exists(topic_model_file_path):
-        print('WARNING: Topic model already exists')
-        return load_topic_model(cycle_index, fold_index)
+def save_topic_model_file(topic_model, cycle_index, fold_index):
+    """
+    Saves the context extractor to the file where load_topic_model finds it
+    when it isn't in the artifact cache, for instance after it has been
+    evicted. The file is written to a temporary file first and then renamed,
+    so a reader never sees a partial file
+    """
+    file_path = get_topic_model_file_path(cycle_index, fold_index)
+    temporary_path = '%s.%d.tmp' % (file_path, os.getpid())
+    save_pickle(temporary_path, topic_model)
+    os.rename(temporary_path, file_path)
 
-    topic_model = train_context_extractor(records)
 
-    with open(topic_model_file_path, 'wb') as write_file:
-        pickle.dump(topic_model, write_file, pickle.HIGHEST_PROTOCOL)
+def create_topic_model(records, cycle_index, fold_index, check_exists=True):
+    """
+    Trains a context extractor with the given records, or loads it from the
+    artifact cache if one has already been trained with the same records and
+    the same CONTEXT_EXTRACTOR_PROPERTIES. The context extractor is also
+    saved to the file of its cycle and fold
+
+    :param check_exists: if False, the topic model is trained again even if
+    it is in the cache
+    """
+
+    print('%s: Create topic model' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+    cache = artifact_cache.get_artifact_cache()
+    name = get_topic_model_name(cycle_index, fold_index)
+    input_hashes = [artifact_cache.hash_records(records)]
+    trained_models = []
+
+    def train():
+        trained_models.append(train_context_extractor(records))
+        return trained_models[0]
+
+    if not check_exists:
+        topic_model = train()
+        key = artifact_cache.generate_key(
+            CONTEXT_EXTRACTOR_STAGE, input_hashes,
+            artifact_cache.get_properties(CONTEXT_EXTRACTOR_PROPERTIES))
+        cache.put(
+            key, 'pkl', lambda file_path: save_pickle(file_path, topic_model),
+            CONTEXT_EXTRACTOR_STAGE, name)
+    else:
+        topic_model = cache.get_or_create(
+            CONTEXT_EXTRACTOR_STAGE, input_hashes,
+            CONTEXT_EXTRACTOR_PROPERTIES, train, save_pickle, load_pickle,
+            'pkl', name)
+
+    if trained_models or not os.path.exists(
+            get_topic_model_file_path(cycle_index, fold_index)):
+        save_topic_model_file(topic_model, cycle_index, fold_index)
 
     return topic_model
 
@@ -48,9 +125,7 @@ def train_topic_model(records):
 
     if Constants.TOPIC_MODEL_TYPE == 'lda':
 
-        topic_model_file_path = \
-            Constants.generate_file_name(
-                'topic_model', 'pkl', Constants.CACHE_FOLDER, None, None, True)
+        topic_model_file_path = get_topic_model_file_path(None, None)
         if os.path.exists(topic_model_file_path):
             print('WARNING: Topic model already exists')
             return
@@ -115,14 +190,27 @@ def train_context_extractor(records, stable=True):
 
 
 def load_topic_model(cycle_index, fold_index):
-    file_path = \
-        Constants.generate_file_name(
-            'topic_model', 'pkl', Constants.CACHE_FOLDER,
-            cycle_index, fold_index, True)
+    """
+    Loads the context extractor that was most recently created for the given
+    cycle and fold, looking for it first in the artifact cache and then in the
+    file where create_topic_model also saves it
+    """
+    file_path = artifact_cache.get_artifact_cache().find(
+        CONTEXT_EXTRACTOR_STAGE, get_topic_model_name(cycle_index, fold_index))
+    if file_path is None:
+        file_path = get_topic_model_file_path(cycle_index, fold_index)
     print(file_path)
-    with open(file_path, 'rb') as read_file:
-        topic_model = pickle.load(read_file)
-    return topic_model
+    return load_pickle(file_path)
+
+
+def load_lda_topic_model():
+    """
+    Loads the LdaModel trained by train_topic_model. It is read from its file
+    and never from the artifact cache, which only contains context extractors
+    """
+    file_path = get_topic_model_file_path(None, None)
+    print(file_path)
+    return load_pickle(file_path)
 
 
 def create_single_topic_model(cycle_index, fold_index, check_exists=True):
@@ -135,7 +223,7 @@ def create_single_topic_model(cycle_index, fold_index, check_exists=True):
               'separate_topic_model_recsys_reviews property is set to True'
         raise ValueError(msg)
 
-    records = ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
+    records = ETLUtils.load_records_file(Constants.PROCESSED_RECORDS_FILE)
 
     if Constants.CROSS_VALIDATION_STRATEGY == 'nested_test':
         pass
@@ -245,7 +333,7 @@ def main():
             {Constants.TOPIC_MODEL_NUM_TOPICS_FIELD: num_topics})
 
     if fold is None and cycle is None:
-        records = ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
+        records = ETLUtils.load_records_file(Constants.PROCESSED_RECORDS_FILE)
 
         if Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
             num_records = len(records)
@@ -25,6 +25,11 @@ class WordBasedContext:
         self.all_nouns = None
         self.all_senses = None
         self.sense_groups = None
+        self.candidate_nouns = None
+        self.noun_matrix = None
+        self.noun_weighted_frequencies = None
+        self.specific_noun_weighted_frequencies = None
+        self.generic_noun_weighted_frequencies = None
 
     def init_reviews(self):
 
@@ -70,57 +75,70 @@ class WordBasedContext:
 
         context_utils.generate_stats(self.specific_reviews, self.generic_reviews)
 
-    def filter_nouns(self):
-        print('filter_nouns', time.strftime("%H:%M:%S"))
-        unwanted_nouns = set()
-        context_nouns = []
-
-        num_nouns = len(self.all_nouns)
-        print('num nouns %d' % len(self.all_nouns))
-        index = 0
-        for noun in list(self.all_nouns):
-            index += 1
-            # print('processes nouns: %d/%d\r' % (index, num_nouns)),
-            sys.stdout.write('\r' + str(index) + '/' + str(num_nouns))
-            sys.stdout.flush()  # important
-
-            weighted_frq =\
-                context_utils.calculate_word_weighted_frequency(
-                    noun, self.reviews)
-            specific_weighted_frq =\
-                context_utils.calculate_word_weighted_frequency(
-                    noun, self.specific_reviews)
-            generic_weighted_frq =\
-                context_utils.calculate_word_weighted_frequency(
-                    noun, self.generic_reviews)
-
-            # print('specific_weighted_frq', specific_weighted_frq)
-            # print('generic_weighted_frq', generic_weighted_frq)
-
-            if weighted_frq < self.alpha:
-                self.all_nouns.remove(noun)
-                unwanted_nouns.add(noun)
-                continue
+    def build_noun_matrix(self):
+        """
+        Builds the reviews x nouns matrix of the candidate nouns and the
+        weighted frequencies of every noun in all, the specific and the
+        generic reviews. They don't depend on alpha and beta, so the nouns can
+        be classified again with other thresholds without rebuilding them
+        """
+        print('build_noun_matrix', time.strftime("%H:%M:%S"))
+        self.candidate_nouns = list(self.all_nouns)
+        self.noun_matrix = context_utils.build_noun_matrix(
+            self.reviews, self.candidate_nouns)
+        self.noun_weighted_frequencies = \
+            context_utils.calculate_word_weighted_frequencies(
+                self.noun_matrix)
+        self.specific_noun_weighted_frequencies = \
+            context_utils.calculate_word_weighted_frequencies(
+                self.noun_matrix, context_utils.get_review_mask(
+                    self.reviews, self.specific_reviews))
+        self.generic_noun_weighted_frequencies = \
+            context_utils.calculate_word_weighted_frequencies(
+                self.noun_matrix, context_utils.get_review_mask(
+                    self.reviews, self.generic_reviews))
+
+    def classify_nouns(self):
+        """
+        Splits the candidate nouns into context nouns and unwanted nouns
+        according to the current alpha and beta. A noun is unwanted when its
+        weighted frequency is lower than alpha, when it doesn't appear in the
+        specific reviews or when the ratio between its specific and generic
+        weighted frequencies is lower than beta
+
+        :rtype: (list[str], set[str])
+        :return: a tuple with the list of context nouns and the set of
+        unwanted nouns
+        """
+        if self.noun_matrix is None:
+            self.build_noun_matrix()
+
+        specific_frequencies = self.specific_noun_weighted_frequencies
+        generic_frequencies = self.generic_noun_weighted_frequencies
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratios = specific_frequencies / generic_frequencies
+        is_unwanted = \
+            (self.noun_weighted_frequencies < self.alpha) | \
+            (specific_frequencies == 0) | \
+            ((generic_frequencies != 0) & (ratios < self.beta))
 
-            if specific_weighted_frq == 0:
-                self.all_nouns.remove(noun)
+        context_nouns = []
+        unwanted_nouns = set()
+        for noun, unwanted in zip(self.candidate_nouns, is_unwanted):
+            if unwanted:
                 unwanted_nouns.add(noun)
-                continue
-
-            if generic_weighted_frq == 0:
+            else:
                 context_nouns.append(noun)
-                continue
 
-            ratio = specific_weighted_frq / generic_weighted_frq
+        return context_nouns, unwanted_nouns
 
-            if ratio < self.beta:
-                self.all_nouns.remove(noun)
-                unwanted_nouns.add(noun)
-                continue
+    def filter_nouns(self):
+        print('filter_nouns', time.strftime("%H:%M:%S"))
+        print('num nouns %d' % len(self.all_nouns))
 
-            context_nouns.append(noun)
+        context_nouns, unwanted_nouns = self.classify_nouns()
+        self.all_nouns -= unwanted_nouns
 
-        print('')
         # print('context nouns', context_nouns)
         print('num context nouns', len(context_nouns))
 
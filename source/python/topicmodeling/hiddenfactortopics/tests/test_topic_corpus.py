@@ -0,0 +1,108 @@
+from unittest import TestCase
+
+import numpy
+
+from topicmodeling.hiddenfactortopics import topic_corpus_benchmark
+from topicmodeling.hiddenfactortopics.topic_corpus import TopicCorpus
+from topicmodeling.hiddenfactortopics.topic_corpus_benchmark import \
+    LoopTopicCorpus
+
+__author__ = 'fpena'
+
+
+class TestTopicCorpus(TestCase):
+
+    def setUp(self):
+        corpus = topic_corpus_benchmark.load_corpus(30, 20, 100, 300, 15)
+        self.loop_corpus = LoopTopicCorpus(corpus, 4, 0.1, 0.1)
+        self.topic_corpus = TopicCorpus(corpus, 4, 0.1, 0.1)
+
+        # Move the parameters away from their initial values, so that all
+        # the terms of the energy and the gradient are not trivial
+        random_state = numpy.random.RandomState(1)
+        for topic_corpus in [self.loop_corpus, self.topic_corpus]:
+            random_state.seed(1)
+            topic_corpus.kappa = 1.5
+            topic_corpus.alpha = 3.5
+            topic_corpus.beta_user = random_state.normal(
+                0, 0.5, topic_corpus.n_users)
+            topic_corpus.beta_item = random_state.normal(
+                0, 0.5, topic_corpus.n_items)
+            topic_corpus.gamma_user = random_state.normal(
+                0, 0.5, (topic_corpus.n_users, 4))
+            topic_corpus.gamma_item = random_state.normal(
+                0, 0.5, (topic_corpus.n_items, 4))
+            topic_corpus.topic_words = random_state.normal(
+                0, 0.5, (topic_corpus.n_words, 4))
+
+    def test_initialize(self):
+        numpy.testing.assert_array_equal(
+            self.loop_corpus.train_topics, self.topic_corpus.train_topics)
+        for vote in self.topic_corpus.train_votes:
+            self.assertEqual(
+                len(vote.word_list), len(self.topic_corpus.word_topics[vote]))
+        self.assertEqual(
+            len(self.topic_corpus.train_words),
+            self.topic_corpus.topic_counts.sum())
+        numpy.testing.assert_array_equal(
+            self.topic_corpus.item_words,
+            self.topic_corpus.item_topic_counts.sum(axis=1))
+
+    def test_normalization_constants(self):
+        numpy.testing.assert_allclose(
+            self.loop_corpus.word_z(), self.topic_corpus.word_z())
+        numpy.testing.assert_allclose(
+            self.loop_corpus.topic_z(), self.topic_corpus.topic_z())
+        self.assertAlmostEqual(
+            self.loop_corpus.topic_z(3), self.topic_corpus.topic_z(3))
+
+    def test_lsq(self):
+        for latent_reg in [0, 0.5]:
+            self.loop_corpus.latent_reg = latent_reg
+            self.topic_corpus.latent_reg = latent_reg
+            self.assertAlmostEqual(
+                self.loop_corpus.lsq(), self.topic_corpus.lsq(), 6)
+
+    def test_dl(self):
+        self.loop_corpus.latent_reg = 0.5
+        self.topic_corpus.latent_reg = 0.5
+        self.loop_corpus.dl()
+        self.topic_corpus.dl()
+
+        self.assertAlmostEqual(
+            self.loop_corpus.d_alpha, self.topic_corpus.d_alpha)
+        self.assertAlmostEqual(
+            self.loop_corpus.d_kappa, self.topic_corpus.d_kappa)
+        for gradient in ['d_beta_user', 'd_beta_item', 'd_gamma_user',
+                         'd_gamma_item', 'd_topic_words']:
+            numpy.testing.assert_allclose(
+                getattr(self.loop_corpus, gradient),
+                getattr(self.topic_corpus, gradient), atol=1e-10,
+                err_msg=gradient)
+
+    def test_update_topics(self):
+        numpy.random.seed(2)
+        self.loop_corpus.update_topics()
+        numpy.random.seed(2)
+        self.topic_corpus.update_topics()
+
+        numpy.testing.assert_array_equal(
+            self.loop_corpus.train_topics, self.topic_corpus.train_topics)
+        for counts in ['topic_counts', 'item_topic_counts',
+                       'word_topic_counts']:
+            numpy.testing.assert_array_equal(
+                getattr(self.loop_corpus, counts),
+                getattr(self.topic_corpus, counts), err_msg=counts)
+
+    def test_train(self):
+        numpy.random.seed(2)
+        self.loop_corpus.train(2, 3)
+        numpy.random.seed(2)
+        self.topic_corpus.train(2, 3)
+
+        for parameter in ['beta_user', 'beta_item', 'gamma_user',
+                          'gamma_item', 'topic_words', 'background_words']:
+            numpy.testing.assert_allclose(
+                getattr(self.loop_corpus, parameter),
+                getattr(self.topic_corpus, parameter), atol=1e-10,
+                err_msg=parameter)
@@ -1,5 +1,9 @@
+import itertools
 import math
 import sys
+
+from scipy import sparse
+
 from etl import ETLUtils
 from topicmodeling.hiddenfactortopics.corpus import Corpus
 # import sys; print('Python %s on %s' % (sys.version, sys.platform))
@@ -10,6 +14,12 @@ __author__ = 'fpena'
 
 import numpy as np
 
+
+# The number of word positions whose topics are sampled at once, it bounds the
+# size of the (word positions x topics) matrix of scores
+SAMPLING_CHUNK_SIZE = 100000
+
+
 class TopicCorpus:
 
     # TODO: Create a list with all the users and all the items as strings
@@ -60,6 +70,19 @@ class TopicCorpus:
         # Latent variables
         self.word_topics = {}
 
+        # The training votes packed in arrays, the words of all the votes are
+        # concatenated and the words of the i-th vote are the ones in the
+        # positions [word_offsets[i], word_offsets[i + 1]) as in a CSR matrix
+        self.train_users = None
+        self.train_items = None
+        self.train_ratings = None
+        self.word_offsets = None
+        self.train_words = None
+        self.word_items = None  # The item of the vote of each word position
+        self.train_topics = None  # The topic of each word position
+        self.user_vote_matrix = None  # Sparse (users x votes) indicator matrix
+        self.item_vote_matrix = None  # Sparse (items x votes) indicator matrix
+
         # Counters
         self.item_topic_counts = None  # How many times does each topic occur for each product?
         self.item_words = None  # Number of words in each "document"
@@ -120,6 +143,7 @@ class TopicCorpus:
                 self.votes_per_item[vote.item].append(vote)
 
         self.split_data()
+        self.pack_train_votes()
 
         # total number of parameters
         self.nw = 1 + 1 + (self.num_topics + 1) * \
@@ -145,8 +169,6 @@ class TopicCorpus:
             self.beta_user = np.zeros(self.n_users)
             self.beta_item = np.zeros(self.n_items)
 
-        self.word_topic_counts = np.zeros((self.n_words, self.num_topics))
-
         self.generate_random_topic_assignments()
         self.init_background_word_frequency()
         self.init_gamma_matrices()
@@ -180,7 +202,42 @@ class TopicCorpus:
             self.train_votes_per_user[user].append(vote)
             self.train_votes_per_item[item].append(vote)
 
+    def pack_train_votes(self):
+        """
+        Packs the users, items, ratings and word lists of the training votes
+        into arrays, so that the gradient, the energy and the topic sampling
+        can be computed for all the votes at once
+
+        """
+        num_votes = len(self.train_votes)
+        lengths = np.fromiter(
+            (len(vote.word_list) for vote in self.train_votes), int, num_votes)
+
+        self.train_users = np.fromiter(
+            (vote.user for vote in self.train_votes), int, num_votes)
+        self.train_items = np.fromiter(
+            (vote.item for vote in self.train_votes), int, num_votes)
+        self.train_ratings = np.fromiter(
+            (vote.rating for vote in self.train_votes), float, num_votes)
+        self.word_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.train_words = np.fromiter(
+            itertools.chain.from_iterable(
+                vote.word_list for vote in self.train_votes),
+            int, self.word_offsets[-1])
+        self.word_items = np.repeat(self.train_items, lengths)
+        self.train_topics = np.zeros(len(self.train_words), int)
+
+        ones = np.ones(num_votes)
+        vote_ids = np.arange(num_votes)
+        self.user_vote_matrix = sparse.csr_matrix(
+            (ones, (self.train_users, vote_ids)),
+            shape=(self.n_users, num_votes))
+        self.item_vote_matrix = sparse.csr_matrix(
+            (ones, (self.train_items, vote_ids)),
+            shape=(self.n_items, num_votes))
+
     def init_gamma_matrices(self):
+        self.topic_words = np.zeros((self.n_words, self.num_topics))
         if self.lambda_param == 0:
             for user in range(self.n_users):
                 if user not in self.n_training_per_user:
@@ -191,20 +248,13 @@ class TopicCorpus:
                 if item not in self.n_training_per_item:
                     continue
                 for k in range(self.num_topics):
-                    self.gamma_user[item][k] = np.random.rand()
-        else:
-            self.topic_words = np.zeros((self.n_words, self.num_topics))
+                    self.gamma_item[item][k] = np.random.rand()
 
     def init_background_word_frequency(self):
         # Initialize the background word frequency
-        self.total_words = 0
-        self.background_words = np.zeros(self.n_words)
-
-        for vote in self.train_votes:
-            for word in vote.word_list:
-                self.total_words += 1
-                self.background_words[word] += 1
-
+        self.total_words = len(self.train_words)
+        self.background_words = np.bincount(
+            self.train_words, minlength=self.n_words).astype(float)
         self.background_words /= self.total_words
 
         # for word in range(self.n_words):
@@ -214,33 +264,38 @@ class TopicCorpus:
         # print("background words = %d" % self.background_words)
 
     def generate_random_topic_assignments(self):
-        # Generate random topic assignments
-        self.topic_counts = np.zeros(self.num_topics)
-        self.item_topic_counts = np.zeros((self.n_items, self.num_topics))
-        self.item_words = np.zeros(self.n_items)
-
-        for vote in self.train_votes:
-            self.word_topics[vote] = np.zeros(self.n_words)
-            self.item_words[vote.item] += len(vote.word_list)
-
-            print_vote(vote)
-
-            # print("item_words[%d]\t = %d" % (vote.item, self.item_words[vote.item]))
-
-            for wp in range(len(vote.word_list)):
-                wi = vote.word_list[wp]
-                t = np.random.random() * self.num_topics
-
-                # print("wi = %d\tt = %d" % (wi, t))
-
-                self.word_topics[vote][wp] = t
-                self.item_topic_counts[vote.item][t] += 1
-                self.word_topic_counts[wi][t] += 1
-                self.topic_counts[t] += 1
+        # Generate random topic assignments, drawing the random numbers in the
+        # same order as if they were drawn word by word
+        self.item_words = np.bincount(
+            self.train_items, weights=np.diff(self.word_offsets),
+            minlength=self.n_items)
+        self.train_topics[:] = (
+            np.random.random(len(self.train_words)) * self.num_topics)
+
+        # The topics of every vote are views of the packed topics array
+        for index, vote in enumerate(self.train_votes):
+            self.word_topics[vote] = self.train_topics[
+                self.word_offsets[index]:self.word_offsets[index + 1]]
+
+        self.count_topics()
+
+    def count_topics(self):
+        """
+        Counts how many times each topic is assigned overall, to the words of
+        each item and to each word
 
-        for item in range(self.n_items):
-            for k in range(self.num_topics):
-                print("item_topic_counts[%d][%d]\t = %d" % (item, k, self.item_topic_counts[item][k]))
+        """
+        num_topics = self.num_topics
+        self.topic_counts = np.bincount(
+            self.train_topics, minlength=num_topics).astype(float)
+        self.item_topic_counts = np.bincount(
+            self.word_items * num_topics + self.train_topics,
+            minlength=self.n_items * num_topics).reshape(
+            self.n_items, num_topics).astype(float)
+        self.word_topic_counts = np.bincount(
+            self.train_words * num_topics + self.train_topics,
+            minlength=self.n_words * num_topics).reshape(
+            self.n_words, num_topics).astype(float)
 
     def _split_data_set(self):
         pass
@@ -281,90 +336,55 @@ class TopicCorpus:
 
         return res
 
-    # TODO: Finish this method
-    def dl(self):
+    def predict_train_votes(self):
         """
-        Derivative of the energy function
+        Predict the ratings of all the training votes given the current
+        parameter values
 
+        :rtype: numpy.ndarray
         """
+        return self.alpha + self.beta_user[self.train_users] + \
+            self.beta_item[self.train_items] + np.einsum(
+                'ij,ij->i', self.gamma_user[self.train_users],
+                self.gamma_item[self.train_items])
 
-        self.d_alpha = 0
-        self.d_kappa = 0
-        self.d_beta_user = np.zeros(self.n_users)
-        self.d_beta_item = np.zeros(self.n_items)
-        self.d_gamma_user = np.zeros((self.n_users, self.num_topics))
-        self.d_gamma_item = np.zeros((self.n_items, self.num_topics))
-        self.d_topic_words = np.zeros((self.n_words, self.num_topics))
-
-        for user in range(self.n_users):
-            for vote in self.train_votes_per_user[user]:
-                p = self.prediction(vote)
-                pred_error = 2 * (p - vote.rating)
-
-                self.d_alpha += pred_error
-                self.d_beta_user[user] += pred_error
-
-                for k in range(self.num_topics):
-                    self.d_gamma_user[user][k] -=\
-                        pred_error * self.gamma_item[vote.item][k]
+    def dl(self):
+        """
+        Derivative of the energy function
 
-        for item in range(self.n_items):
-            for vote in self.train_votes_per_item[item]:
-                p = self.prediction(vote)
-                pred_error = 2 * (p - vote.rating)
+        """
 
-                self.d_beta_item[item] += pred_error
+        pred_errors = 2 * (self.predict_train_votes() - self.train_ratings)
 
-                for k in range(self.num_topics):
-                    self.d_gamma_item[item][k] +=\
-                        pred_error * self.gamma_user[vote.user][k]
+        self.d_alpha = pred_errors.sum()
+        self.d_beta_user = self.user_vote_matrix.dot(pred_errors)
+        self.d_beta_item = self.item_vote_matrix.dot(pred_errors)
+        self.d_gamma_user = self.user_vote_matrix.dot(
+            pred_errors[:, None] * self.gamma_item[self.train_items])
+        self.d_gamma_item = self.item_vote_matrix.dot(
+            pred_errors[:, None] * self.gamma_user[self.train_users])
 
-        # dk = 0
-        for item in range(self.n_items):
-            tZ = self.topic_z(item)
-
-            for k in range(self.num_topics):
-                # print("lambda = %f" % self.lambda_param)
-                # print("item_topic_counts[%d][%d] = %d" % (item, k, self.item_topic_counts[item][k]))
-                # print('%f\t%d\t%d\t%f\t%f\t%f' %
-                #       (self.lambda_param, self.item_topic_counts[item][k],
-                #        self.item_words[item], self.kappa,
-                #        self.gamma_item[item][k], tZ))
-                q = - self.lambda_param * (self.item_topic_counts[item][k] - self.item_words[item] * math.exp(self.kappa * self.gamma_item[item][k]) / tZ)
-                print('q = %f' % q)
-                # print('kappa', self.kappa)
-                self.d_gamma_item[item][k] += self.kappa * q
-                self.d_kappa += self.gamma_item[item][k] * q
+        exp_gamma = np.exp(self.kappa * self.gamma_item)
+        t_z = exp_gamma.sum(axis=1)
+        q = -self.lambda_param * (
+            self.item_topic_counts -
+            self.item_words[:, None] * exp_gamma / t_z[:, None])
+        self.d_gamma_item += self.kappa * q
+        self.d_kappa = (self.gamma_item * q).sum()
 
         # Add the derivative of the regularizer
         if self.latent_reg > 0:
-            for user in range(self.n_users):
-                for k in range(self.num_topics):
-                    self.d_gamma_user[user][k] +=\
-                        self.latent_reg * 2 * self.d_gamma_user[user][k]
-            for item in range(self.n_items):
-                for k in range(self.num_topics):
-                    self.d_gamma_item[item][k] +=\
-                        self.latent_reg * 2 * self.d_gamma_item[item][k]
-
-        wZ = self.word_z()
+            self.d_gamma_user += self.latent_reg * 2 * self.gamma_user
+            self.d_gamma_item += self.latent_reg * 2 * self.gamma_item
 
-        for word in range(self.n_words):
-            for k in range(self.num_topics):
-                twC = self.word_topic_counts[word][k]
-                ex = math.exp(self.background_words[word] +
-                              self.topic_words[word][k])
-                self.d_topic_words[word][k] +=\
-                    -self.lambda_param *\
-                    (twC - self.topic_counts[k] * ex / wZ[k])
+        exp_words = np.exp(self.background_words[:, None] + self.topic_words)
+        w_z = exp_words.sum(axis=0)
+        self.d_topic_words = -self.lambda_param * (
+            self.word_topic_counts - self.topic_counts * exp_words / w_z)
 
         print("d_alpha = %f" % self.d_alpha)
         print("d_kappa = %f" % self.d_kappa)
 
-        for item in range(self.n_items):
-            for k in range(self.num_topics):
-                print("item_topic_counts[%d][%d]\t = %d" % (item, k, self.item_topic_counts[item][k]))
-
     def update_gradient(self):
 
         learning_rate = 0.00001
@@ -415,36 +435,20 @@ class TopicCorpus:
 
         :return:
         """
-        res = 0
-
-        for vote in self.train_votes:
-            res += (self.prediction(vote) - vote.rating) ** 2
+        res = ((self.predict_train_votes() - self.train_ratings) ** 2).sum()
 
-        for item in range(self.n_items):
-            tZ = self.topic_z(item)
-            lZ = math.log(tZ)
-
-            for k in range(self.num_topics):
-                res += -self.lambda_param * self.item_topic_counts[item][k] * \
-                       (self.kappa * self.gamma_item[item][k] - lZ)
+        l_z = np.log(self.topic_z())
+        res += (-self.lambda_param * self.item_topic_counts * (
+            self.kappa * self.gamma_item - l_z[:, None])).sum()
 
         # Add the regularizer to the energy
         if self.latent_reg > 0:
-            for user in range(self.n_users):
-                for k in range(self.num_topics):
-                    res += self.latent_reg * self.gamma_user[user][k] ** 2
-            for item in range(self.n_items):
-                for k in range(self.num_topics):
-                    res += self.latent_reg * self.gamma_item[item][k] ** 2
+            res += self.latent_reg * (self.gamma_user ** 2).sum()
+            res += self.latent_reg * (self.gamma_item ** 2).sum()
 
-        wZ = self.word_z()
-
-        # TODO: Pythonize this, remove the for and put it in one line
-        for k in range(self.num_topics):
-            lZ = math.log(wZ[k])
-            for word in range(self.n_words):
-                res += -self.lambda_param * self.word_topic_counts[word][k] * \
-                       (self.background_words[word] + self.topic_words[word][k] - lZ)
+        l_z = np.log(self.word_z())
+        res += (-self.lambda_param * self.word_topic_counts * (
+            self.background_words[:, None] + self.topic_words - l_z)).sum()
 
         return res
 
@@ -524,14 +528,9 @@ class TopicCorpus:
         "self.background_words")
 
         """
-        for w in range(self.n_words):
-            av = 0
-            for k in range(self.num_topics):
-                av += self.topic_words[w][k]
-            av /= self.num_topics
-            for k in range(self.num_topics):
-                self.topic_words[w][k] -= av
-            self.background_words[w] -= av
+        average = self.topic_words.mean(axis=1)
+        self.topic_words -= average[:, None]
+        self.background_words -= average
 
     def save(self, model_path, prediction_path):
         """
@@ -566,78 +565,49 @@ class TopicCorpus:
         Look at equation 9 in the paper
         """
 
-        res = np.zeros(self.num_topics)
-
-        for k in range(self.num_topics):
-            for w in range(self.n_words):
-                res[k] += math.exp(self.background_words[w] + self.topic_words[w][k])
-
-        return res
+        return np.exp(
+            self.background_words[:, None] + self.topic_words).sum(axis=0)
 
-    def topic_z(self, item):
+    def topic_z(self, item=None):
         """
         Compute normalization constant for a particular item
         Look at equation 4 in the paper
 
         :type item: int
-        :type res: float
+        :param item: the item. If None, the normalization constants of all
+        the items are returned in an array
+        :rtype: float | numpy.ndarray
         """
-        res = 0
-        # print('kappa', self.kappa)
-        for k in range(self.num_topics):
-            # print('gamma_item', self.gamma_item[item][k])
-            res += math.exp(self.kappa * self.gamma_item[item][k])
-
-        return res
-
-    # def gradient_descent(self):
-    #
-    # def train(self, em_iterations, grad_iterations):
+        gamma = self.gamma_item if item is None else self.gamma_item[item]
+        return np.exp(self.kappa * gamma).sum(axis=-1)
 
     def update_topics(self):
         """
-        Update topic assignments for each word, this is done by sampling
+        Update topic assignments for each word, this is done by sampling.
+        The scores of a word don't depend on the topics of the other words, so
+        the word positions are sampled in chunks, with the random numbers drawn
+        in the same order as if they were sampled one by one, and the counts
+        are rebuilt at the end
 
         """
-        for vote in self.train_votes:
-            item = vote.item
-            topics = self.word_topics[vote]
+        for start in range(0, len(self.train_words), SAMPLING_CHUNK_SIZE):
+            end = start + SAMPLING_CHUNK_SIZE
+            words = self.train_words[start:end]
 
-            for wp in range(len(vote.word_list)):
-                # For each word position
-                wi = vote.word_list[wp]
-                topic_scores = np.zeros(self.num_topics)
-                topic_total = 0
+            topic_scores = np.exp(
+                self.kappa * self.gamma_item[self.word_items[start:end]] +
+                self.background_words[words][:, None] +
+                self.topic_words[words])
+            cumulative_scores = topic_scores.cumsum(axis=1)
+            cumulative_scores /= cumulative_scores[:, -1:]
 
-                for k in range(self.num_topics):
-                    topic_scores[k] = math.exp(
-                        self.kappa * self.gamma_item[item][k] +
-                        self.background_words[wi] + self.topic_words[wi][k])
-                    topic_total += topic_scores[k]
+            x = np.random.random(len(words))
+            new_topics = (cumulative_scores <= x[:, None]).sum(axis=1)
+            # Guard against rounding errors in the last cumulative score
+            np.minimum(new_topics, self.num_topics - 1, out=new_topics)
+            self.train_topics[start:end] = new_topics
 
-                # TODO: Pythonize
-                for k in range(self.num_topics):
-                    topic_scores[k] /= topic_total
-
-                new_topic = 0
-                x = np.random.random()
-                while True:
-                    x -= topic_scores[new_topic]
-                    if x < 0:
-                        break
-                    new_topic += 1
-
-                if new_topic != topics[wp]:
-                    # Update topic counts if the topic for this word position
-                    # changed
-                    t = topics[wp]
-                    self.word_topic_counts[wi][t] -= 1
-                    self.word_topic_counts[wi][new_topic] += 1
-                    self.topic_counts[t] -= 1
-                    self.topic_counts[new_topic] += 1
-                    self.item_topic_counts[item][t] -= 1
-                    self.item_topic_counts[item][new_topic] += 1
-                    topics[wp] = new_topic
+        self.count_topics()
 
     def top_words(self):
         """
@@ -672,7 +642,8 @@ def print_vote(vote):
     # for word in vote.word_list:
     #     print(word)
 
-TopicCorpus.main()
+if __name__ == '__main__':
+    TopicCorpus.main()
 
 # np.random.seed(0)
 # random.seed(0)
@@ -0,0 +1,275 @@
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from topicmodeling.hiddenfactortopics.corpus import Corpus
+from topicmodeling.hiddenfactortopics.topic_corpus import TopicCorpus
+
+__author__ = 'fpena'
+
+
+class LoopTopicCorpus(TopicCorpus):
+    """
+    A TopicCorpus that computes the normalization constants, the energy, the
+    gradient and the topic sampling one vote, word and topic at a time, as in
+    the McAuley implementation. It is used as the reference for the vectorized
+    methods of TopicCorpus
+    """
+
+    def dl(self):
+        self.d_alpha = 0
+        self.d_kappa = 0
+        self.d_beta_user = np.zeros(self.n_users)
+        self.d_beta_item = np.zeros(self.n_items)
+        self.d_gamma_user = np.zeros((self.n_users, self.num_topics))
+        self.d_gamma_item = np.zeros((self.n_items, self.num_topics))
+        self.d_topic_words = np.zeros((self.n_words, self.num_topics))
+
+        for user in range(self.n_users):
+            for vote in self.train_votes_per_user[user]:
+                p = self.prediction(vote)
+                pred_error = 2 * (p - vote.rating)
+
+                self.d_alpha += pred_error
+                self.d_beta_user[user] += pred_error
+
+                for k in range(self.num_topics):
+                    self.d_gamma_user[user][k] +=\
+                        pred_error * self.gamma_item[vote.item][k]
+
+        for item in range(self.n_items):
+            for vote in self.train_votes_per_item[item]:
+                p = self.prediction(vote)
+                pred_error = 2 * (p - vote.rating)
+
+                self.d_beta_item[item] += pred_error
+
+                for k in range(self.num_topics):
+                    self.d_gamma_item[item][k] +=\
+                        pred_error * self.gamma_user[vote.user][k]
+
+        for item in range(self.n_items):
+            tZ = self.topic_z(item)
+
+            for k in range(self.num_topics):
+                q = -self.lambda_param * (
+                    self.item_topic_counts[item][k] - self.item_words[item] *
+                    math.exp(self.kappa * self.gamma_item[item][k]) / tZ)
+                self.d_gamma_item[item][k] += self.kappa * q
+                self.d_kappa += self.gamma_item[item][k] * q
+
+        if self.latent_reg > 0:
+            for user in range(self.n_users):
+                for k in range(self.num_topics):
+                    self.d_gamma_user[user][k] +=\
+                        self.latent_reg * 2 * self.gamma_user[user][k]
+            for item in range(self.n_items):
+                for k in range(self.num_topics):
+                    self.d_gamma_item[item][k] +=\
+                        self.latent_reg * 2 * self.gamma_item[item][k]
+
+        wZ = self.word_z()
+
+        for word in range(self.n_words):
+            for k in range(self.num_topics):
+                twC = self.word_topic_counts[word][k]
+                ex = math.exp(self.background_words[word] +
+                              self.topic_words[word][k])
+                self.d_topic_words[word][k] +=\
+                    -self.lambda_param *\
+                    (twC - self.topic_counts[k] * ex / wZ[k])
+
+    def lsq(self):
+        res = 0
+
+        for vote in self.train_votes:
+            res += (self.prediction(vote) - vote.rating) ** 2
+
+        for item in range(self.n_items):
+            tZ = self.topic_z(item)
+            lZ = math.log(tZ)
+
+            for k in range(self.num_topics):
+                res += -self.lambda_param * self.item_topic_counts[item][k] * \
+                       (self.kappa * self.gamma_item[item][k] - lZ)
+
+        if self.latent_reg > 0:
+            for user in range(self.n_users):
+                for k in range(self.num_topics):
+                    res += self.latent_reg * self.gamma_user[user][k] ** 2
+            for item in range(self.n_items):
+                for k in range(self.num_topics):
+                    res += self.latent_reg * self.gamma_item[item][k] ** 2
+
+        wZ = self.word_z()
+
+        for k in range(self.num_topics):
+            lZ = math.log(wZ[k])
+            for word in range(self.n_words):
+                res += -self.lambda_param * self.word_topic_counts[word][k] * \
+                       (self.background_words[word] +
+                        self.topic_words[word][k] - lZ)
+
+        return res
+
+    def word_z(self):
+        res = np.zeros(self.num_topics)
+
+        for k in range(self.num_topics):
+            for w in range(self.n_words):
+                res[k] += math.exp(
+                    self.background_words[w] + self.topic_words[w][k])
+
+        return res
+
+    def topic_z(self, item=None):
+        if item is None:
+            return np.array([self.topic_z(i) for i in range(self.n_items)])
+
+        res = 0
+        for k in range(self.num_topics):
+            res += math.exp(self.kappa * self.gamma_item[item][k])
+
+        return res
+
+    def update_topics(self):
+        for vote in self.train_votes:
+            item = vote.item
+            topics = self.word_topics[vote]
+
+            for wp in range(len(vote.word_list)):
+                wi = vote.word_list[wp]
+                topic_scores = np.zeros(self.num_topics)
+                topic_total = 0
+
+                for k in range(self.num_topics):
+                    topic_scores[k] = math.exp(
+                        self.kappa * self.gamma_item[item][k] +
+                        self.background_words[wi] + self.topic_words[wi][k])
+                    topic_total += topic_scores[k]
+
+                for k in range(self.num_topics):
+                    topic_scores[k] /= topic_total
+
+                new_topic = 0
+                x = np.random.random()
+                while True:
+                    x -= topic_scores[new_topic]
+                    if x < 0 or new_topic == self.num_topics - 1:
+                        break
+                    new_topic += 1
+
+                if new_topic != topics[wp]:
+                    t = topics[wp]
+                    self.word_topic_counts[wi][t] -= 1
+                    self.word_topic_counts[wi][new_topic] += 1
+                    self.topic_counts[t] -= 1
+                    self.topic_counts[new_topic] += 1
+                    self.item_topic_counts[item][t] -= 1
+                    self.item_topic_counts[item][new_topic] += 1
+                    topics[wp] = new_topic
+
+
+def write_votes_file(
+        file_name, num_users, num_items, num_words, num_votes,
+        words_per_vote, seed=0):
+    """
+    Writes a file with random votes in the same format as the McAuley data
+    sets: user, item, rating, date, number of words and the words
+
+    :param file_name: the path of the file
+    :param num_users: the number of users
+    :param num_items: the number of items
+    :param num_words: the size of the vocabulary
+    :param num_votes: the number of votes
+    :param words_per_vote: the number of words of every vote
+    :param seed: the seed of the random number generator
+    """
+    random_state = np.random.RandomState(seed)
+    # Zipf-like word frequencies, as in natural language
+    word_probabilities = 1.0 / np.arange(1, num_words + 1)
+    word_probabilities /= word_probabilities.sum()
+
+    with open(file_name, 'w') as votes_file:
+        for _ in range(num_votes):
+            words = random_state.choice(
+                num_words, words_per_vote, p=word_probabilities)
+            votes_file.write('U%d I%d %.1f 0 %d %s\n' % (
+                random_state.randint(num_users),
+                random_state.randint(num_items),
+                random_state.randint(1, 6), words_per_vote,
+                ' '.join('w%d' % word for word in words)))
+
+
+def load_corpus(num_users, num_items, num_words, num_votes, words_per_vote):
+    """
+    Builds a Corpus with random votes
+
+    :rtype: Corpus
+    """
+    file_descriptor, file_name = tempfile.mkstemp(suffix='.votes')
+    os.close(file_descriptor)
+    try:
+        write_votes_file(
+            file_name, num_users, num_items, num_words, num_votes,
+            words_per_vote)
+        corpus = Corpus()
+        corpus.load_data(file_name, 0)
+    finally:
+        os.remove(file_name)
+    return corpus
+
+
+def time_methods(topic_corpus):
+    """
+    Times the methods of the given topic corpus that compute the energy, the
+    gradient and the topic sampling
+
+    :type topic_corpus: TopicCorpus
+    :rtype: dict[str, float]
+    """
+    times = {}
+    for method in ['lsq', 'dl', 'update_topics']:
+        start = time.time()
+        getattr(topic_corpus, method)()
+        times[method] = time.time() - start
+    return times
+
+
+def benchmark(
+        num_users=500, num_items=300, num_words=2000, num_votes=5000,
+        words_per_vote=50, num_topics=10):
+    """
+    Compares the time it takes to compute the energy, the gradient and the
+    topic sampling with the vote by vote loops and with the packed arrays
+
+    :return: a dictionary with the times in seconds of both versions
+    """
+    corpus = load_corpus(
+        num_users, num_items, num_words, num_votes, words_per_vote)
+    # The training starts with the same parameters and topics in both cases
+    loop_corpus = LoopTopicCorpus(corpus, num_topics, 0.1, 0.1)
+    vectorized_corpus = TopicCorpus(corpus, num_topics, 0.1, 0.1)
+
+    loop_times = time_methods(loop_corpus)
+    vectorized_times = time_methods(vectorized_corpus)
+
+    for method in ['lsq', 'dl', 'update_topics']:
+        print('%s: loops %f seconds, vectorized %f seconds, speedup %.1fx' % (
+            method, loop_times[method], vectorized_times[method],
+            loop_times[method] / vectorized_times[method]))
+
+    return {'loop_times': loop_times, 'vectorized_times': vectorized_times}
+
+
+def main():
+    print('%s: start' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+    benchmark()
+    print('%s: end' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 import numpy
-
-from topicmodeling import hungarian
+from scipy import sparse
+from scipy.optimize import linear_sum_assignment
 
 
 class JaccardBinary:
@@ -19,6 +19,18 @@ class JaccardBinary:
             return 0.0
         return float(numer) / denom
 
+    def similarity_matrix(self, rankings1, rankings2):
+        """
+        Calculates the similarity between every ranking of two ranking sets at
+        once
+
+        :rtype: numpy.ndarray
+        :return: a (rankings1 x rankings2) matrix with the similarities
+        """
+        indicator_matrix1, indicator_matrix2 = \
+            build_indicator_matrices([rankings1, rankings2])
+        return binary_jaccard_matrix(indicator_matrix1, indicator_matrix2)
+
     def __str__(self):
         return "%s" % (self.__class__.__name__)
 
@@ -37,6 +49,18 @@ class AverageJaccard(JaccardBinary):
                                               test_ranking[0:i])
         return total / k
 
+    def similarity_matrix(self, rankings1, rankings2):
+        """
+        Calculates the similarity between every ranking of two ranking sets at
+        once
+
+        :rtype: numpy.ndarray
+        :return: a (rankings1 x rankings2) matrix with the similarities
+        """
+        encoded_rankings1, encoded_rankings2 = \
+            encode_term_rankings([rankings1, rankings2])
+        return average_jaccard_matrix(encoded_rankings1, encoded_rankings2)
+
 
 # --------------------------------------------------------------
 # Ranking Set Agreement
@@ -64,8 +88,12 @@ class RankingSetAgreement:
     def build_matrix(self, rankings1, rankings2):
         """
         Construct the similarity matrix between the pairs of rankings in two
-        different ranking sets.
+        different ranking sets. The metrics of this module calculate the whole
+        matrix at once
         """
+        if hasattr(self.metric, 'similarity_matrix'):
+            return self.metric.similarity_matrix(rankings1, rankings2)
+
         rows = len(rankings1)
         cols = len(rankings2)
         S = numpy.zeros((rows, cols))
@@ -79,17 +107,229 @@ class RankingSetAgreement:
         Solve the Hungarian matching problem to find the best matches between columns and rows based on
         values in the specified similarity matrix.
         """
-        # apply hungarian matching
-        h = hungarian.Hungarian()
-        C = h.make_cost_matrix(self.S)
-        h.calculate(C)
-        results = h.get_results()
-        # compute score based on similarities
-        score = 0.0
-        for (row, col) in results:
-            score += self.S[row, col]
-        score /= len(results)
-        return (score, results)
+        return match_rankings(self.S)
+
+
+def match_rankings(similarity_matrix):
+    """
+    Finds the one-to-one matching between the rankings of two ranking sets that
+    maximizes the total similarity, using the assignment solver of scipy
+    instead of the Hungarian algorithm in topicmodeling.hungarian
+
+    :type similarity_matrix: numpy.ndarray
+    :param similarity_matrix: a matrix with the similarity between every
+    ranking of the first set (rows) and every ranking of the second set
+    (columns)
+    :rtype: (float, list[(int, int)])
+    :return: a tuple with the mean similarity of the matched pairs and the list
+    of matched (row, column) pairs
+    """
+    rows, columns = linear_sum_assignment(-similarity_matrix)
+    score = similarity_matrix[rows, columns].sum() / len(rows)
+    return score, zip(rows, columns)
+
+
+def encode_term_rankings(all_term_rankings):
+    """
+    Encodes the terms of several ranking sets as integers, with the same code
+    for the same term in all the ranking sets
+
+    :type all_term_rankings: list[list[list[str]]]
+    :param all_term_rankings: a list of ranking sets, each one of them is a
+    list of rankings of terms
+    :rtype: list[numpy.ndarray]
+    :return: a (rankings x depth) integer array for each ranking set, where
+    depth is the length of its longest ranking. The positions after the end of
+    the shorter rankings are filled with -1
+    """
+    vocabulary = {}
+    all_encoded_rankings = []
+
+    for term_rankings in all_term_rankings:
+        depth = max([len(ranking) for ranking in term_rankings] + [0])
+        encoded_rankings = numpy.full((len(term_rankings), depth), -1, int)
+        for row, ranking in enumerate(term_rankings):
+            encoded_rankings[row, :len(ranking)] = [
+                vocabulary.setdefault(term, len(vocabulary))
+                for term in ranking]
+        all_encoded_rankings.append(encoded_rankings)
+
+    return all_encoded_rankings
+
+
+def build_indicator_matrices(all_term_rankings):
+    """
+    Encodes the terms of several ranking sets as integers and builds, for each
+    ranking set, a binary (rankings x terms) sparse matrix that indicates which
+    terms appear in each ranking. All the matrices share the same columns, so
+    the rankings of different sets can be compared with a matrix product
+
+    :type all_term_rankings: list[list[list[str]]]
+    :param all_term_rankings: a list of ranking sets, each one of them is a
+    list of rankings of terms
+    :rtype: list[scipy.sparse.csr_matrix]
+    """
+    all_encoded_rankings = encode_term_rankings(all_term_rankings)
+    num_terms = max(
+        [encoded_rankings.max() + 1 for encoded_rankings in
+         all_encoded_rankings if encoded_rankings.size] + [0])
+
+    indicator_matrices = []
+    for encoded_rankings in all_encoded_rankings:
+        rows, positions = numpy.nonzero(encoded_rankings >= 0)
+        matrix = sparse.csr_matrix(
+            (numpy.ones(len(rows)),
+             (rows, encoded_rankings[rows, positions])),
+            shape=(len(encoded_rankings), num_terms))
+        # A term that is repeated in a ranking only counts once, as in a set
+        matrix.data[:] = 1
+        indicator_matrices.append(matrix)
+
+    return indicator_matrices
+
+
+def find_first_occurrences(encoded_rankings):
+    """
+    Finds the positions of the rankings where a term appears for the first
+    time in its ranking, which are the positions that add a new term to the
+    set of terms of the prefixes of the ranking
+
+    :type encoded_rankings: numpy.ndarray
+    :param encoded_rankings: a (rankings x depth) array, as returned by
+    encode_term_rankings
+    :rtype: numpy.ndarray
+    :return: a (rankings x depth) boolean array
+    """
+    is_first = encoded_rankings >= 0
+    if encoded_rankings.shape[1] < 2:
+        return is_first
+
+    # With a stable sort, the first occurrence of every term goes first
+    order = numpy.argsort(encoded_rankings, axis=1, kind='mergesort')
+    sorted_rankings = numpy.take_along_axis(encoded_rankings, order, axis=1)
+    is_repeated = sorted_rankings[:, 1:] == sorted_rankings[:, :-1]
+    rows = numpy.repeat(
+        numpy.arange(len(encoded_rankings)), is_repeated.shape[1])
+    is_first[rows, order[:, 1:].ravel()] &= ~is_repeated.ravel()
+    return is_first
+
+
+def binary_jaccard_matrix(indicator_matrix1, indicator_matrix2):
+    """
+    Calculates the JaccardBinary similarity between every ranking of two
+    ranking sets at once
+
+    :type indicator_matrix1: scipy.sparse.csr_matrix
+    :param indicator_matrix1: the indicator matrix of the first ranking set, as
+    returned by build_indicator_matrices
+    :type indicator_matrix2: scipy.sparse.csr_matrix
+    :param indicator_matrix2: the indicator matrix of the second ranking set
+    :rtype: numpy.ndarray
+    :return: a (rankings1 x rankings2) matrix with the similarities
+    """
+    intersections = (indicator_matrix1 * indicator_matrix2.T).toarray()
+    unions = \
+        indicator_matrix1.getnnz(axis=1)[:, numpy.newaxis] + \
+        indicator_matrix2.getnnz(axis=1)[numpy.newaxis, :] - intersections
+
+    similarity_matrix = numpy.zeros(intersections.shape)
+    overlaps = intersections > 0
+    similarity_matrix[overlaps] = \
+        intersections[overlaps] / unions[overlaps].astype(float)
+    return similarity_matrix
+
+
+def average_jaccard_matrix(
+        encoded_rankings1, encoded_rankings2, max_block_size=10000000):
+    """
+    Calculates the AverageJaccard similarity between every ranking of two
+    ranking sets at once, with the same result as calling
+    AverageJaccard.similarity for every pair.
+
+    A term that appears in both rankings of a pair belongs to the intersection
+    of all the prefixes that are longer than the position of its first
+    occurrence in each ranking, so the intersections of the prefixes of all
+    the pairs are the cumulative sums of a histogram of those positions. The
+    sets are never built, and the cost only grows with the number of common
+    terms and with the number of pairs times the depth
+
+    :type encoded_rankings1: numpy.ndarray
+    :param encoded_rankings1: the first ranking set, as returned by
+    encode_term_rankings
+    :type encoded_rankings2: numpy.ndarray
+    :param encoded_rankings2: the second ranking set, encoded together with the
+    first one
+    :type max_block_size: int
+    :param max_block_size: the maximum number of (pair, depth) elements of the
+    arrays that are built at once. The rankings of the first set are processed
+    in blocks to respect it
+    :rtype: numpy.ndarray
+    :return: a (rankings1 x rankings2) matrix with the similarities
+    """
+    num_rankings1 = len(encoded_rankings1)
+    num_rankings2 = len(encoded_rankings2)
+    lengths1 = (encoded_rankings1 >= 0).sum(axis=1)
+    lengths2 = (encoded_rankings2 >= 0).sum(axis=1)
+    depth = min(encoded_rankings1.shape[1], encoded_rankings2.shape[1])
+    similarity_matrix = numpy.zeros((num_rankings1, num_rankings2))
+    if depth == 0:
+        return similarity_matrix
+
+    # The number of different terms in every prefix of every ranking
+    is_first1 = find_first_occurrences(encoded_rankings1)
+    is_first2 = find_first_occurrences(encoded_rankings2)
+    sizes1 = numpy.cumsum(is_first1, axis=1)[:, :depth]
+    sizes2 = numpy.cumsum(is_first2, axis=1)[:, :depth]
+
+    # The first occurrences of the terms in the second set, sorted by term
+    rows2, positions2 = numpy.nonzero(is_first2[:, :depth])
+    terms2 = encoded_rankings2[rows2, positions2]
+    order = numpy.argsort(terms2, kind='mergesort')
+    rows2, positions2, terms2 = rows2[order], positions2[order], terms2[order]
+
+    block_size = max(1, max_block_size // (num_rankings2 * depth))
+    for start in range(0, num_rankings1, block_size):
+        end = min(start + block_size, num_rankings1)
+        rows1, positions1 = numpy.nonzero(is_first1[start:end, :depth])
+        terms1 = encoded_rankings1[start + rows1, positions1]
+
+        # Every (first set occurrence, second set occurrence) pair of the same
+        # term
+        lower = numpy.searchsorted(terms2, terms1, 'left')
+        counts = numpy.searchsorted(terms2, terms1, 'right') - lower
+        occurrences1 = numpy.repeat(numpy.arange(len(terms1)), counts)
+        occurrences2 = numpy.arange(counts.sum()) - \
+            numpy.repeat(numpy.cumsum(counts) - counts, counts) + \
+            numpy.repeat(lower, counts)
+
+        # The first depth at which the term is in both prefixes
+        common_depths = numpy.maximum(
+            positions1[occurrences1], positions2[occurrences2])
+        pairs = rows1[occurrences1] * num_rankings2 + rows2[occurrences2]
+        intersections = numpy.cumsum(numpy.bincount(
+            pairs * depth + common_depths,
+            minlength=(end - start) * num_rankings2 * depth).reshape(
+            end - start, num_rankings2, depth), axis=2)
+        unions = \
+            sizes1[start:end, numpy.newaxis, :] + \
+            sizes2[numpy.newaxis, :, :] - intersections
+
+        # The similarities are added in the same order as in
+        # AverageJaccard.similarity
+        prefix_similarities = numpy.zeros(intersections.shape)
+        numpy.true_divide(
+            intersections, unions, out=prefix_similarities,
+            where=intersections > 0)
+        totals = numpy.cumsum(prefix_similarities, axis=2)
+
+        k = numpy.minimum(
+            lengths1[start:end, numpy.newaxis], lengths2[numpy.newaxis, :])
+        block_rows, block_columns = numpy.nonzero(k > 0)
+        block_k = k[block_rows, block_columns]
+        similarity_matrix[start + block_rows, block_columns] = \
+            totals[block_rows, block_columns, block_k - 1] / block_k
+
+    return similarity_matrix
 
 
 def main():
@@ -4,12 +4,13 @@ import random
 
 import numpy
 import time
+from scipy import sparse
 
 from etl import ETLUtils
 from topicmodeling.context import topic_model_creator
 from topicmodeling.external.topicensemble.unsupervised import rankings
 from topicmodeling.external.topicensemble.unsupervised import util
-from topicmodeling.hungarian import HungarianError
+from topicmodeling import jaccard_similarity
 from topicmodeling.jaccard_similarity import AverageJaccard, RankingSetAgreement
 from utils import utilities
 from utils.constants import Constants
@@ -30,7 +31,7 @@ def evaluate_topic_model(metric):
     utilities.plant_seeds()
     Constants.print_properties()
 
-    records = ETLUtils.load_json_file(Constants.PROCESSED_RECORDS_FILE)
+    records = ETLUtils.load_records_file(Constants.PROCESSED_RECORDS_FILE)
     if Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
         num_records = len(records)
         records = records[:num_records / 2]
@@ -60,22 +61,24 @@ def evaluate_topic_model(metric):
 
 
 def create_all_term_rankings(records, metric):
+    """
+    Trains TOPIC_MODEL_STABILITY_ITERATIONS topic models, the first one with
+    all the records and the other ones with samples of them (unless the metric
+    compares all the pairs of models), and returns their top terms.
+
+    The records are sampled in this process, and then the topic models are
+    trained by a pool of TOPIC_MODEL_STABILITY_NUM_WORKERS processes. The
+    random seeds are planted again before training each topic model, so the
+    results don't depend on the number of workers
+
+    :type records: list[dict]
+    :param records: the records used to train the topic models
+    :param metric: the metric that is going to be evaluated
+    :rtype: list[list[list[str]]]
+    :return: the top terms of the topics of every topic model
+    """
     print('%s: creating all term rankings' % time.strftime("%Y/%m/%d-%H:%M:%S"))
 
-    all_term_rankings = []
-
-    # context_extractor =\
-    #     topic_model_creator.create_topic_model(records, None, None)
-    # terms_matrix = get_topic_model_terms(
-    #     context_extractor, Constants.TOPIC_MODEL_STABILITY_NUM_TERMS)
-    # all_term_rankings.append(terms_matrix)
-
-    context_extractor = \
-        topic_model_creator.train_context_extractor(records, False)
-    terms_matrix = get_topic_model_terms(
-        context_extractor, Constants.TOPIC_MODEL_STABILITY_NUM_TERMS)
-    all_term_rankings.append(terms_matrix)
-
     sample_ratio = Constants.TOPIC_MODEL_STABILITY_SAMPLE_RATIO
 
     if metric in [TERM_STABILITY_PAIRWISE, TERM_DIFFERENCE]:
@@ -86,15 +89,63 @@ def create_all_term_rankings(records, metric):
               'topic_model_stability_sample_ratio value to None' % metric
         print(msg)
 
+    # The first topic model is always trained with all the records
     num_iterations = Constants.TOPIC_MODEL_STABILITY_ITERATIONS
-    for i in range(num_iterations - 1):
-        print('Iteration %d/%d' % (i+1, num_iterations))
-        print('sample_ratio:', sample_ratio)
-
+    iterations = [(0, None)]
+    for i in range(1, num_iterations):
         if sample_ratio is None:
+            iterations.append((i, None))
+        else:
+            iterations.append((i, numpy.array(
+                sample_list(range(len(records)), sample_ratio))))
+    print('sample_ratio:', sample_ratio)
+
+    # The records are handed to the worker processes once instead of being
+    # sent to them with every iteration
+    all_term_rankings = utilities.map_shards(
+        train_term_rankings, iterations,
+        Constants.TOPIC_MODEL_STABILITY_NUM_WORKERS,
+        shared_data={'records': records})
+
+    return all_term_rankings
+
+
+def get_iteration_seed(seed, iteration):
+    """
+    Returns the seed of the random number generators for one of the topic
+    models of the stability evaluation. It only depends on the seed in the
+    properties and on the iteration, so the topic model is the same no matter
+    which process trains it
+    """
+    return (0 if seed is None else seed) + iteration
+
+
+def train_term_rankings(iterations):
+    """
+    Trains the topic models of the given iterations of the stability
+    evaluation with the records shared by create_all_term_rankings
+
+    :type iterations: list[(int, numpy.ndarray)]
+    :param iterations: a list of (iteration, record indices) pairs, where the
+    record indices are the positions of the sampled records, or None when
+    all the records are used
+    :rtype: list[list[list[str]]]
+    :return: the top terms of the topics of every topic model
+    """
+    records = utilities.get_shared_data()['records']
+    all_term_rankings = []
+
+    for iteration, record_indices in iterations:
+        print('Iteration %d/%d' % (
+            iteration + 1, Constants.TOPIC_MODEL_STABILITY_ITERATIONS))
+        random.seed(get_iteration_seed(Constants.RANDOM_SEED, iteration))
+        numpy.random.seed(
+            get_iteration_seed(Constants.NUMPY_RANDOM_SEED, iteration))
+
+        if record_indices is None:
             sampled_records = records
         else:
-            sampled_records = sample_list(records, sample_ratio)
+            sampled_records = [records[index] for index in record_indices]
         context_extractor = \
             topic_model_creator.train_context_extractor(sampled_records, False)
         terms_matrix = get_topic_model_terms(
@@ -211,16 +262,10 @@ def eval_term_stability_reference(all_term_rankings):
     print("Performing reference comparisons with %s ..." % str(metric))
     all_scores = []
     for i in range(r):
-        try:
-            score = \
-                matcher.similarity(reference_term_ranking,
-                                   remaining_term_rankings[i])
-            all_scores.append(score)
-        except HungarianError:
-            msg = \
-                "HungarianError: Unable to find results. Algorithm has failed."
-            print(msg)
-            all_scores.append(float('nan'))
+        score = \
+            matcher.similarity(reference_term_ranking,
+                               remaining_term_rankings[i])
+        all_scores.append(score)
 
     # Get overall score across all candidates
     all_scores = numpy.array(all_scores)
@@ -286,23 +331,27 @@ def eval_term_stability_pairwise(all_term_rankings):
     :return: a dictionary with the term stability results
     """
     r = len(all_term_rankings)
-    metric = rankings.JaccardBinary()
-    matcher = rankings.RankingSetAgreement(metric)
 
-    # Perform pairwise comparisons evaluation for all models
+    # Perform pairwise comparisons evaluation for all models. The JaccardBinary
+    # similarities between the topics of a model and the topics of all the
+    # following models are calculated at once
     log.info(
         "Evaluating stability %d base term rankings with %s and top %d terms ..." % (
-            r, str(metric), Constants.TOPIC_MODEL_STABILITY_NUM_TERMS))
+            r, 'JaccardBinary', Constants.TOPIC_MODEL_STABILITY_NUM_TERMS))
+    indicator_matrices = \
+        jaccard_similarity.build_indicator_matrices(all_term_rankings)
+    offsets = numpy.cumsum(
+        [0] + [matrix.shape[0] for matrix in indicator_matrices])
     all_scores = []
-    for i in range(r):
+    for i in range(r - 1):
+        similarity_matrix = jaccard_similarity.binary_jaccard_matrix(
+            indicator_matrices[i], sparse.vstack(indicator_matrices[i + 1:]))
         for j in range(i + 1, r):
-            try:
-                score = matcher.similarity(all_term_rankings[i],
-                                           all_term_rankings[j])
-                all_scores.append(score)
-            except Exception as e:
-                log.warning("Error occurred comparing pair (%d,%d): %s" % (
-                    i, j, str(e)))
+            start = offsets[j] - offsets[i + 1]
+            end = offsets[j + 1] - offsets[i + 1]
+            score, _ = jaccard_similarity.match_rankings(
+                similarity_matrix[:, start:end])
+            all_scores.append(score)
     log.info("Compared %d pairs of term rankings" % len(all_scores))
 
     # Get overall score across all pairs
@@ -352,8 +401,9 @@ def main():
     full_cycle(metric)
 
 
-start = time.time()
-main()
-end = time.time()
-total_time = end - start
-print("Total time = %f seconds" % total_time)
+if __name__ == '__main__':
+    start = time.time()
+    main()
+    end = time.time()
+    total_time = end - start
+    print("Total time = %f seconds" % total_time)
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+
+from topicmodeling.latent_dirichlet_allocation import LatentDirichletAllocation
+from topicmodeling.sparse_latent_dirichlet_allocation import \
+    SparseLatentDirichletAllocation
+
+__author__ = 'fpena'
+
+
+def generate_corpus(
+        num_docs, num_words, num_topics, words_per_doc, alpha=0.1, seed=0):
+    """
+    Generates a document-word count matrix following the generative process of
+    LDA, in which every topic has its own block of the vocabulary
+
+    :param num_docs: the number of documents
+    :param num_words: the size of the vocabulary
+    :param num_topics: the number of planted topics
+    :param words_per_doc: the number of tokens of every document
+    :param alpha: the concentration of the topic distribution of the documents
+    :param seed: the seed of the random number generator
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    :return: a tuple with the (documents x words) count matrix and the
+    planted (topics x words) distributions
+    """
+    random_state = np.random.RandomState(seed)
+    block_size = num_words // num_topics
+    phi = np.full((num_topics, num_words), 0.01 / num_words)
+    for topic in range(num_topics):
+        phi[topic, topic * block_size:(topic + 1) * block_size] += \
+            random_state.dirichlet(np.ones(block_size))
+    phi /= phi.sum(axis=1)[:, np.newaxis]
+
+    theta = random_state.dirichlet(np.full(num_topics, alpha), num_docs)
+    matrix = np.zeros((num_docs, num_words))
+    for document in range(num_docs):
+        topics = random_state.choice(
+            num_topics, words_per_doc, p=theta[document])
+        for topic, count in enumerate(np.bincount(topics, minlength=num_topics)):
+            if count > 0:
+                matrix[document] += random_state.multinomial(count, phi[topic])
+    return matrix, phi
+
+
+def time_cycles(sampler, matrix, num_cycles):
+    """
+    :return: the number of tokens sampled per second
+    """
+    cycles = sampler.run(matrix, num_cycles)
+    # The first cycle includes the initialization
+    next(cycles)
+    start = time.time()
+    for _ in cycles:
+        pass
+    return matrix.sum() * (num_cycles - 1) / (time.time() - start)
+
+
+def benchmark(num_docs=500, num_words=2000, num_topics=20, words_per_doc=100):
+    """
+    Compares the throughput, in tokens per second, of the token by token
+    sampler in LatentDirichletAllocation and the sparse sampler
+
+    :return: a dictionary with the throughput of both samplers
+    """
+    matrix, _ = generate_corpus(num_docs, num_words, num_topics, words_per_doc)
+
+    dense_throughput = time_cycles(
+        LatentDirichletAllocation(num_topics), matrix, 2)
+    sparse_throughput = time_cycles(
+        SparseLatentDirichletAllocation(num_topics, seed=0), matrix, 6)
+
+    print('LatentDirichletAllocation: %.0f tokens/second' % dense_throughput)
+    print('SparseLatentDirichletAllocation: %.0f tokens/second' %
+          sparse_throughput)
+    print('speedup: %.1fx' % (sparse_throughput / dense_throughput))
+
+    return {
+        'dense_throughput': dense_throughput,
+        'sparse_throughput': sparse_throughput
+    }
+
+
+def main():
+    print('%s: start' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+    benchmark()
+    print('%s: end' % time.strftime("%Y/%m/%d-%H:%M:%S"))
+
+
+if __name__ == '__main__':
+    main()
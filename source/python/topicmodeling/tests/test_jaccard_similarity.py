@@ -0,0 +1,99 @@
+import random
+from unittest import TestCase
+
+import numpy
+
+from topicmodeling import hungarian
+from topicmodeling import jaccard_similarity
+from topicmodeling.jaccard_similarity import AverageJaccard
+from topicmodeling.jaccard_similarity import JaccardBinary
+from topicmodeling.jaccard_similarity import RankingSetAgreement
+
+__author__ = 'fpena'
+
+
+def generate_term_rankings(num_rankings, num_terms, vocabulary_size, seed):
+    random_generator = random.Random(seed)
+    vocabulary = ['term%d' % index for index in range(vocabulary_size)]
+    return [
+        random_generator.sample(vocabulary, num_terms)
+        for _ in range(num_rankings)
+    ]
+
+
+def build_matrix(metric, rankings1, rankings2):
+    return numpy.array([
+        [metric.similarity(ranking1, ranking2) for ranking2 in rankings2]
+        for ranking1 in rankings1])
+
+
+class TestJaccardSimilarity(TestCase):
+
+    def setUp(self):
+        self.all_term_rankings = [
+            generate_term_rankings(8, 10, 40, seed) for seed in range(5)]
+
+    def test_binary_jaccard_matrix(self):
+        all_term_rankings = self.all_term_rankings + [
+            [['a', 'b', 'a'], ['c'], ['term1', 'term2']]]
+        indicator_matrices = \
+            jaccard_similarity.build_indicator_matrices(all_term_rankings)
+        metric = JaccardBinary()
+
+        for rankings1, matrix1 in zip(all_term_rankings, indicator_matrices):
+            for rankings2, matrix2 in zip(
+                    all_term_rankings, indicator_matrices):
+                numpy.testing.assert_array_equal(
+                    build_matrix(metric, rankings1, rankings2),
+                    jaccard_similarity.binary_jaccard_matrix(matrix1, matrix2))
+
+    def test_average_jaccard_matrix(self):
+        # Rankings of different lengths, with repeated terms and with terms
+        # that are only in one of the ranking sets
+        all_term_rankings = self.all_term_rankings + [
+            [['a', 'b', 'a', 'term1'], ['c'], ['term1', 'term2', 'term1'],
+             ['term3', 'b', 'term4', 'term5', 'term1', 'term0']]]
+        all_encoded_rankings = \
+            jaccard_similarity.encode_term_rankings(all_term_rankings)
+        metric = AverageJaccard()
+
+        for rankings1, encoded1 in zip(
+                all_term_rankings, all_encoded_rankings):
+            for rankings2, encoded2 in zip(
+                    all_term_rankings, all_encoded_rankings):
+                expected_matrix = build_matrix(metric, rankings1, rankings2)
+                numpy.testing.assert_array_equal(
+                    expected_matrix,
+                    jaccard_similarity.average_jaccard_matrix(
+                        encoded1, encoded2))
+                # Processing the rankings in blocks gives the same result
+                numpy.testing.assert_array_equal(
+                    expected_matrix,
+                    jaccard_similarity.average_jaccard_matrix(
+                        encoded1, encoded2, max_block_size=1))
+
+        matcher = RankingSetAgreement(metric)
+        self.assertEqual(
+            1.0, matcher.similarity(
+                all_term_rankings[0], all_term_rankings[0][::-1]))
+
+    def test_match_rankings(self):
+        # The same score as the Hungarian algorithm
+        metric = JaccardBinary()
+        for rankings1 in self.all_term_rankings:
+            for rankings2 in self.all_term_rankings:
+                similarity_matrix = build_matrix(metric, rankings1, rankings2)
+                solver = hungarian.Hungarian()
+                solver.calculate(solver.make_cost_matrix(similarity_matrix))
+                expected_score = numpy.mean([
+                    similarity_matrix[row, column]
+                    for row, column in solver.get_results()])
+
+                score, results = \
+                    jaccard_similarity.match_rankings(similarity_matrix)
+                self.assertAlmostEqual(expected_score, score, places=12)
+                self.assertEqual(
+                    range(len(rankings1)), sorted(row for row, _ in results))
+                self.assertEqual(
+                    range(len(rankings2)),
+                    sorted(column for _, column in results))
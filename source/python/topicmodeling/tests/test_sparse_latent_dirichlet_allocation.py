@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from topicmodeling import sparse_latent_dirichlet_allocation
+from topicmodeling.latent_dirichlet_allocation import word_indices
+from topicmodeling.sparse_latent_dirichlet_allocation import \
+    SparseLatentDirichletAllocation
+from topicmodeling.sparse_latent_dirichlet_allocation_benchmark import \
+    generate_corpus
+
+__author__ = 'fpena'
+
+
+class TestSparseLatentDirichletAllocation(TestCase):
+
+    def test_matrix_to_tokens(self):
+        matrix = np.array([[0, 2, 1], [0, 0, 0], [3, 0, 1]])
+        words, document_offsets = \
+            sparse_latent_dirichlet_allocation.matrix_to_tokens(matrix)
+
+        np.testing.assert_array_equal([0, 3, 3, 7], document_offsets)
+        for document in range(len(matrix)):
+            self.assertEqual(
+                list(word_indices(matrix[document])),
+                words[document_offsets[document]:
+                      document_offsets[document + 1]].tolist())
+
+    def test_counts(self):
+        matrix, _ = generate_corpus(50, 40, 4, 30)
+        lda = SparseLatentDirichletAllocation(4, seed=0)
+        for _ in lda.run(matrix, 3):
+            pass
+
+        documents = np.repeat(
+            np.arange(lda.num_docs), np.diff(lda.document_offsets))
+        expected_counts = np.zeros((lda.num_docs, 4))
+        np.add.at(expected_counts, (documents, lda.topics), 1)
+        np.testing.assert_array_equal(
+            expected_counts, lda.documents_topics_count)
+        expected_counts = np.zeros((4, lda.num_words))
+        np.add.at(expected_counts, (lda.topics, lda.words), 1)
+        np.testing.assert_array_equal(expected_counts, lda.topics_words_count)
+        np.testing.assert_array_equal(
+            expected_counts.sum(axis=1), lda.topics_words_sum)
+
+        # The lists of topics of every word contain the topics with a
+        # non-zero count
+        for word in range(lda.num_words):
+            word_topics = lda.word_topics[word, :lda.word_num_topics[word]]
+            self.assertEqual(
+                np.nonzero(lda.words_topics_count[word])[0].tolist(),
+                sorted(word_topics))
+            np.testing.assert_array_equal(
+                np.arange(len(word_topics)),
+                lda.word_topic_positions[word, word_topics])
+
+    def test_planted_topics(self):
+        num_topics = 5
+        matrix, planted_phi = generate_corpus(200, 100, num_topics, 60)
+        lda = SparseLatentDirichletAllocation(num_topics, seed=0)
+
+        likelihoods = []
+        for _ in lda.run(matrix, 30):
+            likelihoods.append(lda.loglikelihood())
+        self.assertGreater(likelihoods[-1], likelihoods[0])
+
+        # Every planted topic must be matched with a recovered topic that
+        # assigns most of its probability to the same words
+        phi = lda.phi()
+        similarities = planted_phi.dot(phi.T) / np.outer(
+            np.linalg.norm(planted_phi, axis=1), np.linalg.norm(phi, axis=1))
+        rows, columns = linear_sum_assignment(-similarities)
+        self.assertGreater(similarities[rows, columns].min(), 0.9)
+        np.testing.assert_allclose(1, lda.theta().sum(axis=1))
+
+        # The same seed must give the same topics
+        other_lda = SparseLatentDirichletAllocation(num_topics, seed=0)
+        for _ in other_lda.run(matrix, 30):
+            pass
+        np.testing.assert_array_equal(lda.topics, other_lda.topics)
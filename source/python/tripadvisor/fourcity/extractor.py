@@ -3,6 +3,7 @@ import operator
 
 import numpy
 from pandas import DataFrame
+from pandas import factorize
 
 from etl import ETLUtils
 from tripadvisor.fourcity.user import User
@@ -78,7 +79,7 @@ def remove_users_with_low_reviews(reviews, min_reviews):
     :return: a copy of the original reviews list without the reviews made by
     users who have made less than min_reviews reviews
     """
-    users = get_user_list(reviews, min_reviews)
+    users = set(get_user_list(reviews, min_reviews))
     return ETLUtils.filter_records(reviews, Constants.USER_ID_FIELD, users)
 
 
@@ -91,8 +92,9 @@ def remove_items_with_low_reviews(reviews, min_reviews):
     :return: a copy of the original reviews list without the reviews of hotels
     that just have been reviewed once
     """
-    items = get_item_list(reviews, min_reviews)
-    all_items = get_groupby_list(reviews, Constants.ITEM_ID_FIELD)
+    all_items, counts = count_values(reviews, Constants.ITEM_ID_FIELD)
+    items = set(all_items[index] for index in numpy.flatnonzero(
+        counts >= min_reviews))
     num_discarded_items = len(all_items) - len(items)
     print('Discarded %d items due to low count' % num_discarded_items)
     return ETLUtils.filter_records(reviews, Constants.ITEM_ID_FIELD, items)
@@ -209,6 +211,23 @@ def create_ratings_matrix(reviews):
     return ratings_matrix, overall_ratings_list
 
 
+def count_values(reviews, column):
+    """
+    Counts how many times each distinct value of the given column appears in
+    the reviews
+
+    :param reviews: the list of reviews
+    :param column: the column whose values are counted
+    :return: a tuple with the sorted list of distinct values and a numpy array
+    with the number of reviews that have each one of them. The reviews where
+    the column is None are not counted
+    """
+    codes, values = factorize(
+        [review[column] for review in reviews], sort=True)
+    counts = numpy.bincount(codes[codes >= 0], minlength=len(values))
+    return values.tolist(), counts
+
+
 def get_user_list(reviews, min_reviews):
     """
     Returns the list of users that have reviewed at least min_reviews hotels
@@ -217,19 +236,8 @@ def get_user_list(reviews, min_reviews):
     :param min_reviews: the minimum number of reviews
     :return: a list of user IDs
     """
-    data_frame = DataFrame(reviews)
-    column = Constants.USER_ID_FIELD
-    counts = data_frame.groupby(column).size()
-    filtered_counts = counts[counts >= min_reviews]
-    # print(filtered_counts)
-    # num_users = len(filtered_counts)
-    # num_reviews = filtered_counts.sum()
-
-    # print('Number of users: %i' % num_users)
-    # print('Number of reviews: %i' % num_reviews)
-
-    users = filtered_counts.index.get_level_values(0).tolist()
-    return users
+    users, counts = count_values(reviews, Constants.USER_ID_FIELD)
+    return [users[index] for index in numpy.flatnonzero(counts >= min_reviews)]
 
 
 def get_groupby_list(reviews, column):
@@ -242,11 +250,8 @@ def get_groupby_list(reviews, column):
     :return: a list of all the distinct values of the given column in the
     reviews
     """
-    data_frame = DataFrame(reviews)
-    counts = data_frame.groupby(column).size()
-
-    users = counts.index.get_level_values(0).tolist()
-    return users
+    values, _ = count_values(reviews, column)
+    return values
 
 
 def get_item_list(reviews, min_reviews):
@@ -257,13 +262,8 @@ def get_item_list(reviews, min_reviews):
     :param min_reviews: the minimum number of reviews
     :return: a list of item IDs
     """
-    data_frame = DataFrame(reviews)
-    column = Constants.ITEM_ID_FIELD
-    counts = data_frame.groupby(column).size()
-    filtered_counts = counts[counts >= min_reviews]
-
-    items = filtered_counts.index.get_level_values(0).tolist()
-    return items
+    items, counts = count_values(reviews, Constants.ITEM_ID_FIELD)
+    return [items[index] for index in numpy.flatnonzero(counts >= min_reviews)]
 
 
 def get_user_average_overall_rating(reviews, user_id, apply_filter=True):
@@ -381,6 +381,136 @@ def get_significant_criteria(criteria_weights, ranges=None):
     return significant_criteria, cluster_name
 
 
+class UserReviewsIndex:
+    """
+    The reviews grouped by user and by (user, item) pair, built with a single
+    sort of the reviews. The users and the items are in the same order as
+    get_groupby_list returns them, and the (user, item) pairs of the i-th user
+    are the ones in the positions [pair_offsets[i], pair_offsets[i + 1])
+    """
+
+    def __init__(self, reviews, use_multi_ratings=False):
+        """
+        :param reviews: the list of reviews
+        :param use_multi_ratings: if True, the multi-criteria ratings of every
+        (user, item) pair are averaged too
+        """
+        user_codes, user_ids = factorize(
+            [review[Constants.USER_ID_FIELD] for review in reviews], sort=True)
+        item_codes, item_ids = factorize(
+            [review[Constants.ITEM_ID_FIELD] for review in reviews], sort=True)
+        overall_ratings = numpy.array(
+            [review['overall_rating'] for review in reviews], dtype=float)
+
+        self.user_ids = user_ids.tolist()
+        self.item_ids = item_ids.tolist()
+        self.review_users = user_codes
+        self.overall_ratings = overall_ratings
+        self.multi_ratings = None
+        if use_multi_ratings:
+            self.multi_ratings = numpy.array(
+                [review['multi_ratings'] for review in reviews], dtype=float)
+
+        num_users = len(self.user_ids)
+        self.review_counts = numpy.bincount(user_codes, minlength=num_users)
+        self.average_overall_ratings = numpy.bincount(
+            user_codes, overall_ratings, num_users) / self.review_counts
+
+        # The (user, item) pairs, sorted by user and then by item
+        pair_keys = user_codes.astype(numpy.int64) * len(item_ids) + item_codes
+        unique_keys, review_pairs, pair_counts = numpy.unique(
+            pair_keys, return_inverse=True, return_counts=True)
+        self.pair_users = unique_keys // len(item_ids)
+        self.pair_items = unique_keys % len(item_ids)
+        self.pair_offsets = numpy.searchsorted(
+            self.pair_users, numpy.arange(num_users + 1))
+        self.pair_ratings = numpy.bincount(
+            review_pairs, overall_ratings, len(unique_keys)) / pair_counts
+        self.pair_multi_ratings = None
+        if use_multi_ratings:
+            self.pair_multi_ratings = numpy.zeros(
+                (len(unique_keys), self.multi_ratings.shape[1]))
+            numpy.add.at(
+                self.pair_multi_ratings, review_pairs, self.multi_ratings)
+            self.pair_multi_ratings /= pair_counts[:, numpy.newaxis]
+
+    def get_items(self, user_index):
+        """
+        :return: the sorted list of the items the user has rated
+        """
+        pairs = slice(
+            self.pair_offsets[user_index], self.pair_offsets[user_index + 1])
+        return [self.item_ids[item] for item in self.pair_items[pairs]]
+
+    def get_item_ratings(self, user_index):
+        """
+        :return: a dictionary with the average overall rating the user has
+        given to each item, the same as get_user_item_ratings returns
+        """
+        pairs = slice(
+            self.pair_offsets[user_index], self.pair_offsets[user_index + 1])
+        return dict(zip(
+            self.get_items(user_index), self.pair_ratings[pairs].tolist()))
+
+    def get_item_multi_ratings(self, user_index):
+        """
+        :return: a dictionary with the average multi-criteria ratings the user
+        has given to each item
+        """
+        pairs = slice(
+            self.pair_offsets[user_index], self.pair_offsets[user_index + 1])
+        return dict(zip(
+            self.get_items(user_index),
+            self.pair_multi_ratings[pairs].tolist()))
+
+    def calculate_criteria_weights(self):
+        """
+        Fits the criteria ratings of every user as a linear function of the
+        overall rating, the same way as get_criteria_weights, using the reviews
+        without missing criteria ratings. The least squares problems of all
+        the users are solved at once through their normal equations
+
+        :return: a (users x criteria) array with the slopes of the fits
+        """
+        complete = (self.multi_ratings != -1).all(axis=1)
+        users = self.review_users[complete]
+        overall = self.overall_ratings[complete]
+        criteria = self.multi_ratings[complete]
+        num_users = len(self.user_ids)
+
+        # X^T X and X^T y for the design matrix X = [overall, 1] of every user
+        gram = numpy.zeros((num_users, 2, 2))
+        gram[:, 0, 0] = numpy.bincount(users, overall ** 2, num_users)
+        gram[:, 0, 1] = gram[:, 1, 0] = \
+            numpy.bincount(users, overall, num_users)
+        gram[:, 1, 1] = numpy.bincount(users, minlength=num_users)
+        moments = numpy.zeros((num_users, 2, criteria.shape[1]))
+        numpy.add.at(moments[:, 0], users, criteria * overall[:, None])
+        numpy.add.at(moments[:, 1], users, criteria)
+
+        # The pseudo-inverse gives the same minimum norm solution as lstsq
+        # when the overall ratings of a user are all equal
+        coefficients = numpy.einsum(
+            'uij,ujk->uik', numpy.linalg.pinv(gram), moments)
+        return coefficients[:, 0]
+
+
+def build_user(user_index, reviews_index):
+    """
+    Builds the user with the given index with its average overall rating and
+    the ratings it has given to each item
+
+    :type reviews_index: UserReviewsIndex
+    :rtype: User
+    """
+    user = User(reviews_index.user_ids[user_index])
+    user.average_overall_rating = \
+        float(reviews_index.average_overall_ratings[user_index])
+    user.item_ratings = reviews_index.get_item_ratings(user_index)
+    user.item_set = frozenset(user.item_ratings)
+    return user
+
+
 def initialize_users(reviews, is_multi_criteria):
     """
     Builds a dictionary containing all the users in the reviews. Each user
@@ -391,21 +521,16 @@ def initialize_users(reviews, is_multi_criteria):
     :return: a dictionary with the users initialized, the keys of the
     dictionaries are the users' ID
     """
-    user_ids = get_groupby_list(reviews, Constants.USER_ID_FIELD)
+    reviews_index = UserReviewsIndex(reviews, is_multi_criteria)
     user_dictionary = {}
 
-    for user_id in user_ids:
-        user = User(user_id)
-        user_reviews = \
-            ETLUtils.filter_records(reviews, Constants.USER_ID_FIELD, [user_id])
-        user.average_overall_rating = get_user_average_overall_rating(
-            user_reviews, user_id, apply_filter=False)
-        user.item_ratings = get_user_item_ratings(user_reviews, user_id)
+    for user_index, user_id in enumerate(reviews_index.user_ids):
+        user = build_user(user_index, reviews_index)
         user_dictionary[user_id] = user
 
         if is_multi_criteria:
             user.item_multi_ratings =\
-                get_user_item_multi_ratings(user_reviews, user_id)
+                reviews_index.get_item_multi_ratings(user_index)
 
     return user_dictionary
 
@@ -420,22 +545,17 @@ def initialize_cluster_users(reviews, significant_criteria_ranges=None):
     :return: a dictionary with the users initialized, the keys of the
     dictionaries are the users' ID
     """
-    user_ids = get_groupby_list(reviews, Constants.USER_ID_FIELD)
+    reviews_index = UserReviewsIndex(reviews, True)
+    criteria_weights = reviews_index.calculate_criteria_weights()
     user_dictionary = {}
 
-    for user_id in user_ids:
-        user = User(user_id)
-        user_reviews = \
-            ETLUtils.filter_records(reviews, Constants.USER_ID_FIELD, [user_id])
-        user.average_overall_rating = get_user_average_overall_rating(
-            user_reviews, user_id, apply_filter=False)
-        user.criteria_weights = get_criteria_weights(
-            user_reviews, user_id, apply_filter=False)
+    for user_index, user_id in enumerate(reviews_index.user_ids):
+        user = build_user(user_index, reviews_index)
+        user.criteria_weights = criteria_weights[user_index]
         _, user.cluster = get_significant_criteria(
             user.criteria_weights, significant_criteria_ranges)
-        user.item_ratings = get_user_item_ratings(user_reviews, user_id)
         user.item_multi_ratings = \
-            get_user_item_multi_ratings(user_reviews, user_id)
+            reviews_index.get_item_multi_ratings(user_index)
         user_dictionary[user_id] = user
 
     # print('Total users: %i' % len(user_ids))
@@ -554,12 +674,17 @@ def get_common_items(user_dictionary, user1, user2):
     :param user2: the id of the second user
     """
 
-    items_user1 = set(user_dictionary[user1].item_ratings.keys())
-    items_user2 = set(user_dictionary[user2].item_ratings.keys())
+    items_user1 = user_dictionary[user1].item_set
+    items_user2 = user_dictionary[user2].item_set
 
-    common_items = items_user1.intersection(items_user2)
+    # The users that were not built by initialize_users don't have the set of
+    # items precomputed
+    if items_user1 is None:
+        items_user1 = frozenset(user_dictionary[user1].item_ratings)
+    if items_user2 is None:
+        items_user2 = frozenset(user_dictionary[user2].item_ratings)
 
-    return common_items
+    return items_user1.intersection(items_user2)
 
 
 def get_user_ratings(user_dictionary, user, items):
@@ -1,6 +1,7 @@
 import time
 
 from etl import ETLUtils
+from evaluation import precision_in_top_n
 from evaluation.mean_absolute_error import MeanAbsoluteError
 from evaluation.root_mean_square_error import RootMeanSquareError
 from recommenders.similarity.single_similarity_matrix_builder import \
@@ -23,25 +24,21 @@ def predict_rating_list(predictor, reviews):
     :return: a tuple with a list of the predicted ratings and the list of
     errors for those predictions
     """
-    predicted_ratings = []
     errors = []
     num_unknown_ratings = 0.
 
-    for review in reviews:
+    user_ids = [review['user_id'] for review in reviews]
+    item_ids = [review['offering_id'] for review in reviews]
+    contexts = None
+    if predictor.has_context:
+        contexts = [review['text'] for review in reviews]
+    predicted_ratings = precision_in_top_n.predict_ratings(
+        predictor, user_ids, item_ids, contexts)
 
-        user_id = review['user_id']
-        item_id = review['offering_id']
+    for review, predicted_rating in zip(reviews, predicted_ratings):
 
-        if not predictor.has_context:
-            predicted_rating = predictor.predict_rating(user_id, item_id)
-        else:
-            text_review = review['text']
-            predicted_rating =\
-                predictor.predict_rating(user_id, item_id, text_review)
         actual_rating = review['overall_rating']
 
-        # print(user_id, item_id, predicted_rating)
-
         error = None
 
         # print('actual rating', actual_rating, 'Predicted rating', predicted_rating)
@@ -51,7 +48,6 @@ def predict_rating_list(predictor, reviews):
         else:
             num_unknown_ratings += 1
 
-        predicted_ratings.append(predicted_rating)
         errors.append(error)
 
     return predicted_ratings, errors, num_unknown_ratings
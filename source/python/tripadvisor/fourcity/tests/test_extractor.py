@@ -1,5 +1,9 @@
 from unittest import TestCase
+
+import numpy
+
 from tripadvisor.fourcity import extractor
+from utils.constants import Constants
 
 __author__ = 'fpena'
 
@@ -63,6 +67,15 @@ user_item_multi_ratings = {
 
 class TestExtractor(TestCase):
 
+    def setUp(self):
+        # The same reviews with the item ID in the field the extractor uses
+        self.reviews = [
+            dict(review, **{Constants.ITEM_ID_FIELD: review['offering_id']})
+            for review in reviews_matrix_5_1]
+        self.reviews_non_empty = [
+            dict(review, **{Constants.ITEM_ID_FIELD: review['offering_id']})
+            for review in reviews_matrix_non_emtpy]
+
     def test_get_user_multi_item_ratings(self):
 
         actual_value = extractor.get_user_item_multi_ratings(
@@ -80,3 +93,77 @@ class TestExtractor(TestCase):
             reviews_matrix_emtpy[4:])
         self.assertEqual([], actual_value)
 
+    def test_initialize_users(self):
+
+        user_dictionary = extractor.initialize_users(self.reviews, True)
+
+        self.assertEqual(
+            ['U1', 'U2', 'U3', 'U4', 'U5'], sorted(user_dictionary.keys()))
+        for user_id, user in user_dictionary.items():
+            self.assertEqual(user_id, user.user_id)
+            self.assertAlmostEqual(
+                extractor.get_user_average_overall_rating(
+                    self.reviews, user_id),
+                user.average_overall_rating)
+            self.assertEqual(
+                extractor.get_user_item_ratings(
+                    self.reviews, user_id, True),
+                user.item_ratings)
+            self.assertEqual(
+                extractor.get_user_item_multi_ratings(
+                    self.reviews, user_id, True),
+                user.item_multi_ratings)
+
+    def test_initialize_cluster_users(self):
+
+        ranges = [(-float('inf'), -0.1), (0.1, float('inf'))]
+        user_dictionary = extractor.initialize_cluster_users(
+            self.reviews, ranges)
+
+        for user_id, user in user_dictionary.items():
+            criteria_weights = extractor.get_criteria_weights(
+                self.reviews, user_id)
+            _, cluster = extractor.get_significant_criteria(
+                criteria_weights, ranges)
+            numpy.testing.assert_allclose(
+                criteria_weights, user.criteria_weights, atol=1e-10)
+            self.assertEqual(cluster, user.cluster)
+
+    def test_get_common_items(self):
+
+        user_dictionary = extractor.initialize_users(self.reviews, False)
+
+        self.assertEqual(
+            {1, 2, 3, 4},
+            extractor.get_common_items(user_dictionary, 'U1', 'U2'))
+        self.assertEqual(
+            {1, 2, 3, 4, 5},
+            extractor.get_common_items(user_dictionary, 'U2', 'U3'))
+
+        # Users that were built without the precomputed item set
+        user_dictionary['U1'].item_set = None
+        self.assertEqual(
+            {1, 2, 3, 4},
+            extractor.get_common_items(user_dictionary, 'U1', 'U2'))
+
+    def test_get_user_list(self):
+
+        self.assertEqual(
+            ['U1', 'U2'], extractor.get_user_list(self.reviews_non_empty, 1))
+        self.assertEqual(
+            ['U1'], extractor.get_user_list(self.reviews_non_empty, 2))
+
+    def test_get_groupby_list(self):
+
+        self.assertEqual(
+            [1, 2, 3, 4, 5],
+            extractor.get_groupby_list(self.reviews, Constants.ITEM_ID_FIELD))
+
+    def test_remove_items_with_low_reviews(self):
+
+        actual_value = extractor.remove_items_with_low_reviews(
+            self.reviews, 5)
+        self.assertEqual(
+            [review for review in self.reviews
+             if review[Constants.ITEM_ID_FIELD] != 5],
+            actual_value)
@@ -9,6 +9,7 @@ class User:
         self.criteria_weights = None
         self.cluster = None
         self.item_ratings = None
+        self.item_set = None
         self.item_multi_ratings = None
         self.item_reviews = None
         self.item_contexts = None
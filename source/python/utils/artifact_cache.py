@@ -0,0 +1,360 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy
+
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_LOCK_FILE = 'manifest.lock'
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def encode_value(value):
+    """
+    Returns a JSON serializable representation of a value that json can't
+    serialize. numpy arrays and scalars are represented by a hash of their
+    data, their type and their shape, since their repr is truncated
+
+    :rtype: str | list
+    """
+    if isinstance(value, (numpy.ndarray, numpy.generic)):
+        array = numpy.ascontiguousarray(value)
+        return [
+            'numpy', array.dtype.str, list(array.shape),
+            hashlib.sha1(array.tobytes()).hexdigest()]
+    return repr(value)
+
+
+def hash_records(records):
+    """
+    Computes a hash of the content of a list of records, the records are
+    serialized one at a time with their keys sorted, so the hash doesn't depend
+    on the order of the keys of the dictionaries
+
+    :type records: list[dict]
+    :rtype: str
+    """
+    records_hash = hashlib.sha1()
+    for record in records:
+        records_hash.update(json.dumps(
+            record, sort_keys=True, default=encode_value).encode('utf-8'))
+        records_hash.update(b'\n')
+    return records_hash.hexdigest()
+
+
+def hash_file(file_path):
+    """
+    Computes a hash of the content of a file, reading it in blocks
+
+    :type file_path: str
+    :rtype: str
+    """
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as read_file:
+        for block in iter(lambda: read_file.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_properties(property_names):
+    """
+    Returns the current value of the given properties
+
+    :type property_names: list[str]
+    :param property_names: the names of the properties, as they appear in the
+    properties.yaml file
+    :rtype: dict
+    """
+    properties = Constants.get_properties_copy()
+    return {name: properties.get(name) for name in property_names}
+
+
+def generate_key(stage, input_hashes, properties):
+    """
+    Generates the key of an artifact from the name of the stage that produces
+    it, the hashes of its inputs and the values of the properties the stage
+    reads. Changing any other property doesn't change the key
+
+    :type stage: str
+    :type input_hashes: list[str]
+    :type properties: dict
+    :rtype: str
+    """
+    description = json.dumps(
+        [stage, list(input_hashes), properties], sort_keys=True,
+        default=encode_value)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+class ArtifactCache(object):
+    """
+    A cache of files whose names are the keys generated with generate_key, so
+    an artifact is only reused when it was produced from the same inputs and
+    the same parameters.
+
+    Artifacts are written to a temporary file and moved to their final name
+    once they are complete, so a crash or a concurrent reader never sees a
+    partial file. The manifest keeps the stage, the size and the last access
+    time of every artifact, and when the cache grows over max_size bytes the
+    least recently used artifacts are removed. The manifest is updated while
+    holding an exclusive lock on a lock file, so several processes can share
+    the cache without losing each other's entries
+    """
+
+    def __init__(self, folder, max_size=None):
+        """
+        :type folder: str
+        :param folder: the folder where the artifacts and the manifest are
+        stored
+        :type max_size: int
+        :param max_size: the maximum total size of the artifacts in bytes. If
+        None, the artifacts are never evicted
+        """
+        self.folder = folder
+        self.max_size = max_size
+        self.manifest_file = os.path.join(folder, MANIFEST_FILE)
+        self.lock_file = os.path.join(folder, MANIFEST_LOCK_FILE)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # Another process might have created it in the meantime
+                if not os.path.isdir(folder):
+                    raise
+
+    def get_path(self, key, extension):
+        return os.path.join(self.folder, key + '.' + extension)
+
+    @contextlib.contextmanager
+    def lock_manifest(self):
+        """
+        Holds an exclusive lock on the manifest, between reading it and saving
+        it again, so the updates of other processes are not lost
+        """
+        with open(self.lock_file, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_manifest(self):
+        """
+        :rtype: dict[str, dict]
+        :return: a dictionary with the information of every artifact, indexed
+        by key
+        """
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, 'r') as read_file:
+            return json.load(read_file)
+
+    def save_manifest(self, manifest):
+
+        def write_manifest(file_path):
+            with open(file_path, 'w') as write_file:
+                json.dump(manifest, write_file, sort_keys=True, indent=1)
+
+        self.atomic_write(self.manifest_file, write_manifest)
+
+    def atomic_write(self, file_path, write_function):
+        """
+        Calls write_function with the path of a temporary file in the cache
+        folder and renames it to file_path once it has been written
+
+        :param write_function: a function that receives a file path and writes
+        the content to it
+        """
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            suffix='.tmp', dir=self.folder)
+        os.close(file_descriptor)
+        try:
+            write_function(temporary_path)
+            os.rename(temporary_path, file_path)
+        except:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def register(self, key, extension, stage, name):
+        """
+        Adds an artifact to the manifest, or updates its last access time if it
+        was already there. The same artifact can be registered with several
+        names, for instance when two folds are trained with the same records,
+        and find looks for it by any of them. The stage of an artifact that was
+        already there is kept when it is None
+        """
+        file_path = self.get_path(key, extension)
+        with self.lock_manifest():
+            manifest = self.load_manifest()
+            entry = manifest.get(key, {})
+            names = entry.get('names', [])
+            if name is not None and name not in names:
+                names.append(name)
+            entry.update({
+                'file': os.path.basename(file_path),
+                'stage': stage if stage is not None else entry.get('stage'),
+                'names': names,
+                'size': os.path.getsize(file_path),
+                'last_access': time.time()
+            })
+            manifest[key] = entry
+            self.evict(manifest, key)
+            self.save_manifest(manifest)
+
+    def evict(self, manifest, protected_key=None):
+        """
+        Removes the least recently used artifacts from the manifest and from
+        disk until their total size is not greater than max_size. The artifact
+        with the protected key is never removed
+
+        :type manifest: dict[str, dict]
+        """
+        # Forget the artifacts that were removed by someone else
+        for key in list(manifest.keys()):
+            if not os.path.exists(
+                    os.path.join(self.folder, manifest[key]['file'])):
+                del manifest[key]
+
+        if self.max_size is None:
+            return
+
+        total_size = sum(entry['size'] for entry in manifest.values())
+        keys = sorted(manifest, key=lambda k: manifest[k]['last_access'])
+        for key in keys:
+            if total_size <= self.max_size:
+                break
+            if key == protected_key:
+                continue
+            entry = manifest.pop(key)
+            file_path = os.path.join(self.folder, entry['file'])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            total_size -= entry['size']
+            self.evictions += 1
+
+    def get(self, key, extension, stage=None, name=None):
+        """
+        Looks for an artifact in the cache
+
+        :return: the path of the artifact, or None if it is not in the cache
+        """
+        file_path = self.get_path(key, extension)
+        if not os.path.exists(file_path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.register(key, extension, stage, name)
+        return file_path
+
+    def put(self, key, extension, write_function, stage=None, name=None):
+        """
+        Stores an artifact in the cache
+
+        :param write_function: a function that receives a file path and writes
+        the artifact to it
+        :param stage: the name of the stage that produced the artifact
+        :param name: a human readable name of the artifact, used by find
+        :return: the path of the artifact
+        """
+        file_path = self.get_path(key, extension)
+        self.atomic_write(file_path, write_function)
+        self.register(key, extension, stage, name)
+        return file_path
+
+    def find(self, stage, name):
+        """
+        Finds the most recently used artifact of the given stage that was
+        stored with the given name. It is meant for the code that needs to
+        load an artifact without having its inputs at hand
+
+        :return: the path of the artifact, or None if there isn't any
+        """
+        manifest = self.load_manifest()
+        entries = [
+            entry for entry in manifest.values()
+            if entry['stage'] == stage and name in entry['names'] and
+            os.path.exists(os.path.join(self.folder, entry['file']))
+        ]
+        if not entries:
+            return None
+        entry = max(entries, key=lambda e: e['last_access'])
+        return os.path.join(self.folder, entry['file'])
+
+    def get_or_create(
+            self, stage, input_hashes, property_names, create_function,
+            save_function, load_function, extension, name=None):
+        """
+        Loads the artifact produced by the given stage from the given inputs
+        with the current value of the given properties, creating it and
+        storing it in the cache if it isn't there
+
+        :type stage: str
+        :type input_hashes: list[str]
+        :param property_names: the names of the properties the stage reads
+        :param create_function: a function without arguments that creates the
+        artifact
+        :param save_function: a function that receives a file path and the
+        artifact and saves the artifact to the file
+        :param load_function: a function that receives a file path and returns
+        the artifact stored in it
+        :type extension: str
+        :param name: a human readable name of the artifact, used by find
+        :return: the artifact
+        """
+        key = generate_key(
+            stage, input_hashes, get_properties(property_names))
+        file_path = self.get(key, extension, stage, name)
+        if file_path is not None:
+            print('%s: %s loaded from the cache: %s' % (
+                time.strftime("%Y/%m/%d-%H:%M:%S"), stage, file_path))
+            return load_function(file_path)
+
+        artifact = create_function()
+        self.put(
+            key, extension,
+            lambda temporary_path: save_function(temporary_path, artifact),
+            stage, name)
+        return artifact
+
+    def get_statistics(self):
+        """
+        :return: a dictionary with the number of hits, misses and evictions,
+        the hit ratio and the number and total size of the artifacts
+        """
+        manifest = self.load_manifest()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': float(self.hits) / lookups if lookups else None,
+            'num_artifacts': len(manifest),
+            'size': sum(entry['size'] for entry in manifest.values())
+        }
+
+
+def get_artifact_cache():
+    """
+    Returns an artifact cache in the folder and with the maximum size given by
+    the properties
+
+    :rtype: ArtifactCache
+    """
+    max_size = Constants.ARTIFACT_CACHE_MAX_SIZE
+    if max_size is not None:
+        max_size = int(max_size * 1024 * 1024)
+    return ArtifactCache(Constants.ARTIFACT_CACHE_FOLDER, max_size)
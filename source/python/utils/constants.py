@@ -1,8 +1,8 @@
 import copy
+import os
 import platform
 from string import strip
 
-import yaml
 import subprocess
 
 __author__ = 'fpena'
@@ -14,18 +14,410 @@ SOURCE_FOLDER = PROJECT_FOLDER + 'source/'
 PYTHON_CODE_FOLDER = SOURCE_FOLDER + 'python/'
 JAVA_CODE_FOLDER = SOURCE_FOLDER + 'java/'
 PROPERTIES_FILE = PYTHON_CODE_FOLDER + 'properties.yaml'
+# The environment variable through which the git revision hash is passed to
+# the child processes, so git is only run once
+GIT_REVISION_HASH_VARIABLE = 'YELP_GIT_REVISION_HASH'
+
+# The attributes of Constants that hold the value of a property, and the name
+# of the property in the properties.yaml file
+PROPERTY_ATTRIBUTES = {
+    'ITEM_TYPE': 'business_type',
+    'FM_REVIEW_TYPE': 'fm_review_type',
+    'TOPN_N': 'topn_n',
+    'TOPN_NUM_ITEMS': 'topn_num_items',
+    'RANDOM_SEED': 'random_seed',
+    'NUMPY_RANDOM_SEED': 'numpy_random_seed',
+    'NUM_CYCLES': 'num_cycles',
+    'CONTEXT_EXTRACTOR_ALPHA': 'context_extractor_alpha',
+    'CONTEXT_EXTRACTOR_BETA': 'context_extractor_beta',
+    'CONTEXT_EXTRACTOR_EPSILON': 'context_extractor_epsilon',
+    'TOPIC_MODEL_NUM_TOPICS': 'topic_model_num_topics',
+    'TOPIC_MODEL_PASSES': 'topic_model_passes',
+    'TOPIC_MODEL_ITERATIONS': 'topic_model_iterations',
+    'LDA_MULTICORE': 'lda_multicore',
+    'LIBFM_SEED': 'libfm_seed',
+    'FM_NUM_FACTORS': 'fm_num_factors',
+    'CROSS_VALIDATION_NUM_FOLDS': 'cross_validation_num_folds',
+    'SHUFFLE_DATA': 'shuffle_data',
+    'USE_CONTEXT': 'use_context',
+    'NUM_CORES': 'num_cores',
+    'CACHE_TOPIC_MODEL': 'cache_topic_model',
+    'TEXT_SAMPLING_PROPORTION': 'text_sampling_proportion',
+    'TOPIC_WEIGHTING_METHOD': 'topic_weighting_method',
+    'LDA_BETA_COMPARISON_OPERATOR': 'lda_beta_comparison_operator',
+    'BOW_TYPE': 'bow_type',
+    'LEMMATIZE': 'lemmatize',
+    'MIN_DICTIONARY_WORD_COUNT': 'min_dictionary_word_count',
+    'MAX_DICTIONARY_WORD_COUNT': 'max_dictionary_word_count',
+    'DOCUMENT_LEVEL': 'document_level',
+    'SOLVER': 'solver',
+    'FM_METHOD': 'fm_method',
+    'EVALUATION_METRIC': 'evaluation_metric',
+    'RESAMPLER': 'resampler',
+    'DOCUMENT_CLASSIFIER': 'document_classifier',
+    'DOCUMENT_CLASSIFIER_SEED': 'document_classifier_seed',
+    'TEST_CONTEXT_REVIEWS_ONLY': 'test_context_reviews_only',
+    'USE_NO_CONTEXT_TOPICS_SUM': 'use_no_context_topics_sum',
+    'FM_USE_BIAS': 'fm_use_bias',
+    'FM_USE_1WAY_INTERACTIONS': 'fm_use_1way_interactions',
+    'FM_ITERATIONS': 'fm_iterations',
+    'FM_INIT_STDEV': 'fm_init_stdev',
+    'FM_SDG_LEARN_RATE': 'fm_sdg_learn_rate',
+    'FM_REGULARIZATION0': 'fm_regularization0',
+    'FM_REGULARIZATION1': 'fm_regularization1',
+    'FM_REGULARIZATION2': 'fm_regularization2',
+    'MAX_SAMPLE_TEST_SET': 'max_sample_test_set',
+    'NESTED_CROSS_VALIDATION_CYCLE': 'nested_cross_validation_cycle',
+    'CROSS_VALIDATION_STRATEGY': 'cross_validation_strategy',
+    'CROSS_VALIDATION_NUM_WORKERS': 'cross_validation_num_workers',
+    'TOPIC_MODEL_TYPE': 'topic_model_type',
+    'TOPIC_MODEL_STABILITY_ITERATIONS': 'topic_model_stability_iterations',
+    'TOPIC_MODEL_STABILITY_NUM_TERMS': 'topic_model_stability_num_terms',
+    'TOPIC_MODEL_STABILITY_SAMPLE_RATIO': 'topic_model_stability_sample_ratio',
+    'TOPIC_MODEL_STABILITY_NUM_WORKERS': 'topic_model_stability_num_workers',
+    'SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS':
+        'separate_topic_model_recsys_reviews',
+    'MIN_REVIEWS_PER_USER': 'min_reviews_per_user',
+    'MIN_REVIEWS_PER_ITEM': 'min_reviews_per_item',
+    'LANGUAGE': 'language',
+    'LANGDETECT_SEED': 'langdetect_seed',
+    'PREPROCESSING_NUM_WORKERS': 'preprocessing_num_workers',
+    'TOPIC_MODEL_TARGET_TYPE': 'topic_model_target_type',
+    'TOPIC_MODEL_TARGET_REVIEWS': 'topic_model_target_reviews',
+    'NMF_REGULARIZATION': 'nmf_regularization',
+    'NMF_REGULARIZATION_RATIO': 'nmf_regularization_ratio',
+    'TOPIC_MODEL_FOLDS': 'topic_model_folds',
+    'CARSKIT_RECOMMENDERS': 'carskit_recommenders',
+    'CARSKIT_NOMINAL_FORMAT': 'carskit_nominal_format',
+    'CARSKIT_ITEM_RANKING': 'carskit_item_ranking',
+    'TOPIC_MODEL_NORMALIZE': 'topic_model_normalize',
+    'CONTEXT_FORMAT': 'context_format',
+    'RIVAL_EVALUATION_STRATEGY': 'rival_evaluation_strategy',
+    'CARSKIT_PARAMETERS': 'carskit_parameters',
+    'ARTIFACT_CACHE_MAX_SIZE': 'artifact_cache_max_size',
+}
+INTEGER_ATTRIBUTES = {'FM_USE_BIAS', 'FM_USE_1WAY_INTERACTIONS'}
 
 
 def load_properties():
+    # yaml takes longer to import than the rest of this module, and it is
+    # only needed the first time a property is read
+    import yaml
     with open(PROPERTIES_FILE, 'r') as f:
         return yaml.load(f)
 
 
+def get_git_revision_hash():
+    """
+    Returns the short hash of the current git revision. Git is only run the
+    first time, the hash is stored in the GIT_REVISION_HASH_VARIABLE
+    environment variable, which the child processes inherit
+
+    :rtype: str
+    """
+    revision_hash = os.environ.get(GIT_REVISION_HASH_VARIABLE)
+    if revision_hash is None:
+        revision_hash = strip(subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_FOLDER))
+        os.environ[GIT_REVISION_HASH_VARIABLE] = revision_hash
+    return revision_hash
+
+
+class cached_property(object):
+    """
+    A read-only attribute that is computed the first time it is accessed and
+    stored in the instance afterwards
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.function(instance)
+        instance.__dict__[self.function.__name__] = value
+        return value
+
+
+class Configuration(object):
+    """
+    An immutable set of properties. The attributes listed in
+    PROPERTY_ATTRIBUTES return the value of their property, and the file names
+    and folders that depend on the properties are computed the first time they
+    are accessed. A configuration with different properties is created with
+    with_overrides, which doesn't modify this one
+    """
+
+    def __init__(self, properties):
+        """
+        :type properties: dict
+        :param properties: the properties, as they appear in the
+        properties.yaml file
+        """
+        self.__dict__['_properties'] = copy.deepcopy(properties)
+
+    def __getattr__(self, name):
+        if name not in PROPERTY_ATTRIBUTES:
+            raise AttributeError(name)
+        value = self._properties[PROPERTY_ATTRIBUTES[name]]
+        return int(value) if name in INTEGER_ATTRIBUTES else value
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            'Configurations are immutable, use with_overrides to change \'%s\''
+            % name)
+
+    def with_overrides(self, overrides):
+        """
+        Returns a new configuration with the given properties replaced
+
+        :type overrides: dict
+        :param overrides: the new value of the properties, indexed by the name
+        of the property
+        :rtype: Configuration
+        """
+        properties = dict(self._properties)
+        properties.update(overrides)
+        return Configuration(properties)
+
+    def get_properties_copy(self):
+        properties = copy.deepcopy(self._properties)
+        properties['git_revision_hash'] = self.GIT_REVISION_HASH
+        properties['os_name'] = self.OS_NAME
+        return properties
+
+    @cached_property
+    def GIT_REVISION_HASH(self):
+        return get_git_revision_hash()
+
+    @cached_property
+    def OS_NAME(self):
+        return platform.system() + ' ' + platform.release()
+
+    # Main Files
+    @cached_property
+    def CACHE_FOLDER(self):
+        return Constants.DATASET_FOLDER + 'cache_context/'
+
+    @cached_property
+    def TEXT_FILES_FOLDER(self):
+        return self.CACHE_FOLDER + 'text_files/'
+
+    @cached_property
+    def TOPIC_MODEL_FOLDER(self):
+        return self.CACHE_FOLDER + 'topic_models/'
+
+    @cached_property
+    def ENSEMBLE_FOLDER(self):
+        return self.TOPIC_MODEL_FOLDER + 'ensemble/'
+
+    @cached_property
+    def RIVAL_FOLDER(self):
+        return self.CACHE_FOLDER + 'rival/'
+
+    @cached_property
+    def ARTIFACT_CACHE_FOLDER(self):
+        return self.CACHE_FOLDER + 'artifacts/'
+
+    @cached_property
+    def GENERATED_TEXT_FILES_FOLDER(self):
+        return self.generate_file_name(
+            'bow_files', '', self.TEXT_FILES_FOLDER, None, None, False,
+            True)[:-1] + '/'
+
+    @cached_property
+    def RECORDS_FILE(self):
+        return Constants.DATASET_FOLDER + self.ITEM_TYPE + '_reviews.json'
+
+    @cached_property
+    def LANGUAGE_RECORDS_FILE(self):
+        return self.CACHE_FOLDER + self.ITEM_TYPE + '_language_reviews.json'
+
+    @cached_property
+    def CLASSIFIED_RECORDS_FILE(self):
+        return Constants.DATASET_FOLDER + 'classified_' + self.ITEM_TYPE + \
+            '_reviews' + \
+            ('' if self.DOCUMENT_LEVEL == 'review' else '_sentences') + \
+            '.json'
+
+    @cached_property
+    def LEMMATIZED_RECORDS_FILE(self):
+        return self.CACHE_FOLDER + self.ITEM_TYPE + '_lemmatized_reviews' + \
+            ('' if self.LANGUAGE is None else '_lang-' + self.LANGUAGE) + \
+            '_document_level-' + str(self.DOCUMENT_LEVEL) + '.json'
+
+    @cached_property
+    def PROCESSED_RECORDS_FILE(self):
+        return self.generate_file_name(
+            'processed_reviews', 'json', self.CACHE_FOLDER, None, None, False,
+            True)
+
+    @cached_property
+    def FULL_PROCESSED_RECORDS_FILE(self):
+        return self.generate_file_name(
+            'full_processed_reviews', 'json', self.CACHE_FOLDER, None, None,
+            False, True)
+
+    @cached_property
+    def TOPIC_MODEL_PROCESSED_RECORDS_FILE(self):
+        return self.generate_file_name(
+            'topic_model_processed_reviews', 'json', self.CACHE_FOLDER, None,
+            None, False, True)
+
+    @cached_property
+    def RECSYS_PROCESSED_RECORDS_FILE(self):
+        return self.generate_file_name(
+            'recsys_records', 'json', self.CACHE_FOLDER, None, None, False,
+            True)
+
+    @cached_property
+    def RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE(self):
+        return self.generate_file_name(
+            'recsys_contextual_records', 'json', self.CACHE_FOLDER, None, None,
+            True, True, normalize_topics=True)
+
+    @cached_property
+    def RECSYS_TOPICS_PROCESSED_RECORDS_FILE(self):
+        return self.generate_file_name(
+            'recsys_topic_records', 'json', self.CACHE_FOLDER, None, None,
+            True, True, normalize_topics=True)
+
+    @cached_property
+    def DICTIONARY_FILE(self):
+        return self.generate_file_name(
+            'dictionary', 'pkl', self.CACHE_FOLDER, None, None, False, True)
+
+    @cached_property
+    def RATINGS_FILE(self):
+        return self.generate_file_name(
+            'ratings', 'txt', self.CACHE_FOLDER, None, None, False, True)
+
+    @cached_property
+    def REVIEWS_FILE(self):
+        return Constants.DATASET_FOLDER + 'reviews_' + self.ITEM_TYPE + \
+            '_shuffled.pkl'
+
+    @cached_property
+    def CSV_RESULTS_FILE(self):
+        return Constants.DATASET_FOLDER + self.ITEM_TYPE + '_results.csv'
+
+    @cached_property
+    def JSON_RESULTS_FILE(self):
+        return Constants.DATASET_FOLDER + self.ITEM_TYPE + '_results.json'
+
+    # Cache files
+    @cached_property
+    def TOPIC_MODEL_FILE(self):
+        return self.CACHE_FOLDER + 'topic_model_' + self.ITEM_TYPE + '.pkl'
+
+    @cached_property
+    def ENSEMBLED_RESULTS_FOLDER(self):
+        return self.generate_file_name(
+            'topic_model', '', self.ENSEMBLE_FOLDER, None, None, True,
+            True)[:-1] + '/'
+
+    @cached_property
+    def CARSKIT_RATINGS_FOLDER(self):
+        return self.generate_file_name(
+            'carskit_ratings', '', self.CACHE_FOLDER + 'rival/', None, None,
+            True, True, True, True)[:-1] + '/'
+
+    @cached_property
+    def RIVAL_RATINGS_FOLD_FOLDER(self):
+        return self.generate_file_name(
+            'recsys_formatted_context_records', '', self.RIVAL_FOLDER, None,
+            None, True, True, uses_carskit=False, normalize_topics=True,
+            format_context=True)[:-1] + '/fold_%d/'
+
+    def generate_file_name(
+            self, name, extension, folder, cycle_index, fold_index,
+            uses_context, is_etl=False, uses_carskit=False,
+            normalize_topics=False, format_context=False):
+
+        prefix = self.ITEM_TYPE + '_' + name
+        context_suffix = ''
+        if uses_context:
+            context_suffix = \
+                '_' + self.TOPIC_MODEL_TYPE + \
+                '_numtopics-' + str(self.TOPIC_MODEL_NUM_TOPICS) + \
+                '_iterations-' + str(self.TOPIC_MODEL_ITERATIONS) + \
+                '_passes-' + str(self.TOPIC_MODEL_PASSES) + \
+                '_targetreview-' + str(self.TOPIC_MODEL_TARGET_REVIEWS)
+            if normalize_topics:
+                context_suffix += \
+                    '_normalized' \
+                    if self.TOPIC_MODEL_NORMALIZE else '_not-normalized'
+
+        if uses_carskit:
+            context_suffix += '_ck-' + self.CARSKIT_NOMINAL_FORMAT
+        if format_context:
+            context_suffix += '_contextformat-' + self.CONTEXT_FORMAT
+        suffix = context_suffix + \
+            ('' if self.LANGUAGE is None
+             else '_lang-' + self.LANGUAGE) + \
+            '_bow-' + str(self.BOW_TYPE) + \
+            '_document_level-' + str(self.DOCUMENT_LEVEL) + \
+            '_targettype-' + str(self.TOPIC_MODEL_TARGET_TYPE) + \
+            ('' if self.MIN_REVIEWS_PER_USER is None
+             else '_min_user_reviews-' + str(self.MIN_REVIEWS_PER_USER)) +\
+            ('' if self.MIN_REVIEWS_PER_ITEM is None
+             else '_min_item_reviews-' + str(self.MIN_REVIEWS_PER_ITEM)) +\
+            '.' + extension
+
+        if is_etl:
+            topic_model_file = prefix + suffix
+        elif self.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
+            topic_model_file = prefix + '_separated' + suffix
+        elif cycle_index is None and fold_index is None:
+            topic_model_file = prefix + '_full' + suffix
+        else:
+            strategy = self.CROSS_VALIDATION_STRATEGY
+            cross_validation_info = '_' + strategy
+            if strategy == 'nested_validate':
+                cross_validation_info += \
+                    '-' + str(self.NESTED_CROSS_VALIDATION_CYCLE)
+            topic_model_file = prefix + \
+                cross_validation_info + \
+                '_cycle-' + str(cycle_index + 1) + '|' + \
+                str(self.NUM_CYCLES) + \
+                '_fold-' + str(fold_index + 1) + '|' + \
+                str(self.CROSS_VALIDATION_NUM_FOLDS) + \
+                suffix
+        return folder + topic_model_file
+
+
+class ConstantsType(type):
+    """
+    Makes the attributes of the current configuration available as class
+    attributes of Constants. The configuration is only loaded the first time
+    one of them is accessed, so importing this module has no side effects
+    """
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(cls.get_configuration(), name)
+
+    def __setattr__(cls, name, value):
+        # Assigning a property replaces the current configuration, so the
+        # values that depend on it are computed again
+        if name in PROPERTY_ATTRIBUTES:
+            cls.update_properties({PROPERTY_ATTRIBUTES[name]: value})
+        else:
+            type.__setattr__(cls, name, value)
+
+
 class Constants(object):
 
+    __metaclass__ = ConstantsType
+
+
     # Please keep the constants' names in alphabetical order to avoid problems
     # with the version control system (merging)
 
+    ARTIFACT_CACHE_MAX_SIZE_FIELD = 'artifact_cache_max_size'
     BOW_FIELD = 'bow'
     BOW_TYPE_FIELD = 'bow_type'
     BUSINESS_TYPE_FIELD = 'business_type'
@@ -40,6 +432,7 @@ class Constants(object):
     CONTEXT_WORDS_FIELD = 'context_words'
     CORPUS_FIELD = 'corpus'
     CROSS_VALIDATION_NUM_FOLDS_FIELD = 'cross_validation_num_folds'
+    CROSS_VALIDATION_NUM_WORKERS_FIELD = 'cross_validation_num_workers'
     CROSS_VALIDATION_STRATEGY_FIELD = 'cross_validation_strategy'
     DOCUMENT_CLASSIFIER_FIELD = 'document_classifier'
     DOCUMENT_CLASSIFIER_SEED_FIELD = 'document_classifier_seed'
@@ -66,11 +459,14 @@ class Constants(object):
     MAX_SAMPLE_TEST_SET_FIELD = 'max_sample_test_set'
     MIN_DICTIONARY_WORD_COUNT_FIELD = 'min_dictionary_word_count'
     NESTED_CROSS_VALIDATION_CYCLE_FIELD = 'nested_cross_validation_cycle'
+    NMF_REGULARIZATION_FIELD = 'nmf_regularization'
+    NMF_REGULARIZATION_RATIO_FIELD = 'nmf_regularization_ratio'
     NUM_CORES_FIELD = 'num_cores'
     NUM_CYCLES_FIELD = 'num_cycles'
     NUMPY_RANDOM_SEED_FIELD = 'numpy_random_seed'
     POS_TAGS_FIELD = 'pos_tags'
     PREDICTED_CLASS_FIELD = 'predicted_class'
+    PREPROCESSING_NUM_WORKERS_FIELD = 'preprocessing_num_workers'
     RANDOM_SEED_FIELD = 'random_seed'
     RATING_FIELD = 'stars'
     RESAMPLER_FIELD = 'resampler'
@@ -81,7 +477,9 @@ class Constants(object):
     TEST_CONTEXT_REVIEWS_ONLY_FIELD = 'test_context_reviews_only'
     TEXT_FIELD = 'text'
     TEXT_SAMPLING_PROPORTION_FIELD = 'text_sampling_proportion'
+    TOPIC_MODEL_FOLDS_FIELD = 'topic_model_folds'
     TOPIC_MODEL_ITERATIONS_FIELD = 'topic_model_iterations'
+    TOPIC_MODEL_NORMALIZE_FIELD = 'topic_model_normalize'
     TOPIC_MODEL_NUM_TOPICS_FIELD = 'topic_model_num_topics'
     TOPIC_MODEL_PASSES_FIELD = 'topic_model_passes'
     TOPIC_MODEL_STABILITY_SAMPLE_RATIO_FIELD =\
@@ -109,6 +507,7 @@ class Constants(object):
     ALL_REVIEWS = 'all_reviews'
     LIBFM = 'libfm'
     FASTFM = 'fastfm'
+    FACTORIZATION_MACHINE = 'factorization_machine'
 
     # Folders
     DATASET_FOLDER = '/home/fpena/data/'
@@ -122,418 +521,48 @@ class Constants(object):
     GENERATED_FOLDER = DATASET_FOLDER + 'generated_context/'
     RESULTS_FOLDER = DATASET_FOLDER + 'results/'
 
-    _properties = load_properties()
-    ITEM_TYPE = _properties['business_type']
-    FM_REVIEW_TYPE = _properties['fm_review_type']
-    TOPN_N = _properties['topn_n']
-    TOPN_NUM_ITEMS = _properties['topn_num_items']
-    RANDOM_SEED = _properties['random_seed']
-    NUMPY_RANDOM_SEED = _properties['numpy_random_seed']
-    NUM_CYCLES = _properties['num_cycles']
-    CONTEXT_EXTRACTOR_ALPHA = _properties['context_extractor_alpha']
-    CONTEXT_EXTRACTOR_BETA = _properties['context_extractor_beta']
-    CONTEXT_EXTRACTOR_EPSILON = _properties['context_extractor_epsilon']
-    TOPIC_MODEL_NUM_TOPICS = _properties['topic_model_num_topics']
-    TOPIC_MODEL_PASSES = _properties['topic_model_passes']
-    TOPIC_MODEL_ITERATIONS = _properties['topic_model_iterations']
-    LDA_MULTICORE = _properties['lda_multicore']
-    LIBFM_SEED = _properties['libfm_seed']
-    FM_NUM_FACTORS = _properties['fm_num_factors']
-    CROSS_VALIDATION_NUM_FOLDS =\
-        _properties['cross_validation_num_folds']
-    SHUFFLE_DATA = _properties['shuffle_data']
-    USE_CONTEXT = _properties['use_context']
-    NUM_CORES = _properties['num_cores']
-    CACHE_TOPIC_MODEL = _properties['cache_topic_model']
-    TEXT_SAMPLING_PROPORTION = _properties['text_sampling_proportion']
-    TOPIC_WEIGHTING_METHOD = _properties['topic_weighting_method']
-    LDA_BETA_COMPARISON_OPERATOR = _properties['lda_beta_comparison_operator']
-    BOW_TYPE = _properties['bow_type']
-    LEMMATIZE = _properties['lemmatize']
-    MIN_DICTIONARY_WORD_COUNT = _properties['min_dictionary_word_count']
-    MAX_DICTIONARY_WORD_COUNT = _properties['max_dictionary_word_count']
-    DOCUMENT_LEVEL = _properties['document_level']
-    SOLVER = _properties['solver']
-    FM_METHOD = _properties['fm_method']
-    EVALUATION_METRIC = _properties['evaluation_metric']
-    RESAMPLER = _properties['resampler']
-    DOCUMENT_CLASSIFIER = _properties['document_classifier']
-    DOCUMENT_CLASSIFIER_SEED = _properties['document_classifier_seed']
-    TEST_CONTEXT_REVIEWS_ONLY = _properties['test_context_reviews_only']
-    USE_NO_CONTEXT_TOPICS_SUM = _properties['use_no_context_topics_sum']
-    FM_USE_BIAS = int(_properties['fm_use_bias'])
-    FM_USE_1WAY_INTERACTIONS = int(_properties['fm_use_1way_interactions'])
-    FM_ITERATIONS = _properties['fm_iterations']
-    FM_INIT_STDEV = _properties['fm_init_stdev']
-    FM_SDG_LEARN_RATE = _properties['fm_sdg_learn_rate']
-    FM_REGULARIZATION0 = _properties['fm_regularization0']
-    FM_REGULARIZATION1 = _properties['fm_regularization1']
-    FM_REGULARIZATION2 = _properties['fm_regularization2']
-    MAX_SAMPLE_TEST_SET = _properties['max_sample_test_set']
-    NESTED_CROSS_VALIDATION_CYCLE = _properties['nested_cross_validation_cycle']
-    CROSS_VALIDATION_STRATEGY = _properties['cross_validation_strategy']
-    TOPIC_MODEL_TYPE = _properties['topic_model_type']
-    TOPIC_MODEL_STABILITY_ITERATIONS = \
-        _properties['topic_model_stability_iterations']
-    TOPIC_MODEL_STABILITY_NUM_TERMS = \
-        _properties['topic_model_stability_num_terms']
-    TOPIC_MODEL_STABILITY_SAMPLE_RATIO = \
-        _properties['topic_model_stability_sample_ratio']
-    SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS = \
-        _properties['separate_topic_model_recsys_reviews']
-    MIN_REVIEWS_PER_USER = _properties['min_reviews_per_user']
-    MIN_REVIEWS_PER_ITEM = _properties['min_reviews_per_item']
-    LANGUAGE = _properties['language']
-    LANGDETECT_SEED = _properties['langdetect_seed']
-    TOPIC_MODEL_TARGET_TYPE = _properties['topic_model_target_type']
-    TOPIC_MODEL_TARGET_REVIEWS = _properties['topic_model_target_reviews']
-    NMF_REGULARIZATION = _properties['nmf_regularization']
-    NMF_REGULARIZATION_RATIO = _properties['nmf_regularization_ratio']
-    TOPIC_MODEL_FOLDS = _properties['topic_model_folds']
-    CARSKIT_RECOMMENDERS = _properties['carskit_recommenders']
-    CARSKIT_NOMINAL_FORMAT = _properties['carskit_nominal_format']
-    CARSKIT_ITEM_RANKING = _properties['carskit_item_ranking']
-    TOPIC_MODEL_NORMALIZE = _properties['topic_model_normalize']
-    CONTEXT_FORMAT = _properties['context_format']
-    RIVAL_EVALUATION_STRATEGY = _properties['rival_evaluation_strategy']
-    CARSKIT_PARAMETERS = _properties['carskit_parameters']
 
-    # Main Files
-    CACHE_FOLDER = DATASET_FOLDER + 'cache_context/'
-    # CACHE_FOLDER = '/tmp/cache_context/'
-    TEXT_FILES_FOLDER = CACHE_FOLDER + 'text_files/'
-    TOPIC_MODEL_FOLDER = CACHE_FOLDER + 'topic_models/'
-    ENSEMBLE_FOLDER = TOPIC_MODEL_FOLDER + 'ensemble/'
-    RIVAL_FOLDER = CACHE_FOLDER + 'rival/'
-    GENERATED_TEXT_FILES_FOLDER = None
-    # RECORDS_FILE = DATASET_FOLDER + 'yelp_training_set_review_' +\
-    #                ITEM_TYPE + 's_shuffled_tagged.json'
-    RECORDS_FILE = DATASET_FOLDER + ITEM_TYPE + '_reviews.json'
-    LANGUAGE_RECORDS_FILE = \
-        CACHE_FOLDER + ITEM_TYPE + '_language_reviews.json'
-    CLASSIFIED_RECORDS_FILE = DATASET_FOLDER + 'classified_' + ITEM_TYPE +\
-        '_reviews' + ('' if DOCUMENT_LEVEL == 'review' else '_sentences') +\
-        '.json'
-    LEMMATIZED_RECORDS_FILE = CACHE_FOLDER + ITEM_TYPE + \
-        '_lemmatized_reviews' + \
-        ('' if LANGUAGE is None else '_lang-' + LANGUAGE) + \
-        '_document_level-' + str(DOCUMENT_LEVEL) + '.json'
-    PROCESSED_RECORDS_FILE = None
-    FULL_PROCESSED_RECORDS_FILE = None
-    TOPIC_MODEL_PROCESSED_RECORDS_FILE = None
-    RECSYS_PROCESSED_RECORDS_FILE = None
-    RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE = None
-    RECSYS_TOPICS_PROCESSED_RECORDS_FILE = None
-    DICTIONARY_FILE = None
-    RATINGS_FILE = None
-    REVIEWS_FILE = DATASET_FOLDER + 'reviews_' + ITEM_TYPE + '_shuffled.pkl'
-    CSV_RESULTS_FILE = DATASET_FOLDER + \
-        ITEM_TYPE + '_results.csv'
-    JSON_RESULTS_FILE = DATASET_FOLDER + \
-        ITEM_TYPE + '_results.json'
-    GIT_REVISION_HASH = strip(subprocess.check_output(
-        ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_FOLDER))
-    _properties['git_revision_hash'] = GIT_REVISION_HASH
-    OS_NAME = platform.system() + ' ' + platform.release()
-    _properties['os_name'] = OS_NAME
-    # Cache files
-    TOPIC_MODEL_FILE = CACHE_FOLDER + 'topic_model_' +\
-        ITEM_TYPE + '.pkl'
-    ENSEMBLED_RESULTS_FOLDER = None
-    CARSKIT_RATINGS_FOLDER = None
-    RIVAL_RATINGS_FOLD_FOLDER = None
+    _configuration = None
+
+    @staticmethod
+    def get_configuration():
+        """
+        Returns the current configuration, loading it from the properties file
+        the first time
 
-    @classmethod
-    def get_properties_copy(cls):
-        return copy.deepcopy(cls._properties)
+        :rtype: Configuration
+        """
+        if Constants._configuration is None:
+            Constants._configuration = Configuration(load_properties())
+        return Constants._configuration
+
+    @staticmethod
+    def set_configuration(configuration):
+        """
+        Makes the given configuration the current one
+
+        :type configuration: Configuration
+        """
+        Constants._configuration = configuration
+
+    @staticmethod
+    def get_properties_copy():
+        return Constants.get_configuration().get_properties_copy()
 
     @staticmethod
     def update_properties(new_properties):
-        Constants._properties.update(new_properties)
-
-        Constants.ITEM_TYPE = Constants._properties['business_type']
-        Constants.FM_REVIEW_TYPE = Constants._properties['fm_review_type']
-        Constants.TOPN_N = Constants._properties['topn_n']
-        Constants.TOPN_NUM_ITEMS = Constants._properties['topn_num_items']
-        Constants.RANDOM_SEED = Constants._properties['random_seed']
-        Constants.NUMPY_RANDOM_SEED = Constants._properties['numpy_random_seed']
-        Constants.NUM_CYCLES = Constants._properties['num_cycles']
-        Constants.CONTEXT_EXTRACTOR_ALPHA = \
-            Constants._properties['context_extractor_alpha']
-        Constants.CONTEXT_EXTRACTOR_BETA = \
-            Constants._properties['context_extractor_beta']
-        Constants.CONTEXT_EXTRACTOR_EPSILON = \
-            Constants._properties['context_extractor_epsilon']
-        Constants.TOPIC_MODEL_NUM_TOPICS = \
-            Constants._properties['topic_model_num_topics']
-        Constants.TOPIC_MODEL_PASSES = \
-            Constants._properties['topic_model_passes']
-        Constants.TOPIC_MODEL_ITERATIONS =\
-            Constants._properties['topic_model_iterations']
-        Constants.LDA_MULTICORE = Constants._properties['lda_multicore']
-        Constants.LIBFM_SEED = Constants._properties['libfm_seed']
-        Constants.FM_NUM_FACTORS = Constants._properties['fm_num_factors']
-        Constants.CROSS_VALIDATION_NUM_FOLDS =\
-            Constants._properties['cross_validation_num_folds']
-        Constants.SHUFFLE_DATA = Constants._properties['shuffle_data']
-        Constants.USE_CONTEXT = Constants._properties['use_context']
-        Constants.NUM_CORES = Constants._properties['num_cores']
-        Constants.CACHE_TOPIC_MODEL = Constants._properties['cache_topic_model']
-        Constants.TEXT_SAMPLING_PROPORTION =\
-            Constants._properties['text_sampling_proportion']
-        Constants.TOPIC_WEIGHTING_METHOD =\
-            Constants._properties['topic_weighting_method']
-        Constants.LDA_BETA_COMPARISON_OPERATOR =\
-            Constants._properties['lda_beta_comparison_operator']
-        Constants.BOW_TYPE = Constants._properties['bow_type']
-        Constants.LEMMATIZE = Constants._properties['lemmatize']
-        Constants.MIN_DICTIONARY_WORD_COUNT =\
-            Constants._properties['min_dictionary_word_count']
-        Constants.MAX_DICTIONARY_WORD_COUNT =\
-            Constants._properties['max_dictionary_word_count']
-        Constants.DOCUMENT_LEVEL = Constants._properties['document_level']
-        Constants.SOLVER = Constants._properties['solver']
-        Constants.FM_METHOD = Constants._properties['fm_method']
-        Constants.EVALUATION_METRIC = Constants._properties['evaluation_metric']
-        Constants.RESAMPLER = Constants._properties['resampler']
-        Constants.DOCUMENT_CLASSIFIER =\
-            Constants._properties['document_classifier']
-        Constants.DOCUMENT_CLASSIFIER_SEED =\
-            Constants._properties['document_classifier_seed']
-        Constants.TEST_CONTEXT_REVIEWS_ONLY = \
-            Constants._properties['test_context_reviews_only']
-        Constants.USE_NO_CONTEXT_TOPICS_SUM = \
-            Constants._properties['use_no_context_topics_sum']
-        Constants.FM_USE_BIAS = \
-            int(Constants._properties['fm_use_bias'])
-        Constants.FM_USE_1WAY_INTERACTIONS = \
-            int(Constants._properties['fm_use_1way_interactions'])
-        Constants.FM_ITERATIONS = Constants._properties['fm_iterations']
-        Constants.FM_INIT_STDEV = Constants._properties['fm_init_stdev']
-        Constants.FM_SDG_LEARN_RATE = Constants._properties['fm_sdg_learn_rate']
-        Constants.FM_REGULARIZATION0 = \
-            Constants._properties['fm_regularization0']
-        Constants.FM_REGULARIZATION1 = \
-            Constants._properties['fm_regularization1']
-        Constants.FM_REGULARIZATION2 = \
-            Constants._properties['fm_regularization2']
-        Constants.MAX_SAMPLE_TEST_SET =\
-            Constants._properties['max_sample_test_set']
-        Constants.NESTED_CROSS_VALIDATION_CYCLE = \
-            Constants._properties['nested_cross_validation_cycle']
-        Constants.CROSS_VALIDATION_STRATEGY = \
-            Constants._properties['cross_validation_strategy']
-        Constants.TOPIC_MODEL_TYPE = Constants._properties['topic_model_type']
-        Constants.TOPIC_MODEL_STABILITY_ITERATIONS = \
-            Constants._properties['topic_model_stability_iterations']
-        Constants.TOPIC_MODEL_STABILITY_NUM_TERMS = \
-            Constants._properties['topic_model_stability_num_terms']
-        Constants.TOPIC_MODEL_STABILITY_SAMPLE_RATIO = \
-            Constants._properties['topic_model_stability_sample_ratio']
-        Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS = \
-            Constants._properties['separate_topic_model_recsys_reviews']
-        Constants.MIN_REVIEWS_PER_USER = \
-            Constants._properties['min_reviews_per_user']
-        Constants.MIN_REVIEWS_PER_ITEM = \
-            Constants._properties['min_reviews_per_item']
-        Constants.LANGUAGE = Constants._properties['language']
-        Constants.LANGDETECT_SEED = Constants._properties['langdetect_seed']
-        Constants.TOPIC_MODEL_TARGET_TYPE = \
-            Constants._properties['topic_model_target_type']
-        Constants.TOPIC_MODEL_TARGET_REVIEWS = \
-            Constants._properties['topic_model_target_reviews']
-        Constants.NMF_REGULARIZATION = \
-            Constants._properties['nmf_regularization']
-        Constants.NMF_REGULARIZATION_RATIO = \
-            Constants._properties['nmf_regularization_ratio']
-        Constants.TOPIC_MODEL_FOLDS = Constants._properties['topic_model_folds']
-        Constants.CARSKIT_RECOMMENDERS = \
-            Constants._properties['carskit_recommenders']
-        Constants.CARSKIT_NOMINAL_FORMAT = \
-            Constants._properties['carskit_nominal_format']
-        Constants.CARSKIT_ITEM_RANKING = \
-            Constants._properties['carskit_item_ranking']
-        Constants.TOPIC_MODEL_NORMALIZE = \
-            Constants._properties['topic_model_normalize']
-        Constants.CONTEXT_FORMAT = \
-            Constants._properties['context_format']
-        Constants.RIVAL_EVALUATION_STRATEGY = \
-            Constants._properties['rival_evaluation_strategy']
-        Constants.CARSKIT_PARAMETERS = \
-            Constants._properties['carskit_parameters']
-
-        # Main Files
-        Constants.CACHE_FOLDER = Constants.DATASET_FOLDER + 'cache_context/'
-        # Constants.CACHE_FOLDER = '/tmp/cache_context/'
-        Constants.TEXT_FILES_FOLDER = Constants.CACHE_FOLDER + 'text_files/'
-        Constants.TOPIC_MODEL_FOLDER = Constants.CACHE_FOLDER + 'topic_models/'
-        Constants.ENSEMBLE_FOLDER = Constants.TOPIC_MODEL_FOLDER + 'ensemble/'
-        Constants.RIVAL_FOLDER = Constants.CACHE_FOLDER + 'rival/'
-        Constants.GENERATED_TEXT_FILES_FOLDER = Constants.generate_file_name(
-            'bow_files', '', Constants.TEXT_FILES_FOLDER, None, None, False,
-            True)[:-1] + '/'
-        Constants.RECORDS_FILE =\
-            Constants.DATASET_FOLDER + Constants.ITEM_TYPE + '_reviews.json'
-        Constants.LANGUAGE_RECORDS_FILE =\
-            Constants.CACHE_FOLDER + Constants.ITEM_TYPE + \
-            '_language_reviews.json'
-        Constants.CLASSIFIED_RECORDS_FILE = Constants.DATASET_FOLDER + \
-            'classified_' + Constants.ITEM_TYPE + '_reviews' +\
-            ('' if Constants.DOCUMENT_LEVEL == 'review' else '_sentences') + \
-            '.json'
-        Constants.LEMMATIZED_RECORDS_FILE = \
-            Constants.CACHE_FOLDER + Constants.ITEM_TYPE + \
-            '_lemmatized_reviews' + \
-            ('' if Constants.LANGUAGE is None
-             else '_lang-' + Constants.LANGUAGE) + \
-            '_document_level-' + \
-            str(Constants.DOCUMENT_LEVEL) + '.json'
-        Constants.PROCESSED_RECORDS_FILE = Constants.generate_file_name(
-            'processed_reviews', 'json', Constants.CACHE_FOLDER, None, None,
-            False, True)
-        Constants.FULL_PROCESSED_RECORDS_FILE = \
-            Constants.generate_file_name(
-                'full_processed_reviews', 'json', Constants.CACHE_FOLDER, None,
-                None, False, True)
-        Constants.RECSYS_PROCESSED_RECORDS_FILE = Constants.generate_file_name(
-            'recsys_records', 'json', Constants.CACHE_FOLDER, None, None, False,
-            True)
-        Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE = \
-            Constants.generate_file_name(
-                'recsys_contextual_records', 'json', Constants.CACHE_FOLDER,
-                None, None, True, True, normalize_topics=True)
-        Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE = \
-            Constants.generate_file_name(
-                'recsys_topic_records', 'json', Constants.CACHE_FOLDER,
-                None, None, True, True, normalize_topics=True)
-        Constants.DICTIONARY_FILE = Constants.generate_file_name(
-            'dictionary', 'pkl', Constants.CACHE_FOLDER, None, None, False,
-            True)
-        Constants.RATINGS_FILE = Constants.generate_file_name(
-            'ratings', 'txt', Constants.CACHE_FOLDER, None, None, False, True)
-        Constants.REVIEWS_FILE = Constants.DATASET_FOLDER + 'reviews_' + \
-            Constants.ITEM_TYPE + '_shuffled.pkl'
-        Constants.CSV_RESULTS_FILE = Constants.DATASET_FOLDER + \
-            Constants.ITEM_TYPE + '_results.csv'
-        Constants.JSON_RESULTS_FILE = Constants.DATASET_FOLDER + \
-            Constants.ITEM_TYPE + '_results.json'
-        Constants.GIT_REVISION_HASH = strip(subprocess.check_output(
-            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_FOLDER))
-        Constants._properties['git_revision_hash'] = Constants.GIT_REVISION_HASH
-        Constants.OS_NAME = platform.system() + ' ' + platform.release()
-        Constants._properties['os_name'] = Constants.OS_NAME
-        # Cache files
-        Constants.TOPIC_MODEL_FILE = Constants.CACHE_FOLDER + 'topic_model_' +\
-            Constants.ITEM_TYPE + '.pkl'
-        Constants.ENSEMBLED_RESULTS_FOLDER = Constants.generate_file_name(
-            'topic_model', '', Constants.ENSEMBLE_FOLDER, None, None,
-            True, True)[:-1] + '/'
-        Constants.CARSKIT_RATINGS_FOLDER = Constants.generate_file_name(
-            'carskit_ratings', '', Constants.CACHE_FOLDER + 'rival/', None,
-            None, True, True, True, True)[:-1] + '/'
-        Constants.RIVAL_RATINGS_FOLD_FOLDER = Constants.generate_file_name(
-            'recsys_formatted_context_records', '',
-            Constants.RIVAL_FOLDER, None, None, True, True, uses_carskit=False,
-            normalize_topics=True, format_context=True)[:-1] + '/fold_%d/'
+        Constants.set_configuration(
+            Constants.get_configuration().with_overrides(new_properties))
 
     @staticmethod
     def print_properties():
-        print(Constants._properties)
+        print(Constants.get_properties_copy())
 
     @staticmethod
     def generate_file_name(
             name, extension, folder, cycle_index, fold_index, uses_context,
             is_etl=False, uses_carskit=False, normalize_topics=False,
             format_context=False):
-
-        prefix = Constants.ITEM_TYPE + '_' + name
-        context_suffix = ''
-        if uses_context:
-            context_suffix = \
-                '_' + Constants.TOPIC_MODEL_TYPE + \
-                '_numtopics-' + str(Constants.TOPIC_MODEL_NUM_TOPICS) + \
-                '_iterations-' + str(Constants.TOPIC_MODEL_ITERATIONS) + \
-                '_passes-' + str(Constants.TOPIC_MODEL_PASSES) + \
-                '_targetreview-' + str(Constants.TOPIC_MODEL_TARGET_REVIEWS)
-            if normalize_topics:
-                context_suffix += \
-                    '_normalized' \
-                    if Constants.TOPIC_MODEL_NORMALIZE else '_not-normalized'
-
-        if uses_carskit:
-            context_suffix += '_ck-' + Constants.CARSKIT_NOMINAL_FORMAT
-        if format_context:
-            context_suffix += '_contextformat-' + Constants.CONTEXT_FORMAT
-        suffix = context_suffix + \
-            ('' if Constants.LANGUAGE is None
-             else '_lang-' + Constants.LANGUAGE) + \
-            '_bow-' + str(Constants.BOW_TYPE) + \
-            '_document_level-' + str(Constants.DOCUMENT_LEVEL) + \
-            '_targettype-' + str(Constants.TOPIC_MODEL_TARGET_TYPE) + \
-            ('' if Constants.MIN_REVIEWS_PER_USER is None
-             else '_min_user_reviews-' + str(Constants.MIN_REVIEWS_PER_USER)) +\
-            ('' if Constants.MIN_REVIEWS_PER_ITEM is None
-             else '_min_item_reviews-' + str(Constants.MIN_REVIEWS_PER_ITEM)) +\
-            '.' + extension
-
-        if is_etl:
-            topic_model_file = prefix + suffix
-        elif Constants.SEPARATE_TOPIC_MODEL_RECSYS_REVIEWS:
-            topic_model_file = prefix + '_separated' + suffix
-        elif cycle_index is None and fold_index is None:
-            topic_model_file = prefix + '_full' + suffix
-        else:
-            strategy = Constants.CROSS_VALIDATION_STRATEGY
-            cross_validation_info = '_' + strategy
-            if strategy == 'nested_validate':
-                cross_validation_info += \
-                    '-' + str(Constants.NESTED_CROSS_VALIDATION_CYCLE)
-            topic_model_file = prefix + \
-                cross_validation_info + \
-                '_cycle-' + str(cycle_index + 1) + '|' + \
-                str(Constants.NUM_CYCLES) + \
-                '_fold-' + str(fold_index + 1) + '|' + \
-                str(Constants.CROSS_VALIDATION_NUM_FOLDS) + \
-                suffix
-        return folder + topic_model_file
-
-Constants.PROCESSED_RECORDS_FILE = Constants.generate_file_name(
-    'processed_reviews', 'json', Constants.CACHE_FOLDER, None, None, False, True
-)
-Constants.FULL_PROCESSED_RECORDS_FILE = Constants.generate_file_name(
-    'full_processed_reviews', 'json', Constants.CACHE_FOLDER, None, None, False,
-    True)
-Constants.RECSYS_PROCESSED_RECORDS_FILE = Constants.generate_file_name(
-    'recsys_records', 'json', Constants.CACHE_FOLDER, None, None, False, True)
-Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE = \
-    Constants.generate_file_name(
-        'recsys_contextual_records', 'json', Constants.CACHE_FOLDER, None,
-        None, True, True)
-Constants.TOPIC_MODEL_PROCESSED_RECORDS_FILE = Constants.generate_file_name(
-    'topic_model_processed_reviews', 'json', Constants.CACHE_FOLDER, None, None,
-    False, True)
-Constants.DICTIONARY_FILE = Constants.generate_file_name(
-    'dictionary', 'pkl', Constants.CACHE_FOLDER, None, None, False, True)
-Constants.RATINGS_FILE = Constants.generate_file_name(
-    'ratings', 'txt', Constants.CACHE_FOLDER, None, None, False, True)
-Constants.GENERATED_TEXT_FILES_FOLDER = Constants.generate_file_name(
-    'bow_files', '', Constants.TEXT_FILES_FOLDER, None, None, False,
-    True)[:-1] + '/'
-Constants.RECSYS_CONTEXTUAL_PROCESSED_RECORDS_FILE = \
-    Constants.generate_file_name(
-        'recsys_contextual_records', 'json', Constants.CACHE_FOLDER,
-        None, None, True, True, normalize_topics=True)
-Constants.RECSYS_TOPICS_PROCESSED_RECORDS_FILE = \
-    Constants.generate_file_name(
-        'recsys_topic_records', 'json', Constants.CACHE_FOLDER,
-        None, None, True, True, normalize_topics=True)
-Constants.ENSEMBLED_RESULTS_FOLDER = Constants.generate_file_name(
-    'topic_model', '', Constants.ENSEMBLE_FOLDER, None, None,
-    True, True)[:-1] + '/'
-Constants.CARSKIT_RATINGS_FOLDER = Constants.generate_file_name(
-    'carskit_ratings', '', Constants.CACHE_FOLDER + 'rival/', None,
-    None, True, True, True, True)[:-1] + '/'
-Constants.RIVAL_RATINGS_FOLD_FOLDER = Constants.generate_file_name(
-    'recsys_formatted_context_records', '', Constants.RIVAL_FOLDER, None, None,
-    True, True, uses_carskit=False, normalize_topics=True,
-    format_context=True)[:-1] + '/fold_%d/'
+        return Constants.get_configuration().generate_file_name(
+            name, extension, folder, cycle_index, fold_index, uses_context,
+            is_etl, uses_carskit, normalize_topics, format_context)
@@ -0,0 +1,169 @@
+from multiprocessing import Pool
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from utils import artifact_cache
+from utils.artifact_cache import ArtifactCache
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+def write_text(file_path, text):
+    with open(file_path, 'w') as write_file:
+        write_file.write(text)
+
+
+def read_text(file_path):
+    with open(file_path, 'r') as read_file:
+        return read_file.read()
+
+
+def put_artifacts(arguments):
+    folder, worker = arguments
+    cache = ArtifactCache(folder)
+    for index in range(20):
+        cache.put(
+            'key%d-%d' % (worker, index), 'txt',
+            lambda file_path: write_text(file_path, 'artifact'), 'stage',
+            'name%d-%d' % (worker, index))
+
+
+class TestArtifactCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + '/'
+        self.original_properties = Constants.get_properties_copy()
+
+    def tearDown(self):
+        Constants.update_properties(self.original_properties)
+        shutil.rmtree(self.folder)
+
+    def test_hash_records(self):
+        records = [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+        self.assertEqual(
+            artifact_cache.hash_records(records),
+            artifact_cache.hash_records(
+                [{'b': 'x', 'a': 1}, {'b': 'y', 'a': 2}]))
+        self.assertNotEqual(
+            artifact_cache.hash_records(records),
+            artifact_cache.hash_records(records[::-1]))
+
+    def test_hash_numpy_records(self):
+        array = numpy.zeros(10000)
+        other_array = array.copy()
+        other_array[5000] = 1
+        # The repr of both arrays is the same, since it is truncated
+        self.assertEqual(repr(array), repr(other_array))
+        self.assertNotEqual(
+            artifact_cache.hash_records([{'a': array}]),
+            artifact_cache.hash_records([{'a': other_array}]))
+        self.assertNotEqual(
+            artifact_cache.hash_records([{'a': array}]),
+            artifact_cache.hash_records([{'a': array.astype('f')}]))
+        self.assertNotEqual(
+            artifact_cache.hash_records([{'a': array}]),
+            artifact_cache.hash_records([{'a': array.reshape(100, 100)}]))
+        self.assertEqual(
+            artifact_cache.hash_records([{'a': array[::2]}]),
+            artifact_cache.hash_records([{'a': numpy.zeros(5000)}]))
+
+    def test_get_or_create(self):
+        cache = ArtifactCache(self.folder)
+        calls = []
+
+        def create():
+            calls.append(1)
+            return 'topic model %d' % len(calls)
+
+        def get_artifact(input_hash):
+            return cache.get_or_create(
+                'stage', [input_hash], [Constants.TOPIC_MODEL_NUM_TOPICS_FIELD],
+                create, write_text, read_text, 'txt')
+
+        self.assertEqual('topic model 1', get_artifact('records1'))
+        self.assertEqual('topic model 1', get_artifact('records1'))
+        self.assertEqual(1, len(calls))
+
+        # A property the stage doesn't read doesn't change the key
+        Constants.update_properties({Constants.FM_NUM_FACTORS_FIELD: 123})
+        self.assertEqual('topic model 1', get_artifact('records1'))
+
+        # Different inputs or a property the stage reads do
+        self.assertEqual('topic model 2', get_artifact('records2'))
+        Constants.update_properties(
+            {Constants.TOPIC_MODEL_NUM_TOPICS_FIELD: 123})
+        self.assertEqual('topic model 3', get_artifact('records1'))
+
+        statistics = cache.get_statistics()
+        self.assertEqual(2, statistics['hits'])
+        self.assertEqual(3, statistics['misses'])
+        self.assertEqual(3, statistics['num_artifacts'])
+        # No temporary files are left behind
+        self.assertEqual(
+            ['manifest.json', 'manifest.lock'],
+            sorted(name for name in os.listdir(self.folder)
+                   if not name.endswith('.txt')))
+
+    def test_failed_write(self):
+        cache = ArtifactCache(self.folder)
+
+        def write_function(file_path):
+            write_text(file_path, 'partial')
+            raise IOError('disk full')
+
+        self.assertRaises(
+            IOError, cache.put, 'key', 'txt', write_function, 'stage')
+        self.assertIsNone(cache.get('key', 'txt'))
+        self.assertEqual([], os.listdir(self.folder))
+
+    def test_eviction(self):
+        cache = ArtifactCache(self.folder, max_size=25)
+        for key in ['a', 'b', 'c']:
+            cache.put(
+                key, 'txt', lambda file_path: write_text(file_path, '0' * 10),
+                'stage', 'name')
+            # Access 'a' again, so 'b' is the least recently used artifact
+            cache.get('a', 'txt')
+
+        self.assertIsNotNone(cache.get('a', 'txt'))
+        self.assertIsNone(cache.get('b', 'txt'))
+        self.assertIsNotNone(cache.get('c', 'txt'))
+        self.assertEqual(1, cache.get_statistics()['evictions'])
+        self.assertEqual(20, cache.get_statistics()['size'])
+        # 'c' is the most recently used artifact with that name
+        self.assertEqual(
+            cache.get_path('c', 'txt'), cache.find('stage', 'name'))
+
+    def test_register_names(self):
+        cache = ArtifactCache(self.folder)
+        cache.put(
+            'key', 'txt', lambda file_path: write_text(file_path, 'a'),
+            'stage', 'fold1')
+        # The same artifact is found for another fold with the same inputs
+        cache.get('key', 'txt', 'stage', 'fold2')
+        self.assertEqual(
+            cache.get_path('key', 'txt'), cache.find('stage', 'fold1'))
+        self.assertEqual(
+            cache.get_path('key', 'txt'), cache.find('stage', 'fold2'))
+        self.assertIsNone(cache.find('other_stage', 'fold1'))
+
+    def test_concurrent_register(self):
+        pool = Pool(4)
+        try:
+            pool.map(
+                put_artifacts, [(self.folder, worker) for worker in range(4)])
+        finally:
+            pool.close()
+            pool.join()
+
+        cache = ArtifactCache(self.folder)
+        self.assertEqual(80, cache.get_statistics()['num_artifacts'])
+        for worker in range(4):
+            for index in range(20):
+                self.assertIsNotNone(
+                    cache.find('stage', 'name%d-%d' % (worker, index)))
@@ -0,0 +1,62 @@
+import os
+from unittest import TestCase
+
+from utils import constants
+from utils.constants import Constants
+
+__author__ = 'fpena'
+
+
+class TestConstants(TestCase):
+
+    def setUp(self):
+        self.configuration = Constants.get_configuration()
+
+    def tearDown(self):
+        Constants.set_configuration(self.configuration)
+
+    def test_with_overrides(self):
+        configuration = self.configuration.with_overrides(
+            {Constants.TOPIC_MODEL_NUM_TOPICS_FIELD: 123})
+
+        self.assertEqual(123, configuration.TOPIC_MODEL_NUM_TOPICS)
+        self.assertIn(
+            '_numtopics-123_', configuration.ENSEMBLED_RESULTS_FOLDER)
+        self.assertNotEqual(123, self.configuration.TOPIC_MODEL_NUM_TOPICS)
+        self.assertNotEqual(
+            123, Constants.get_properties_copy()[
+                Constants.TOPIC_MODEL_NUM_TOPICS_FIELD])
+        self.assertRaises(
+            AttributeError, setattr, configuration, 'TOPIC_MODEL_NUM_TOPICS',
+            5)
+
+    def test_update_properties(self):
+        Constants.update_properties(
+            {Constants.TOPIC_MODEL_NUM_TOPICS_FIELD: 123})
+        self.assertEqual(123, Constants.TOPIC_MODEL_NUM_TOPICS)
+        self.assertIn('_numtopics-123_', Constants.ENSEMBLED_RESULTS_FOLDER)
+
+        # Assigning an attribute updates its property
+        Constants.TOPIC_MODEL_NUM_TOPICS = 45
+        self.assertEqual(
+            45, Constants.get_properties_copy()[
+                Constants.TOPIC_MODEL_NUM_TOPICS_FIELD])
+        self.assertIn('_numtopics-45_', Constants.ENSEMBLED_RESULTS_FOLDER)
+
+        self.assertIsNot(self.configuration, Constants.get_configuration())
+
+    def test_git_revision_hash(self):
+        previous_hash = os.environ.get(constants.GIT_REVISION_HASH_VARIABLE)
+        os.environ[constants.GIT_REVISION_HASH_VARIABLE] = 'abc1234'
+        try:
+            configuration = self.configuration.with_overrides({})
+            self.assertEqual('abc1234', configuration.GIT_REVISION_HASH)
+            self.assertEqual(
+                'abc1234',
+                configuration.get_properties_copy()['git_revision_hash'])
+        finally:
+            if previous_hash is None:
+                del os.environ[constants.GIT_REVISION_HASH_VARIABLE]
+            else:
+                os.environ[constants.GIT_REVISION_HASH_VARIABLE] = \
+                    previous_hash
@@ -0,0 +1,57 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+from scipy import sparse
+
+from utils import utilities
+
+__author__ = 'fpena'
+
+
+def square_all(numbers):
+    return [number * number for number in numbers]
+
+
+def add_shared_offset(numbers):
+    offset = utilities.get_shared_data()['offset']
+    return [number + offset for number in numbers]
+
+
+class TestUtilities(TestCase):
+
+    def test_map_shards(self):
+
+        numbers = range(103)
+        expected_result = [number * number for number in numbers]
+
+        self.assertEqual(
+            expected_result, utilities.map_shards(square_all, numbers))
+        self.assertEqual(
+            expected_result, utilities.map_shards(square_all, numbers, 3))
+        self.assertEqual([], utilities.map_shards(square_all, [], 3))
+
+    def test_map_shards_shared_data(self):
+
+        numbers = range(103)
+        expected_result = [number + 5 for number in numbers]
+
+        for num_workers in [None, 3]:
+            self.assertEqual(expected_result, utilities.map_shards(
+                add_shared_offset, numbers, num_workers,
+                shared_data={'offset': 5}))
+            self.assertEqual({}, utilities.get_shared_data())
+
+    def test_save_sparse_matrix(self):
+
+        folder = tempfile.mkdtemp()
+        matrix = sparse.random(20, 7, density=0.3, format='csr', random_state=0)
+        try:
+            utilities.save_sparse_matrix(folder, matrix)
+            loaded_matrix = utilities.load_sparse_matrix(folder)
+            self.assertEqual(matrix.shape, loaded_matrix.shape)
+            numpy.testing.assert_array_equal(
+                matrix.toarray(), loaded_matrix.toarray())
+        finally:
+            shutil.rmtree(folder)
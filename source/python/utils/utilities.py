@@ -1,6 +1,10 @@
+import contextlib
+import os
 import random
+from multiprocessing import Pool
 
 import numpy
+from scipy import sparse
 
 from utils.constants import Constants
 
@@ -127,3 +131,138 @@ def plant_seeds():
     if Constants.NUMPY_RANDOM_SEED is not None:
         print('numpy random seed: %d' % Constants.NUMPY_RANDOM_SEED)
         numpy.random.seed(Constants.NUMPY_RANDOM_SEED)
+
+
+# The data shared with the functions that run in the worker processes, see
+# get_shared_data
+_shared_data = {}
+
+
+def get_shared_data():
+    """
+    Returns the data shared with the functions that map_shards applies, or
+    with the functions run by a pool created with initialize_shared_data as
+    its initializer
+
+    :rtype: dict
+    """
+    return _shared_data
+
+
+def initialize_shared_data(shared_data, initializer=None):
+    """
+    Makes the given data available through get_shared_data in the current
+    process. It is meant to be the initializer of a pool of worker processes,
+    so the data is handed to every worker once when it starts, instead of
+    being pickled and sent with every task
+
+    :type shared_data: dict
+    :param shared_data: the data to share
+    :param initializer: a function that is called after the data is set
+    """
+    _shared_data.update(shared_data)
+    if initializer is not None:
+        initializer()
+
+
+@contextlib.contextmanager
+def share_data(shared_data):
+    """
+    Makes the given data available through get_shared_data in the current
+    process while the block runs, for the tasks that are run serially
+    """
+    previous_data = dict(_shared_data)
+    _shared_data.update(shared_data)
+    try:
+        yield
+    finally:
+        _shared_data.clear()
+        _shared_data.update(previous_data)
+
+
+def map_shards(function, items, num_workers=None, initializer=None,
+               shared_data=None):
+    """
+    Splits the given items into contiguous shards and applies the function to
+    each one of them. When num_workers is greater than 1 the shards are
+    processed in parallel by a pool of worker processes, otherwise they are
+    processed serially in the current process. Either way, the results are
+    merged back in the same order as the items.
+
+    :param function: a top-level (picklable) function that receives a list of
+    items and returns a list with one result per item
+    :type items: list
+    :param items: the items to process
+    :type num_workers: int
+    :param num_workers: the number of worker processes to use
+    :param initializer: a top-level function that is called once when every
+    worker process starts (e.g. to plant the random seeds)
+    :type shared_data: dict
+    :param shared_data: data that the function reads with get_shared_data,
+    it is handed to every worker process once
+    :rtype: list
+    :return: a list with the results of applying the function to every item
+    """
+    if shared_data is None:
+        shared_data = {}
+
+    if num_workers is None or num_workers < 2 or len(items) < 2:
+        with share_data(shared_data):
+            if initializer is not None:
+                initializer()
+            return function(items)
+
+    # Several shards per worker, so that the pool can balance the load
+    num_shards = min(len(items), num_workers * 4)
+    shard_size = int(numpy.ceil(len(items) / float(num_shards)))
+    shards = [
+        items[start:start + shard_size]
+        for start in range(0, len(items), shard_size)
+    ]
+
+    pool = Pool(num_workers, initialize_shared_data, (shared_data, initializer))
+    try:
+        shard_results = pool.map(function, shards)
+    finally:
+        pool.close()
+        pool.join()
+
+    return [result for results in shard_results for result in results]
+
+
+def save_sparse_matrix(folder, matrix):
+    """
+    Saves the arrays of a sparse matrix in compressed rows format as numpy
+    .npy files, so that other processes can memory-map them with
+    load_sparse_matrix instead of receiving a pickled copy
+
+    :type folder: str
+    :param folder: the folder in which the arrays are saved
+    :type matrix: scipy.sparse.spmatrix
+    :param matrix: the matrix to save
+    """
+    matrix = sparse.csr_matrix(matrix)
+    numpy.save(os.path.join(folder, 'data.npy'), matrix.data)
+    numpy.save(os.path.join(folder, 'indices.npy'), matrix.indices)
+    numpy.save(os.path.join(folder, 'indptr.npy'), matrix.indptr)
+    numpy.save(os.path.join(folder, 'shape.npy'), numpy.array(matrix.shape))
+
+
+def load_sparse_matrix(folder, mmap_mode='r'):
+    """
+    Loads a sparse matrix saved with save_sparse_matrix. By default the arrays
+    are memory-mapped, so the matrix is read-only
+
+    :type folder: str
+    :param folder: the folder in which the arrays were saved
+    :param mmap_mode: the mode used to memory-map the numpy files. If None
+    the files are read into memory
+    :rtype: scipy.sparse.csr_matrix
+    """
+    def load_array(name):
+        return numpy.load(
+            os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode)
+
+    return sparse.csr_matrix(
+        (load_array('data'), load_array('indices'), load_array('indptr')),
+        shape=tuple(numpy.load(os.path.join(folder, 'shape.npy'))))